@@ -1,12 +1,13 @@
 from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 
 from models.schemas import (
     RealTimeDataInput, NodeData, NodePressureRequest, 
     NodeFlowRequest, BulkDataInput, ErrorResponse
 )
-from core.database import db_manager
+from core.async_database import async_db_manager
+from core.ingestion import ingest_real_time_rows_async, IngestionBacklogFull
 
 router = APIRouter()
 
@@ -19,14 +20,11 @@ async def submit_real_time_data(data: RealTimeDataInput):
     - **nodes**: Danh sách dữ liệu các nút (áp lực, lưu lượng, nhu cầu)
     """
     try:
-        # Lưu dữ liệu vào database
-        for node_data in data.nodes:
-            db_manager.save_real_time_data(
-                node_id=node_data.node_id,
-                pressure=node_data.pressure,
-                flow=node_data.flow,
-                demand=node_data.demand
-            )
+        # Lưu dữ liệu vào database (một transaction cho cả request)
+        await ingest_real_time_rows_async([
+            (node_data.node_id, node_data.pressure, node_data.flow, node_data.demand, None)
+            for node_data in data.nodes
+        ])
         
         return {
             "success": True,
@@ -35,6 +33,8 @@ async def submit_real_time_data(data: RealTimeDataInput):
             "nodes_count": len(data.nodes)
         }
         
+    except IngestionBacklogFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -51,14 +51,10 @@ async def submit_pressure_data(pressure_data: List[NodePressureRequest]):
     - **timestamp**: Thời gian đo
     """
     try:
-        saved_count = 0
-        
-        for data in pressure_data:
-            db_manager.save_real_time_data(
-                node_id=data.node_id,
-                pressure=data.pressure
-            )
-            saved_count += 1
+        saved_count = await ingest_real_time_rows_async([
+            (data.node_id, data.pressure, None, None, None)
+            for data in pressure_data
+        ])
         
         return {
             "success": True,
@@ -67,6 +63,8 @@ async def submit_pressure_data(pressure_data: List[NodePressureRequest]):
             "count": saved_count
         }
         
+    except IngestionBacklogFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -83,14 +81,10 @@ async def submit_flow_data(flow_data: List[NodeFlowRequest]):
     - **timestamp**: Thời gian đo
     """
     try:
-        saved_count = 0
-        
-        for data in flow_data:
-            db_manager.save_real_time_data(
-                node_id=data.node_id,
-                flow=data.flow
-            )
-            saved_count += 1
+        saved_count = await ingest_real_time_rows_async([
+            (data.node_id, None, data.flow, None, None)
+            for data in flow_data
+        ])
         
         return {
             "success": True,
@@ -99,6 +93,8 @@ async def submit_flow_data(flow_data: List[NodeFlowRequest]):
             "count": saved_count
         }
         
+    except IngestionBacklogFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -115,24 +111,12 @@ async def submit_bulk_data(bulk_data: BulkDataInput):
     - **flow_data**: Danh sách dữ liệu lưu lượng
     """
     try:
-        saved_pressure = 0
-        saved_flow = 0
-        
-        # Lưu dữ liệu áp lực
-        for data in bulk_data.pressure_data:
-            db_manager.save_real_time_data(
-                node_id=data.node_id,
-                pressure=data.pressure
-            )
-            saved_pressure += 1
-        
-        # Lưu dữ liệu lưu lượng
-        for data in bulk_data.flow_data:
-            db_manager.save_real_time_data(
-                node_id=data.node_id,
-                flow=data.flow
-            )
-            saved_flow += 1
+        # Áp lực và lưu lượng ghi chung một batch (một transaction)
+        rows = [(data.node_id, data.pressure, None, None, None) for data in bulk_data.pressure_data]
+        rows += [(data.node_id, None, data.flow, None, None) for data in bulk_data.flow_data]
+        await ingest_real_time_rows_async(rows)
+        saved_pressure = len(bulk_data.pressure_data)
+        saved_flow = len(bulk_data.flow_data)
         
         return {
             "success": True,
@@ -142,6 +126,8 @@ async def submit_bulk_data(bulk_data: BulkDataInput):
             "flow_count": saved_flow
         }
         
+    except IngestionBacklogFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -154,7 +140,7 @@ async def get_latest_data(node_id: str):
     Lấy dữ liệu mới nhất cho một nút cụ thể
     """
     try:
-        data = db_manager.get_latest_real_time_data(node_id)
+        data = await async_db_manager.get_latest_real_time_data(node_id)
         
         if not data:
             raise HTTPException(
@@ -182,7 +168,7 @@ async def get_latest_all_data():
     Lấy dữ liệu mới nhất cho tất cả các nút
     """
     try:
-        data = db_manager.get_latest_real_time_data()
+        data = await async_db_manager.get_latest_real_time_data()
         
         return {
             "success": True,
@@ -197,22 +183,38 @@ async def get_latest_all_data():
         )
 
 @router.get("/history/{node_id}")
-async def get_data_history(node_id: str, limit: int = 100):
+async def get_data_history(
+    node_id: str,
+    limit: int = 100,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: str = "auto"
+):
     """
     Lấy lịch sử dữ liệu cho một nút
     
     - **node_id**: ID của nút
     - **limit**: Số lượng bản ghi tối đa (mặc định: 100)
+    - **start** / **end**: Khoảng thời gian (UTC, tùy chọn)
+    - **resolution**: raw | hourly | daily | auto (mặc định). Auto đọc bảng rollup
+      (min/max/mean/count) cho khoảng thời gian dài thay vì dữ liệu thô
     """
     try:
-        # Implementation cần được thêm vào database manager
+        history = await async_db_manager.get_real_time_history(
+            node_id, start=start, end=end, resolution=resolution, limit=limit
+        )
+        
         return {
             "success": True,
             "node_id": node_id,
-            "data": [],  # Cần implement
+            "resolution": history["resolution"],
+            "data": history["data"],
+            "count": len(history["data"]),
             "limit": limit
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
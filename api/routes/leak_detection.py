@@ -1,11 +1,16 @@
 """
 API routes cho leak detection
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from typing import Dict, Any, List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from services.leak_detection_service import leak_detection_service
+from services.leak_detection_service import RunNotFoundError, leak_detection_service, load_stored_run
+from services.baseline_cache import BaselineNotWarmedError
+from services.leak_signatures import SignaturesNotBuiltError
+from services.node_arrays import NodeArrays
+from services.inference_batcher import inference_batcher
 from utils.logger import logger
 
 router = APIRouter()
@@ -14,26 +19,87 @@ class LeakDetectionRequest(BaseModel):
     """Request để detect leak từ simulation results"""
     nodes_data: Dict[str, List[Dict[str, Any]]]
     threshold: Optional[float] = None
+    top_k: Optional[int] = Field(None, ge=1, description="Chỉ trả về k node có xác suất cao nhất")
+    window_seconds: Optional[float] = Field(None, gt=0, description="Gộp theo node x cửa sổ thời gian (giây)")
 
 class LeakDetectionFromSimulationRequest(BaseModel):
     """Request để detect leak từ simulation result"""
     simulation_result: Dict[str, Any]
     threshold: Optional[float] = None
+    top_k: Optional[int] = Field(None, ge=1, description="Chỉ trả về k node có xác suất cao nhất")
+    window_seconds: Optional[float] = Field(None, gt=0, description="Gộp theo node x cửa sổ thời gian (giây)")
+
+class BatchDetectionRequest(BaseModel):
+    """Request để detect leak cho nhiều run một lần"""
+    run_ids: List[int] = []  # simulation đã lưu trong database
+    simulation_results: Dict[str, Dict[str, Any]] = {}  # run_key -> SimulationResult dict
+    threshold: Optional[float] = None
+    top_k: Optional[int] = Field(None, ge=1, description="Chỉ trả về k node có xác suất cao nhất mỗi run")
+    window_seconds: Optional[float] = Field(None, gt=0, description="Gộp theo node x cửa sổ thời gian (giây)")
+
+class LocalizationRequest(BaseModel):
+    """Request để định vị rò rỉ bằng từ điển chữ ký"""
+    residuals: Dict[str, float] = {}  # node_id -> residual áp lực (m)
+    run_id: Optional[int] = None  # simulation đã lưu trong database
+    simulation_result: Optional[Dict[str, Any]] = None
+    top_k: int = Field(10, ge=1, description="Số junction ứng viên trả về")
+
+class ConfirmationRequest(BaseModel):
+    """Request để xác nhận ứng viên rò rỉ bằng mô phỏng lại"""
+    run_id: Optional[int] = None  # simulation đã lưu trong database
+    simulation_result: Optional[Dict[str, Any]] = None
+    candidates: Optional[List[str]] = None  # None -> top_k leaks do model phát hiện
+    top_k: int = Field(10, ge=1, description="Số ứng viên lấy từ model")
+    threshold: Optional[float] = None
+    window_start: Optional[float] = Field(None, description="Đầu cửa sổ thời gian (giây)")
+    window_end: Optional[float] = Field(None, description="Cuối cửa sổ thời gian (giây)")
+
+class StreamUpdateRequest(BaseModel):
+    """Một bước thời gian của luồng streaming"""
+    timestamp: Any
+    nodes: Dict[str, Dict[str, float]]  # node_id -> {pressure, head, demand}
+    threshold: Optional[float] = None
 
 @router.get("/status")
 async def get_leak_detection_status():
     """
     Kiểm tra trạng thái của leak detection service
     """
-    is_ready = leak_detection_service.is_ready()
+    is_ready = await run_in_threadpool(leak_detection_service.is_ready)
     
     return {
         "success": True,
         "ready": is_ready,
         "message": "Service ready" if is_ready else "Service not ready - model not loaded",
-        "threshold": leak_detection_service.threshold if is_ready else None
+        "threshold": leak_detection_service.threshold if is_ready else None,
+        "model": leak_detection_service.model_info(),
+        "inference": inference_batcher.stats(),
+        "scored_runs": leak_detection_service.scored_runs.stats(),
+        "baseline": leak_detection_service.baseline.stats(),
+        "signatures": leak_detection_service.signatures.stats(),
+        "confirmation": leak_detection_service.confirmer.stats(),
+        "streams": leak_detection_service.stream_stats()
     }
 
+@router.post("/models/reload")
+async def reload_model():
+    """
+    Load lại model từ thư mục model (sau khi train/copy model mới) mà không restart server.
+    Request đang chạy dùng tiếp model cũ; load lỗi -> giữ model cũ.
+    """
+    try:
+        info = await run_in_threadpool(leak_detection_service.reload_model)
+        return {
+            "success": True,
+            "model": info
+        }
+    except Exception as e:
+        logger.error(f"Error reloading model: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error reloading model (previous model kept): {str(e)}"
+        )
+
 @router.post("/detect")
 async def detect_leaks(request: LeakDetectionRequest):
     """
@@ -42,17 +108,23 @@ async def detect_leaks(request: LeakDetectionRequest):
     - **nodes_data**: Dict với key là node_id, value là list of records
                       Mỗi record có: timestamp, pressure, head, demand
     - **threshold**: Optional threshold override (default: use model threshold)
+    - **top_k**: Optional - chỉ trả về k node có xác suất cao nhất
+    - **window_seconds**: Optional - gộp theo node x cửa sổ thời gian (vd 3600 = theo giờ)
     """
     try:
-        if not leak_detection_service.is_ready():
+        if not await run_in_threadpool(leak_detection_service.is_ready):
             raise HTTPException(
                 status_code=503,
                 detail="Leak detection service not ready - model not loaded"
             )
         
-        result = leak_detection_service.detect_leaks(
+        # Chay tren threadpool: request dong thoi duoc gom batch khi predict (services/inference_batcher.py)
+        result = await run_in_threadpool(
+            leak_detection_service.detect_leaks,
             nodes_data=request.nodes_data,
-            threshold=request.threshold
+            threshold=request.threshold,
+            top_k=request.top_k,
+            window=request.window_seconds
         )
         
         if not result.get("success"):
@@ -82,17 +154,21 @@ async def detect_leaks_from_simulation(request: LeakDetectionFromSimulationReque
     
     - **simulation_result**: SimulationResult dict từ EPANET service
     - **threshold**: Optional threshold override
+    - **top_k**, **window_seconds**: như /detect
     """
     try:
-        if not leak_detection_service.is_ready():
+        if not await run_in_threadpool(leak_detection_service.is_ready):
             raise HTTPException(
                 status_code=503,
                 detail="Leak detection service not ready - model not loaded"
             )
         
-        result = leak_detection_service.detect_leaks_from_simulation_result(
+        result = await run_in_threadpool(
+            leak_detection_service.detect_leaks_from_simulation_result,
             simulation_result=request.simulation_result,
-            threshold=request.threshold
+            threshold=request.threshold,
+            top_k=request.top_k,
+            window=request.window_seconds
         )
         
         if not result.get("success"):
@@ -115,5 +191,263 @@ async def detect_leaks_from_simulation(request: LeakDetectionFromSimulationReque
             detail=f"Error detecting leaks: {str(e)}"
         )
 
+@router.post("/detect-batch")
+async def detect_leaks_batch(request: BatchDetectionRequest):
+    """
+    Detect leaks cho nhiều run trong một lần gọi (vd báo cáo rò rỉ theo tuần)
+    
+    Feature của các run được nối thành một ma trận và chấm điểm trong một lần predict
+    (chia đoạn theo settings.leak_batch_max_rows); kết quả xếp hạng riêng cho từng run.
+    
+    - **run_ids**: ID các simulation đã lưu (run_key = run_id, dùng chung cache với simulate-and-detect)
+    - **simulation_results**: tên run -> SimulationResult dict (cache theo hash dữ liệu, run_key
+      trả về trong từng kết quả để query lại qua /runs/{run_key}/leaks)
+    - **threshold**, **top_k**, **window_seconds**: áp dụng cho từng run
+    """
+    try:
+        if not await run_in_threadpool(leak_detection_service.is_ready):
+            raise HTTPException(
+                status_code=503,
+                detail="Leak detection service not ready - model not loaded"
+            )
+        if not request.run_ids and not request.simulation_results:
+            raise HTTPException(status_code=400, detail="No runs provided")
+        
+        runs = {str(run_id): (lambda run_id=run_id: load_stored_run(run_id)) for run_id in request.run_ids}
+        for run_key, simulation_result in request.simulation_results.items():
+            runs[run_key] = NodeArrays.from_nodes_results(simulation_result.get('nodes_results', {}))
+        
+        result = await run_in_threadpool(
+            leak_detection_service.detect_leaks_batch,
+            runs,
+            threshold=request.threshold,
+            top_k=request.top_k,
+            window=request.window_seconds
+        )
+        
+        if not result.get("success"):
+            raise HTTPException(
+                status_code=500,
+                detail=result.get("error", "Batch leak detection failed")
+            )
+        
+        return {
+            "success": True,
+            "data": result
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in detect_leaks_batch endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error detecting leaks: {str(e)}"
+        )
+
+@router.get("/runs/{run_key}/leaks")
+async def query_run_leaks(
+    run_key: str,
+    threshold: Optional[float] = Query(None, ge=0, le=1),
+    min_probability: Optional[float] = Query(None, ge=0, le=1),
+    top_k: Optional[int] = Query(None, ge=1),
+    window_seconds: Optional[float] = Query(None, gt=0)
+):
+    """
+    Truy vấn lại leaks của một run đã chấm điểm với threshold / min_probability / top_k khác
+    - dùng ma trận xác suất trong cache, không chạy lại feature engineering và model.
+    
+    - **run_key**: run_key trả về bởi /detect, /detect-from-simulation (hash dữ liệu đầu vào)
+                   hoặc run_id của /simulation/simulate-and-detect
+    - **threshold**: Optional threshold override (default: use model threshold)
+    - **min_probability**: Optional - xác suất tối thiểu (default: 0.05)
+    """
+    result = await run_in_threadpool(
+        leak_detection_service.query_cached_run,
+        run_key,
+        threshold=threshold,
+        top_k=top_k,
+        window=window_seconds,
+        min_probability=min_probability
+    )
+    if result is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Run {run_key} not in probability cache (evicted or model reloaded) - run detection again"
+        )
+    return {
+        "success": True,
+        "data": result
+    }
+
+@router.post("/localize")
+async def localize_leak(request: LocalizationRequest):
+    """
+    Định vị rò rỉ bằng vật lý (không cần model): so residual áp lực quan sát với chữ ký
+    rò rỉ chuẩn đã mô phỏng trước cho từng junction (services/leak_signatures.py).
+    Từ điển được tạo lúc warmup (main.py) hoặc bằng scripts/build_leak_signatures.py;
+    chưa có từ điển -> 503, request không bao giờ tự mô phỏng.
+    
+    - **residuals**: node_id -> residual áp lực (m, âm = áp lực thấp hơn bình thường)
+    - **run_id** / **simulation_result**: residual tính từ baseline không rò rỉ của run
+    - **top_k**: số junction ứng viên trả về
+    """
+    try:
+        if request.residuals:
+            source = request.residuals
+        elif request.run_id is not None:
+            source = await run_in_threadpool(load_stored_run, request.run_id)
+        elif request.simulation_result is not None:
+            source = NodeArrays.from_nodes_results(request.simulation_result.get('nodes_results', {}))
+        else:
+            raise HTTPException(status_code=400, detail="Provide residuals, run_id or simulation_result")
+        
+        result = await run_in_threadpool(leak_detection_service.localize_leak, source, request.top_k)
+        if not result.get("success"):
+            raise HTTPException(
+                status_code=500,
+                detail=result.get("error", "Leak localization failed")
+            )
+        
+        return {
+            "success": True,
+            "data": result
+        }
+        
+    except HTTPException:
+        raise
+    except (SignaturesNotBuiltError, BaselineNotWarmedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except RunNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in localize_leak endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error localizing leak: {str(e)}"
+        )
+
+@router.post("/confirm")
+async def confirm_leaks(request: ConfirmationRequest):
+    """
+    Xác nhận ứng viên rò rỉ trước khi cử đội: mô phỏng lại rò rỉ tại từng ứng viên (song song)
+    trong cửa sổ thời gian bị đánh dấu, fit diện tích rò rỉ khớp nhất với áp lực quan sát và
+    xếp hạng theo sai số (services/leak_confirmation.py).
+    
+    - **run_id** / **simulation_result**: dữ liệu áp lực quan sát
+    - **candidates**: Optional - node ứng viên (mặc định: top_k leaks do model phát hiện)
+    - **window_start**, **window_end**: Optional - mặc định khoảng model đánh dấu
+    """
+    try:
+        if request.run_id is not None:
+            arrays = await run_in_threadpool(load_stored_run, request.run_id)
+        elif request.simulation_result is not None:
+            arrays = NodeArrays.from_nodes_results(request.simulation_result.get('nodes_results', {}))
+        else:
+            raise HTTPException(status_code=400, detail="Provide run_id or simulation_result")
+        if request.candidates is None and not await run_in_threadpool(leak_detection_service.is_ready):
+            raise HTTPException(
+                status_code=503,
+                detail="Leak detection service not ready - model not loaded (or pass candidates)"
+            )
+        
+        result = await run_in_threadpool(
+            leak_detection_service.confirm_leaks,
+            arrays,
+            candidates=request.candidates,
+            top_k=request.top_k,
+            threshold=request.threshold,
+            window_start=request.window_start,
+            window_end=request.window_end
+        )
+        if not result.get("success"):
+            raise HTTPException(
+                status_code=500,
+                detail=result.get("error", "Leak confirmation failed")
+            )
+        
+        return {
+            "success": True,
+            "data": result
+        }
+        
+    except HTTPException:
+        raise
+    except RunNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in confirm_leaks endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error confirming leaks: {str(e)}"
+        )
 
+@router.post("/stream/{stream_id}/update")
+async def update_stream(stream_id: str, request: StreamUpdateRequest):
+    """
+    Online detection: thêm một bước thời gian vào luồng stream_id và chỉ chấm điểm bước đó.
+    
+    Rolling features được cập nhật tăng dần từ ring buffer của từng node
+    (services/online_detector.py), chi phí không phụ thuộc độ dài lịch sử.
+    """
+    try:
+        if not await run_in_threadpool(leak_detection_service.is_ready):
+            raise HTTPException(
+                status_code=503,
+                detail="Leak detection service not ready - model not loaded"
+            )
+        
+        detector = leak_detection_service.online_detector(stream_id)
+        result = await run_in_threadpool(
+            detector.score,
+            request.timestamp,
+            request.nodes,
+            request.threshold
+        )
+        
+        if not result.get("success"):
+            raise HTTPException(
+                status_code=500,
+                detail=result.get("error", "Leak detection failed")
+            )
+        
+        return {
+            "success": True,
+            "data": result
+        }
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in update_stream endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error detecting leaks: {str(e)}"
+        )
+
+@router.get("/stream/{stream_id}")
+async def get_stream(stream_id: str):
+    """Trạng thái luồng streaming"""
+    detector = leak_detection_service.get_stream(stream_id)
+    if detector is None:
+        raise HTTPException(status_code=404, detail=f"Stream {stream_id} not found")
+    return {
+        "success": True,
+        "data": detector.info()
+    }
 
+@router.delete("/stream/{stream_id}")
+async def reset_stream(stream_id: str):
+    """Xóa trạng thái (ring buffer) của luồng streaming"""
+    if not leak_detection_service.reset_stream(stream_id):
+        raise HTTPException(status_code=404, detail=f"Stream {stream_id} not found")
+    return {
+        "success": True,
+        "message": f"Stream {stream_id} reset"
+    }
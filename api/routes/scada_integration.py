@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel
@@ -30,7 +31,8 @@ async def get_scada_data(request: SCADARequest):
     try:
         logger.api_request("POST", "/scada/data", 200)
         
-        result = scada_service.get_multiple_stations_data(
+        result = await run_in_threadpool(
+            scada_service.get_multiple_stations_data,
             station_codes=request.station_codes,
             from_date=request.from_date,
             to_date=request.to_date
@@ -60,7 +62,8 @@ async def get_scada_data_by_hours(request: SCADATimeRangeRequest):
     try:
         logger.api_request("POST", "/scada/data-by-hours", 200)
         
-        result = scada_service.get_realtime_data_for_epanet(
+        result = await run_in_threadpool(
+            scada_service.get_realtime_data_for_epanet,
             station_codes=request.station_codes,
             hours_back=request.hours_back
         )
@@ -89,7 +92,8 @@ async def get_scada_realtime_data(request: SCADATimeRangeRequest):
     try:
         logger.api_request("POST", "/scada/realtime", 200)
         
-        result = scada_service.get_realtime_data_for_epanet(
+        result = await run_in_threadpool(
+            scada_service.get_realtime_data_for_epanet,
             station_codes=request.station_codes,
             hours_back=request.hours_back
         )
@@ -149,7 +153,8 @@ async def convert_scada_to_epanet_format(request: SCADARequest):
         logger.api_request("POST", "/scada/convert-to-epanet", 200)
         
         # Lay du lieu SCADA
-        scada_result = scada_service.get_multiple_stations_data(
+        scada_result = await run_in_threadpool(
+            scada_service.get_multiple_stations_data,
             station_codes=request.station_codes,
             from_date=request.from_date,
             to_date=request.to_date
@@ -210,7 +215,8 @@ async def run_simulation_with_scada_data(request: SimulationWithRealtimeRequest)
         logger.api_request("POST", "/scada/simulation-with-realtime", 200)
         
         # Lay du lieu thoi gian thuc tu SCADA
-        scada_result = scada_service.get_realtime_data_for_epanet(
+        scada_result = await run_in_threadpool(
+            scada_service.get_realtime_data_for_epanet,
             station_codes=request.station_codes,
             hours_back=request.hours_back
         )
@@ -240,7 +246,8 @@ async def run_simulation_with_scada_data(request: SimulationWithRealtimeRequest)
         try:
             logger.info(f"Running simulation with {len(scada_boundary_data)} SCADA stations")
             logger.info(f"SCADA boundary data keys: {list(scada_boundary_data.keys())}")
-            simulation_result = epanet_service.run_simulation(
+            simulation_result = await run_in_threadpool(
+                epanet_service.run_simulation,
                 simulation_input,
                 scada_boundary_data=scada_boundary_data  # ✅ Truyền SCADA boundary data
             )
@@ -296,7 +303,8 @@ async def run_simulation_with_custom_time(request: SimulationWithCustomTimeReque
         logger.api_request("POST", "/scada/simulation-with-custom-time", 200)
         
         # Lay du lieu SCADA theo thoi gian tuy chinh
-        scada_result = scada_service.get_multiple_stations_data(
+        scada_result = await run_in_threadpool(
+            scada_service.get_multiple_stations_data,
             station_codes=request.station_codes,
             from_date=request.from_date,
             to_date=request.to_date
@@ -348,7 +356,8 @@ async def run_simulation_with_custom_time(request: SimulationWithCustomTimeReque
         
         # Chay mo phong EPANET với SCADA boundary data
         from services.epanet_service import epanet_service
-        simulation_result = epanet_service.run_simulation(
+        simulation_result = await run_in_threadpool(
+            epanet_service.run_simulation,
             simulation_input,
             scada_boundary_data=scada_boundary_data  # ✅ Truyền SCADA boundary data
         )
@@ -383,7 +392,8 @@ async def test_scada_connection():
         from_date = (now - timedelta(hours=1)).strftime("%Y-%m-%d %H:%M")
         to_date = now.strftime("%Y-%m-%d %H:%M")
         
-        result = scada_service.get_station_data_by_hour(
+        result = await run_in_threadpool(
+            scada_service.get_station_data_by_hour,
             station_code=test_station,
             from_date=from_date,
             to_date=to_date
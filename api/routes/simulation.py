@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
-from typing import Dict, Any
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, Any, Optional
 from datetime import datetime
 
 from models.schemas import (
@@ -7,6 +8,8 @@ from models.schemas import (
     NetworkStatus, ErrorResponse
 )
 from services.epanet_service import epanet_service
+from services.leak_detection_service import leak_detection_service
+from services.node_arrays import NodeArrays
 from core.database import db_manager
 
 router = APIRouter()
@@ -26,8 +29,8 @@ async def run_simulation(
     - **demand_multiplier**: Hệ số nhân nhu cầu
     """
     try:
-        # Chạy mô phỏng
-        result = epanet_service.run_simulation(simulation_input)
+        # Chạy mô phỏng trong thread pool (không chặn event loop)
+        result = await run_in_threadpool(epanet_service.run_simulation, simulation_input)
         
         if result.status == "failed":
             return SimulationResponse(
@@ -48,6 +51,67 @@ async def run_simulation(
             detail=f"Lỗi khi chạy mô phỏng: {str(e)}"
         )
 
+def _simulate_and_detect(simulation_input: SimulationInput, threshold: Optional[float]) -> Dict[str, Any]:
+    """Mô phỏng rồi detect leak trên mảng kết quả WNTR (không qua records của nodes_results)"""
+    captured = {}
+    result = epanet_service.run_simulation(
+        simulation_input,
+        on_results=lambda results, wn: captured.update(arrays=NodeArrays.from_wntr(results))
+    )
+    detection = None
+    if result.status != "failed" and "arrays" in captured:
+        # Cache xac suat theo run_id: doi threshold qua GET /leak-detection/runs/{run_id}/leaks
+        detection = leak_detection_service.detect_leaks_from_arrays(
+            captured["arrays"], threshold, run_key=str(result.run_id) if result.run_id is not None else None
+        )
+    return {
+        "run_id": result.run_id,
+        "status": result.status,
+        "duration": result.duration,
+        "error_message": result.error_message,
+        "leak_detection": detection
+    }
+
+@router.post("/simulate-and-detect")
+async def simulate_and_detect(simulation_input: SimulationInput, threshold: Optional[float] = None):
+    """
+    Chạy mô phỏng EPANET và phát hiện rò rỉ trong một lần gọi
+    
+    Kết quả node của WNTR được đưa thẳng vào feature pipeline dạng mảng; response chỉ
+    chứa kết quả leak detection (kết quả mô phỏng đầy đủ lưu trong database theo run_id).
+    
+    - **threshold**: Optional threshold override (default: use model threshold)
+    """
+    try:
+        if not await run_in_threadpool(leak_detection_service.is_ready):
+            raise HTTPException(
+                status_code=503,
+                detail="Leak detection service not ready - model not loaded"
+            )
+        
+        data = await run_in_threadpool(_simulate_and_detect, simulation_input, threshold)
+        
+        if data["status"] == "failed":
+            return {
+                "success": False,
+                "message": "Mô phỏng thất bại",
+                "data": data
+            }
+        
+        return {
+            "success": True,
+            "message": "Mô phỏng và phát hiện rò rỉ hoàn thành",
+            "data": data
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Lỗi khi mô phỏng và phát hiện rò rỉ: {str(e)}"
+        )
+
 @router.get("/status/{run_id}", response_model=SimulationResponse)
 async def get_simulation_status(run_id: int):
     """
@@ -92,7 +156,7 @@ async def get_network_status():
     Lấy trạng thái tổng quan của mạng lưới
     """
     try:
-        network_info = epanet_service.get_network_info()
+        network_info = await run_in_threadpool(epanet_service.get_network_info)
         
         return NetworkStatus(
             total_nodes=network_info['total_nodes'],
@@ -0,0 +1,111 @@
+"""
+Async data access layer for route handlers
+
+SQLite has no async driver in this stack, so every call still runs on a thread; what
+matters is that it does not run on the event loop thread. AsyncDatabaseManager wraps a
+DatabaseManager and submits each operation to a dedicated, bounded ThreadPoolExecutor:
+
+    - the event loop only awaits a future, so other requests keep being served while
+      SQLite is busy (disk I/O, busy_timeout waits on the write lock, large history reads);
+    - each worker thread keeps its own persistent connection from DatabaseManager, so the
+      pool size is also the number of open SQLite connections;
+    - the pool is separate from the default executor (asyncio.to_thread / Starlette's
+      threadpool), so slow database work cannot starve other offloaded work and vice versa.
+
+Import cost is the same as core.database (no WNTR/model imports), so both main.py and
+leak_detection_api.py can use it.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.config import settings
+from core.database import DatabaseManager, db_manager
+
+
+class AsyncDatabaseManager:
+    """
+    Awaitable counterpart of DatabaseManager (same operations, same return values).
+
+    Args:
+        manager: Underlying synchronous DatabaseManager
+        max_workers: Worker threads (= concurrent SQLite connections)
+    """
+
+    def __init__(self, manager: DatabaseManager, max_workers: int = 4):
+        self.manager = manager
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Created lazily so the manager can be reused after close() (app restarted in tests)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="sqlite"
+                )
+            return self._executor
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking callable on the database pool and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), functools.partial(func, *args, **kwargs)
+        )
+
+    async def init_database(self):
+        await self.run(self.manager.init_database)
+
+    async def save_simulation_run(self, status: str, input_data: Dict[str, Any] = None,
+                                  results: Dict[str, Any] = None, error_message: str = None) -> int:
+        return await self.run(self.manager.save_simulation_run, status, input_data, results, error_message)
+
+    async def update_simulation_run(self, run_id: int, status: str, results: Dict[str, Any] = None,
+                                    error_message: str = None) -> bool:
+        return await self.run(self.manager.update_simulation_run, run_id, status, results, error_message)
+
+    async def get_simulation_run(self, run_id: int) -> Optional[Dict[str, Any]]:
+        return await self.run(self.manager.get_simulation_run, run_id)
+
+    async def save_real_time_data(self, node_id: str, pressure: float = None,
+                                  flow: float = None, demand: float = None):
+        await self.run(self.manager.save_real_time_data, node_id, pressure, flow, demand)
+
+    async def save_real_time_data_batch(
+        self,
+        rows: Iterable[Tuple[str, Optional[float], Optional[float], Optional[float], Optional[str]]]
+    ) -> int:
+        # Materialize here: a generator must not be consumed on another thread
+        return await self.run(self.manager.save_real_time_data_batch, list(rows))
+
+    async def get_latest_real_time_data(self, node_id: str = None) -> List[Dict[str, Any]]:
+        return await self.run(self.manager.get_latest_real_time_data, node_id)
+
+    async def get_real_time_history(self, node_id: str, start: Optional[datetime] = None,
+                                    end: Optional[datetime] = None, resolution: str = "auto",
+                                    limit: int = 100) -> Dict[str, Any]:
+        return await self.run(
+            self.manager.get_real_time_history, node_id,
+            start=start, end=end, resolution=resolution, limit=limit
+        )
+
+    async def prune_real_time_data(self, chunk_size: int = 5000) -> Dict[str, int]:
+        return await self.run(self.manager.prune_real_time_data, chunk_size)
+
+    async def close(self):
+        """Wait for queued operations, stop the pool and close the pooled connections"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(executor.shutdown, wait=True)
+            )
+        self.manager.close()
+
+
+# Global async instance (shares connections/settings with db_manager)
+async_db_manager = AsyncDatabaseManager(db_manager, max_workers=settings.sqlite_async_workers)
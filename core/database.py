@@ -1,126 +1,491 @@
 import sqlite3
 import os
-from datetime import datetime
-from typing import Dict, Any, List
-import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Iterable, Optional, Tuple
+
+from core.config import settings
+from core.payload_codec import encode_payload, decode_payload
+
+# Rollup tables -> strftime bucket format
+ROLLUP_BUCKETS = {
+    "real_time_rollup_hourly": "%Y-%m-%d %H:00:00",
+    "real_time_rollup_daily": "%Y-%m-%d",
+}
+ROLLUP_METRICS = ("pressure", "flow", "demand")
+
+# History auto-resolution thresholds (days)
+HISTORY_RAW_MAX_DAYS = 2
+HISTORY_HOURLY_MAX_DAYS = 60
+
+
+def to_naive_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    """Stored timestamps are naive UTC: convert aware datetimes, keep naive ones as UTC"""
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
 
 class DatabaseManager:
+    """
+    SQLite data access.
+
+    Connections are persistent and per-thread (sqlite3 connections must not be shared
+    between threads mid-transaction), opened lazily on first use and tuned once:
+    WAL journal so readers do not block the writer, synchronous=NORMAL (durable at
+    checkpoint, safe against application crashes), a larger page cache and a busy
+    timeout instead of immediate "database is locked" errors. Python's sqlite3 keeps
+    a per-connection prepared statement cache, which only pays off because the
+    connection now outlives a single call.
+    """
+
     def __init__(self, db_path: str = "epanet_data.db"):
         self.db_path = db_path
+        self._local = threading.local()
+        self._connections: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
         self.init_database()
-    
+
+    def _open_connection(self) -> sqlite3.Connection:
+        """Open and tune a new connection"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=settings.sqlite_busy_timeout_ms / 1000.0,
+            cached_statements=settings.sqlite_cached_statements,
+            check_same_thread=False  # only so close() can run from the shutdown thread
+        )
+        conn.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+        conn.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        conn.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kb)}")
+        conn.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use"""
+        if os.getpid() != self._pid:
+            # Forked child: connections inherited from the parent must not be used
+            self._local = threading.local()
+            self._connections = {}
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            current = threading.current_thread()
+            with self._lock:
+                # Close connections of threads that have exited (e.g. recycled pool workers)
+                for ident, (thread, stale) in list(self._connections.items()):
+                    if not thread.is_alive():
+                        stale.close()
+                        del self._connections[ident]
+                self._connections[current.ident] = (current, conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Per-thread connection wrapped in a transaction.
+
+        Commits on success, rolls back on error. The connection stays open for reuse.
+        """
+        conn = self._get_connection()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def close(self):
+        """Close every connection opened by this manager (call at shutdown)"""
+        with self._lock:
+            for _, conn in self._connections.values():
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
     def init_database(self):
         """Initialize database with required tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create tables
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS simulation_runs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                status TEXT NOT NULL,
-                input_data TEXT,
-                results TEXT,
-                error_message TEXT
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS real_time_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                node_id TEXT NOT NULL,
-                pressure REAL,
-                flow REAL,
-                demand REAL
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS simulation_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                run_id INTEGER,
-                node_id TEXT,
-                time_step INTEGER,
-                pressure REAL,
-                flow REAL,
-                head REAL,
-                FOREIGN KEY (run_id) REFERENCES simulation_runs (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
-    def save_simulation_run(self, status: str, input_data: Dict[str, Any] = None, 
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            # Create tables
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS simulation_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    status TEXT NOT NULL,
+                    input_data TEXT,
+                    results TEXT,
+                    error_message TEXT
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS real_time_data (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    node_id TEXT NOT NULL,
+                    pressure REAL,
+                    flow REAL,
+                    demand REAL
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS simulation_results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id INTEGER,
+                    node_id TEXT,
+                    time_step INTEGER,
+                    pressure REAL,
+                    flow REAL,
+                    head REAL,
+                    FOREIGN KEY (run_id) REFERENCES simulation_runs (id)
+                )
+            ''')
+
+            # Indexes: latest/history per node and time-range scans / retention pruning
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_real_time_data_node_ts
+                ON real_time_data (node_id, timestamp)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_real_time_data_ts
+                ON real_time_data (timestamp)
+            ''')
+
+            # Downsampled rollups (min/max/sum/count per metric), maintained incrementally
+            for table in ROLLUP_BUCKETS:
+                metric_cols = ",\n".join(
+                    f"{m}_min REAL, {m}_max REAL, {m}_sum REAL, {m}_count INTEGER NOT NULL DEFAULT 0"
+                    for m in ROLLUP_METRICS
+                )
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        node_id TEXT NOT NULL,
+                        bucket TEXT NOT NULL,
+                        {metric_cols},
+                        PRIMARY KEY (node_id, bucket)
+                    ) WITHOUT ROWID
+                ''')
+
+            # Watermark: real_time_data ids <= last_id are already in the rollups
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS rollup_state (
+                    name TEXT PRIMARY KEY,
+                    last_id INTEGER NOT NULL
+                )
+            ''')
+
+            # Backfill rollups for rows written before rollups existed
+            self._refresh_rollups(conn)
+
+    def _refresh_rollups(self, conn: sqlite3.Connection):
+        """
+        Fold raw rows newer than the watermark into the hourly/daily rollups.
+
+        Runs inside the caller's transaction, so rollups commit together with the raw
+        rows that produced them. Only rows with id > watermark are grouped, so the
+        cost is proportional to the new rows, not to the table size.
+        """
+        row = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'real_time_data'").fetchone()
+        last_id = row[0] if row else 0
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM real_time_data").fetchone()[0]
+        if max_id <= last_id:
+            return
+
+        select_cols = ", ".join(
+            f"MIN({m}), MAX({m}), SUM({m}), COUNT({m})" for m in ROLLUP_METRICS
+        )
+        insert_cols = ", ".join(
+            f"{m}_min, {m}_max, {m}_sum, {m}_count" for m in ROLLUP_METRICS
+        )
+        # SQLite multi-argument MIN/MAX return NULL if any argument is NULL -> COALESCE both sides
+        update_cols = ",\n".join(
+            f"{m}_min = MIN(COALESCE({m}_min, excluded.{m}_min), COALESCE(excluded.{m}_min, {m}_min)), "
+            f"{m}_max = MAX(COALESCE({m}_max, excluded.{m}_max), COALESCE(excluded.{m}_max, {m}_max)), "
+            f"{m}_sum = COALESCE({m}_sum, 0) + COALESCE(excluded.{m}_sum, 0), "
+            f"{m}_count = {m}_count + excluded.{m}_count"
+            for m in ROLLUP_METRICS
+        )
+        for table, bucket_format in ROLLUP_BUCKETS.items():
+            conn.execute(f'''
+                INSERT INTO {table} (node_id, bucket, {insert_cols})
+                SELECT node_id, strftime('{bucket_format}', timestamp) AS bucket, {select_cols}
+                FROM real_time_data
+                WHERE id > ? AND id <= ? AND strftime('{bucket_format}', timestamp) IS NOT NULL
+                GROUP BY node_id, bucket
+                ON CONFLICT (node_id, bucket) DO UPDATE SET
+                {update_cols}
+            ''', (last_id, max_id))
+
+        conn.execute('''
+            INSERT INTO rollup_state (name, last_id) VALUES ('real_time_data', ?)
+            ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id
+        ''', (max_id,))
+
+    def prune_real_time_data(self, chunk_size: int = 5000) -> Dict[str, int]:
+        """
+        Apply retention: delete raw rows and rollup buckets older than the configured windows.
+
+        Rollups are refreshed first, so pruned raw rows are already aggregated. Raw rows
+        are deleted in chunks to keep each write transaction (and the lock) short.
+        A retention of 0 days keeps data forever.
+        """
+        deleted = {"raw": 0, "hourly": 0, "daily": 0}
+        with self.connection() as conn:
+            self._refresh_rollups(conn)
+
+        if settings.realtime_raw_retention_days > 0:
+            cutoff = f"-{int(settings.realtime_raw_retention_days)} days"
+            while True:
+                with self.connection() as conn:
+                    cursor = conn.execute('''
+                        DELETE FROM real_time_data WHERE id IN (
+                            SELECT id FROM real_time_data
+                            WHERE timestamp < datetime('now', ?)
+                            LIMIT ?
+                        )
+                    ''', (cutoff, chunk_size))
+                deleted["raw"] += cursor.rowcount
+                if cursor.rowcount < chunk_size:
+                    break
+
+        for key, table, days in [
+            ("hourly", "real_time_rollup_hourly", settings.realtime_hourly_retention_days),
+            ("daily", "real_time_rollup_daily", settings.realtime_daily_retention_days),
+        ]:
+            if days > 0:
+                with self.connection() as conn:
+                    cursor = conn.execute(
+                        f"DELETE FROM {table} WHERE bucket < strftime(?, 'now', ?)",
+                        (ROLLUP_BUCKETS[table], f"-{int(days)} days")
+                    )
+                deleted[key] = cursor.rowcount
+
+        return deleted
+
+    def save_simulation_run(self, status: str, input_data: Dict[str, Any] = None,
                           results: Dict[str, Any] = None, error_message: str = None) -> int:
-        """Save simulation run to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Convert datetime objects and Pydantic models to strings for JSON serialization
-        def json_serial(obj):
-            if isinstance(obj, datetime):
-                return obj.isoformat()
-            elif hasattr(obj, 'dict'):  # Pydantic models
-                return obj.dict()
-            elif hasattr(obj, '__dict__'):  # Objects with __dict__
-                return obj.__dict__
-            raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
-        
-        cursor.execute('''
-            INSERT INTO simulation_runs (status, input_data, results, error_message)
-            VALUES (?, ?, ?, ?)
-        ''', (status, json.dumps(input_data, default=json_serial) if input_data else None,
-              json.dumps(results, default=json_serial) if results else None, error_message))
-        
-        run_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return run_id
-    
-    def save_real_time_data(self, node_id: str, pressure: float = None, 
+        """Save simulation run to database (payloads encoded by core/payload_codec.py)"""
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                INSERT INTO simulation_runs (status, input_data, results, error_message)
+                VALUES (?, ?, ?, ?)
+            ''', (status, encode_payload(input_data) if input_data else None,
+                  encode_payload(results) if results else None, error_message))
+            return cursor.lastrowid
+
+    def update_simulation_run(self, run_id: int, status: str, results: Dict[str, Any] = None,
+                              error_message: str = None) -> bool:
+        """Update status (and results/error) of an existing run; False if run_id does not exist"""
+        with self.connection() as conn:
+            cursor = conn.execute('''
+                UPDATE simulation_runs
+                SET status = ?, results = COALESCE(?, results), error_message = COALESCE(?, error_message)
+                WHERE id = ?
+            ''', (status, encode_payload(results) if results else None, error_message, run_id))
+            return cursor.rowcount > 0
+
+    def list_simulation_runs(self, status: Optional[str] = None, start: Optional[datetime] = None,
+                             end: Optional[datetime] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Runs (id, timestamp, status - without payloads), oldest first, optionally filtered"""
+        query = "SELECT id, timestamp, status FROM simulation_runs WHERE 1 = 1"
+        params: List[Any] = []
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        if start is not None:
+            query += " AND timestamp >= ?"
+            params.append(start.strftime("%Y-%m-%d %H:%M:%S"))
+        if end is not None:
+            query += " AND timestamp < ?"
+            params.append(end.strftime("%Y-%m-%d %H:%M:%S"))
+        query += " ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with self.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [{"id": row[0], "timestamp": row[1], "status": row[2]} for row in rows]
+
+    def get_simulation_run(self, run_id: int) -> Optional[Dict[str, Any]]:
+        """Get one simulation run with input_data/results decoded (binary or legacy JSON rows)"""
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT id, timestamp, status, input_data, results, error_message
+                FROM simulation_runs WHERE id = ?
+            ''', (run_id,)).fetchone()
+
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "timestamp": row[1],
+            "status": row[2],
+            "input_data": decode_payload(row[3]),
+            "results": decode_payload(row[4]),
+            "error_message": row[5]
+        }
+
+    def save_real_time_data(self, node_id: str, pressure: float = None,
                           flow: float = None, demand: float = None):
         """Save real-time sensor data"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO real_time_data (node_id, pressure, flow, demand)
-            VALUES (?, ?, ?, ?)
-        ''', (node_id, pressure, flow, demand))
-        
-        conn.commit()
-        conn.close()
-    
+        with self.connection() as conn:
+            conn.execute('''
+                INSERT INTO real_time_data (node_id, pressure, flow, demand)
+                VALUES (?, ?, ?, ?)
+            ''', (node_id, pressure, flow, demand))
+            self._refresh_rollups(conn)
+
+    def save_real_time_data_batch(
+        self,
+        rows: Iterable[Tuple[str, Optional[float], Optional[float], Optional[float], Optional[str]]]
+    ) -> int:
+        """
+        Save many real-time rows in a single transaction (executemany).
+
+        Each row is (node_id, pressure, flow, demand, timestamp). A None timestamp
+        falls back to CURRENT_TIMESTAMP, same as save_real_time_data. Either all rows
+        are committed or none (the transaction rolls back on error).
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+        with self.connection() as conn:
+            conn.executemany('''
+                INSERT INTO real_time_data (node_id, pressure, flow, demand, timestamp)
+                VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ''', rows)
+            self._refresh_rollups(conn)
+        return len(rows)
+
     def get_latest_real_time_data(self, node_id: str = None) -> List[Dict[str, Any]]:
         """Get latest real-time data for a specific node or all nodes"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        if node_id:
-            cursor.execute('''
-                SELECT * FROM real_time_data 
-                WHERE node_id = ? 
-                ORDER BY timestamp DESC 
-                LIMIT 1
-            ''', (node_id,))
-        else:
-            cursor.execute('''
-                SELECT * FROM real_time_data 
-                ORDER BY timestamp DESC 
-                LIMIT 100
-            ''')
-        
-        results = cursor.fetchall()
-        conn.close()
-        
+        with self.connection() as conn:
+            if node_id:
+                cursor = conn.execute('''
+                    SELECT * FROM real_time_data
+                    WHERE node_id = ?
+                    ORDER BY timestamp DESC
+                    LIMIT 1
+                ''', (node_id,))
+            else:
+                cursor = conn.execute('''
+                    SELECT * FROM real_time_data
+                    ORDER BY timestamp DESC
+                    LIMIT 100
+                ''')
+
+            results = cursor.fetchall()
+
         return [dict(zip([col[0] for col in cursor.description], row)) for row in results]
 
+    def resolve_history_resolution(self, start: Optional[datetime], end: Optional[datetime],
+                                   resolution: str = "auto") -> str:
+        """
+        Pick raw/hourly/daily for a history query.
+
+        auto: raw for short ranges (or no range), hourly up to HISTORY_HOURLY_MAX_DAYS,
+        daily beyond; never raw for ranges reaching past raw-data retention.
+        Aware ``start``/``end`` are converted to UTC; naive ones are taken as UTC.
+        """
+        start, end = to_naive_utc(start), to_naive_utc(end)
+        if resolution != "auto":
+            if resolution not in ("raw", "hourly", "daily"):
+                raise ValueError(f"Unknown resolution '{resolution}' - expected raw, hourly, daily or auto")
+            return resolution
+        if start is None:
+            return "raw"
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        end = end or now
+        span_days = (end - start).total_seconds() / 86400.0
+        if span_days > HISTORY_HOURLY_MAX_DAYS:
+            return "daily"
+        retention = settings.realtime_raw_retention_days
+        if span_days > HISTORY_RAW_MAX_DAYS or (
+            retention > 0 and start < now - timedelta(days=retention)
+        ):
+            return "hourly"
+        return "raw"
+
+    def get_real_time_history(self, node_id: str, start: Optional[datetime] = None,
+                              end: Optional[datetime] = None, resolution: str = "auto",
+                              limit: int = 100) -> Dict[str, Any]:
+        """
+        History for one node, newest first.
+
+        Timestamps are UTC (same as CURRENT_TIMESTAMP). Rollup rows carry min/max/mean/count
+        per metric; long ranges read rollups so the cost does not grow with raw row count.
+        """
+        start, end = to_naive_utc(start), to_naive_utc(end)
+        resolution = self.resolve_history_resolution(start, end, resolution)
+        params: List[Any] = [node_id]
+        where = "node_id = ?"
+
+        if resolution == "raw":
+            if start is not None:
+                where += " AND timestamp >= ?"
+                params.append(start.strftime("%Y-%m-%d %H:%M:%S"))
+            if end is not None:
+                where += " AND timestamp <= ?"
+                params.append(end.strftime("%Y-%m-%d %H:%M:%S"))
+            sql = f'''
+                SELECT id, timestamp, node_id, pressure, flow, demand
+                FROM real_time_data
+                WHERE {where}
+                ORDER BY timestamp DESC
+                LIMIT ?
+            '''
+        else:
+            table = f"real_time_rollup_{resolution}"
+            bucket_format = ROLLUP_BUCKETS[table]
+            if start is not None:
+                where += " AND bucket >= ?"
+                params.append(start.strftime(bucket_format))
+            if end is not None:
+                where += " AND bucket <= ?"
+                params.append(end.strftime(bucket_format))
+            metric_cols = ", ".join(
+                f"{m}_min, {m}_max, "
+                f"CASE WHEN {m}_count > 0 THEN {m}_sum / {m}_count END AS {m}_mean, {m}_count"
+                for m in ROLLUP_METRICS
+            )
+            sql = f'''
+                SELECT bucket AS timestamp, node_id, {metric_cols}
+                FROM {table}
+                WHERE {where}
+                ORDER BY bucket DESC
+                LIMIT ?
+            '''
+        params.append(limit)
+
+        with self.connection() as conn:
+            cursor = conn.execute(sql, params)
+            rows = cursor.fetchall()
+
+        columns = [col[0] for col in cursor.description]
+        return {
+            "resolution": resolution,
+            "data": [dict(zip(columns, row)) for row in rows]
+        }
+
 # Global database instance
 db_manager = DatabaseManager()
 
 def init_db():
     """Initialize database"""
     db_manager.init_database()
+
+def close_db():
+    """Close pooled database connections"""
+    db_manager.close()
@@ -0,0 +1,214 @@
+"""
+Real-time sensor ingestion: batched writes and an optional write-behind queue
+
+Two paths, selected by ``settings.realtime_write_behind``:
+
+Synchronous batch (default)
+    Each request is written with one ``executemany`` in a single transaction before
+    the response is returned. A successful response means the rows are committed.
+    With WAL + synchronous=NORMAL they survive an application crash; a power loss
+    or OS crash can lose the last few transactions that were not yet checkpointed.
+    A request is all-or-nothing: if one row fails the whole request is rolled back.
+
+Write-behind queue
+    Rows are stamped (UTC, same format as SQLite CURRENT_TIMESTAMP) when they are
+    accepted and appended to an in-memory queue. A background thread writes them in
+    batches when ``realtime_flush_rows`` rows are pending or every
+    ``realtime_flush_interval_ms``, whichever comes first. A successful response
+    only means the rows were accepted:
+        - rows still in the queue are lost if the process is killed (at most
+          roughly one flush interval's worth of rows under steady load);
+        - graceful shutdown (``stop()``, called from the app lifespan) drains the queue;
+        - a failed batch is retried, then dropped and counted in ``stats()["dropped"]``;
+        - when the queue holds ``realtime_queue_max_rows`` rows, new requests are
+          rejected with ``IngestionBacklogFull`` instead of growing memory unbounded.
+"""
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import settings
+from core.async_database import async_db_manager
+from core.database import DatabaseManager, db_manager
+from utils.logger import logger
+
+RealTimeRow = Tuple[str, Optional[float], Optional[float], Optional[float], Optional[str]]
+
+
+class IngestionBacklogFull(Exception):
+    """Raised when the write-behind queue is full"""
+
+
+def utc_timestamp() -> str:
+    """Current UTC time in SQLite CURRENT_TIMESTAMP format"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class WriteBehindQueue:
+    """
+    Background batch writer for real_time_data.
+
+    Args:
+        manager: DatabaseManager used for flushing
+        flush_rows: Flush as soon as this many rows are pending
+        flush_interval_ms: Maximum time a row waits before being flushed
+        max_pending_rows: Reject new rows beyond this backlog
+        max_retries: Attempts per batch before it is dropped
+    """
+
+    def __init__(
+        self,
+        manager: DatabaseManager,
+        flush_rows: int = 500,
+        flush_interval_ms: int = 200,
+        max_pending_rows: int = 100000,
+        max_retries: int = 3
+    ):
+        self.manager = manager
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = max(1, flush_interval_ms) / 1000.0
+        self.max_pending_rows = max_pending_rows
+        self.max_retries = max_retries
+
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._stats = {"accepted": 0, "written": 0, "batches": 0, "dropped": 0, "rejected": 0}
+
+    def start(self):
+        """Start the background flush thread"""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="realtime-write-behind", daemon=True)
+            self._thread.start()
+        logger.info(f"Write-behind ingestion started (flush {self.flush_rows} rows / {self.flush_interval * 1000:.0f} ms)")
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the thread and drain everything still queued"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self.flush()
+        logger.info(f"Write-behind ingestion stopped: {self.stats()}")
+
+    def enqueue(self, rows: List[RealTimeRow]) -> int:
+        """
+        Accept rows for asynchronous writing.
+
+        Rows without a timestamp are stamped now, so the stored time is the arrival
+        time rather than the flush time.
+        """
+        if not rows:
+            return 0
+        # Checked here: a NOT NULL failure at flush time would take the whole batch with it
+        if any(row[0] is None for row in rows):
+            raise ValueError("node_id is required for real-time data")
+        now = utc_timestamp()
+        stamped = [row if row[4] is not None else (row[0], row[1], row[2], row[3], now) for row in rows]
+
+        with self._cond:
+            if len(self._pending) + len(stamped) > self.max_pending_rows:
+                self._stats["rejected"] += len(stamped)
+                raise IngestionBacklogFull(
+                    f"Write-behind backlog full ({len(self._pending)} rows pending)"
+                )
+            self._pending.extend(stamped)
+            self._stats["accepted"] += len(stamped)
+            if len(self._pending) >= self.flush_rows:
+                self._cond.notify()
+        return len(stamped)
+
+    def _take_batch(self) -> List[RealTimeRow]:
+        with self._cond:
+            n = min(len(self._pending), self.flush_rows)
+            return [self._pending.popleft() for _ in range(n)]
+
+    def _write(self, batch: List[RealTimeRow]):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self.manager.save_real_time_data_batch(batch)
+                with self._cond:
+                    self._stats["written"] += len(batch)
+                    self._stats["batches"] += 1
+                return
+            except Exception as e:
+                logger.warning(f"Write-behind batch failed (attempt {attempt}/{self.max_retries}): {e}")
+                time.sleep(0.05 * attempt)
+        with self._cond:
+            self._stats["dropped"] += len(batch)
+        logger.error(f"Dropped {len(batch)} real-time rows after {self.max_retries} failed attempts")
+
+    def flush(self) -> int:
+        """Write everything currently queued (blocking). Returns rows written or dropped"""
+        total = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return total
+                self._write(batch)
+                total += len(batch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._pending) < self.flush_rows:
+                    self._cond.wait(timeout=self.flush_interval)
+                if self._stopping:
+                    return
+            self.flush()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self._stats, "pending": len(self._pending)}
+
+
+# Global write-behind instance (only started when settings.realtime_write_behind is on)
+realtime_write_behind = WriteBehindQueue(
+    db_manager,
+    flush_rows=settings.realtime_flush_rows,
+    flush_interval_ms=settings.realtime_flush_interval_ms,
+    max_pending_rows=settings.realtime_queue_max_rows
+)
+
+
+def ingest_real_time_rows(rows: List[RealTimeRow]) -> int:
+    """Write rows through the configured path (write-behind queue or one transaction)"""
+    if settings.realtime_write_behind:
+        return realtime_write_behind.enqueue(rows)
+    return db_manager.save_real_time_data_batch(rows)
+
+
+async def ingest_real_time_rows_async(rows: List[RealTimeRow]) -> int:
+    """
+    Same as ingest_real_time_rows for async route handlers.
+
+    Enqueueing is in-memory and stays on the event loop; the synchronous batch path
+    runs on the async database pool instead of blocking the loop.
+    """
+    if settings.realtime_write_behind:
+        return realtime_write_behind.enqueue(rows)
+    return await async_db_manager.save_real_time_data_batch(rows)
+
+
+def start_ingestion():
+    if settings.realtime_write_behind:
+        realtime_write_behind.start()
+
+
+def stop_ingestion():
+    if settings.realtime_write_behind:
+        realtime_write_behind.stop()
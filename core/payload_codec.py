@@ -0,0 +1,292 @@
+"""
+Storage codec for simulation_runs.input_data / results
+
+Legacy rows hold ``json.dumps`` text. New rows hold a BLOB:
+
+    b"EPC" | format version (u8) | serializer id (u8) | compressor id (u8) | compressed body
+    body = skeleton length (u32) | skeleton | float64 column buffer
+
+    - columnar: a list of >= 2 dicts sharing the same keys (time series records such as
+      ``results["nodes"][node_id]``) is stored once as key list + one array per key, so
+      keys are not repeated for every time step;
+    - float columns go to the column buffer as little-endian float64, byte-shuffled
+      (all first bytes, then all second bytes, ...) so exponents/high mantissa bytes sit
+      together and compress; no float <-> text conversion either way;
+    - skeleton (everything else): msgpack when installed, otherwise compact JSON;
+    - compressor: zstd or lz4 when installed, otherwise zlib (stdlib).
+
+The header records what was used, so rows stay readable whatever is installed later
+(as long as the decompressor exists). ``decode_payload`` accepts both formats and returns
+the same Python structure ``json.loads`` gives for the legacy text: datetimes / pydantic
+models are converted with the same ``json_serial`` rules and dict keys become strings.
+"""
+import json
+import struct
+import zlib
+from datetime import datetime
+from typing import Any, List, Optional, Union
+
+import numpy as np
+
+from core.config import settings
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+MAGIC = b"EPC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<3sBBB")
+SKELETON_LENGTH = struct.Struct("<I")
+
+SERIALIZER_JSON = 1
+SERIALIZER_MSGPACK = 2
+
+COMPRESSOR_NONE = 0
+COMPRESSOR_ZLIB = 1
+COMPRESSOR_ZSTD = 2
+COMPRESSOR_LZ4 = 3
+
+COMPRESSOR_NAMES = {"none": COMPRESSOR_NONE, "zlib": COMPRESSOR_ZLIB,
+                    "zstd": COMPRESSOR_ZSTD, "lz4": COMPRESSOR_LZ4}
+DEFAULT_LEVELS = {COMPRESSOR_ZLIB: 1, COMPRESSOR_ZSTD: 3, COMPRESSOR_LZ4: 0}
+
+# Columnar block: {COLUMNAR_KEY: [keys, n_rows], COLUMNAR_DATA: [column, ...]}
+# column = list of values, or int = offset (in float64 items) into the column buffer.
+# keys None marks an escaped user dict that happens to use these two keys.
+COLUMNAR_KEY = "__columnar__"
+COLUMNAR_DATA = "__data__"
+
+_SCALARS = (str, int, float, bool, type(None))
+_FLOAT64 = np.dtype("<f8")
+
+
+class PayloadCodecError(ValueError):
+    """Stored payload cannot be decoded (unknown version or missing codec)"""
+
+
+def json_serial(obj):
+    """Fallback for non-JSON types (same rules as the original save_simulation_run)"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    elif hasattr(obj, 'dict'):  # Pydantic models
+        return obj.dict()
+    elif hasattr(obj, '__dict__'):  # Objects with __dict__
+        return obj.__dict__
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+def _json_key(key) -> str:
+    # json.dumps key conversion: str kept, True -> "true", None -> "null", 1.5 -> "1.5"
+    return key if isinstance(key, str) else json.dumps(key)
+
+
+def _is_columnar(obj: dict) -> bool:
+    return len(obj) == 2 and COLUMNAR_KEY in obj and COLUMNAR_DATA in obj
+
+
+class _Encoder:
+    """Reduce a payload to a msgpack/JSON-safe skeleton plus float64 columns"""
+
+    def __init__(self):
+        self.float_columns: List[np.ndarray] = []
+        self.float_items = 0
+
+    def plain(self, obj) -> Any:
+        if type(obj) in _SCALARS:
+            return obj
+        if isinstance(obj, dict):
+            if _is_columnar(obj):
+                return {COLUMNAR_KEY: None, COLUMNAR_DATA: {k: self.plain(v) for k, v in obj.items()}}
+            return {_json_key(k): self.plain(v) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return self.plain_list(obj)
+        if isinstance(obj, bool):
+            return bool(obj)
+        if isinstance(obj, float):  # numpy.float64 and other float subclasses
+            return float(obj)
+        if isinstance(obj, int):
+            return int(obj)
+        if isinstance(obj, str):
+            return str(obj)
+        return self.plain(json_serial(obj))
+
+    def plain_list(self, items) -> Any:
+        if len(items) >= 2 and all(type(item) is dict for item in items):
+            keys = list(items[0])
+            if keys and all(isinstance(k, str) for k in keys) and all(
+                len(item) == len(keys) and list(item) == keys for item in items
+            ):
+                return {COLUMNAR_KEY: [keys, len(items)],
+                        COLUMNAR_DATA: [self.column([item[k] for item in items]) for k in keys]}
+        return [self.plain(v) for v in items]
+
+    def column(self, values: list) -> Any:
+        if all(isinstance(v, float) for v in values):
+            offset = self.float_items
+            self.float_columns.append(np.asarray(values, dtype=_FLOAT64))
+            self.float_items += len(values)
+            return offset
+        if all(type(v) in _SCALARS for v in values):
+            return values
+        return [self.plain(v) for v in values]
+
+    def float_buffer(self) -> bytes:
+        if not self.float_columns:
+            return b""
+        data = np.concatenate(self.float_columns)
+        # Byte shuffle: (n, 8) -> (8, n)
+        return data.view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def _unshuffle(buffer: bytes) -> np.ndarray:
+    if not buffer:
+        return np.empty(0, dtype=_FLOAT64)
+    if len(buffer) % 8:
+        raise PayloadCodecError("Corrupt float column buffer")
+    shuffled = np.frombuffer(buffer, dtype=np.uint8).reshape(8, -1)
+    return np.ascontiguousarray(shuffled.T).view(_FLOAT64).reshape(-1)
+
+
+def _restore(obj, floats: np.ndarray) -> Any:
+    """Inverse of _Encoder.plain: expand columnar blocks back into lists of dicts"""
+    if isinstance(obj, dict):
+        if _is_columnar(obj):
+            meta = obj[COLUMNAR_KEY]
+            if meta is None:
+                return {k: _restore(v, floats) for k, v in obj[COLUMNAR_DATA].items()}
+            keys, n_rows = meta
+            columns = []
+            for col in obj[COLUMNAR_DATA]:
+                if isinstance(col, int):
+                    columns.append(floats[col:col + n_rows].tolist())
+                elif all(type(v) in _SCALARS for v in col):
+                    columns.append(col)
+                else:
+                    columns.append([_restore(v, floats) for v in col])
+            return [dict(zip(keys, row)) for row in zip(*columns)]
+        return {k: _restore(v, floats) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_restore(v, floats) for v in obj]
+    return obj
+
+
+def _resolve_compressor(name: str) -> int:
+    if name == "auto":
+        if zstandard is not None:
+            return COMPRESSOR_ZSTD
+        if lz4_frame is not None:
+            return COMPRESSOR_LZ4
+        return COMPRESSOR_ZLIB
+    if name not in COMPRESSOR_NAMES:
+        raise ValueError(f"Unknown payload compression '{name}' - expected auto, zstd, lz4, zlib or none")
+    compressor = COMPRESSOR_NAMES[name]
+    if compressor == COMPRESSOR_ZSTD and zstandard is None:
+        raise ValueError("payload compression 'zstd' requires the zstandard package")
+    if compressor == COMPRESSOR_LZ4 and lz4_frame is None:
+        raise ValueError("payload compression 'lz4' requires the lz4 package")
+    return compressor
+
+
+def _compress(data: bytes, compressor: int, level: Optional[int]) -> bytes:
+    level = DEFAULT_LEVELS.get(compressor) if level is None else level
+    if compressor == COMPRESSOR_ZSTD:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if compressor == COMPRESSOR_LZ4:
+        return lz4_frame.compress(data, compression_level=level)
+    if compressor == COMPRESSOR_ZLIB:
+        return zlib.compress(data, level)
+    return data
+
+
+def _decompress(data: bytes, compressor: int) -> bytes:
+    if compressor == COMPRESSOR_ZSTD:
+        if zstandard is None:
+            raise PayloadCodecError("Payload is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if compressor == COMPRESSOR_LZ4:
+        if lz4_frame is None:
+            raise PayloadCodecError("Payload is lz4-compressed but lz4 is not installed")
+        return lz4_frame.decompress(data)
+    if compressor == COMPRESSOR_ZLIB:
+        return zlib.decompress(data)
+    if compressor == COMPRESSOR_NONE:
+        return data
+    raise PayloadCodecError(f"Unknown payload compressor id {compressor}")
+
+
+def encode_payload(payload: Any, fmt: Optional[str] = None, compression: Optional[str] = None,
+                   level: Optional[int] = None) -> Union[bytes, str]:
+    """
+    Encode a payload for storage.
+
+    Args:
+        payload: JSON-like structure (datetimes / pydantic models allowed)
+        fmt: "binary" or "json" (legacy text); default settings.simulation_payload_format
+        compression: auto | zstd | lz4 | zlib | none; default settings.simulation_payload_compression
+        level: Compression level (None = settings, then per-compressor default)
+    """
+    fmt = fmt or settings.simulation_payload_format
+    if fmt == "json":
+        return json.dumps(payload, default=json_serial)
+    if fmt != "binary":
+        raise ValueError(f"Unknown payload format '{fmt}' - expected binary or json")
+
+    compressor = _resolve_compressor(compression or settings.simulation_payload_compression)
+    if level is None:
+        level = settings.simulation_payload_compression_level
+
+    encoder = _Encoder()
+    skeleton = encoder.plain(payload)
+    if msgpack is not None:
+        serializer = SERIALIZER_MSGPACK
+        skeleton_bytes = msgpack.packb(skeleton, use_bin_type=True)
+    else:
+        serializer = SERIALIZER_JSON
+        skeleton_bytes = json.dumps(skeleton, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    body = SKELETON_LENGTH.pack(len(skeleton_bytes)) + skeleton_bytes + encoder.float_buffer()
+    return HEADER.pack(MAGIC, FORMAT_VERSION, serializer, compressor) + _compress(body, compressor, level)
+
+
+def decode_payload(value: Union[bytes, memoryview, str, None]) -> Any:
+    """Decode a stored payload (binary codec or legacy JSON text). None stays None"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+    value = bytes(value)
+    if not value.startswith(MAGIC):
+        return json.loads(value.decode("utf-8"))
+    if len(value) < HEADER.size:
+        raise PayloadCodecError("Truncated payload header")
+
+    _, version, serializer, compressor = HEADER.unpack_from(value)
+    if version > FORMAT_VERSION:
+        raise PayloadCodecError(f"Payload format version {version} is newer than supported ({FORMAT_VERSION})")
+    body = _decompress(value[HEADER.size:], compressor)
+    (skeleton_length,) = SKELETON_LENGTH.unpack_from(body)
+    start = SKELETON_LENGTH.size
+    skeleton_bytes = body[start:start + skeleton_length]
+    floats = _unshuffle(body[start + skeleton_length:])
+
+    if serializer == SERIALIZER_MSGPACK:
+        if msgpack is None:
+            raise PayloadCodecError("Payload is msgpack-encoded but msgpack is not installed")
+        skeleton = msgpack.unpackb(skeleton_bytes, raw=False, strict_map_key=False)
+    elif serializer == SERIALIZER_JSON:
+        skeleton = json.loads(skeleton_bytes.decode("utf-8"))
+    else:
+        raise PayloadCodecError(f"Unknown payload serializer id {serializer}")
+    return _restore(skeleton, floats)
@@ -0,0 +1,141 @@
+"""
+Prefork serving: warm the shared artifacts once, then fork uvicorn workers
+
+``uvicorn --workers N`` spawns N fresh interpreters. Each one imports wntr, catboost and
+networkx, parses the .inp file, compiles topology features and loads the model on its own,
+so cold start and memory both scale with N.
+
+``PreforkServer`` does the expensive part once, in the master:
+    1. import the app and run ``services.warmup.warm_up`` (network template, parsed
+       topology, topology features, model, baseline table, leak-signature dictionary);
+    2. ``gc.freeze()`` so the collector of each worker does not write to (and copy) the
+       pages holding those objects;
+    3. bind the listening socket and ``fork()`` the workers. Each worker runs its own
+       uvicorn event loop on the inherited socket and shares the warmed objects with the
+       master copy-on-write. Its ``warmup_state`` is inherited, so ``GET /ready`` is green
+       as soon as it accepts connections.
+
+The master starts no threads and holds no event loop before forking. Importing the app does
+open a database connection (``core.database.db_manager`` runs ``init_database`` at import);
+the master closes it before forking so no SQLite handle is shared with the workers. Workers
+would discard an inherited connection anyway (``DatabaseManager._get_connection`` reopens
+when the pid changes), but closing it keeps the master free of open database files. The
+master restarts workers that exit unexpectedly and forwards SIGTERM/SIGINT to them on
+shutdown.
+POSIX only (``os.fork``).
+"""
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional, Sequence
+
+from services.warmup import WARMUP_STEPS, warm_up
+from utils.logger import logger
+
+
+class PreforkServer:
+    """
+    Master process of the prefork serving mode.
+
+    Args:
+        app: Import string of the ASGI app ("main:app")
+        host, port: Listening address
+        workers: Number of forked worker processes
+        warmup_steps: Steps of services.warmup to run in the master before forking
+        log_level: uvicorn log level of the workers
+    """
+
+    def __init__(self, app: str = "main:app", host: str = "0.0.0.0", port: int = 8000, workers: int = 2,
+                 warmup_steps: Sequence[str] = tuple(WARMUP_STEPS), log_level: str = "info"):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.warmup_steps = tuple(warmup_steps)
+        self.log_level = log_level
+        self.children: Dict[int, int] = {}  # pid -> worker slot
+        self._socket: Optional[socket.socket] = None
+        self._stopping = False
+
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def _spawn(self, slot: int, asgi_app) -> int:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = slot
+            return pid
+        # Worker: default signal handlers (uvicorn installs its own), serve until told to stop
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            import uvicorn
+
+            config = uvicorn.Config(asgi_app, log_level=self.log_level, lifespan="on")
+            uvicorn.Server(config).run(sockets=[self._socket])
+        except BaseException as e:
+            logger.error(f"Prefork worker {os.getpid()} failed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        """Warm up, fork the workers and supervise them until SIGTERM/SIGINT"""
+        started = time.perf_counter()
+        from uvicorn.importer import import_from_string
+
+        asgi_app = import_from_string(self.app)
+        state = warm_up(self.warmup_steps)
+        if state.errors:
+            logger.warning(f"Warmup finished with errors: {state.errors}")
+        # Connection opened when core.database was imported (init_database): close it before forking
+        if "core.database" in sys.modules:
+            sys.modules["core.database"].db_manager.close()
+        self._socket = self._bind()
+        # Objects created so far (modules, network template, model, ...) move to the permanent
+        # generation: worker collections no longer touch their pages
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for slot in range(self.workers):
+            self._spawn(slot, asgi_app)
+        logger.info(f"[OK] Prefork master {os.getpid()}: {self.workers} worker(s) on {self.host}:{self.port} "
+                    f"after {time.perf_counter() - started:.1f} s (warmup {state.elapsed_ms:.0f} ms)")
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            slot = self.children.pop(pid, None)
+            if slot is None or self._stopping:
+                continue
+            logger.warning(f"Prefork worker {pid} exited with status {status} - restarting slot {slot}")
+            time.sleep(1.0)  # avoid a tight restart loop when workers crash on startup
+            if not self._stopping:
+                self._spawn(slot, asgi_app)
+        self._socket.close()
+        logger.info("Prefork master stopped")
+        return 0
@@ -4,21 +4,42 @@ Chạy độc lập, không cần WNTR/EPANET
 """
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 
 # Import leak detection service (không cần wntr)
 from services.leak_detection_service import leak_detection_service
+from services.inference_batcher import start_inference_batching, stop_inference_batching
+from services.warmup import LEAK_API_STEPS, warm_up, warmup_state
 from api.routes.leak_detection import router as leak_detection_router
+from core.async_database import async_db_manager
+from core.config import settings
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting Leak Detection API...")
-    print(f"Service ready: {leak_detection_service.is_ready()}")
+    print(f"Model directory: {settings.leak_model_dir} (runtime: {settings.leak_model_runtime})")
+    # Shared SQLite store, accessed off the event loop (core/async_database.py)
+    await async_db_manager.init_database()
+    # Topology features + model nap tren thread nen, khong chan startup; GET /ready = 503 den khi xong
+    warmup_task = asyncio.create_task(asyncio.to_thread(warm_up, LEAK_API_STEPS))
+    start_inference_batching()
+    model_watch_task = None
+    if settings.leak_model_watch_interval_seconds > 0:
+        model_watch_task = asyncio.create_task(
+            leak_detection_service.watch_model_files(settings.leak_model_watch_interval_seconds)
+        )
     yield
     # Shutdown
     print("Shutting down Leak Detection API...")
+    warmup_task.cancel()
+    if model_watch_task is not None:
+        model_watch_task.cancel()
+    stop_inference_batching()
+    await async_db_manager.close()
 
 app = FastAPI(
     title="Leak Detection API",
@@ -47,7 +68,7 @@ async def root():
         "message": "Leak Detection API",
         "version": "1.0.0",
         "status": "running",
-        "service_ready": leak_detection_service.is_ready()
+        "service_ready": leak_detection_service.is_loaded()
     }
 
 @app.get("/health")
@@ -55,9 +76,15 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "leak-detection-api",
-        "model_ready": leak_detection_service.is_ready()
+        "model_ready": leak_detection_service.is_loaded()
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Sẵn sàng nhận request: 200 sau warmup, 503 khi đang warmup hoặc bước bắt buộc lỗi"""
+    state = warmup_state.to_dict()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
 if __name__ == "__main__":
     uvicorn.run(
         "leak_detection_api:app",
@@ -1,25 +1,64 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 import uvicorn
 import os
+import asyncio
 from dotenv import load_dotenv
 
 from api.routes import simulation, data_input, scada_integration, leak_detection
 from routers.network_topology import router as network_topology_router
 from core.config import settings
-from core.database import init_db
+from core.database import init_db, close_db
+from core.async_database import async_db_manager
+from core.ingestion import start_ingestion, stop_ingestion
+from services.leak_detection_service import leak_detection_service
+from services.inference_batcher import start_inference_batching, stop_inference_batching
+from services.warmup import warm_up, warmup_state
 
 load_dotenv()
 
+async def retention_loop():
+    """Prune real-time data theo retention (lúc startup và định kỳ)"""
+    while True:
+        try:
+            deleted = await async_db_manager.prune_real_time_data()
+            if any(deleted.values()):
+                print(f"Retention pruning: {deleted}")
+        except Exception as e:
+            print(f"Retention pruning failed: {e}")
+        await asyncio.sleep(settings.realtime_retention_interval_minutes * 60)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting EPANET Simulation API...")
     init_db()
+    start_ingestion()
+    retention_task = asyncio.create_task(retention_loop())
+    start_inference_batching()
+    # Warmup tren thread nen (mang, topology features, model, baseline, tu dien chu ky ro ri -
+    # services/warmup.py): GET /ready tra 503 cho den khi xong; worker prefork (core/prefork.py) da warm tu master
+    warmup_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    # Watcher tu reload khi file model thay doi
+    model_watch_task = None
+    if settings.leak_model_watch_interval_seconds > 0:
+        model_watch_task = asyncio.create_task(
+            leak_detection_service.watch_model_files(settings.leak_model_watch_interval_seconds)
+        )
     yield
     # Shutdown
     print("Shutting down EPANET Simulation API...")
+    retention_task.cancel()
+    warmup_task.cancel()
+    if model_watch_task is not None:
+        model_watch_task.cancel()
+    stop_inference_batching()
+    leak_detection_service.confirmer.close()
+    stop_ingestion()
+    await async_db_manager.close()
+    close_db()
 
 app = FastAPI(
     title="EPANET Water Network Simulation API",
@@ -58,6 +97,12 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "epanet-api"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Sẵn sàng nhận request: 200 sau warmup, 503 khi đang warmup hoặc bước bắt buộc lỗi"""
+    state = warmup_state.to_dict()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -2,11 +2,11 @@
 Network Topology API - Cung cấp dữ liệu topology cho frontend
 """
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from typing import Dict, Any, List
 import logging
-import wntr
 from services.network_parser import network_parser
-from core.config import settings
+from services.epanet_service import epanet_service
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +24,7 @@ async def get_network_topology() -> Dict[str, Any]:
         logger.info("Parsing network topology from EPANET input file")
         
         # Parse file EPANET
-        result = network_parser.parse_file()
+        result = await run_in_threadpool(network_parser.parse_file)
         
         if not result["success"]:
             raise HTTPException(
@@ -63,7 +63,7 @@ async def get_network_summary() -> Dict[str, Any]:
         Dict chứa thông tin tổng quan
     """
     try:
-        result = network_parser.parse_file()
+        result = await run_in_threadpool(network_parser.parse_file)
         
         if not result["success"]:
             raise HTTPException(
@@ -95,7 +95,7 @@ async def get_network_graph():
     Returns nodes and edges formatted for Cytoscape visualization
     """
     try:
-        result = network_parser.get_graph_structure()
+        result = await run_in_threadpool(network_parser.get_graph_structure)
         
         return {
             "success": result.get("success"),
@@ -128,8 +128,8 @@ async def get_demand_patterns() -> Dict[str, Any]:
     try:
         logger.info("Getting demand patterns from EPANET input file")
         
-        # Load EPANET model
-        wn = wntr.network.WaterNetworkModel(settings.epanet_input_file)
+        # Load EPANET model (ban rieng tu mang da parse dung chung, trong thread pool)
+        wn = await run_in_threadpool(epanet_service.template.model)
         
         # ✅ Apply same pattern logic as simulation: Set multipliers to 1.0
         # This ensures consistency between simulation and pattern API
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Backtest leak detection tren du lieu SCADA lich su (services/backtest.py)
+
+Moi ngay trong khoang --from/--to: lay SCADA cua ngay tu kho cuc bo (file ghi bang
+``scripts/scada_replay_server.py record``, khong goi API that) -> mo phong EPANET 24h ->
+leak detection voi model / threshold hien tai. Chay song song mot process moi CPU; ket qua
+tung ngay ghi Parquet trong <output>/days/, gop thanh <output>/detections.parquet va
+<output>/timings.parquet. Chay lai cung --output se bo qua ngay da xong (resume).
+
+Usage:
+    python scripts/backtest.py --store data/scada_recordings --from 2025-07-01 --to 2025-09-30
+    python scripts/backtest.py --store data/scada_recordings --from 2025-07-01 --to 2025-07-07 \\
+        --threshold 0.7 --top-k 20 --workers 4 --output backtests/july_w1
+"""
+import argparse
+import os
+import sys
+from datetime import date
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+os.makedirs("logs", exist_ok=True)
+
+
+def print_progress(timing):
+    status = timing['status']
+    if status == "completed":
+        detail = (f"{timing['detected_leaks']} leaks / {timing['records']} records, "
+                  f"scada {timing['scada_ms']:.0f} ms, sim {timing['simulation_ms']:.0f} ms, "
+                  f"detect {timing['detection_ms']:.0f} ms")
+    elif status == "no_data":
+        detail = "no SCADA data"
+    else:
+        detail = f"[ERROR] {timing['error']}"
+    print(f"  {timing['day']}  {status:<9} {timing['total_ms'] / 1000:6.1f} s  {detail}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest leak detection over stored SCADA data")
+    parser.add_argument("--store", default="data/scada_recordings", help="Recorded SCADA directory")
+    parser.add_argument("--from", dest="start", help="First day (YYYY-MM-DD, default: first stored day)")
+    parser.add_argument("--to", dest="end", help="Last day (YYYY-MM-DD, default: last stored day)")
+    parser.add_argument("--stations", nargs="*", help="Station codes (default: all stored stations)")
+    parser.add_argument("--threshold", type=float, help="Threshold override (default: model threshold)")
+    parser.add_argument("--top-k", type=int)
+    parser.add_argument("--window-seconds", type=float)
+    parser.add_argument("--timestep", type=int, default=1, help="Hydraulic timestep (hours)")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: CPU count)")
+    parser.add_argument("--output", default="backtests/latest", help="Output directory (resumable)")
+    args = parser.parse_args()
+
+    from services.backtest import BacktestRunner
+    from services.scada_store import LocalSCADAStore
+
+    try:
+        store = LocalSCADAStore(args.store)
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    if args.start and args.end:
+        start, end = date.fromisoformat(args.start), date.fromisoformat(args.end)
+    else:
+        stored = store.date_range(args.stations)
+        if stored is None:
+            print(f"[ERROR] No stored SCADA data in {args.store}")
+            return 1
+        start = date.fromisoformat(args.start) if args.start else stored[0].date()
+        end = date.fromisoformat(args.end) if args.end else stored[1].date()
+
+    # Kiem tra model truoc khi chay mo phong ca khoang (worker tu load model rieng)
+    from services.leak_detection_service import leak_detection_service
+    if not leak_detection_service.is_ready():
+        print(f"[ERROR] Model not loaded: {leak_detection_service.models.last_error}")
+        return 1
+
+    runner = BacktestRunner(
+        args.store, args.output, start, end, stations=args.stations, threshold=args.threshold,
+        top_k=args.top_k, window=args.window_seconds, hydraulic_timestep=args.timestep,
+        workers=args.workers
+    )
+    try:
+        print(f"\nBacktest {start} -> {end} ({len(runner.days)} days), output {args.output}")
+        summary = runner.run(progress=print_progress)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 1
+
+    print(f"\n{summary['processed_days']} day(s) processed ({summary['skipped_days']} already done) "
+          f"on {summary['workers']} worker(s) in {summary['elapsed_s']:.1f} s")
+    print(f"  completed {summary['completed']}, no data {summary['no_data']}, failed {summary['failed']}")
+    if summary['days_per_minute']:
+        print(f"  {summary['days_per_minute']} days/minute")
+    print(f"  detections: {summary['detections_path']}")
+    print(f"  timings:    {summary['timings_path']}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
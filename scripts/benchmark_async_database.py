@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Benchmark event-loop latency: SQLite goi truc tiep trong async handler (blocking)
+vs AsyncDatabaseManager (thread pool rieng, xem core/async_database.py)
+
+Chay uvicorn that voi router data_input, tai hon hop:
+    - POST /api/v1/data/pressure      (ghi batch)
+    - GET  /api/v1/data/latest/{node} (doc nho)
+    - GET  /api/v1/data/history/{node}?resolution=raw&limit=... (doc lon)
+Dong thoi do:
+    - loop lag: do tre cua asyncio.sleep(interval) ben trong event loop cua server
+    - ping:     latency cua GET /ping (khong dung DB) tu mot client rieng
+
+Luu y: client chay cung process (chung GIL) va FastAPI encode JSON response tren event loop,
+nen loop lag o che do async khong ve 0; history limit lon chu yeu do chi phi encode, khong phai SQLite.
+
+Usage:
+    python scripts/benchmark_async_database.py
+    python scripts/benchmark_async_database.py --requests 2000 --concurrency 32 --history-limit 5000
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+os.makedirs("logs", exist_ok=True)
+
+import requests
+import uvicorn
+from fastapi import FastAPI
+
+from core.config import settings
+from core.database import DatabaseManager
+from core.async_database import AsyncDatabaseManager
+from core import ingestion
+from api.routes import data_input
+
+
+class BlockingAsyncDatabaseManager(AsyncDatabaseManager):
+    """Hanh vi cu: goi SQLite ngay tren thread cua event loop"""
+
+    async def run(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+
+def _percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+def _start_server(app):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def run_scenario(label, async_manager, n_requests, concurrency, rows_per_request,
+                 history_limit, n_nodes=50, probe_interval_ms=5):
+    lag_samples = []
+    measuring = threading.Event()
+
+    async def lag_monitor():
+        interval = probe_interval_ms / 1000.0
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(interval)
+            if measuring.is_set():
+                lag_samples.append(time.perf_counter() - t0 - interval)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        task = asyncio.create_task(lag_monitor())
+        yield
+        task.cancel()
+
+    original = (data_input.async_db_manager, ingestion.async_db_manager, settings.realtime_write_behind)
+    data_input.async_db_manager = async_manager
+    ingestion.async_db_manager = async_manager
+    settings.realtime_write_behind = False
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(data_input.router, prefix="/api/v1/data")
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    server, thread, base = _start_server(app)
+    local = threading.local()
+    latencies = []
+    ping_latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def session():
+        s = getattr(local, "session", None)
+        if s is None:
+            s = local.session = requests.Session()
+        return s
+
+    def work(i):
+        node = f"N{i % n_nodes}"
+        t0 = time.perf_counter()
+        kind = i % 4
+        if kind in (0, 1):
+            payload = [{"node_id": f"N{(i + k) % n_nodes}", "pressure": 20.0 + k % 5}
+                       for k in range(rows_per_request)]
+            response = session().post(f"{base}/api/v1/data/pressure", json=payload)
+        elif kind == 2:
+            response = session().get(f"{base}/api/v1/data/latest/{node}")
+        else:
+            response = session().get(f"{base}/api/v1/data/history/{node}",
+                                     params={"resolution": "raw", "limit": history_limit})
+        dt = time.perf_counter() - t0
+        if response.status_code not in (200, 404):
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        with lock:
+            latencies.append(dt)
+
+    def pinger():
+        s = requests.Session()
+        while not done.is_set():
+            t0 = time.perf_counter()
+            s.get(f"{base}/ping")
+            ping_latencies.append(time.perf_counter() - t0)
+            time.sleep(0.005)
+
+    try:
+        for i in range(20):
+            work(i)
+        latencies.clear()
+
+        measuring.set()
+        ping_thread = threading.Thread(target=pinger, daemon=True)
+        ping_thread.start()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(work, range(n_requests)))
+        elapsed = time.perf_counter() - t0
+        done.set()
+        measuring.clear()
+        ping_thread.join(timeout=5)
+
+        ms = 1000.0
+        print(f"\n{label}")
+        print(f"  requests   {len(latencies) / elapsed:>8.0f} req/s   p50={statistics.median(latencies) * ms:7.2f}ms  "
+              f"p99={_percentile(latencies, 99) * ms:7.2f}ms")
+        print(f"  loop lag   p50={statistics.median(lag_samples) * ms:7.2f}ms  p99={_percentile(lag_samples, 99) * ms:7.2f}ms  "
+              f"max={max(lag_samples) * ms:7.2f}ms  ({len(lag_samples)} samples)")
+        print(f"  /ping      p50={statistics.median(ping_latencies) * ms:7.2f}ms  "
+              f"p99={_percentile(ping_latencies, 99) * ms:7.2f}ms  max={max(ping_latencies) * ms:7.2f}ms")
+    finally:
+        done.set()
+        server.should_exit = True
+        thread.join(timeout=5)
+        data_input.async_db_manager, ingestion.async_db_manager, settings.realtime_write_behind = original
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark event-loop latency of database access")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rows-per-request", type=int, default=20)
+    parser.add_argument("--history-limit", type=int, default=200)
+    parser.add_argument("--seed-rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    print("Event-loop latency benchmark (mixed read/write)")
+    print("=" * 80)
+    print(f"requests={args.requests} concurrency={args.concurrency} rows/request={args.rows_per_request} "
+          f"history_limit={args.history_limit} seed_rows={args.seed_rows}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(os.path.join(tmp, "bench.db"))
+        # Bang lon -> history query doc nhieu page
+        manager.save_real_time_data_batch(
+            (f"N{i % 50}", 20.0 + i % 7, None, None, None) for i in range(args.seed_rows)
+        )
+        for label, cls in [("blocking (SQLite on the event loop)", BlockingAsyncDatabaseManager),
+                           (f"async (pool of {settings.sqlite_async_workers} threads)", AsyncDatabaseManager)]:
+            async_manager = cls(manager, max_workers=settings.sqlite_async_workers)
+            run_scenario(label, async_manager, args.requests, args.concurrency,
+                         args.rows_per_request, args.history_limit)
+            asyncio.run(async_manager.close())
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Benchmark SQLite data access: connection per call (legacy) vs persistent per-thread WAL connections
+(va write-behind ingestion, xem core/ingestion.py)
+
+Do 2 kich ban:
+    - direct: N thread goi truc tiep db_manager (insert + latest query)
+    - http:   request dong thoi toi /api/v1/data/pressure va /api/v1/data/latest/{node_id}
+              qua uvicorn that (router data_input)
+
+Usage:
+    python scripts/benchmark_database.py
+    python scripts/benchmark_database.py --requests 2000 --concurrency 16 --rows-per-request 20
+"""
+import argparse
+import os
+import socket
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+os.makedirs("logs", exist_ok=True)
+
+import requests
+import uvicorn
+from fastapi import FastAPI
+
+from core.config import settings
+from core.database import DatabaseManager
+from core.async_database import AsyncDatabaseManager
+from core import ingestion
+from api.routes import data_input
+
+
+class LegacyDatabaseManager(DatabaseManager):
+    """Hanh vi cu: sqlite3.connect/close moi lan goi, rollback journal mac dinh"""
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def _percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+def _report(label, latencies, elapsed, rows):
+    print(f"  {label:<8} {len(latencies) / elapsed:>9.0f} ops/s  {rows / elapsed:>9.0f} rows/s  "
+          f"p50={statistics.median(latencies) * 1000:6.2f}ms  p95={_percentile(latencies, 95) * 1000:6.2f}ms")
+
+
+def bench_direct(manager, n_ops, concurrency, n_nodes=50):
+    """Insert va query truc tiep tu nhieu thread (50/50)"""
+    latencies = []
+    lock = threading.Lock()
+
+    def work(i):
+        node_id = f"N{i % n_nodes}"
+        t0 = time.perf_counter()
+        if i % 2 == 0:
+            manager.save_real_time_data(node_id, pressure=20.0 + i % 7)
+        else:
+            manager.get_latest_real_time_data(node_id)
+        dt = time.perf_counter() - t0
+        with lock:
+            latencies.append(dt)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(work, range(n_ops)))
+    elapsed = time.perf_counter() - t0
+    _report("direct", latencies, elapsed, n_ops // 2)
+
+
+def _start_server(app):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def bench_http(manager, n_requests, concurrency, rows_per_request, n_nodes=50, write_behind=False):
+    """Request dong thoi qua FastAPI: 50% POST /pressure (batch), 50% GET /latest/{node_id}"""
+    original = (data_input.async_db_manager, ingestion.async_db_manager, ingestion.realtime_write_behind,
+                settings.realtime_write_behind)
+    async_manager = AsyncDatabaseManager(manager, max_workers=settings.sqlite_async_workers)
+    data_input.async_db_manager = async_manager
+    ingestion.async_db_manager = async_manager
+    settings.realtime_write_behind = write_behind
+    if write_behind:
+        ingestion.realtime_write_behind = ingestion.WriteBehindQueue(
+            manager, settings.realtime_flush_rows, settings.realtime_flush_interval_ms
+        )
+        ingestion.realtime_write_behind.start()
+    app = FastAPI()
+    app.include_router(data_input.router, prefix="/api/v1/data")
+    server, thread, base = _start_server(app)
+
+    local = threading.local()
+    latencies = []
+    lock = threading.Lock()
+
+    def work(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        t0 = time.perf_counter()
+        if i % 2 == 0:
+            payload = [
+                {"node_id": f"N{(i + k) % n_nodes}", "pressure": 20.0 + k % 5}
+                for k in range(rows_per_request)
+            ]
+            response = session.post(f"{base}/api/v1/data/pressure", json=payload)
+        else:
+            response = session.get(f"{base}/api/v1/data/latest/N{i % n_nodes}")
+        dt = time.perf_counter() - t0
+        if response.status_code not in (200, 404):
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        with lock:
+            latencies.append(dt)
+
+    try:
+        # Warm up (tao connection, nap page cache)
+        for i in range(20):
+            work(i)
+        latencies.clear()
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(work, range(n_requests)))
+        elapsed = time.perf_counter() - t0
+        _report("http+wb" if write_behind else "http", latencies, elapsed, (n_requests // 2) * rows_per_request)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        if write_behind:
+            ingestion.realtime_write_behind.stop()
+        (data_input.async_db_manager, ingestion.async_db_manager, ingestion.realtime_write_behind,
+         settings.realtime_write_behind) = original
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite connection management")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rows-per-request", type=int, default=10)
+    args = parser.parse_args()
+
+    print("SQLite benchmark")
+    print("=" * 80)
+    print(f"requests={args.requests} concurrency={args.concurrency} rows/request={args.rows_per_request}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, cls in [("legacy (connect per call, rollback journal)", LegacyDatabaseManager),
+                           ("pooled (per-thread, WAL)", DatabaseManager)]:
+            print(f"\n{label}")
+            manager = cls(os.path.join(tmp, f"{cls.__name__}.db"))
+            # Bang lon dan -> query latest co chi phi that
+            with manager.connection() as conn:
+                conn.executemany(
+                    "INSERT INTO real_time_data (node_id, pressure) VALUES (?, ?)",
+                    [(f"N{i % 50}", 20.0) for i in range(20000)]
+                )
+            bench_direct(manager, args.requests, args.concurrency)
+            bench_http(manager, args.requests, args.concurrency, args.rows_per_request)
+            if cls is DatabaseManager:
+                bench_http(manager, args.requests, args.concurrency, args.rows_per_request, write_behind=True)
+            manager.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark leak detection tu ket qua mo phong: chuyen doi cu (records -> list of dicts ->
+DataFrame) vs duong dan dang cot (services/node_arrays.py)
+
+Chay mot mo phong WNTR that (settings.epanet_input_file), lay nodes_results nhu
+EPANETService._extract_wntr_results, roi do:
+    - chuyen doi sang DataFrame: cach cu / NodeArrays.from_nodes_results / NodeArrays.from_wntr;
+    - detect trong service: cach cu / detect_leaks_from_simulation_result / tu mang WNTR
+      (phan detect cua /simulation/simulate-and-detect);
+    - end-to-end POST /api/v1/leak-detection/detect-from-simulation (JSON + pydantic + detect).
+
+Khong co model trong models/ -> dung model thay the (xac suat co dinh) va ghi chu trong
+output; thoi gian predict cua model that khong nam trong ket qua do.
+
+Usage:
+    python scripts/benchmark_detect_from_simulation.py
+    python scripts/benchmark_detect_from_simulation.py --duration 72 --runs 5
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+os.makedirs("logs", exist_ok=True)
+
+import numpy as np
+import pandas as pd
+
+from core.config import settings
+from services.feature_pipeline import BASE_FEATURES
+from services.leak_detection_service import leak_detection_service
+from services.model_store import ModelBundle, ModelStore
+from services.node_arrays import NodeArrays
+
+
+class StandInModel:
+    def predict_proba(self, X):
+        n = len(X)
+        return np.column_stack([np.full(n, 0.9), np.full(n, 0.1)])
+
+
+def legacy_frame(nodes_results):
+    """Chuyen doi truoc day (detect_leaks_from_simulation_result + detect_leaks)"""
+    nodes_data = {}
+    for node_id, node_data in nodes_results.items():
+        if isinstance(node_data, list):
+            nodes_data[node_id] = node_data
+    records = []
+    for node_id, node_records in nodes_data.items():
+        for record in node_records:
+            records.append({
+                'node_id': node_id,
+                'timestamp': record.get('timestamp', 0),
+                'pressure': record.get('pressure', 0),
+                'head': record.get('head', 0),
+                'demand': record.get('demand', 0)
+            })
+    return pd.DataFrame(records)
+
+
+def timed(fn, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detect-from-simulation paths")
+    parser.add_argument("--duration", type=int, default=24, help="Simulation duration (hours)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    import wntr
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api.routes.leak_detection import router
+    from services.epanet_service import EPANETService
+
+    logging.getLogger("epanet_api").setLevel(logging.ERROR)
+
+    wn = wntr.network.WaterNetworkModel(settings.epanet_input_file)
+    wn.options.time.duration = args.duration * 3600
+    wn.options.time.hydraulic_timestep = 3600
+    wn.options.time.report_timestep = 3600
+    results = wntr.sim.WNTRSimulator(wn).run_sim()
+    nodes_results = EPANETService()._extract_wntr_results(results, wn)["nodes"]
+    n_rows = sum(len(v) for v in nodes_results.values())
+
+    if leak_detection_service.models.get() is None:
+        print("[INFO] No model in models/ - using a stand-in model (real predict time not included)")
+        leak_detection_service.models = ModelStore(loader=lambda path: ModelBundle(
+            StandInModel(), None, None, list(BASE_FEATURES), 0.5, Path("stand-in"), ()
+        ))
+
+    print("Detect-from-simulation benchmark")
+    print("=" * 80)
+    print(f"input={settings.epanet_input_file} nodes={len(nodes_results)} rows={n_rows} runs={args.runs}")
+
+    print("\nConversion to DataFrame:")
+    legacy_ms, legacy = timed(lambda: legacy_frame(nodes_results), args.runs)
+    arrays_ms, frame = timed(lambda: NodeArrays.from_nodes_results(nodes_results).to_frame(), args.runs)
+    wntr_ms, _ = timed(lambda: NodeArrays.from_wntr(results).to_frame(), args.runs)
+    if not legacy.equals(frame):
+        print("[ERROR] NodeArrays frame differs from legacy conversion")
+        return 1
+    print(f"  {'legacy records':<28} {legacy_ms:8.2f} ms")
+    print(f"  {'NodeArrays (nodes_results)':<28} {arrays_ms:8.2f} ms")
+    print(f"  {'NodeArrays (WNTR arrays)':<28} {wntr_ms:8.2f} ms")
+
+    print("\nDetect in service (conversion + features + predict):")
+    service = leak_detection_service
+    old_ms, _ = timed(lambda: service.detect_leaks_from_arrays(
+        NodeArrays(*[c for _, c in legacy_frame(nodes_results).items()])), args.runs)
+    new_ms, _ = timed(lambda: service.detect_leaks_from_simulation_result({"nodes_results": nodes_results}), args.runs)
+    sim_ms, _ = timed(lambda: service.detect_leaks_from_arrays(NodeArrays.from_wntr(results)), args.runs)
+    print(f"  {'legacy records':<28} {old_ms:8.2f} ms")
+    print(f"  {'from nodes_results':<28} {new_ms:8.2f} ms")
+    print(f"  {'from WNTR arrays':<28} {sim_ms:8.2f} ms  (simulate-and-detect)")
+
+    print("\nEnd-to-end POST /api/v1/leak-detection/detect-from-simulation:")
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1/leak-detection")
+    payload = {"simulation_result": {"nodes_results": nodes_results}}
+    with TestClient(app) as client:
+        http_ms, response = timed(
+            lambda: client.post("/api/v1/leak-detection/detect-from-simulation", json=payload), args.runs
+        )
+    if response.status_code != 200:
+        print(f"[ERROR] HTTP {response.status_code}: {response.text[:200]}")
+        return 1
+    print(f"  {'latency (median)':<28} {http_ms:8.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark luu simulation_runs: JSON text cu vs payload codec (columnar + nen, xem core/payload_codec.py)
+
+Tao results gia lap cung cau truc voi EPANETService._extract_wntr_results
+(nodes: pressure/head/demand/flow, pipes: timestamp/flow, pumps) cho N ngay,
+ghi qua DatabaseManager.save_simulation_run va doc lai qua get_simulation_run.
+
+Bao cao: kich thuoc payload, kich thuoc file DB, thoi gian encode+ghi va doc+decode.
+
+Usage:
+    python scripts/benchmark_payload_codec.py
+    python scripts/benchmark_payload_codec.py --nodes 500 --pipes 600 --days 7 --step-minutes 15 --runs 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+os.makedirs("logs", exist_ok=True)
+
+from core.config import settings
+from core.database import DatabaseManager
+from core import payload_codec
+
+
+def make_results(n_nodes, n_pipes, n_pumps, n_steps, step_seconds, seed=0):
+    rng = random.Random(seed)
+    nodes = {}
+    for n in range(n_nodes):
+        node_id = str(n + 1)
+        base = rng.uniform(15, 40)
+        records = []
+        for t in range(n_steps):
+            pressure = base + 3 * rng.random()
+            demand = rng.uniform(0, 2)
+            records.append({
+                "node_id": node_id,
+                "pressure": pressure,
+                "head": pressure + 5.0,
+                "demand": demand,
+                "flow": demand
+            })
+        nodes[node_id] = records
+    pipes = {
+        f"P{p}": [{"timestamp": t * step_seconds, "flow": rng.uniform(-50, 50)} for t in range(n_steps)]
+        for p in range(n_pipes)
+    }
+    pumps = {
+        f"PU{p}": [{"timestamp": t * step_seconds, "flow": rng.uniform(0, 80), "head": 0.0, "power": 0.0}
+                   for t in range(n_steps)]
+        for p in range(n_pumps)
+    }
+    return {"nodes": nodes, "pipes": pipes, "pumps": pumps}
+
+
+def bench(label, results, input_data, runs, tmp, fmt, compression=None):
+    settings.simulation_payload_format = fmt
+    if compression is not None:
+        settings.simulation_payload_compression = compression
+    db_path = os.path.join(tmp, f"{label.replace(' ', '_')}.db")
+    manager = DatabaseManager(db_path)
+
+    payload_size = len(payload_codec.encode_payload(results))
+    t0 = time.perf_counter()
+    run_ids = [manager.save_simulation_run("completed", input_data, results) for _ in range(runs)]
+    write = (time.perf_counter() - t0) / runs
+
+    t0 = time.perf_counter()
+    for run_id in run_ids:
+        loaded = manager.get_simulation_run(run_id)
+    read = (time.perf_counter() - t0) / runs
+
+    manager.close()
+    db_size = os.path.getsize(db_path) + (os.path.getsize(db_path + "-wal") if os.path.exists(db_path + "-wal") else 0)
+    print(f"  {label:<18} payload={payload_size / 1e6:8.2f} MB  db={db_size / 1e6:8.2f} MB  "
+          f"write={write * 1000:8.1f} ms  read={read * 1000:8.1f} ms")
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark simulation payload storage")
+    parser.add_argument("--nodes", type=int, default=300)
+    parser.add_argument("--pipes", type=int, default=350)
+    parser.add_argument("--pumps", type=int, default=3)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--step-minutes", type=int, default=60)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    n_steps = args.days * 24 * 60 // args.step_minutes + 1
+    results = make_results(args.nodes, args.pipes, args.pumps, n_steps, args.step_minutes * 60)
+    input_data = {"duration": args.days * 24, "hydraulic_timestep": 1, "report_timestep": 1,
+                  "real_time_data": None, "demand_multiplier": 1.0}
+
+    print("Simulation payload storage benchmark")
+    print("=" * 80)
+    print(f"nodes={args.nodes} pipes={args.pipes} pumps={args.pumps} steps={n_steps} runs={args.runs}")
+    print(f"msgpack={'yes' if payload_codec.msgpack else 'no'} zstd={'yes' if payload_codec.zstandard else 'no'} "
+          f"lz4={'yes' if payload_codec.lz4_frame else 'no'}")
+
+    original = (settings.simulation_payload_format, settings.simulation_payload_compression)
+    scenarios = [("json (legacy)", "json", None), ("binary none", "binary", "none"),
+                 ("binary zlib", "binary", "zlib")]
+    if payload_codec.lz4_frame is not None:
+        scenarios.append(("binary lz4", "binary", "lz4"))
+    if payload_codec.zstandard is not None:
+        scenarios.append(("binary zstd", "binary", "zstd"))
+
+    expected = payload_codec.decode_payload(payload_codec.encode_payload(results, fmt="json"))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, fmt, compression in scenarios:
+                loaded = bench(label, results, input_data, args.runs, tmp, fmt, compression)
+                if loaded["results"] != expected:
+                    print(f"  [ERROR] {label}: decoded results differ from JSON round-trip")
+                    return 1
+    finally:
+        settings.simulation_payload_format, settings.simulation_payload_compression = original
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
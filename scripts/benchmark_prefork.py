@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark khoi dong va bo nho: ``uvicorn main:app --workers N`` vs prefork (scripts/serve_prefork.py)
+
+Moi che do chay server that tren mot port rieng va do:
+    - startup: tu luc chay lenh den khi GET /ready tra 200 (worker dau tien / tat ca N worker,
+      nhan biet worker theo pid trong body cua /ready)
+    - bo nho moi process (/proc/<pid>/smaps_rollup): RSS, PSS (phan trang dung chung chia deu
+      cho cac process dung chung) va private (chi rieng process do); tong PSS = RAM thuc te
+      cua ca cay process
+uvicorn --workers: moi worker tu import + warmup (lifespan, services/warmup.py).
+Prefork: master warmup mot lan roi fork, worker dung chung trang nho voi master (copy-on-write).
+Chi chay tren Linux (/proc).
+
+Usage:
+    python scripts/benchmark_prefork.py
+    python scripts/benchmark_prefork.py --workers 4 --model-dir /path/to/models
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+os.makedirs("logs", exist_ok=True)
+
+import requests
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _descendants(root: int) -> List[int]:
+    """root va moi process con chau (doc ppid tu /proc/<pid>/stat)"""
+    parents: Dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        parents[int(entry)] = int(stat.rsplit(")", 1)[1].split()[1])
+    tree, frontier = [root], [root]
+    while frontier:
+        children = [pid for pid, ppid in parents.items() if ppid in frontier]
+        tree.extend(children)
+        frontier = children
+    return tree
+
+
+def _memory(pid: int) -> Optional[Dict[str, float]]:
+    """RSS / PSS / private (MB) cua process"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {line.split(":")[0]: int(line.split()[1]) for line in f if line.split()[-1] == "kB"}
+    except OSError:
+        return None
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {"rss": fields.get("Rss", 0) / 1024, "pss": fields.get("Pss", 0) / 1024, "private": private / 1024}
+
+
+def measure(name: str, command: List[str], port: int, workers: int, timeout: float, env: Dict[str, str]):
+    print(f"\n--- {name}: {' '.join(command)}")
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    url = f"http://127.0.0.1:{port}/ready"
+    ready_pids: Set[int] = set()
+    first_ready = all_ready = None
+    try:
+        while time.perf_counter() - started < timeout and len(ready_pids) < workers:
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} exited with code {process.returncode}")
+            try:
+                response = requests.get(url, timeout=2)
+                if response.status_code == 200:
+                    ready_pids.add(response.json()["pid"])
+                    first_ready = first_ready or time.perf_counter() - started
+                    continue
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+        if len(ready_pids) == workers:
+            all_ready = time.perf_counter() - started
+        time.sleep(1.0)  # de worker on dinh truoc khi do bo nho
+
+        rows = []
+        for pid in _descendants(process.pid):
+            memory = _memory(pid)
+            if memory is not None:
+                role = "worker" if pid in ready_pids else ("master" if pid == process.pid else "helper")
+                rows.append((pid, role, memory))
+        first = f"{first_ready:.1f} s" if first_ready else "timeout"
+        every = f"{all_ready:.1f} s" if all_ready else f"only {len(ready_pids)}/{workers} seen ready"
+        print(f"startup: first worker ready {first}, all workers ready {every}")
+        for pid, role, m in rows:
+            print(f"  {role:6s} {pid:>7d}  RSS {m['rss']:7.1f} MB  PSS {m['pss']:7.1f} MB  private {m['private']:7.1f} MB")
+        worker_rows = [m for _, role, m in rows if role == "worker"]
+        total_pss = sum(m["pss"] for _, _, m in rows)
+        if worker_rows:
+            print(f"  per worker: RSS {sum(m['rss'] for m in worker_rows) / len(worker_rows):.1f} MB, "
+                  f"private {sum(m['private'] for m in worker_rows) / len(worker_rows):.1f} MB; "
+                  f"total PSS (all processes) {total_pss:.1f} MB")
+        return {"first_ready": first_ready, "all_ready": all_ready, "total_pss": total_pss, "workers": worker_rows}
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare startup time and per-worker memory: uvicorn vs prefork")
+    parser.add_argument("--app", default="main:app", help="ASGI app import string")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds to wait for all workers")
+    parser.add_argument("--model-dir", default=None, help="LEAK_MODEL_DIR for both servers")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.model_dir:
+        env["LEAK_MODEL_DIR"] = args.model_dir
+
+    uvicorn_port, prefork_port = _free_port(), _free_port()
+    results = {
+        "uvicorn": measure("uvicorn --workers", [sys.executable, "-m", "uvicorn", args.app, "--host", "127.0.0.1",
+                                                  "--port", str(uvicorn_port), "--workers", str(args.workers),
+                                                  "--log-level", "warning"],
+                           uvicorn_port, args.workers, args.timeout, env),
+        "prefork": measure("prefork", [sys.executable, "scripts/serve_prefork.py", "--app", args.app, "--host",
+                                       "127.0.0.1", "--port", str(prefork_port), "--workers", str(args.workers),
+                                       "--log-level", "warning"],
+                           prefork_port, args.workers, args.timeout, env),
+    }
+
+    print("\n" + "=" * 60)
+    print(f"{'mode':10s} {'all ready':>10s} {'worker RSS':>11s} {'worker private':>15s} {'total PSS':>10s}")
+    for mode, r in results.items():
+        workers = r["workers"] or [{"rss": float("nan"), "private": float("nan")}]
+        ready = f"{r['all_ready']:.1f} s" if r["all_ready"] else "n/a"
+        print(f"{mode:10s} {ready:>10s} {sum(w['rss'] for w in workers) / len(workers):>8.1f} MB "
+              f"{sum(w['private'] for w in workers) / len(workers):>12.1f} MB {r['total_pss']:>7.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
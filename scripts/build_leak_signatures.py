@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tao truoc tu dien chu ky ro ri cho dinh vi vat ly (services/leak_signatures.py)
+
+Mo phong ro ri chuan tai moi junction cua file .inp tren process pool va luu vao
+settings.leak_signature_cache_dir; POST /api/v1/leak-detection/localize dung lai file nay
+thay vi tao lazy o request dau tien. Chay lai sau khi doi file .inp (tu dien cu khong con dung).
+
+Usage:
+    python scripts/build_leak_signatures.py
+    python scripts/build_leak_signatures.py --area 0.001 --head 28 --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+os.makedirs("logs", exist_ok=True)
+
+
+def main():
+    from core.config import settings
+
+    parser = argparse.ArgumentParser(description="Precompute the leak-signature dictionary")
+    parser.add_argument("--inp", default=settings.epanet_input_file, help="EPANET input file")
+    parser.add_argument("--area", type=float, default=settings.leak_signature_area_m2, help="Standard leak area (m2)")
+    parser.add_argument("--head", type=float, default=settings.leak_signature_reservoir_head_m,
+                        help="Reservoir head during signature simulations (m)")
+    parser.add_argument("--workers", type=int, default=settings.leak_signature_workers,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--output", default=settings.leak_signature_cache_dir, help="Signature cache directory")
+    args = parser.parse_args()
+
+    from services.leak_signatures import LeakSignatureDictionary
+
+    signatures = LeakSignatureDictionary(args.inp, args.output, args.area, args.head, workers=args.workers)
+    started = time.perf_counter()
+    try:
+        table = signatures.table()
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        return 1
+    elapsed = time.perf_counter() - started
+
+    stats = signatures.stats()
+    source = "simulated" if stats["builds"] else "already cached"
+    print(f"\n[OK] {len(table)} junctions x {len(table.sensors)} sensors ({source}) in {elapsed:.1f} s")
+    print(f"  key:    {table.key}")
+    print(f"  output: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Chuyen model CatBoost da pickle (.pkl) sang dinh dang native (.cbm)
+
+LeakDetectionService (services/model_store.py) uu tien load .cbm khi catboost co cai dat
+va file .cbm khong cu hon file .pkl cung ten. Chay script nay cho model da train truoc
+khi scripts/train_leak_model.py luu them .cbm; server dang chay se nhan model moi qua
+POST /api/v1/leak-detection/models/reload (hoac watcher neu bat).
+
+Usage:
+    python scripts/convert_model_to_cbm.py
+    python scripts/convert_model_to_cbm.py --model-dir models --verify
+"""
+import argparse
+import pickle
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.model_store import CATBOOST_INSTALLED, MODEL_STEMS, load_model_file
+
+
+def convert(pickled: Path, verify: bool) -> bool:
+    started = time.perf_counter()
+    with open(pickled, 'rb') as f:
+        model = pickle.load(f)
+    pickle_ms = (time.perf_counter() - started) * 1000
+
+    if not hasattr(model, 'save_model'):
+        print(f"[ERROR] {pickled}: {type(model).__name__} is not a CatBoost model - skipped")
+        return False
+
+    native = pickled.with_suffix(".cbm")
+    model.save_model(str(native), format="cbm")
+    print(f"[OK] {pickled} -> {native} ({native.stat().st_size / 1024:.0f} KB)")
+
+    started = time.perf_counter()
+    loaded = load_model_file(native)
+    native_ms = (time.perf_counter() - started) * 1000
+    print(f"     Load time: pickle {pickle_ms:.0f} ms, native {native_ms:.0f} ms")
+
+    if verify:
+        # So sanh du doan tren du lieu ngau nhien dung so feature cua model
+        import numpy as np
+        X = np.random.default_rng(0).normal(size=(1000, len(model.feature_names_)))
+        diff = np.abs(model.predict_proba(X) - loaded.predict_proba(X)).max()
+        if diff > 1e-9:
+            print(f"[ERROR] Predictions differ after conversion (max diff {diff})")
+            return False
+        print("[OK] Predictions identical")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert pickled CatBoost models to native .cbm")
+    parser.add_argument("--model-dir", default="models")
+    parser.add_argument("--verify", action="store_true", help="Compare predictions before/after")
+    args = parser.parse_args()
+
+    if not CATBOOST_INSTALLED:
+        print("[ERROR] catboost is not installed")
+        return 1
+
+    model_dir = Path(args.model_dir)
+    found = [model_dir / f"{stem}.pkl" for stem in MODEL_STEMS if (model_dir / f"{stem}.pkl").exists()]
+    if not found:
+        print(f"[ERROR] No model .pkl in {model_dir}/")
+        return 1
+
+    ok = all([convert(path, args.verify) for path in found])
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
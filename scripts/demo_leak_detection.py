@@ -9,6 +9,12 @@ import json
 from pathlib import Path
 import sys
 
+# Add project root to path (services.feature_pipeline)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from services.feature_pipeline import (
+    FeatureSchemaError, build_features, check_feature_metadata, load_topology, select_features
+)
+
 def print_header(title):
     """Print beautiful header"""
     print("\n" + "="*80)
@@ -38,48 +44,22 @@ def load_model():
     with open(metadata_file, 'r') as f:
         metadata = json.load(f)
     
+    try:
+        check_feature_metadata(metadata)
+    except FeatureSchemaError as e:
+        print(f"❌ {e}")
+        return None, None
+    
     print(f"✅ Model loaded successfully")
     print(f"   • Features: {len(metadata['feature_cols'])}")
     print(f"   • Training Date: {metadata.get('timestamp', 'N/A')}")
     
     return model, metadata
 
-def prepare_features(df, scenario_id):
-    """Prepare features for prediction"""
+def prepare_features(df, scenario_id, feature_cols):
+    """Prepare features for prediction (shared pipeline: services/feature_pipeline.py)"""
     df['scenario_id'] = scenario_id
-    df['hour'] = (df['timestamp'] / 3600).astype(int)
-    
-    # Enhanced features
-    parts = []
-    for sid, sdf in df.groupby('scenario_id', sort=False):
-        sdf = sdf.copy()
-        g = sdf.groupby('node_id', sort=False)
-        
-        sdf['pressure_change'] = g['pressure'].diff().fillna(0)
-        sdf['head_change'] = g['head'].diff().fillna(0)
-        
-        sdf['pressure_ma5'] = g['pressure'].rolling(5, min_periods=1).mean().reset_index(level=0, drop=True)
-        sdf['head_ma5'] = g['head'].rolling(5, min_periods=1).mean().reset_index(level=0, drop=True)
-        sdf['pressure_ma3'] = g['pressure'].rolling(3, min_periods=1).mean().reset_index(level=0, drop=True)
-        sdf['head_ma3'] = g['head'].rolling(3, min_periods=1).mean().reset_index(level=0, drop=True)
-        
-        pressure_max = g['pressure'].rolling(5, min_periods=1).max().reset_index(level=0, drop=True)
-        head_max = g['head'].rolling(5, min_periods=1).max().reset_index(level=0, drop=True)
-        sdf['pressure_drop'] = pressure_max - sdf['pressure']
-        sdf['head_drop'] = head_max - sdf['head']
-        
-        parts.append(sdf)
-    
-    df = pd.concat(parts, ignore_index=True)
-    
-    # Spatial features
-    df['network_pressure_mean'] = df.groupby(['scenario_id', 'timestamp'])['pressure'].transform('mean')
-    df['network_pressure_std'] = df.groupby(['scenario_id', 'timestamp'])['pressure'].transform('std')
-    df['network_demand_mean'] = df.groupby(['scenario_id', 'timestamp'])['demand'].transform('mean')
-    df['pressure_deviation'] = df['pressure'] - df['network_pressure_mean']
-    df['demand_deviation'] = df.groupby('node_id')['demand'].transform(lambda x: x - x.mean())
-    
-    return df
+    return build_features(df, feature_cols, topology_loader=load_topology)
 
 def demo_scenario(scenario_id, model, metadata, dataset_dir="dataset"):
     """Demo leak detection on a scenario"""
@@ -130,13 +110,13 @@ def demo_scenario(scenario_id, model, metadata, dataset_dir="dataset"):
     
     # Prepare features
     print_section("⚙️  Feature Engineering")
-    df = prepare_features(df, scenario_id)
-    print(f"✅ Engineered {len(metadata['feature_cols'])} features")
+    feature_cols = metadata['feature_cols']
+    df = prepare_features(df, scenario_id, feature_cols)
+    print(f"✅ Engineered {len(feature_cols)} features")
     
     # Predict
     print_section("🤖 Running AI Model")
-    feature_cols = metadata['feature_cols']
-    X = df[feature_cols].values
+    X = select_features(df, feature_cols)
     
     print("⏳ Computing leak probabilities...")
     y_proba = model.predict_proba(X)[:, 1]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Detect leaks cho nhieu simulation mot lan (vd bao cao ro ri theo tuan)
+
+Cung duong dan voi POST /api/v1/leak-detection/detect-batch
+(LeakDetectionService.detect_leaks_batch): feature cua cac run noi thanh mot ma tran,
+predict mot lan (chia doan --max-rows dong), xep hang rieng tung run.
+
+Nguon run:
+    - simulation da luu trong database: --run-ids 12 13 14, hoac --completed [--since/--until];
+    - file JSON SimulationResult (co nodes_results): --files results/*.json.
+
+--compare: do them thoi gian goi detect tung run (nhu goi /detect-from-simulation lan luot).
+
+Usage:
+    python scripts/detect_leaks_batch.py --completed --since 2025-01-06 --until 2025-01-13 --top-k 20
+    python scripts/detect_leaks_batch.py --run-ids 12 13 14 --output weekly_leaks.json
+    python scripts/detect_leaks_batch.py --files results/run_*.json --workers 4 --compare
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+os.makedirs("logs", exist_ok=True)
+
+
+def load_json_run(path: Path):
+    from services.node_arrays import NodeArrays
+    with open(path, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    # File co the la SimulationResponse ({"data": SimulationResult}) hoac SimulationResult
+    if isinstance(result.get('data'), dict):
+        result = result['data']
+    return NodeArrays.from_nodes_results(result.get('nodes_results', {}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch leak detection over many simulation runs")
+    parser.add_argument("--run-ids", type=int, nargs="*", default=[], help="Stored simulation run IDs")
+    parser.add_argument("--completed", action="store_true", help="All completed runs in the database")
+    parser.add_argument("--since", help="With --completed: runs at or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="With --completed: runs before this date (YYYY-MM-DD)")
+    parser.add_argument("--files", nargs="*", default=[], help="SimulationResult JSON files")
+    parser.add_argument("--threshold", type=float)
+    parser.add_argument("--top-k", type=int)
+    parser.add_argument("--window-seconds", type=float)
+    parser.add_argument("--max-rows", type=int, help="Rows per model pass (default: settings.leak_batch_max_rows)")
+    parser.add_argument("--workers", type=int, help="Threads (default: settings.leak_batch_workers / CPU count)")
+    parser.add_argument("--output", help="Write the full result as JSON")
+    parser.add_argument("--compare", action="store_true", help="Also time one detection call per run")
+    args = parser.parse_args()
+
+    from services.leak_detection_service import leak_detection_service, load_stored_run
+
+    runs = {}
+    run_ids = list(args.run_ids)
+    if args.completed:
+        from core.database import db_manager
+        since = datetime.strptime(args.since, "%Y-%m-%d") if args.since else None
+        until = datetime.strptime(args.until, "%Y-%m-%d") if args.until else None
+        run_ids.extend(run["id"] for run in db_manager.list_simulation_runs("completed", since, until))
+    for run_id in run_ids:
+        runs[str(run_id)] = lambda run_id=run_id: load_stored_run(run_id)
+    for path in args.files:
+        runs[Path(path).stem] = lambda path=path: load_json_run(Path(path))
+    if not runs:
+        print("[ERROR] No runs - use --run-ids, --completed or --files")
+        return 1
+
+    if not leak_detection_service.is_ready():
+        print(f"[ERROR] Model not loaded: {leak_detection_service.models.last_error}")
+        return 1
+
+    result = leak_detection_service.detect_leaks_batch(
+        runs, threshold=args.threshold, top_k=args.top_k, window=args.window_seconds,
+        max_rows=args.max_rows, workers=args.workers
+    )
+    if not result["success"]:
+        print(f"[ERROR] {result['error']}")
+        return 1
+
+    summary = result["summary"]
+    print(f"\nBatch detection: {summary['runs']} runs, {summary['total_records']} records, "
+          f"{summary['model_passes']} model passes, {summary['workers']} workers")
+    print(f"  {summary['elapsed_ms']:.0f} ms ({summary['records_per_second']} records/s)")
+    print(f"\n  {'run':<24} {'records':>9} {'leaks':>6}  top leak")
+    for run_key, run in result["runs"].items():
+        if not run["success"]:
+            print(f"  {run_key:<24} {'-':>9} {'-':>6}  [ERROR] {run['error']}")
+            continue
+        top = run["leaks"][0] if run["leaks"] else None
+        top_text = f"{top['node_id']} (p={top['probability']:.3f})" if top else "-"
+        print(f"  {run_key:<24} {run['summary']['total_records']:>9} {run['summary']['detected_leaks']:>6}  {top_text}")
+
+    if args.compare:
+        # Moi run mot lan detect rieng (khong dung cache cua lan batch vua roi)
+        leak_detection_service.scored_runs.clear()
+        started = time.perf_counter()
+        for source in runs.values():
+            arrays = source() if callable(source) else source
+            leak_detection_service.detect_leaks_from_arrays(arrays, args.threshold, args.top_k, args.window_seconds)
+        per_run_ms = (time.perf_counter() - started) * 1000
+        print(f"\nOne call per run: {per_run_ms:.0f} ms vs batch {summary['elapsed_ms']:.0f} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2, default=str)
+        print(f"\n[OK] Result written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Xuat model CatBoost sang dang mang NumPy (.npz) va so sanh voi CatBoost
+
+Container serving (leak_detection_api.py) voi settings.leak_model_runtime = "numpy" (hoac
+"auto" khi khong cai catboost) load .npz va predict bang services/oblivious_trees.py -
+khong import catboost, khong unpickle model.
+
+Script:
+    - doc model .cbm/.pkl (can catboost) hoac file JSON cua CatBoost (--json, khong can catboost);
+    - luu models/<ten model>.npz;
+    - kiem tra predict_proba cua ban NumPy = CatBoost (max abs diff) tren du lieu ngau nhien;
+    - do latency predict_proba theo batch size, thoi gian load va RSS cua mot worker moi
+      (process con: load model + predict 1 dong) cho tung runtime.
+--synthetic: khong co model -> train CatBoost tren du lieu ngau nhien voi kich thuoc cua
+scripts/train_leak_model.py (1000 tree, depth 12); khong cai catboost -> ensemble ngau
+nhien cung kich thuoc va chi do ban NumPy.
+
+Usage:
+    python scripts/export_model_numpy.py
+    python scripts/export_model_numpy.py --json models/leak_detection_model.json
+    python scripts/export_model_numpy.py --synthetic --trees 1000 --depth 12
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+os.makedirs("logs", exist_ok=True)
+
+import numpy as np
+
+from services.model_store import CATBOOST_INSTALLED, MODEL_STEMS, find_model_file, load_model_file
+from services.oblivious_trees import ObliviousTreeModel
+
+BATCH_SIZES = (1, 100, 1000, 10000)
+
+# Process con: load model theo runtime + predict 1 dong -> thoi gian, RSS dinh (KB).
+# VmHWM cua /proc (ru_maxrss giu gia tri cua process cha qua fork/exec)
+_WORKER_PROBE = """
+import resource, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from services.model_store import load_model_file
+from pathlib import Path
+import numpy as np
+model = load_model_file(Path({path!r}))
+model.predict_proba(np.zeros((1, {n_features})))
+elapsed = time.perf_counter() - started
+try:
+    with open("/proc/self/status") as f:
+        peak_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+except (OSError, StopIteration):
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, peak_kb)
+"""
+
+
+def synthetic_model(n_trees: int, depth: int, n_features: int, seed: int = 0):
+    """CatBoostClassifier train tren du lieu ngau nhien, hoac (khong co catboost) ensemble ngau nhien"""
+    rng = np.random.default_rng(seed)
+    if CATBOOST_INSTALLED:
+        from catboost import CatBoostClassifier
+        X = rng.normal(size=(20000, n_features))
+        y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(size=len(X)) > 1.5).astype(int)
+        model = CatBoostClassifier(iterations=n_trees, depth=depth, verbose=False, random_seed=seed,
+                                   thread_count=-1, allow_writing_files=False)
+        model.fit(X, y)
+        return model
+    return ObliviousTreeModel(
+        rng.integers(0, n_features, (n_trees, depth)),
+        rng.normal(size=(n_trees, depth)),
+        rng.normal(scale=0.05, size=(n_trees, 1 << depth)),
+        bias=-2.0,
+    )
+
+
+def timed_ms(fn, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000
+
+
+def probe_worker(path: Path, n_features: int):
+    code = _WORKER_PROBE.format(root=str(project_root), path=str(path), n_features=n_features)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    seconds, rss_kb = out.stdout.split()
+    return float(seconds) * 1000, int(rss_kb) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export CatBoost model to NumPy arrays and compare latency")
+    parser.add_argument("--model-dir", default="models")
+    parser.add_argument("--json", help="CatBoost JSON model (save_model(format='json')) instead of .cbm/.pkl")
+    parser.add_argument("--synthetic", action="store_true", help="Benchmark a random ensemble (no model needed)")
+    parser.add_argument("--trees", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=12)
+    parser.add_argument("--features", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    model_dir = Path(args.model_dir)
+    reference = None
+    source = None
+    if args.synthetic:
+        print(f"[INFO] Synthetic model: {args.trees} trees, depth {args.depth}, {args.features} features")
+        numpy_model = synthetic_model(args.trees, args.depth, args.features)
+        target = Path(tempfile.mkdtemp()) / "synthetic.npz"
+        if not isinstance(numpy_model, ObliviousTreeModel):
+            reference = numpy_model
+            source = target.with_suffix(".cbm")
+            reference.save_model(str(source), format="cbm")
+            numpy_model = ObliviousTreeModel.from_catboost(reference)
+    elif args.json:
+        with open(args.json, 'r') as f:
+            numpy_model = ObliviousTreeModel.from_catboost_json(json.load(f))
+        target = model_dir / f"{Path(args.json).stem}.npz"
+    else:
+        if not CATBOOST_INSTALLED:
+            print("[ERROR] catboost is not installed - use --json with a CatBoost JSON model")
+            return 1
+        source = find_model_file(model_dir, runtime="catboost")
+        if source is None:
+            print(f"[ERROR] No model in {model_dir}/ (expected {', '.join(MODEL_STEMS)} .cbm/.pkl)")
+            return 1
+        reference = load_model_file(source)
+        numpy_model = ObliviousTreeModel.from_catboost(reference)
+        target = source.with_suffix(".npz")
+
+    numpy_model.save(target)
+    n_features = numpy_model.n_features
+    print(f"[OK] {numpy_model.tree_count_} trees (depth {numpy_model.depth}) -> {target} "
+          f"({target.stat().st_size / 1024:.0f} KB)")
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(max(BATCH_SIZES), n_features))
+    X[rng.random(X.shape) < 0.01] = np.nan
+
+    if reference is not None:
+        diff = np.abs(reference.predict_proba(X) - numpy_model.predict_proba(X)).max()
+        if diff > 1e-9:
+            print(f"[ERROR] NumPy predictions differ from CatBoost (max abs diff {diff:.2e})")
+            return 1
+        print(f"[OK] predict_proba matches CatBoost on {len(X)} rows (max abs diff {diff:.2e})")
+
+    print("\npredict_proba latency (median):")
+    print(f"  {'rows':>6} {'catboost':>12} {'numpy':>12}")
+    for n in BATCH_SIZES:
+        batch = X[:n]
+        numpy_ms = timed_ms(lambda: numpy_model.predict_proba(batch), args.runs)
+        catboost_ms = timed_ms(lambda: reference.predict_proba(batch), args.runs) if reference is not None else None
+        catboost_col = f"{catboost_ms:9.2f} ms" if catboost_ms is not None else f"{'-':>12}"
+        print(f"  {n:>6} {catboost_col} {numpy_ms:9.2f} ms")
+
+    print("\nNew worker (import + load + first predict):")
+    workers = [("numpy (.npz)", target)]
+    if source is not None:
+        workers.insert(0, (f"catboost ({source.suffix})", source))
+    for label, path in workers:
+        load_ms, rss_mb = probe_worker(path, n_features)
+        print(f"  {label:<18} {load_ms:8.0f} ms  peak RSS {rss_mb:6.0f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
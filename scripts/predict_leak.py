@@ -7,6 +7,12 @@ import pickle
 import sys
 from pathlib import Path
 
+# Add project root to path (services.feature_pipeline)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from services.feature_pipeline import (
+    FeatureSchemaError, build_features, check_feature_metadata, load_topology
+)
+
 def load_model():
     """Load model và scaler"""
     model_dir = Path("models")
@@ -29,6 +35,12 @@ def load_model():
     with open(metadata_file, 'r') as f:
         metadata = json.load(f)
     
+    try:
+        check_feature_metadata(metadata)
+    except FeatureSchemaError as e:
+        print(f"[ERROR] {e}")
+        return None, None, None
+    
     return model, scaler, metadata
 
 def predict_scenario(scenario_id, dataset_dir="dataset"):
@@ -50,19 +62,11 @@ def predict_scenario(scenario_id, dataset_dir="dataset"):
     reservoir_nodes = metadata['reservoir_nodes']
     df_ml = df[~df['node_id'].isin(reservoir_nodes)].copy()
     
-    # Feature engineering
-    df_ml['hour'] = (df_ml['timestamp'] / 3600).astype(int)
-    df_ml['hour_sin'] = np.sin(2 * np.pi * df_ml['hour'] / 24)
-    df_ml['hour_cos'] = np.cos(2 * np.pi * df_ml['hour'] / 24)
-    
-    # Node ID encoding (same as training)
-    from sklearn.preprocessing import LabelEncoder
-    le = LabelEncoder()
-    le.fit(df_ml['node_id'].astype(str))
-    df_ml['node_id_int'] = le.transform(df_ml['node_id'].astype(str))
+    # Feature engineering (shared pipeline: services/feature_pipeline.py)
+    feature_cols = metadata['feature_cols']
+    df_ml = build_features(df_ml, feature_cols, topology_loader=load_topology)
     
     # Prepare features
-    feature_cols = metadata['feature_cols']
     X = df_ml[feature_cols]
     X_scaled = pd.DataFrame(
         scaler.transform(X),
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+SCADA replay server - stand-in cho API SCADA Nuoc Ngam Sai Gon
+
+Server nay noi cung contract voi API that ma ``SCADAService.get_station_data_by_hour``
+dang goi:
+
+    POST {base_url}/GetStationDataByHour
+    body: {"stationCode": "13085", "fromDate": "2025-10-22 00:00", "toDate": "2025-10-24 00:00"}
+    -> {"code": 200, "message": "success", "data": [{transferTime, parameterCode, value, ...}]}
+
+Du lieu duoc phat lai tu file ghi san (recordings) hoac sinh tong hop (synthetic,
+dang dao dong theo ngay), voi toc do dong ho, do tre va ty le loi cau hinh duoc.
+Dung de load test / soak test ca pipeline SCADA -> boundary -> simulation -> detection
+ma khong can goi ``scada.nuocngamsaigon.com``.
+
+Usage:
+    python scripts/scada_replay_server.py --port 8090 --latency-ms 150 --jitter-ms 50 --error-rate 0.02
+    python scripts/scada_replay_server.py --recordings data/scada_recordings --speed 60
+
+    # Ghi lai du lieu that de phat lai sau:
+    python scripts/scada_replay_server.py record --stations 13085 --from "2025-10-22 00:00" --to "2025-10-24 00:00"
+
+Tro backend vao server nay bang bien moi truong (xem core/config.py):
+    SCADA_BASE_URL=http://localhost:8090/scada-api/api/station
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from fastapi import APIRouter, FastAPI, Header
+from fastapi.responses import JSONResponse
+
+# Prefix trung voi base_url cua API that, chi can doi host:port khi tro backend vao day
+API_PREFIX = "/scada-api/api/station"
+
+# Thong tin tham so giong API that (xem SCADAService._extract_*_from_params)
+PARAMETERS = {
+    "P1": {"parameterName": "Ap luc vao", "unitCode": "m"},
+    "Q1": {"parameterName": "Luu luong thuan", "unitCode": "l/s"},
+    "Q2": {"parameterName": "Luu luong nghich", "unitCode": "l/s"},
+    "V": {"parameterName": "Nguon", "unitCode": "V"},
+}
+
+TIME_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M")
+
+
+def parse_time(value: str) -> datetime:
+    """Parse thoi gian theo cac format API SCADA dung (fromDate/toDate/transferTime)"""
+    value = str(value).strip()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return datetime.fromisoformat(value)
+
+
+def format_transfer_time(ts: datetime) -> str:
+    """Format transferTime - SCADABoundaryService parse duoc dang ISO co 'T'"""
+    return ts.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+class ReplayConfig:
+    """Cau hinh server replay"""
+
+    def __init__(
+        self,
+        recordings_dir: Optional[str] = None,
+        speed: float = 1.0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        hang_seconds: float = 35.0,
+        step_minutes: int = 60,
+        seed: int = 42,
+        require_token: Optional[str] = None,
+    ):
+        if speed <= 0:
+            raise ValueError("speed phai > 0")
+        if not 0.0 <= error_rate <= 1.0 or not 0.0 <= timeout_rate <= 1.0:
+            raise ValueError("error_rate va timeout_rate phai nam trong [0, 1]")
+        if step_minutes <= 0:
+            raise ValueError("step_minutes phai > 0")
+
+        self.recordings_dir = recordings_dir
+        self.speed = speed
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        # Mac dinh lon hon timeout 30s cua SCADAService de gia lap timeout that
+        self.hang_seconds = hang_seconds
+        self.step_minutes = step_minutes
+        self.seed = seed
+        self.require_token = require_token
+
+
+class ReplayClock:
+    """
+    Dong ho ao cua server.
+
+    Bat dau tu thoi diem khoi dong va chay nhanh gap ``speed`` lan dong ho that.
+    Du lieu co transferTime sau "bay gio" cua dong ho ao chua duoc tra ve,
+    giong API that chi co du lieu da truyen ve.
+    """
+
+    def __init__(self, speed: float = 1.0, origin: Optional[datetime] = None):
+        self.speed = speed
+        self.origin = origin or datetime.now()
+        self._wall_start = time.monotonic()
+
+    def now(self) -> datetime:
+        elapsed = time.monotonic() - self._wall_start
+        return self.origin + timedelta(seconds=elapsed * self.speed)
+
+
+class SyntheticStationSource:
+    """
+    Sinh du lieu tram tong hop theo chu ky ngay.
+
+    Gia tri chi phu thuoc (station_code, timestamp, seed) nen cung mot cua so
+    thoi gian luon tra ve cung du lieu - ket qua load test lap lai duoc.
+    """
+
+    def __init__(self, seed: int = 42):
+        self.seed = seed
+
+    def _noise(self, station_code: str, ts: datetime, param: str) -> float:
+        key = f"{self.seed}:{station_code}:{param}:{ts.isoformat()}".encode("utf-8")
+        digest = hashlib.blake2b(key, digest_size=8).digest()
+        return int.from_bytes(digest, "big") / 2 ** 64 - 0.5
+
+    def values_at(self, station_code: str, ts: datetime) -> Dict[str, float]:
+        hour = ts.hour + ts.minute / 60.0
+        # Nhu cau cao buoi sang (~7h) va chieu toi (~19h)
+        demand_factor = (
+            1.0
+            + 0.25 * math.exp(-((hour - 7.0) ** 2) / 4.0)
+            + 0.20 * math.exp(-((hour - 19.0) ** 2) / 5.0)
+            - 0.30 * math.exp(-((hour - 3.0) ** 2) / 6.0)
+        )
+        # Ap luc giam khi nhu cau tang (quanh 19m nhu du lieu tram 13085)
+        pressure = 21.0 - 2.5 * (demand_factor - 1.0) + 0.3 * self._noise(station_code, ts, "P1")
+        flow_forward = 180.0 * demand_factor + 5.0 * self._noise(station_code, ts, "Q1")
+        flow_reverse = max(0.0, 0.5 * self._noise(station_code, ts, "Q2"))
+        voltage = 12.6 + 0.1 * self._noise(station_code, ts, "V")
+
+        return {
+            "P1": round(pressure, 2),
+            "Q1": round(flow_forward, 2),
+            "Q2": round(flow_reverse, 2),
+            "V": round(voltage, 2),
+        }
+
+    def records(self, station_code: str, timestamps: List[datetime]) -> List[Tuple[datetime, Dict[str, float]]]:
+        return [(ts, self.values_at(station_code, ts)) for ts in timestamps]
+
+
+class RecordedStationSource:
+    """
+    Phat lai du lieu da ghi tu API that.
+
+    Moi tram la mot file ``<stationCode>.json`` trong ``recordings_dir``, noi dung la
+    response nguyen ban cua API (``{"code": 200, "data": [...]}``) hoac chi mang ``data``.
+    Ban ghi duoc lap lai theo chu ky: moc thoi gian duoc yeu cau duoc map ve vi tri
+    tuong ung trong ban ghi (modulo do dai ban ghi), nen mot ban ghi 2 ngay co the
+    phuc vu soak test nhieu ngay.
+    """
+
+    def __init__(self, recordings_dir: str, step_minutes: int = 60):
+        self.recordings_dir = Path(recordings_dir)
+        self.step = timedelta(minutes=step_minutes)
+        self._stations: Dict[str, Dict[str, Any]] = {}
+
+        if not self.recordings_dir.is_dir():
+            raise FileNotFoundError(f"Khong tim thay thu muc recordings: {recordings_dir}")
+
+        for path in sorted(self.recordings_dir.glob("*.json")):
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            items = payload.get("data", []) if isinstance(payload, dict) else payload
+            series = self._build_series(items)
+            if series:
+                self._stations[path.stem] = series
+
+    def _build_series(self, items: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        slots: Dict[datetime, Dict[str, float]] = {}
+        for item in items or []:
+            try:
+                ts = parse_time(item["transferTime"])
+                value = float(item["value"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            slots.setdefault(ts, {})[item.get("parameterCode", "")] = value
+
+        if not slots:
+            return None
+
+        times = sorted(slots)
+        start = times[0]
+        n_slots = int((times[-1] - start) / self.step) + 1
+        # Slot trong (mat du lieu) duoc giu trong: API that cung co gio khong co du lieu
+        values = [None] * n_slots
+        for ts in times:
+            idx = int((ts - start) / self.step)
+            values[idx] = slots[ts]
+        return {"start": start, "values": values}
+
+    @property
+    def stations(self) -> List[str]:
+        return list(self._stations)
+
+    def records(self, station_code: str, timestamps: List[datetime]) -> List[Tuple[datetime, Dict[str, float]]]:
+        series = self._stations.get(station_code)
+        if series is None:
+            return []
+
+        n_slots = len(series["values"])
+        out = []
+        for ts in timestamps:
+            idx = int((ts - series["start"]) // self.step) % n_slots
+            params = series["values"][idx]
+            if params:
+                out.append((ts, params))
+        return out
+
+
+class ReplayStats:
+    """Dem request de doi chieu voi ket qua load test"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "errors": 0, "timeouts": 0, "records": 0}
+
+    def incr(self, key: str, amount: int = 1):
+        with self._lock:
+            self.counts[key] += amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+def _window_timestamps(from_dt: datetime, to_dt: datetime, step: timedelta) -> List[datetime]:
+    """Cac moc thoi gian trong [from_dt, to_dt], can theo buoc ``step`` tinh tu 00:00"""
+    day_start = from_dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    offset = from_dt - day_start
+    n = int(math.ceil(offset / step)) if offset else 0
+    ts = day_start + n * step
+
+    timestamps = []
+    while ts <= to_dt:
+        timestamps.append(ts)
+        ts += step
+    return timestamps
+
+
+def create_replay_app(config: Optional[ReplayConfig] = None, clock: Optional[ReplayClock] = None) -> FastAPI:
+    """Tao FastAPI app replay voi cau hinh cho truoc"""
+    config = config or ReplayConfig()
+    clock = clock or ReplayClock(speed=config.speed)
+    if config.recordings_dir:
+        source = RecordedStationSource(config.recordings_dir, step_minutes=config.step_minutes)
+    else:
+        source = SyntheticStationSource(seed=config.seed)
+
+    rng = random.Random(config.seed)
+    rng_lock = threading.Lock()
+    stats = ReplayStats()
+    step = timedelta(minutes=config.step_minutes)
+
+    app = FastAPI(
+        title="SCADA Replay Server",
+        description="Stand-in cho API SCADA de load test offline",
+        version="1.0.0",
+    )
+    router = APIRouter(prefix=API_PREFIX)
+
+    def _draw() -> Dict[str, float]:
+        with rng_lock:
+            return {"fault": rng.random(), "jitter": rng.uniform(-1.0, 1.0)}
+
+    @router.post("/GetStationDataByHour")
+    async def get_station_data_by_hour(payload: Dict[str, Any], authorization: Optional[str] = Header(None)):
+        stats.incr("requests")
+
+        if config.require_token and authorization != f"Bearer {config.require_token}":
+            stats.incr("errors")
+            return JSONResponse(status_code=401, content={"code": 401, "message": "Unauthorized", "data": None})
+
+        draw = _draw()
+        delay_ms = max(0.0, config.latency_ms + config.jitter_ms * draw["jitter"])
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000.0)
+
+        # Loi gia lap: timeout (treo lau hon timeout client) hoac loi 5xx
+        if draw["fault"] < config.timeout_rate:
+            stats.incr("timeouts")
+            await asyncio.sleep(config.hang_seconds)
+            return JSONResponse(status_code=504, content={"code": 504, "message": "Gateway Timeout", "data": None})
+        if draw["fault"] < config.timeout_rate + config.error_rate:
+            stats.incr("errors")
+            return JSONResponse(status_code=503, content={"code": 503, "message": "Service Unavailable", "data": None})
+
+        station_code = str(payload.get("stationCode", ""))
+        try:
+            from_dt = parse_time(payload["fromDate"])
+            to_dt = parse_time(payload["toDate"])
+        except (KeyError, ValueError) as e:
+            stats.incr("errors")
+            return JSONResponse(
+                status_code=400,
+                content={"code": 400, "message": f"Invalid fromDate/toDate: {e}", "data": None},
+            )
+
+        # Chi tra du lieu da "truyen ve" theo dong ho ao
+        to_dt = min(to_dt, clock.now())
+        data = []
+        for ts, params in source.records(station_code, _window_timestamps(from_dt, to_dt, step)):
+            transfer_time = format_transfer_time(ts)
+            for code, value in params.items():
+                info = PARAMETERS.get(code, {"parameterName": code, "unitCode": ""})
+                data.append({
+                    "stationCode": station_code,
+                    "transferTime": transfer_time,
+                    "parameterCode": code,
+                    "parameterName": info["parameterName"],
+                    "unitCode": info["unitCode"],
+                    "value": value,
+                })
+
+        stats.incr("ok")
+        stats.incr("records", len(data))
+        return {"code": 200, "message": "success", "data": data}
+
+    app.include_router(router)
+
+    @app.get("/replay/status")
+    async def replay_status():
+        return {
+            "source": "recorded" if config.recordings_dir else "synthetic",
+            "stations": getattr(source, "stations", None),
+            "clock_now": clock.now().isoformat(),
+            "speed": config.speed,
+            "latency_ms": config.latency_ms,
+            "jitter_ms": config.jitter_ms,
+            "error_rate": config.error_rate,
+            "timeout_rate": config.timeout_rate,
+            "stats": stats.snapshot(),
+        }
+
+    app.state.replay_config = config
+    app.state.replay_clock = clock
+    app.state.replay_stats = stats
+    return app
+
+
+def record_stations(station_codes: List[str], from_date: str, to_date: str, output_dir: str) -> int:
+    """Ghi du lieu that tu API SCADA ra file de phat lai sau"""
+    from services.scada_service import scada_service
+
+    out_dir = Path(output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    failed = 0
+    for station_code in station_codes:
+        result = scada_service.get_station_data_by_hour(station_code, from_date, to_date)
+        if not result.get("success"):
+            print(f"[ERROR] Station {station_code}: {result.get('error')} - {result.get('message')}")
+            failed += 1
+            continue
+        path = out_dir / f"{station_code}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result["data"], f, ensure_ascii=False, indent=2)
+        n_items = len(result["data"].get("data") or [])
+        print(f"[OK] Station {station_code}: {n_items} items -> {path}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SCADA replay server cho load/soak test offline")
+    sub = parser.add_subparsers(dest="command")
+
+    rec = sub.add_parser("record", help="Ghi du lieu that tu API SCADA")
+    rec.add_argument("--stations", nargs="+", required=True)
+    rec.add_argument("--from", dest="from_date", required=True, help='VD: "2025-10-22 00:00"')
+    rec.add_argument("--to", dest="to_date", required=True, help='VD: "2025-10-24 00:00"')
+    rec.add_argument("--output", default="data/scada_recordings")
+
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--recordings", default=None, help="Thu muc <stationCode>.json (mac dinh: synthetic)")
+    parser.add_argument("--speed", type=float, default=1.0, help="He so toc do dong ho ao")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Ty le tra ve 503")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Ty le treo request")
+    parser.add_argument("--hang-seconds", type=float, default=35.0)
+    parser.add_argument("--step-minutes", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--require-token", default=None)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        return record_stations(args.stations, args.from_date, args.to_date, args.output)
+
+    import uvicorn
+
+    config = ReplayConfig(
+        recordings_dir=args.recordings,
+        speed=args.speed,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds,
+        step_minutes=args.step_minutes,
+        seed=args.seed,
+        require_token=args.require_token,
+    )
+    app = create_replay_app(config)
+
+    print("SCADA Replay Server")
+    print("=" * 60)
+    print(f"Source: {'recorded (' + args.recordings + ')' if args.recordings else 'synthetic'}")
+    print(f"Base URL: http://localhost:{args.port}{API_PREFIX}")
+    print(f"  -> SCADA_BASE_URL=http://localhost:{args.port}{API_PREFIX}")
+    print("=" * 60)
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
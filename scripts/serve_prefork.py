@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Chay API o che do prefork (core/prefork.py): master nap san mang da parse, topology features,
+model, bang baseline, tu dien chu ky ro ri roi fork cac worker uvicorn dung chung chung (copy-on-write)
+
+Thay cho ``uvicorn main:app --workers N``: khoi dong nhanh hon va it RAM hon moi worker
+(so sanh: scripts/benchmark_prefork.py). GET /ready xanh ngay khi worker nhan ket noi.
+
+Usage:
+    python scripts/serve_prefork.py --workers 2
+    python scripts/serve_prefork.py --app leak_detection_api:app --port 8001 --workers 2
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+os.makedirs("logs", exist_ok=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from prefork workers sharing a warmed master")
+    parser.add_argument("--app", default="main:app", help="ASGI app import string")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2, help="Number of forked workers")
+    parser.add_argument("--warmup", default=None,
+                        help="Comma-separated warmup steps (default: all for main:app, "
+                             "topology_features,leak_model for leak_detection_api:app)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    from core.prefork import PreforkServer
+    from services.warmup import LEAK_API_STEPS, WARMUP_STEPS
+
+    if args.warmup:
+        steps = [s.strip() for s in args.warmup.split(",") if s.strip()]
+    elif args.app.startswith("leak_detection_api:"):
+        steps = list(LEAK_API_STEPS)
+    else:
+        steps = list(WARMUP_STEPS)
+    server = PreforkServer(args.app, args.host, args.port, args.workers, steps, args.log_level)
+    return server.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,8 +5,15 @@ import pandas as pd
 import numpy as np
 import pickle
 import json
+import sys
 from pathlib import Path
 
+# Add project root to path (services.feature_pipeline)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from services.feature_pipeline import (
+    FEATURE_VERSION, FeatureSchemaError, build_features, check_feature_metadata, load_topology, select_features
+)
+
 def load_model():
     """Load trained model"""
     model_file = Path("models/leak_detection_model.pkl")
@@ -22,6 +29,12 @@ def load_model():
     with open(metadata_file, 'r') as f:
         metadata = json.load(f)
     
+    try:
+        check_feature_metadata(metadata)
+    except FeatureSchemaError as e:
+        print(f"[ERROR] {e}")
+        return None, None
+    
     print("[OK] Model loaded successfully")
     print(f"  Features: {len(metadata['feature_cols'])} features")
     if 'optimal_threshold' in metadata:
@@ -31,46 +44,10 @@ def load_model():
     
     return model, metadata
 
-def prepare_features(df):
-    """Prepare features matching training pipeline"""
-    print("[INFO] Preparing features...")
-    
-    # Time features (removed for bias prevention)
-    df['hour'] = (df['timestamp'] / 3600).astype(int)
-    
-    # Enhanced features - process by scenario
-    parts = []
-    for scenario_id, sdf in df.groupby('scenario_id', sort=False):
-        sdf = sdf.copy()
-        g = sdf.groupby('node_id', sort=False)
-        
-        # Changes
-        sdf['pressure_change'] = g['pressure'].diff().fillna(0)
-        sdf['head_change'] = g['head'].diff().fillna(0)
-        
-        # Moving averages
-        sdf['pressure_ma5'] = g['pressure'].rolling(5, min_periods=1).mean().reset_index(level=0, drop=True)
-        sdf['head_ma5'] = g['head'].rolling(5, min_periods=1).mean().reset_index(level=0, drop=True)
-        sdf['pressure_ma3'] = g['pressure'].rolling(3, min_periods=1).mean().reset_index(level=0, drop=True)
-        sdf['head_ma3'] = g['head'].rolling(3, min_periods=1).mean().reset_index(level=0, drop=True)
-        
-        # Drops
-        pressure_max = g['pressure'].rolling(5, min_periods=1).max().reset_index(level=0, drop=True)
-        head_max = g['head'].rolling(5, min_periods=1).max().reset_index(level=0, drop=True)
-        sdf['pressure_drop'] = pressure_max - sdf['pressure']
-        sdf['head_drop'] = head_max - sdf['head']
-        
-        parts.append(sdf)
-    
-    df = pd.concat(parts, ignore_index=True)
-    
-    # Spatial features (network-level statistics)
-    df['network_pressure_mean'] = df.groupby(['scenario_id', 'timestamp'])['pressure'].transform('mean')
-    df['network_pressure_std'] = df.groupby(['scenario_id', 'timestamp'])['pressure'].transform('std')
-    df['network_demand_mean'] = df.groupby(['scenario_id', 'timestamp'])['demand'].transform('mean')
-    df['pressure_deviation'] = df['pressure'] - df['network_pressure_mean']
-    df['demand_deviation'] = df.groupby('node_id')['demand'].transform(lambda x: x - x.mean())
-    
+def prepare_features(df, feature_cols):
+    """Prepare features matching training pipeline (services/feature_pipeline.py)"""
+    print(f"[INFO] Preparing features (pipeline v{FEATURE_VERSION})...")
+    df = build_features(df, feature_cols, topology_loader=load_topology)
     print("[OK] Features prepared")
     return df
 
@@ -95,11 +72,11 @@ def test_scenario(scenario_id, model, metadata, dataset_dir="dataset"):
     df['scenario_id'] = scenario_id
     
     # Prepare features
-    df = prepare_features(df)
+    feature_cols = metadata['feature_cols']
+    df = prepare_features(df, feature_cols)
     
     # Extract features
-    feature_cols = metadata['feature_cols']
-    X = df[feature_cols].values
+    X = select_features(df, feature_cols)
     
     # Predict probabilities
     print("[INFO] Running prediction...")
@@ -7,9 +7,17 @@ from pathlib import Path
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import classification_report, confusion_matrix
 import pickle
+import sys
 import warnings
 warnings.filterwarnings('ignore')
 
+# Add project root to path (services.feature_pipeline)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from services.feature_pipeline import (
+    BASELINE_FEATURES, FEATURE_VERSION, build_features, feature_metadata, load_topology
+)
+from services.oblivious_trees import ObliviousTreeModel
+
 # CatBoost
 try:
     from catboost import CatBoostClassifier
@@ -222,57 +230,6 @@ df_ml['hour'] = (df_ml['timestamp'] / 3600).astype(int)
 # df_ml['hour_cos'] = np.cos(2 * np.pi * df_ml['hour'] / 24)
 print("[OK] Time features REMOVED to prevent time-based learning bias")
 
-# Enhanced features: pressure changes, moving averages
-print("[INFO] Adding enhanced features...")
-print("[INFO] Optimizing with scenario-wise processing for memory efficiency...")
-import time
-feat_start = time.time()
-
-# FIX: MEMORY EFFICIENT - Use groupby(['scenario_id', 'node_id']) with transform
-# NO sorting needed, NO loop, pandas handles everything efficiently
-print("[INFO] Computing features with groupby(['scenario_id', 'node_id']).transform()...")
-print("[INFO] This is memory efficient and fast (single pass over data)...")
-
-# Group by scenario_id AND node_id at once (ensures no leakage between scenarios)
-g = df_ml.groupby(['scenario_id', 'node_id'], sort=False)
-
-# Pressure/Head changes (diff within each scenario-node group)
-print("  Computing pressure_change, head_change...")
-df_ml['pressure_change'] = g['pressure'].transform(lambda x: x.diff().fillna(0))
-df_ml['head_change'] = g['head'].transform(lambda x: x.diff().fillna(0))
-
-# Moving averages (rolling within each scenario-node group)
-print("  Computing moving averages (MA3, MA5)...")
-df_ml['pressure_ma5'] = g['pressure'].transform(lambda x: x.rolling(5, min_periods=1).mean())
-df_ml['head_ma5'] = g['head'].transform(lambda x: x.rolling(5, min_periods=1).mean())
-df_ml['pressure_ma3'] = g['pressure'].transform(lambda x: x.rolling(3, min_periods=1).mean())
-df_ml['head_ma3'] = g['head'].transform(lambda x: x.rolling(3, min_periods=1).mean())
-
-# Pressure/Head drops (rolling max - current within each scenario-node group)
-print("  Computing pressure_drop, head_drop...")
-pressure_max = g['pressure'].transform(lambda x: x.rolling(5, min_periods=1).max())
-head_max = g['head'].transform(lambda x: x.rolling(5, min_periods=1).max())
-df_ml['pressure_drop'] = pressure_max - df_ml['pressure']
-df_ml['head_drop'] = head_max - df_ml['head']
-
-print(f"  [OK] Enhanced features completed in {time.time() - feat_start:.1f}s")
-
-# Add SPATIAL features (network-level statistics - no topology needed!)
-print("[INFO] Adding spatial features (network-level statistics)...")
-spatial_start = time.time()
-
-# Network-wide statistics at each timestep (captures global anomalies)
-df_ml['network_pressure_mean'] = df_ml.groupby(['scenario_id', 'timestamp'])['pressure'].transform('mean')
-df_ml['network_pressure_std'] = df_ml.groupby(['scenario_id', 'timestamp'])['pressure'].transform('std')
-df_ml['network_demand_mean'] = df_ml.groupby(['scenario_id', 'timestamp'])['demand'].transform('mean')
-
-# Node deviation from network (leak creates local anomalies)
-df_ml['pressure_deviation'] = df_ml['pressure'] - df_ml['network_pressure_mean']
-# FIX: Calculate demand_deviation per scenario to prevent leakage between train/val/test
-df_ml['demand_deviation'] = df_ml.groupby(['scenario_id', 'node_id'])['demand'].transform(lambda x: x - x.mean())
-
-print(f"  [OK] Spatial features completed in {time.time() - spatial_start:.1f}s")
-
 # REMOVED: node_id_int, leak_node, scenario_id (to prevent data leakage)
 print("[OK] REMOVED: node_id_int, leak_node, scenario_id from features")
 
@@ -287,6 +244,32 @@ feature_cols = [
     'network_pressure_mean', 'network_pressure_std', 'network_demand_mean',
     'pressure_deviation', 'demand_deviation'
 ]
+
+# --residual-features: them observed - baseline khong ro ri (services/baseline_cache.py, cung
+# bang baseline voi serving: hash file .inp + bin head reservoir)
+baseline = None
+if '--residual-features' in sys.argv:
+    from core.config import settings
+    from services.baseline_cache import BaselineCache
+    baseline = BaselineCache(settings.epanet_input_file, settings.leak_baseline_cache_dir,
+                             settings.leak_baseline_head_bin_m)
+    feature_cols.extend(BASELINE_FEATURES)
+    print(f"[INFO] Residual features enabled: {list(BASELINE_FEATURES)} (baseline {settings.epanet_input_file})")
+
+# Shared feature pipeline (services/feature_pipeline.py) - same definitions as serving
+# (rolling per scenario-node group, network statistics per scenario-timestamp)
+print(f"[INFO] Computing features with feature pipeline v{FEATURE_VERSION}...")
+import time
+feat_start = time.time()
+if baseline is not None:
+    # residuals() chi dung bin da giai: giai truoc moi head reservoir co trong du lieu train
+    baseline.warm_frame(df_ml)
+df_ml = build_features(df_ml, feature_cols, topology_loader=load_topology,
+                       baseline_loader=(lambda: baseline) if baseline is not None else None)
+if baseline is not None:
+    print(f"  [OK] Baseline: {baseline.stats()}")
+print(f"  [OK] Features completed in {time.time() - feat_start:.1f}s")
+
 print(f"[OK] Features: {len(feature_cols)} features")
 print(f"  Features: {feature_cols}")
 
@@ -687,6 +670,17 @@ with open(model_file, 'wb') as f:
     pickle.dump(model, f)
 print(f"[OK] Model saved: {model_file}")
 
+# Dinh dang native cua CatBoost (.cbm): service uu tien load file nay (services/model_store.py)
+native_model_file = None
+if hasattr(model, 'save_model'):
+    native_model_file = model_dir / "leak_detection_model.cbm"
+    model.save_model(str(native_model_file), format="cbm")
+    print(f"[OK] Native model saved: {native_model_file}")
+    # Ban NumPy cho container serving khong cai catboost (services/oblivious_trees.py)
+    numpy_model_file = model_dir / "leak_detection_model.npz"
+    ObliviousTreeModel.from_catboost(model).save(numpy_model_file)
+    print(f"[OK] NumPy model saved: {numpy_model_file}")
+
 # Save scaler (if exists)
 if scaler is not None:
     scaler_file = model_dir / "scaler.pkl"
@@ -705,7 +699,7 @@ except:
 # Save metadata
 # Note: reservoir_nodes not defined (filter removed to avoid misclassification)
 model_metadata = {
-    'feature_cols': feature_cols,
+    **feature_metadata(feature_cols),
     'reservoir_nodes': [],  # Not filtered (temporarily removed to avoid misclassification)
     'n_train': len(X_train),
     'n_val': len(X_val),
@@ -746,6 +740,8 @@ print("TRAINING HOAN TAT!")
 print("="*80)
 print("\nCac file da luu:")
 print(f"  1. {model_file} - Model")
+if native_model_file is not None:
+    print(f"     {native_model_file} - Model (CatBoost native)")
 if scaler is not None:
     print(f"  2. {scaler_file} - Scaler")
 else:
@@ -0,0 +1,329 @@
+"""
+Backtest leak detection tren du lieu SCADA lich su
+
+Chay lai pipeline SCADA -> mo phong EPANET -> leak detection cho tung ngay trong mot khoang
+lich su, doc SCADA tu kho cuc bo (services/scada_store.py, khong goi API that), de xem model
+va threshold hien tai se bao ro ri the nao tren nhieu thang du lieu.
+
+- Khoang [start, end] chia theo ngay; moi ngay la mot task doc lap, chay tren process pool
+  (mac dinh mot process moi CPU - mo phong WNTR va feature engineering giu GIL nen thread
+  khong tang toc). Process dung context "spawn": moi worker tu tao SCADAService / EPANETService
+  / LeakDetectionService (model, ket noi SQLite rieng) thay vi ke thua tu process cha qua fork.
+- Ket qua moi ngay ghi ra Parquet trong ``<out_dir>/days/``: ``<ngay>.detections.parquet``
+  (ro ri da xep hang) roi ``<ngay>.timing.parquet`` (thoi gian tung buoc, trang thai). File
+  timing ghi sau cung (ghi file tam roi rename) nen la checkpoint: chay lai cung out_dir bo qua
+  ngay da "completed" / "no_data", chi chay ngay chua xong hoac "failed".
+- ``backtest.json`` giu tham so (kho SCADA, tram, threshold, top_k, window, timestep); chay lai
+  voi tham so khac tren cung out_dir bi tu choi de khong tron ket qua.
+- Xong thi gop cac file ngay thanh ``detections.parquet`` va ``timings.parquet``.
+"""
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from utils.logger import logger
+
+DETECTION_COLUMNS = (
+    'day', 'run_id', 'rank', 'node_id', 'probability', 'mean_probability', 'flagged_steps',
+    'first_flagged', 'last_flagged', 'detected_at', 'pressure', 'head', 'demand', 'flow'
+)
+TIMING_COLUMNS = (
+    'day', 'status', 'error', 'run_id', 'simulation_start', 'scada_stations', 'scada_records',
+    'records', 'detected_leaks', 'threshold_used', 'model', 'scada_ms', 'simulation_ms',
+    'detection_ms', 'total_ms', 'worker_pid'
+)
+# Trang thai khong can chay lai khi resume ("failed" thi chay lai)
+DONE_STATUSES = ("completed", "no_data")
+
+
+def day_range(start: date, end: date) -> List[date]:
+    """Cac ngay tu start den end (ca hai dau)"""
+    if end < start:
+        raise ValueError(f"end ({end}) is before start ({start})")
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+class BacktestPipeline:
+    """SCADA -> mo phong -> detect cho mot ngay (moi worker process mot instance)"""
+
+    def __init__(self, scada: Any, epanet: Any, detector: Any):
+        self.scada = scada
+        self.epanet = epanet
+        self.detector = detector
+
+    def run_day(self, day: date, options: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Chay pipeline cho ngay ``day``; tra ve {"timing": dict, "leaks": list}
+
+        Loi tung buoc duoc ghi vao timing (status "failed") thay vi raise, de mot ngay hong
+        khong dung ca backtest.
+        """
+        from models.schemas import SimulationInput, SimulationStatus
+        from services.node_arrays import NodeArrays
+
+        timing: Dict[str, Any] = {c: None for c in TIMING_COLUMNS}
+        timing.update(day=day.isoformat(), status="failed", worker_pid=os.getpid(),
+                      scada_ms=0.0, simulation_ms=0.0, detection_ms=0.0)
+        leaks: List[Dict[str, Any]] = []
+        started = time.perf_counter()
+        try:
+            day_start = datetime.combine(day, datetime.min.time())
+            day_end = day_start + timedelta(hours=options['duration_hours'])
+            stations = options['stations'] or list(self.scada.store.stations)
+
+            t0 = time.perf_counter()
+            boundary = self.scada.get_boundary_data(
+                stations, day_start.strftime("%Y-%m-%d %H:%M"), day_end.strftime("%Y-%m-%d %H:%M")
+            )
+            timing['scada_ms'] = (time.perf_counter() - t0) * 1000
+            boundary_conditions = boundary.get("boundary_conditions", {})
+            timing['scada_stations'] = len(boundary_conditions)
+            timing['scada_records'] = boundary["summary"]["total_records"]
+            if not boundary["success"]:
+                # Khong co du lieu SCADA ngay nay: mo phong voi boundary cua file .inp khong
+                # phan anh lich su -> bo qua
+                timing['status'] = "no_data"
+                return {"timing": timing, "leaks": leaks}
+
+            captured = {}
+
+            def capture(results, wn):
+                captured['arrays'] = NodeArrays.from_wntr(results)
+
+            t0 = time.perf_counter()
+            result = self.epanet.run_simulation(
+                SimulationInput(
+                    duration=options['duration_hours'],
+                    hydraulic_timestep=options['hydraulic_timestep'],
+                    report_timestep=options['hydraulic_timestep'],
+                ),
+                scada_boundary_data=boundary_conditions,
+                on_results=capture
+            )
+            timing['simulation_ms'] = (time.perf_counter() - t0) * 1000
+            timing['run_id'] = result.run_id
+            if result.status != SimulationStatus.COMPLETED or 'arrays' not in captured:
+                timing['error'] = result.error_message or "Simulation produced no results"
+                return {"timing": timing, "leaks": leaks}
+
+            arrays = captured['arrays']
+            t0 = time.perf_counter()
+            detection = self.detector.detect_leaks_from_arrays(
+                arrays, options['threshold'], options['top_k'], options['window'],
+                run_key=f"backtest-{day.isoformat()}"
+            )
+            timing['detection_ms'] = (time.perf_counter() - t0) * 1000
+            timing['records'] = len(arrays)
+            if not detection["success"]:
+                timing['error'] = detection.get("error")
+                return {"timing": timing, "leaks": leaks}
+
+            bundle = self.detector.models.peek()
+            timing['model'] = bundle.source.name if bundle is not None else None
+            timing['threshold_used'] = detection["summary"]["threshold_used"]
+            timing['detected_leaks'] = detection["summary"]["detected_leaks"]
+
+            # timestamp mo phong tinh tu thoi diem SCADA dau tien (nhu EPANETService)
+            sim_start = _simulation_start(boundary_conditions) or day_start
+            timing['simulation_start'] = sim_start.isoformat()
+            for rank, leak in enumerate(detection["leaks"], start=1):
+                row = {c: leak.get(c) for c in DETECTION_COLUMNS}
+                row.update(day=day.isoformat(), run_id=result.run_id, rank=rank,
+                           detected_at=(sim_start + timedelta(seconds=leak['timestamp'])).isoformat())
+                if 'window_start' in leak:
+                    row['window_start'] = leak['window_start']
+                leaks.append(row)
+            timing['status'] = "completed"
+        except Exception as e:
+            logger.error(f"Backtest day {day} failed: {e}")
+            timing['error'] = str(e)
+        finally:
+            timing['total_ms'] = (time.perf_counter() - started) * 1000
+        return {"timing": timing, "leaks": leaks}
+
+
+def _simulation_start(boundary_conditions: Dict[str, List[Dict[str, Any]]]) -> Optional[datetime]:
+    from services.scada_store import parse_time
+    for records in boundary_conditions.values():
+        if records and records[0].get('timestamp'):
+            try:
+                return parse_time(records[0]['timestamp']).replace(minute=0, second=0, microsecond=0)
+            except ValueError:
+                continue
+    return None
+
+
+def default_pipeline(store_dir: str) -> BacktestPipeline:
+    """Pipeline cua ung dung: SCADAService doc kho cuc bo + singleton EPANET / leak detection"""
+    from services.epanet_service import epanet_service
+    from services.leak_detection_service import leak_detection_service
+    from services.scada_service import SCADAService
+    from services.scada_store import LocalSCADAStore
+
+    return BacktestPipeline(SCADAService(store=LocalSCADAStore(store_dir)), epanet_service, leak_detection_service)
+
+
+# Pipeline cua worker process hien tai (tao mot lan trong _init_worker)
+_pipeline: Optional[BacktestPipeline] = None
+
+
+def _init_worker(factory: Callable[[str], BacktestPipeline], store_dir: str):
+    global _pipeline
+    _pipeline = factory(store_dir)
+
+
+def _write_parquet(df: pd.DataFrame, path: Path):
+    """Ghi file tam roi rename: file dich hoac day du hoac chua ton tai"""
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _run_day_task(day_iso: str, options: Dict[str, Any], days_dir: str) -> Dict[str, Any]:
+    """Task cua worker: chay mot ngay, ghi detections roi timing (checkpoint), tra ve timing"""
+    day = date.fromisoformat(day_iso)
+    output = _pipeline.run_day(day, options)
+    days_path = Path(days_dir)
+    leaks = pd.DataFrame(output["leaks"], columns=_detection_columns(options))
+    _write_parquet(leaks, days_path / f"{day_iso}.detections.parquet")
+    _write_parquet(pd.DataFrame([output["timing"]], columns=list(TIMING_COLUMNS)),
+                   days_path / f"{day_iso}.timing.parquet")
+    return output["timing"]
+
+
+def _detection_columns(options: Dict[str, Any]) -> List[str]:
+    return list(DETECTION_COLUMNS) + (['window_start'] if options.get('window') is not None else [])
+
+
+class BacktestRunner:
+    """Chia khoang lich su theo ngay, chay song song tren process pool, resume tu checkpoint"""
+
+    def __init__(
+        self,
+        store_dir: str,
+        out_dir: str,
+        start: date,
+        end: date,
+        stations: Optional[List[str]] = None,
+        threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+        window: Optional[float] = None,
+        hydraulic_timestep: int = 1,
+        workers: int = 0,
+        pipeline_factory: Callable[[str], BacktestPipeline] = default_pipeline
+    ):
+        self.store_dir = str(store_dir)
+        self.out_dir = Path(out_dir)
+        self.days_dir = self.out_dir / "days"
+        self.days = day_range(start, end)
+        self.workers = workers if workers and workers > 0 else (os.cpu_count() or 1)
+        self.pipeline_factory = pipeline_factory
+        self.options = {
+            "store_dir": str(Path(store_dir).resolve()),
+            "stations": sorted(stations) if stations else None,
+            "threshold": threshold,
+            "top_k": top_k,
+            "window": window,
+            "duration_hours": 24,
+            "hydraulic_timestep": hydraulic_timestep,
+        }
+
+    def _check_manifest(self):
+        """Tham so phai trung voi lan chay truoc tren cung out_dir (neu co)"""
+        manifest_path = self.out_dir / "backtest.json"
+        if manifest_path.exists():
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+            if previous != self.options:
+                changed = sorted(k for k in set(previous) | set(self.options) if previous.get(k) != self.options.get(k))
+                raise ValueError(
+                    f"Backtest in {self.out_dir} was run with different options ({', '.join(changed)}) "
+                    f"- use a new output directory"
+                )
+            return
+        self.days_dir.mkdir(parents=True, exist_ok=True)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(self.options, f, indent=2)
+
+    def completed_days(self) -> Dict[str, str]:
+        """Ngay da co checkpoint -> status"""
+        done = {}
+        for path in self.days_dir.glob("*.timing.parquet"):
+            status = pd.read_parquet(path, columns=['status'])['status']
+            if len(status):
+                done[path.name.split(".")[0]] = status.iloc[0]
+        return done
+
+    def pending_days(self) -> List[date]:
+        done = self.completed_days() if self.days_dir.exists() else {}
+        return [d for d in self.days if done.get(d.isoformat()) not in DONE_STATUSES]
+
+    def run(self, progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Chay cac ngay chua xong, gop ket qua; tra ve summary
+
+        Args:
+            progress: callback(timing) sau moi ngay xong (vd in tien do ra CLI)
+        """
+        self._check_manifest()
+        pending = self.pending_days()
+        workers = max(1, min(self.workers, len(pending)))
+        logger.info(f"Backtest {self.days[0]} -> {self.days[-1]}: {len(pending)}/{len(self.days)} day(s) "
+                    f"to run on {workers} worker(s)")
+
+        started = time.perf_counter()
+        timings = []
+        if workers == 1:
+            _init_worker(self.pipeline_factory, self.store_dir)
+            for day in pending:
+                timings.append(_run_day_task(day.isoformat(), self.options, str(self.days_dir)))
+                if progress:
+                    progress(timings[-1])
+        elif pending:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(self.pipeline_factory, self.store_dir)) as pool:
+                futures = [pool.submit(_run_day_task, day.isoformat(), self.options, str(self.days_dir))
+                           for day in pending]
+                for future in as_completed(futures):
+                    timings.append(future.result())
+                    if progress:
+                        progress(timings[-1])
+        elapsed = time.perf_counter() - started
+
+        paths = self.collect()
+        statuses = [t['status'] for t in timings]
+        return {
+            "days": len(self.days),
+            "skipped_days": len(self.days) - len(pending),
+            "processed_days": len(timings),
+            "completed": statuses.count("completed"),
+            "no_data": statuses.count("no_data"),
+            "failed": statuses.count("failed"),
+            "workers": workers,
+            "elapsed_s": round(elapsed, 3),
+            "days_per_minute": round(len(timings) / elapsed * 60, 2) if elapsed > 0 and timings else None,
+            **paths,
+        }
+
+    def collect(self) -> Dict[str, Optional[str]]:
+        """Gop file tung ngay (trong khoang cua runner) thanh detections.parquet / timings.parquet"""
+        paths: Dict[str, Optional[str]] = {}
+        for kind, name in (("detections", "detections.parquet"), ("timing", "timings.parquet")):
+            frames = [pd.read_parquet(path) for path in (self.days_dir / f"{d.isoformat()}.{kind}.parquet"
+                                                         for d in self.days) if path.exists()]
+            frames = [f for f in frames if len(f)]
+            target = self.out_dir / name
+            if not frames:
+                paths[kind] = None
+                continue
+            _write_parquet(pd.concat(frames, ignore_index=True), target)
+            paths[kind] = str(target)
+        return {"detections_path": paths["detections"], "timings_path": paths["timing"]}
@@ -0,0 +1,297 @@
+"""
+Loi giai khong ro ri (baseline) cua mang cho residual features
+
+Model chi thay pressure / head tuyet doi: do lech so voi thuy luc "binh thuong" phai suy ra
+gian tiep qua network_pressure_mean / pressure_deviation. Voi mang hien tai (mot reservoir
+TXU2, demand co dinh theo file .inp - EPANETService dat moi pattern demand = 1.0), trang thai
+khong ro ri chi phu thuoc head cua reservoir. BaselineCache giu loi giai steady-state (mot
+buoc WNTR) cua mang theo:
+    - hash noi dung file .inp: doi .inp -> baseline cu khong con dung;
+    - bin head reservoir (rong ``bin_width`` m): baseline tai head h = noi suy tuyen tinh
+      giua hai bin ke nhau (mang mot nguon, demand co dinh: pressure tuyen tinh theo head
+      reservoir nen noi suy la chinh xac).
+Moi bin chi mo phong mot lan (luu <cache_dir>/<inp_hash>_<bin_width>.npz, dung lai giua cac
+lan khoi dong). Bin duoc giai truoc - warm(head_min, head_max) o warmup (services/warmup.py),
+warm_frame(df) cho training / script; residuals() khong bao gio mo phong: chi gather + tru mang
+tren cac bin da giai (head ngoai khoang -> ngoai suy tuyen tinh tu hai bin o bien):
+    pressure_residual = pressure - baseline_pressure(node, head reservoir cung timestamp)
+    head_residual = head - baseline_head(node, ...)
+Head reservoir cua moi (scenario_id, timestamp) lay tu dong cua reservoir trong du lieu (ket qua
+mo phong co ca node reservoir); khong co -> head trong file .inp.
+"""
+import hashlib
+import os
+import threading
+import warnings
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import logger
+
+Fingerprint = Tuple[str, int, int]
+
+
+def inp_hash(inp_file: str) -> str:
+    """Hash noi dung file .inp (khoa cua baseline)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(inp_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BaselineNotWarmedError(RuntimeError):
+    """Chua co du bin baseline da giai (can warmup / warm truoc khi tinh residual)"""
+
+
+class SteadyStateSolver:
+    """Giai steady-state (duration 0) cua mang voi head reservoir cho truoc"""
+
+    def __init__(self, inp_file: str, reservoir: Optional[str] = None):
+        import wntr
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.wn = wntr.network.WaterNetworkModel(inp_file)
+        reservoirs = list(self.wn.reservoir_name_list)
+        if reservoir is None:
+            if not reservoirs:
+                raise ValueError(f"{inp_file} has no reservoir")
+            if len(reservoirs) > 1:
+                logger.warning(f"Baseline keyed by reservoir {reservoirs[0]} only - {reservoirs[1:]} stay at INP head")
+            reservoir = reservoirs[0]
+        self.reservoir = str(reservoir)
+        self.node_ids = [str(n) for n in self.wn.node_name_list]
+
+        # Nhu EPANETService._real_simulation: demand co dinh tu .inp (pattern = 1.0)
+        for pattern_id in list(self.wn.pattern_name_list):
+            pattern = self.wn.get_pattern(pattern_id)
+            pattern.multipliers = [1.0] * len(pattern.multipliers)
+        self.wn.options.time.duration = 0
+        node = self.wn.get_node(self.reservoir)
+        self.default_head = float(node.base_head)
+        node.head_pattern_name = None
+        self._lock = threading.Lock()
+
+    def __call__(self, heads: Sequence[float]) -> Tuple[Sequence[str], np.ndarray, np.ndarray]:
+        import wntr
+
+        pressure = np.empty((len(heads), len(self.node_ids)))
+        head = np.empty_like(pressure)
+        with self._lock:
+            node = self.wn.get_node(self.reservoir)
+            for i, h in enumerate(heads):
+                node.base_head = float(h)
+                results = wntr.sim.WNTRSimulator(self.wn).run_sim()
+                pressure[i] = results.node['pressure'][self.node_ids].to_numpy()[0]
+                head[i] = results.node['head'][self.node_ids].to_numpy()[0]
+            node.base_head = self.default_head
+        return self.node_ids, pressure, head
+
+
+class BaselineTable:
+    """Cac bin da giai cua mot file .inp (khong doi sau khi tao - them bin tao ban moi)"""
+
+    def __init__(self, key: str, reservoir: str, default_head: float, node_ids: Sequence[str],
+                 bins: np.ndarray, pressure: np.ndarray, head: np.ndarray):
+        order = np.argsort(bins)
+        self.key = key
+        self.reservoir = reservoir
+        self.default_head = default_head
+        self.node_ids = [str(n) for n in node_ids]
+        self.index = pd.Index(self.node_ids)
+        self.bins = np.asarray(bins, dtype=np.int64)[order]
+        self.pressure = np.asarray(pressure, dtype=np.float64)[order]
+        self.head = np.asarray(head, dtype=np.float64)[order]
+
+    def __len__(self) -> int:
+        return len(self.bins)
+
+    def with_bins(self, bins: np.ndarray, pressure: np.ndarray, head: np.ndarray) -> "BaselineTable":
+        return BaselineTable(
+            self.key, self.reservoir, self.default_head, self.node_ids,
+            np.concatenate([self.bins, bins]),
+            np.vstack([self.pressure, pressure]), np.vstack([self.head, head])
+        )
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".{os.getpid()}.tmp.npz")
+        np.savez(tmp, key=self.key, reservoir=self.reservoir, default_head=self.default_head,
+                 node_ids=np.asarray(self.node_ids), bins=self.bins, pressure=self.pressure, head=self.head)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BaselineTable":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(str(data['key']), str(data['reservoir']), float(data['default_head']),
+                       data['node_ids'].tolist(), data['bins'], data['pressure'], data['head'])
+
+
+class BaselineCache:
+    """
+    Baseline khong ro ri theo (hash .inp, bin head reservoir); bin giai truoc bang warm /
+    warm_frame, residuals chi doc bang
+
+    Args:
+        inp_file: File .inp cua mang (hash noi dung la khoa)
+        cache_dir: Thu muc luu bang baseline (None -> chi giu trong bo nho)
+        bin_width: Do rong bin head reservoir (m)
+        solver_factory: inp_file -> SteadyStateSolver (tests thay bang solver gia)
+    """
+
+    def __init__(self, inp_file: str, cache_dir: Optional[str] = None, bin_width: float = 0.25,
+                 solver_factory: Callable[[str], SteadyStateSolver] = SteadyStateSolver):
+        if bin_width <= 0:
+            raise ValueError("bin_width must be positive")
+        self.inp_file = Path(inp_file)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.bin_width = float(bin_width)
+        self.solver_factory = solver_factory
+        self.solves = 0  # so bin da mo phong (khong tinh bin doc tu file)
+        self.extrapolated = 0  # so dong residual co head reservoir ngoai khoang bin da giai
+        self._fingerprint: Optional[Fingerprint] = None
+        self._solver: Optional[SteadyStateSolver] = None
+        self._table: Optional[BaselineTable] = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / f"{key}_{self.bin_width:g}.npz"
+
+    def table(self) -> BaselineTable:
+        """Bang baseline cua file .inp hien tai (doc file cache neu co; .inp doi -> bang moi)"""
+        stat = self.inp_file.stat()
+        fingerprint = (str(self.inp_file), stat.st_mtime_ns, stat.st_size)
+        table = self._table
+        if table is not None and self._fingerprint == fingerprint:
+            return table
+        with self._lock:
+            if self._table is None or self._fingerprint != fingerprint:
+                key = inp_hash(str(self.inp_file))
+                if self._table is None or self._table.key != key:
+                    self._solver = None
+                    self._table = self._open(key)
+                self._fingerprint = fingerprint
+            return self._table
+
+    def _open(self, key: str) -> BaselineTable:
+        path = self._path(key)
+        if path is not None and path.exists():
+            try:
+                table = BaselineTable.load(path)
+                if table.key == key:
+                    logger.info(f"[OK] Baseline loaded: {len(table)} head bins from {path}")
+                    return table
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable baseline cache {path}: {e}")
+        solver = self._get_solver()
+        return BaselineTable(key, solver.reservoir, solver.default_head, solver.node_ids,
+                             np.zeros(0, dtype=np.int64), np.zeros((0, len(solver.node_ids))),
+                             np.zeros((0, len(solver.node_ids))))
+
+    def _get_solver(self) -> SteadyStateSolver:
+        if self._solver is None:
+            self._solver = self.solver_factory(str(self.inp_file))
+        return self._solver
+
+    def ensure_bins(self, bins: np.ndarray) -> BaselineTable:
+        """Bang co du cac bin (so nguyen, head = bin * bin_width); mo phong bin con thieu"""
+        table = self.table()
+        bins = np.unique(np.asarray(bins, dtype=np.int64))
+        if np.isin(bins, table.bins).all():
+            return table
+        with self._lock:
+            table = self._table
+            missing = bins[~np.isin(bins, table.bins)]
+            if len(missing):
+                node_ids, pressure, head = self._get_solver()(missing * self.bin_width)
+                if list(node_ids) != table.node_ids:
+                    raise ValueError("Baseline solver returned a different node list")
+                self.solves += len(missing)
+                table = self._table = table.with_bins(missing, pressure, head)
+                path = self._path(table.key)
+                if path is not None:
+                    table.save(path)
+                logger.info(f"[OK] Baseline: solved {len(missing)} head bin(s), {len(table)} cached")
+            return table
+
+    def warm(self, head_min: float, head_max: float) -> BaselineTable:
+        """Giai truoc moi bin trong [head_min, head_max] (vd khoang head SCADA lich su)"""
+        lo = int(np.floor(head_min / self.bin_width))
+        hi = int(np.floor(head_max / self.bin_width)) + 1
+        return self.ensure_bins(np.arange(lo, hi + 1))
+
+    def warm_frame(self, df: pd.DataFrame) -> BaselineTable:
+        """Giai truoc cac bin ma residuals(df) can (offline: training, script)"""
+        table = self.table()
+        lo = np.floor(self.reservoir_heads(df, table) / self.bin_width).astype(np.int64)
+        return self.ensure_bins(np.concatenate([lo, lo + 1]))
+
+    def reservoir_heads(self, df: pd.DataFrame, table: BaselineTable) -> np.ndarray:
+        """Head reservoir tai (scenario_id, timestamp) cua moi dong"""
+        scenario = df['scenario_id'].to_numpy() if 'scenario_id' in df.columns else np.zeros(len(df))
+        # Ma (scenario, timestamp) = ghep ma cua tung cot (nhanh hon factorize tren MultiIndex)
+        scenario_codes, scenarios = pd.factorize(scenario)
+        time_codes, times = pd.factorize(df['timestamp'].to_numpy())
+        codes = scenario_codes.astype(np.int64) * len(times) + time_codes
+        heads = np.full(len(scenarios) * len(times), table.default_head)
+        is_reservoir = (df['node_id'].astype(str) == table.reservoir).to_numpy()
+        observed = df['head'].to_numpy(dtype=np.float64)[is_reservoir]
+        valid = np.isfinite(observed)
+        heads[codes[is_reservoir][valid]] = observed[valid]
+        return heads[codes]
+
+    def residuals(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """
+        pressure_residual / head_residual cho moi dong (node khong co trong mang -> 0)
+
+        Chi dung bin da giai (khong mo phong tren request path): noi suy giua hai bin da giai
+        ke nhau, head ngoai khoang -> ngoai suy tu hai bin o bien (mang mot nguon, demand co
+        dinh: pressure tuyen tinh theo head reservoir).
+
+        Raises:
+            BaselineNotWarmedError: bang co it hon 2 bin
+        """
+        table = self.table()
+        if len(table) < 2:
+            raise BaselineNotWarmedError(
+                f"Baseline not warmed: {len(table)} head bin(s) solved - run warmup (leak_baseline) "
+                f"or BaselineCache.warm first"
+            )
+        scaled = self.reservoir_heads(df, table) / self.bin_width
+        row_hi = np.clip(np.searchsorted(table.bins, scaled, side='right'), 1, len(table) - 1)
+        row_lo = row_hi - 1
+        frac = (scaled - table.bins[row_lo]) / (table.bins[row_hi] - table.bins[row_lo])
+        outside = int(((scaled < table.bins[0]) | (scaled > table.bins[-1])).sum())
+        if outside:
+            self.extrapolated += outside
+            logger.debug(f"Baseline: {outside} rows with reservoir head outside the solved bins (extrapolated)")
+
+        col = table.index.get_indexer(df['node_id'].astype(str))
+        known = col >= 0
+        col = np.where(known, col, 0)
+
+        result = {}
+        for name, values in (('pressure_residual', table.pressure), ('head_residual', table.head)):
+            baseline = (1 - frac) * values[row_lo, col] + frac * values[row_hi, col]
+            observed = df[name.replace('_residual', '')].to_numpy(dtype=np.float64)
+            result[name] = np.where(known, observed - baseline, 0.0)
+        return result
+
+    def stats(self) -> Dict[str, object]:
+        table = self._table
+        return {
+            "inp_hash": table.key if table is not None else None,
+            "reservoir": table.reservoir if table is not None else None,
+            "bin_width": self.bin_width,
+            "bins": len(table) if table is not None else 0,
+            "head_range_m": ([float(table.bins[0] * self.bin_width), float(table.bins[-1] * self.bin_width)]
+                             if table is not None and len(table) else None),
+            "solves": self.solves,
+            "extrapolated_rows": self.extrapolated,
+        }
@@ -2,7 +2,7 @@ import os
 import tempfile
 import json
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 import pandas as pd
 import numpy as np
 
@@ -23,16 +23,20 @@ from core.database import db_manager
 from models.schemas import SimulationInput, SimulationResult, SimulationStatus, NodeData
 from utils.logger import logger
 from services.scada_boundary_service import scada_boundary_service
+from services.network_template import NetworkTemplate
 
 class EPANETService:
     def __init__(self):
         self.input_file = settings.epanet_input_file
         self.temp_dir = tempfile.mkdtemp()
+        # Ban mau mang bat bien dung chung; moi lan mo phong lay mot wn rieng
+        self.template = NetworkTemplate(self.input_file)
         
     def run_simulation(
         self, 
         simulation_input: SimulationInput,
-        scada_boundary_data: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        scada_boundary_data: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        on_results: Optional[Callable[[Any, Any], None]] = None
     ) -> SimulationResult:
         """
         Chay mo phong EPANET voi du lieu dau vao
@@ -40,6 +44,8 @@ class EPANETService:
         Args:
             simulation_input: Input parameters cho simulation
             scada_boundary_data: Optional SCADA boundary conditions dict (key: station_code, value: list of records)
+            on_results: Optional callback(results, wn) nhan ket qua WNTR goc (dang mang) truoc khi
+                        chuyen thanh records, vd NodeArrays.from_wntr cho leak detection
         """
         # Convert to dict with proper serialization
         input_dict = simulation_input.dict()
@@ -55,11 +61,11 @@ class EPANETService:
         
         try:
             # Always try real EPANET simulation first
-            return self._real_simulation(simulation_input, run_id, scada_boundary_data)
+            return self._real_simulation(simulation_input, run_id, scada_boundary_data, on_results)
             
         except Exception as e:
             error_msg = f"Simulation failed: {str(e)}"
-            db_manager.save_simulation_run("failed", error_message=error_msg)
+            db_manager.update_simulation_run(run_id, "failed", error_message=error_msg)
             return SimulationResult(
                 run_id=run_id,
                 status=SimulationStatus.FAILED,
@@ -75,15 +81,16 @@ class EPANETService:
         self, 
         simulation_input: SimulationInput, 
         run_id: int,
-        scada_boundary_data: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        scada_boundary_data: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        on_results: Optional[Callable[[Any, Any], None]] = None
     ) -> SimulationResult:
         """Chay mo phong EPANET thuc te voi WNTR"""
         try:
             # Import WNTR
             import wntr
             
-            # Load water network model
-            wn = wntr.network.WaterNetworkModel(self.input_file)
+            # Load water network model (ban rieng cua request nay tu ban mau da parse)
+            wn = self.template.model()
             
             # ✅ DEBUG: Log initial reservoir head BEFORE SCADA application
             logger.info(f"[DEBUG] All patterns in network: {list(wn.pattern_name_list)}")
@@ -132,7 +139,6 @@ class EPANETService:
                         timestamp_str = first_record.get('timestamp')
                         if timestamp_str:
                             try:
-                                from datetime import datetime
                                 if 'T' in timestamp_str:
                                     simulation_start_time = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
                                 else:
@@ -170,6 +176,8 @@ class EPANETService:
             # Run simulation
             sim = wntr.sim.WNTRSimulator(wn)
             results = sim.run_sim()
+            if on_results is not None:
+                on_results(results, wn)
             
             # Extract results
             try:
@@ -181,7 +189,7 @@ class EPANETService:
                 processed_results = {"nodes": {}, "pipes": {}, "pumps": {}}
             
             # Save results to database
-            db_manager.save_simulation_run("completed", results=processed_results)
+            db_manager.update_simulation_run(run_id, "completed", results=processed_results)
             
             return SimulationResult(
                 run_id=run_id,
@@ -195,6 +203,7 @@ class EPANETService:
             
         except Exception as e:
             logger.error(f"Error running EPANET simulation: {str(e)}")
+            db_manager.update_simulation_run(run_id, "failed", error_message=f"EPANET simulation failed: {str(e)}")
             # Return error instead of mock
             return SimulationResult(
                 run_id=run_id,
@@ -420,7 +429,9 @@ class EPANETService:
     
     def _create_updated_input_file(self, simulation_input: SimulationInput) -> str:
         """Tao file input EPANET voi du lieu cap nhat"""
-        temp_file = os.path.join(self.temp_dir, "updated_input.inp")
+        # Ten file rieng cho moi lan goi (cac request dong thoi khong ghi de file cua nhau)
+        fd, temp_file = tempfile.mkstemp(suffix=".inp", prefix="updated_input_", dir=self.temp_dir)
+        os.close(fd)
         
         # Doc file goc
         with open(self.input_file, 'r', encoding='utf-8') as f:
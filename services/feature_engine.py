@@ -0,0 +1,253 @@
+"""
+Dense [node x time] feature engine cho rolling/diff features
+
+Thay cac ``groupby([...]).transform(lambda x: x.rolling(...))`` (mot lambda Python cho
+moi nhom scenario x node) trong LeakDetectionService.prepare_features,
+scripts/train_leak_model.py va scripts/test_model.py bang:
+    - layout dense: moi nhom (scenario_id, node_id) la mot cot, thu tu dong trong nhom
+      (giong groupby sort=False) la truc thoi gian -> mang [time x group]; du lieu luoi
+      deu (scenario x node x timestep) chi co mot block, nhom co do dai khac nhau duoc
+      gom theo do dai (khong padding);
+    - kernel sliding window chay theo truc thoi gian, vector hoa tren tat ca cac nhom.
+
+Kernel mean/var tai hien dung thuat toan cua pandas (roll_mean / roll_var: cong tru
+Kahan, dem gia tri lap lien tiep, inf -> NaN) nen ket qua trung tung bit voi cot cu.
+"""
+from typing import Dict, Iterable, List, Union
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_KEYS = ('scenario_id', 'node_id')
+
+
+def _prep_rolling(values: np.ndarray) -> np.ndarray:
+    """Nhu Rolling._prep_values: float64, inf -> NaN"""
+    values = values.astype(np.float64)
+    values[np.isinf(values)] = np.nan
+    return values
+
+
+def rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    """rolling(window, min_periods=1).mean() cho moi cot cua x [time x group]"""
+    n_groups = x.shape[1]
+    out = np.empty_like(x)
+    nobs = np.zeros(n_groups)
+    neg_ct = np.zeros(n_groups)
+    sum_x = np.zeros(n_groups)
+    comp_add = np.zeros(n_groups)
+    comp_remove = np.zeros(n_groups)
+    consecutive = np.zeros(n_groups)
+    prev_value = x[0].copy() if len(x) else np.zeros(n_groups)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for t in range(len(x)):
+            if t >= window:
+                val = x[t - window]
+                ok = ~np.isnan(val)
+                y = -val - comp_remove
+                s = sum_x + y
+                comp_remove = np.where(ok, s - sum_x - y, comp_remove)
+                sum_x = np.where(ok, s, sum_x)
+                nobs -= ok
+                neg_ct -= ok & np.signbit(val)
+
+            val = x[t]
+            ok = ~np.isnan(val)
+            y = val - comp_add
+            s = sum_x + y
+            comp_add = np.where(ok, s - sum_x - y, comp_add)
+            sum_x = np.where(ok, s, sum_x)
+            nobs += ok
+            neg_ct += ok & np.signbit(val)
+            consecutive = np.where(ok, np.where(val == prev_value, consecutive + 1, 1), consecutive)
+            prev_value = np.where(ok, val, prev_value)
+
+            result = sum_x / nobs
+            same = consecutive >= nobs
+            result = np.where(same, prev_value, result)
+            result = np.where(~same & (neg_ct == 0) & (result < 0), 0.0, result)
+            result = np.where(~same & (neg_ct == nobs) & (result > 0), 0.0, result)
+            out[t] = np.where(nobs > 0, result, np.nan)
+    return out
+
+
+def rolling_var(x: np.ndarray, window: int) -> np.ndarray:
+    """rolling(window, min_periods=1).var() (ddof=1) cho moi cot cua x [time x group]"""
+    n_groups = x.shape[1]
+    out = np.empty_like(x)
+    nobs = np.zeros(n_groups)
+    mean_x = np.zeros(n_groups)
+    ssqdm_x = np.zeros(n_groups)
+    comp_add = np.zeros(n_groups)
+    comp_remove = np.zeros(n_groups)
+    consecutive = np.zeros(n_groups)
+    prev_value = x[0].copy() if len(x) else np.zeros(n_groups)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for t in range(len(x)):
+            if t >= window:
+                val = x[t - window]
+                ok = ~np.isnan(val)
+                nobs -= ok
+                prev_mean = mean_x - comp_remove
+                y = val - comp_remove
+                delta = y - mean_x
+                new_mean = mean_x - delta / nobs
+                new_ssqdm = ssqdm_x - (val - prev_mean) * (val - new_mean)
+                keep = ok & (nobs > 0)
+                comp_remove = np.where(keep, delta + mean_x - y, comp_remove)
+                emptied = ok & (nobs == 0)
+                mean_x = np.where(keep, new_mean, np.where(emptied, 0.0, mean_x))
+                ssqdm_x = np.where(keep, new_ssqdm, np.where(emptied, 0.0, ssqdm_x))
+
+            val = x[t]
+            ok = ~np.isnan(val)
+            nobs += ok
+            consecutive = np.where(ok, np.where(val == prev_value, consecutive + 1, 1), consecutive)
+            prev_value = np.where(ok, val, prev_value)
+            prev_mean = mean_x - comp_add
+            y = val - comp_add
+            delta = y - mean_x
+            comp_add = np.where(ok, delta + mean_x - y, comp_add)
+            new_mean = mean_x + delta / nobs
+            ssqdm_x = np.where(ok, ssqdm_x + (val - prev_mean) * (val - new_mean), ssqdm_x)
+            mean_x = np.where(ok, new_mean, mean_x)
+
+            result = np.where(consecutive >= nobs, 0.0, ssqdm_x / (nobs - 1))
+            out[t] = np.where(nobs > 1, result, np.nan)
+    return out
+
+
+def _rolling_extreme(x: np.ndarray, window: int, take_max: bool) -> np.ndarray:
+    # Duyet cac phan tu cua cua so tu cu den moi; gia tri bang nhau lay phan tu moi nhat
+    # (deque cua roll_max/roll_min giu phan tu sau cung -> phan biet duoc 0.0 / -0.0)
+    out = np.full_like(x, np.nan)
+    for lag in range(min(window, len(x)) - 1, -1, -1):
+        val = x[:len(x) - lag]
+        cur = out[lag:]
+        better = (val >= cur) if take_max else (val <= cur)
+        take = ~np.isnan(val) & (better | np.isnan(cur))
+        cur[take] = val[take]
+    return out
+
+
+def rolling_max(x: np.ndarray, window: int) -> np.ndarray:
+    """rolling(window, min_periods=1).max() cho moi cot cua x [time x group]"""
+    return _rolling_extreme(x, window, take_max=True)
+
+
+def rolling_min(x: np.ndarray, window: int) -> np.ndarray:
+    """rolling(window, min_periods=1).min() cho moi cot cua x [time x group]"""
+    return _rolling_extreme(x, window, take_max=False)
+
+
+def diff_fill(x: np.ndarray) -> np.ndarray:
+    """diff().fillna(0) cho moi cot cua x [time x group]; giu dtype float (int -> float64)"""
+    out = np.empty_like(x) if x.dtype.kind == 'f' else np.empty(x.shape, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        out[1:] = x[1:] - x[:-1]
+    out[:1] = 0
+    out[np.isnan(out)] = 0
+    return out
+
+
+class RollingFeatureEngine:
+    """
+    Tinh rolling/diff features theo nhom (mac dinh scenario_id x node_id) tren mang dense.
+
+    Layout (nhom, thu tu trong nhom) duoc tao mot lan; moi cot nguon duoc gather thanh
+    mang [time x group] mot lan va dung lai cho moi feature. Cac method tra ve
+    np.ndarray theo vi tri dong cua df, trung tung bit (ca dtype) voi:
+        diff(col)            -> g[col].transform(lambda x: x.diff().fillna(0))
+        mean(col, w)         -> g[col].transform(lambda x: x.rolling(w, min_periods=1).mean())
+        std(col, w)          -> g[col].transform(lambda x: x.rolling(w, min_periods=1).std().fillna(0))
+        min(col, w)/max(...) -> g[col].transform(lambda x: x.rolling(w, min_periods=1).min()/max())
+        deviation(col)       -> g[col].transform(lambda x: x - x.mean())
+
+    Cot nguon duoc doc tu df o lan dung dau tien, nen co the gan cot moi (vd
+    pressure_change) roi dung tiep lam nguon (pressure_acceleration).
+    """
+
+    def __init__(self, df: pd.DataFrame, keys: Union[str, Iterable[str]] = DEFAULT_KEYS):
+        self.df = df
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        codes = df.groupby(keys, sort=False).ngroup().to_numpy()
+        # Dong co key NaN bi groupby bo qua -> transform tra ve NaN
+        self._valid = ~np.isnan(codes) if codes.dtype.kind == 'f' else np.ones(len(codes), dtype=bool)
+        codes = codes[self._valid].astype(np.int64)
+        rows = np.flatnonzero(self._valid)
+        order = rows[np.argsort(codes, kind='stable')]
+        sizes = np.bincount(codes)
+        starts = np.cumsum(sizes) - sizes
+
+        # Moi block: chi so dong [time x group] cua cac nhom co cung do dai
+        self.blocks: List[np.ndarray] = []
+        for length in np.unique(sizes):
+            groups = np.flatnonzero(sizes == length)
+            index = starts[groups][None, :] + np.arange(length)[:, None]
+            self.blocks.append(order[index])
+        self._raw: Dict[str, List[np.ndarray]] = {}
+        self._prepped: Dict[str, List[np.ndarray]] = {}
+
+    @property
+    def n_groups(self) -> int:
+        return sum(block.shape[1] for block in self.blocks)
+
+    def _source(self, column: str) -> List[np.ndarray]:
+        if column not in self._raw:
+            values = self.df[column].to_numpy()
+            self._raw[column] = [values[block] for block in self.blocks]
+        return self._raw[column]
+
+    def _rolling_source(self, column: str) -> List[np.ndarray]:
+        if column not in self._prepped:
+            self._prepped[column] = [_prep_rolling(x) for x in self._source(column)]
+        return self._prepped[column]
+
+    def _scatter(self, results: List[np.ndarray], dtype) -> np.ndarray:
+        out = np.full(len(self.df), np.nan, dtype=dtype)
+        for block, values in zip(self.blocks, results):
+            out[block] = values
+        return out
+
+    def _rolling(self, kernel, column: str, window: int) -> np.ndarray:
+        return self._scatter([kernel(x, window) for x in self._rolling_source(column)], np.float64)
+
+    def diff(self, column: str) -> np.ndarray:
+        results = [diff_fill(x) for x in self._source(column)]
+        dtype = results[0].dtype if results else np.float64
+        return self._scatter(results, dtype)
+
+    def mean(self, column: str, window: int) -> np.ndarray:
+        return self._rolling(rolling_mean, column, window)
+
+    def std(self, column: str, window: int) -> np.ndarray:
+        out = self._rolling(rolling_var, column, window)
+        with np.errstate(invalid='ignore'):
+            out = np.sqrt(out)
+        # zsqrt: phuong sai am do sai so -> 0; fillna(0) cho cua so 1 phan tu
+        out[np.isnan(out) & self._valid] = 0.0
+        return out
+
+    def min(self, column: str, window: int) -> np.ndarray:
+        return self._rolling(rolling_min, column, window)
+
+    def max(self, column: str, window: int) -> np.ndarray:
+        return self._rolling(rolling_max, column, window)
+
+    def deviation(self, column: str) -> np.ndarray:
+        """x - x.mean() trong moi nhom (nanmean cua pandas: cong pairwise theo dtype goc)"""
+        results = []
+        for x in self._source(column):
+            if x.dtype.kind != 'f':
+                x = x.astype(np.float64)
+            by_group = np.ascontiguousarray(x.T)
+            missing = np.isnan(by_group)
+            count = (~missing).sum(axis=1).astype(x.dtype)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                group_mean = np.where(missing, 0, by_group).sum(axis=1, dtype=x.dtype) / count
+                group_mean[count == 0] = np.nan
+                results.append(x - group_mean[None, :])
+        dtype = results[0].dtype if results else np.float64
+        return self._scatter(results, dtype)
@@ -0,0 +1,286 @@
+"""
+Feature pipeline dung chung cho training, evaluation va serving
+
+Truoc day feature engineering duoc viet lai o train_leak_model.py, scripts/test_model.py,
+scripts/predict_leak.py, scripts/demo_leak_detection.py va LeakDetectionService.prepare_features,
+moi ban lech nhau mot chut (vd demand_deviation nhom theo scenario x node o ban nay, theo
+node o ban kia; pressure_drop = max5 - pressure o ban nay, -min(change, 0) o ban kia).
+Module nay la dinh nghia duy nhat:
+    - FEATURE_SCHEMA: danh sach feature pipeline tao ra (thu tu cua model 39 feature),
+      BASE_FEATURES (30) / TOPOLOGY_FEATURES (9);
+    - BASELINE_FEATURES: residual so voi loi giai khong ro ri (services/baseline_cache.py),
+      ngoai FEATURE_SCHEMA - chi tinh khi duoc yeu cau (model moi liet ke trong feature_cols);
+    - build_features: tinh theo batch (rolling qua RollingFeatureEngine, neighbor features
+      qua services/neighbor_features.py, thuoc tinh node tinh san qua services/topology_store.py),
+      chi tinh cac cot duoc yeu cau va phu thuoc cua chung;
+    - FEATURE_VERSION: tang moi khi dinh nghia mot feature thay doi. Training ghi version
+      vao model_metadata.json (feature_metadata), luc load model check_feature_metadata tu
+      choi metadata khac version / co feature la -> loi ngay thay vi am tham dien 0.
+      v1 giu dung dinh nghia cua train_leak_model.py ma model dang chay da train (vd
+      pressure_drop = pressure_max_5 - pressure); doi dinh nghia -> tang version va train lai.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from services.feature_engine import RollingFeatureEngine
+from services.neighbor_features import assign_feature_column, compute_neighbor_features, lookup_node_keys
+# load_topology / DEFAULT_TOPOLOGY_FILE van import duoc tu day (training, scripts)
+from services.topology_store import (
+    DEFAULT_TOPOLOGY_FILE, STATIC_FEATURES, TopologyFeatures, as_topology_features, load_topology
+)
+
+FEATURE_VERSION = 1
+# model_metadata.json truoc khi co 'feature_version' (train_leak_model.py cu) dung dinh nghia v1
+LEGACY_FEATURE_VERSION = 1
+
+BASE_FEATURES = (
+    # Basic (3)
+    'pressure', 'head', 'demand',
+    # Moving averages (4)
+    'pressure_ma3', 'pressure_ma5', 'head_ma3', 'head_ma5',
+    # Temporal changes (4)
+    'pressure_change', 'head_change', 'pressure_drop', 'head_drop',
+    # Network-level spatial (5)
+    'network_pressure_mean', 'network_pressure_std', 'network_demand_mean',
+    'pressure_deviation', 'demand_deviation',
+    # Statistical rolling (7)
+    'pressure_std_5', 'head_std_5', 'demand_std_5',
+    'pressure_min_5', 'pressure_max_5', 'head_min_5', 'head_max_5',
+    # Acceleration (2)
+    'pressure_acceleration', 'head_acceleration',
+    # Percentage change (3)
+    'pressure_change_pct', 'head_change_pct', 'demand_change_pct',
+    # Ratio (2)
+    'pressure_demand_ratio', 'head_demand_ratio',
+)
+
+TOPOLOGY_FEATURES = (
+    'neighbors_pressure_mean', 'neighbors_pressure_std', 'neighbors_head_mean',
+    'neighbors_demand_mean', 'pressure_gradient', 'head_gradient',
+    'node_degree', 'node_betweenness', 'node_elevation',
+)
+
+FEATURE_SCHEMA = BASE_FEATURES + TOPOLOGY_FEATURES
+
+# observed - baseline khong ro ri cung head reservoir (services/baseline_cache.py)
+BASELINE_FEATURES = ('pressure_residual', 'head_residual')
+
+# Moi feature pipeline tinh duoc (FEATURE_SCHEMA + feature tuy chon)
+PIPELINE_FEATURES = FEATURE_SCHEMA + BASELINE_FEATURES
+
+# TopologyFeatures (services/topology_store.py) hoac (neighbor_map, topology_df) nhu load_topology
+TopologyLoader = Callable[[], Union[TopologyFeatures, Tuple[Dict[str, List[str]], Optional[pd.DataFrame]]]]
+# BaselineCache (services/baseline_cache.py) hoac object co residuals(df) -> {feature: mang}
+BaselineLoader = Callable[[], Any]
+
+
+class FeatureSchemaError(ValueError):
+    """Model / metadata khong khop voi feature pipeline hien tai"""
+
+
+def _network(df: pd.DataFrame, column: str, how: str) -> pd.Series:
+    return df.groupby(['scenario_id', 'timestamp'])[column].transform(how)
+
+
+# feature -> (phu thuoc, ham tinh); thu tu = thu tu cot trong DataFrame ket qua
+_COLUMN_FEATURES: Dict[str, Tuple[Tuple[str, ...], Callable[[pd.DataFrame, RollingFeatureEngine], Any]]] = {
+    # Basic temporal features
+    'pressure_change': ((), lambda df, r: r.diff('pressure')),
+    'head_change': ((), lambda df, r: r.diff('head')),
+    # Moving averages
+    'pressure_ma3': ((), lambda df, r: r.mean('pressure', 3)),
+    'pressure_ma5': ((), lambda df, r: r.mean('pressure', 5)),
+    'head_ma3': ((), lambda df, r: r.mean('head', 3)),
+    'head_ma5': ((), lambda df, r: r.mean('head', 5)),
+    # Network-level features
+    'network_pressure_mean': ((), lambda df, r: _network(df, 'pressure', 'mean')),
+    'network_pressure_std': ((), lambda df, r: _network(df, 'pressure', 'std').fillna(0)),
+    'network_demand_mean': ((), lambda df, r: _network(df, 'demand', 'mean')),
+    # Deviation features
+    'pressure_deviation': (('network_pressure_mean',), lambda df, r: df['pressure'] - df['network_pressure_mean']),
+    'demand_deviation': ((), lambda df, r: r.deviation('demand')),
+    # Statistical features (rolling window 5)
+    'pressure_std_5': ((), lambda df, r: r.std('pressure', 5)),
+    'head_std_5': ((), lambda df, r: r.std('head', 5)),
+    'demand_std_5': ((), lambda df, r: r.std('demand', 5)),
+    'pressure_min_5': ((), lambda df, r: r.min('pressure', 5)),
+    'pressure_max_5': ((), lambda df, r: r.max('pressure', 5)),
+    'head_min_5': ((), lambda df, r: r.min('head', 5)),
+    'head_max_5': ((), lambda df, r: r.max('head', 5)),
+    # Pressure/Head drops: max cua so 5 - gia tri hien tai (dinh nghia model dang chay da train)
+    'pressure_drop': (('pressure_max_5',), lambda df, r: df['pressure_max_5'] - df['pressure']),
+    'head_drop': (('head_max_5',), lambda df, r: df['head_max_5'] - df['head']),
+    # Acceleration features (second derivative)
+    'pressure_acceleration': (('pressure_change',), lambda df, r: r.diff('pressure_change')),
+    'head_acceleration': (('head_change',), lambda df, r: r.diff('head_change')),
+    # Percentage change features
+    'pressure_change_pct': (('pressure_change',), lambda df, r: df['pressure_change'] / (df['pressure'].abs() + 1e-6)),
+    'head_change_pct': (('head_change',), lambda df, r: df['head_change'] / (df['head'].abs() + 1e-6)),
+    'demand_change': ((), lambda df, r: r.diff('demand')),
+    'demand_change_pct': (('demand_change',), lambda df, r: df['demand_change'] / (df['demand'].abs() + 1e-6)),
+    # Ratio features
+    'pressure_demand_ratio': ((), lambda df, r: df['pressure'] / (df['demand'].abs() + 1e-6)),
+    'head_demand_ratio': ((), lambda df, r: df['head'] / (df['demand'].abs() + 1e-6)),
+}
+
+
+def _required_columns(features: Sequence[str], present) -> List[str]:
+    """Cac cot can tinh (gom ca phu thuoc), theo thu tu cua _COLUMN_FEATURES"""
+    needed = set()
+    stack = [f for f in features if f in _COLUMN_FEATURES]
+    while stack:
+        name = stack.pop()
+        if name in needed or name in present:
+            continue
+        needed.add(name)
+        stack.extend(_COLUMN_FEATURES[name][0])
+    return [name for name in _COLUMN_FEATURES if name in needed]
+
+
+def _add_topology_features(df_fe: pd.DataFrame, topology_loader: Optional[TopologyLoader]) -> pd.DataFrame:
+    """9 topology features (neighbor + node_degree/betweenness/elevation); mac dinh khi khong co topology"""
+    topology = as_topology_features(topology_loader() if topology_loader is not None else None)
+    neighbor_map = topology.neighbor_map
+    # Cot da co trong df giu nguyen
+    static_missing = [f for f in STATIC_FEATURES if f not in df_fe.columns]
+
+    # Initialize ALL topology features with defaults
+    if 'neighbors_pressure_mean' not in df_fe.columns:
+        df_fe['neighbors_pressure_mean'] = df_fe['pressure'].astype('float32')
+    if 'neighbors_pressure_std' not in df_fe.columns:
+        df_fe['neighbors_pressure_std'] = 0.0
+    if 'neighbors_head_mean' not in df_fe.columns:
+        df_fe['neighbors_head_mean'] = df_fe['head'].astype('float32')
+    if 'neighbors_demand_mean' not in df_fe.columns:
+        df_fe['neighbors_demand_mean'] = df_fe['demand'].astype('float32')
+    if 'pressure_gradient' not in df_fe.columns:
+        df_fe['pressure_gradient'] = 0.0
+    if 'head_gradient' not in df_fe.columns:
+        df_fe['head_gradient'] = 0.0
+    if 'node_degree' not in df_fe.columns:
+        df_fe['node_degree'] = 0
+    if 'node_betweenness' not in df_fe.columns:
+        df_fe['node_betweenness'] = 0.0
+    if 'node_elevation' not in df_fe.columns:
+        df_fe['node_elevation'] = 0.0
+
+    # Static node attributes: mot lan gather tu mang da bien dich (thay cho merge theo node_id)
+    if topology.n_nodes and static_missing:
+        attributes = topology.gather(df_fe['node_id'].astype(str))
+        for feat in static_missing:
+            df_fe[feat] = attributes[feat]
+
+    # Compute neighbor features if neighbor_map is available
+    # (vectorized theo [timestamp x node], xem services/neighbor_features.py)
+    if neighbor_map:
+        visited, neighbor_features = compute_neighbor_features(
+            lookup_node_keys(df_fe), df_fe['timestamp'],
+            df_fe['pressure'].to_numpy(), df_fe['head'].to_numpy(), df_fe['demand'].to_numpy(),
+            neighbor_map
+        )
+        for feat, values in neighbor_features.items():
+            assign_feature_column(df_fe, feat, values, visited)
+    return df_fe
+
+
+def _add_baseline_features(df_fe: pd.DataFrame, features: Sequence[str],
+                           baseline_loader: Optional[BaselineLoader]) -> pd.DataFrame:
+    """Residual features: mot lan gather baseline theo (node, head reservoir) roi tru mang"""
+    if baseline_loader is None:
+        raise FeatureSchemaError(f"Features {list(features)} need a no-leak baseline (baseline_loader)")
+    residuals = baseline_loader().residuals(df_fe)
+    for feat in features:
+        df_fe[feat] = residuals[feat]
+    return df_fe
+
+
+def build_features(
+    df: pd.DataFrame,
+    features: Optional[Sequence[str]] = None,
+    topology_loader: Optional[TopologyLoader] = None,
+    baseline_loader: Optional[BaselineLoader] = None
+) -> pd.DataFrame:
+    """
+    Tinh feature theo dinh nghia FEATURE_VERSION.
+
+    Ghi them cot vao df (khong copy) - luon dung gia tri tra ve. Cot da co san trong df
+    duoc giu nguyen.
+
+    Args:
+        df: Du lieu node theo thoi gian: node_id, timestamp, pressure, head, demand
+            (+ scenario_id, mac dinh 0); thu tu dong trong moi (scenario, node) la thu tu thoi gian
+        features: Feature can tinh (mac dinh FEATURE_SCHEMA); chi cac cot nay va phu thuoc duoc tinh
+        topology_loader: Ham tra ve TopologyFeatures (vd TopologyFeatureStore.get) hoac
+            (neighbor_map, topology_df) (vd load_topology), chi goi khi can topology features;
+            None -> topology features lay gia tri mac dinh
+        baseline_loader: Ham tra ve BaselineCache, chi goi khi yeu cau BASELINE_FEATURES
+            (bat buoc khi do - residual khong co gia tri mac dinh co nghia)
+    """
+    features = FEATURE_SCHEMA if features is None else tuple(features)
+    unknown = [f for f in features if f not in PIPELINE_FEATURES and f not in _COLUMN_FEATURES]
+    if unknown:
+        raise FeatureSchemaError(f"Unknown features for pipeline v{FEATURE_VERSION}: {unknown}")
+    if df.empty:
+        return df
+
+    if 'scenario_id' not in df.columns:
+        df['scenario_id'] = 0  # Default scenario_id
+
+    # Rolling/diff features theo (scenario_id, node_id) tren mang dense [time x node]
+    rolling = RollingFeatureEngine(df, ('scenario_id', 'node_id'))
+    for name in _required_columns(features, df.columns):
+        df[name] = _COLUMN_FEATURES[name][1](df, rolling)
+
+    if any(f not in df.columns for f in TOPOLOGY_FEATURES if f in features):
+        df = _add_topology_features(df, topology_loader)
+    baseline = [f for f in BASELINE_FEATURES if f in features and f not in df.columns]
+    if baseline:
+        df = _add_baseline_features(df, baseline, baseline_loader)
+    return df
+
+
+def serving_features(feature_cols: Optional[Sequence[str]] = None) -> Tuple[str, ...]:
+    """
+    Feature can tinh khi serving cho model dung feature_cols: FEATURE_SCHEMA + residual
+    features neu model dung (baseline chi mo phong khi can). None -> FEATURE_SCHEMA.
+    """
+    if feature_cols is None:
+        return FEATURE_SCHEMA
+    return FEATURE_SCHEMA + tuple(f for f in BASELINE_FEATURES if f in feature_cols)
+
+
+def select_features(df: pd.DataFrame, feature_cols: Sequence[str]) -> np.ndarray:
+    """Ma tran feature theo dung thu tu feature_cols; thieu cot -> FeatureSchemaError (khong dien 0)"""
+    missing = [f for f in feature_cols if f not in df.columns]
+    if missing:
+        raise FeatureSchemaError(f"Missing {len(missing)} features: {missing}")
+    return df[list(feature_cols)].values
+
+
+def feature_metadata(feature_cols: Sequence[str]) -> Dict[str, Any]:
+    """Muc feature cho model_metadata.json (training)"""
+    return {'feature_version': FEATURE_VERSION, 'feature_cols': list(feature_cols)}
+
+
+def check_feature_metadata(metadata: Dict[str, Any]) -> List[str]:
+    """
+    Kiem tra model_metadata.json voi pipeline hien tai, tra ve feature_cols.
+
+    Raises:
+        FeatureSchemaError: version khac FEATURE_VERSION, thieu feature_cols hoac co feature
+            ma pipeline khong tao ra
+    """
+    version = metadata.get('feature_version', LEGACY_FEATURE_VERSION)
+    if version != FEATURE_VERSION:
+        raise FeatureSchemaError(
+            f"Model was trained with feature pipeline v{version}, this build computes v{FEATURE_VERSION} - retrain the model"
+        )
+    feature_cols = metadata.get('feature_cols')
+    if not feature_cols:
+        raise FeatureSchemaError("Model metadata has no feature_cols")
+    unknown = [f for f in feature_cols if f not in PIPELINE_FEATURES]
+    if unknown:
+        raise FeatureSchemaError(f"Model metadata lists features not produced by pipeline v{FEATURE_VERSION}: {unknown}")
+    return list(feature_cols)
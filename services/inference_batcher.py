@@ -0,0 +1,223 @@
+"""
+Micro-batching cho predict_proba cua leak detection model
+
+Moi request /detect chi co vai nghin dong; goi predict_proba rieng cho tung request
+thi chi phi co dinh moi lan goi (kiem tra input, chuan bi du lieu, duyet ensemble)
+lap lai. InferenceBatcher gom cac request den trong mot khoang ngan:
+    - caller (thread cua threadpool) dua ma tran feature vao hang doi va cho Future;
+    - thread nen lay request dau tien, cho them toi ``max_wait_ms`` hoac den khi du
+      ``max_batch_size`` request / ``max_batch_rows`` dong, noi cac ma tran lai, goi
+      predict_proba MOT lan roi tra lai tung doan xac suat cho tung caller.
+
+Chi gom cac request dung cung model (reload giua chung -> batch rieng). Chua start
+(scripts, tests) thi predict() goi model truc tiep. stats(): so batch, kich thuoc
+batch, thoi gian cho trong hang doi va thoi gian predict.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from core.config import settings
+from utils.logger import logger
+
+
+class _Request:
+    __slots__ = ("model", "X", "rows", "future", "enqueued")
+
+    def __init__(self, model: Any, X: Any):
+        self.model = model
+        self.X = X
+        self.rows = len(X)
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+
+def positive_proba(model: Any, X: Any) -> np.ndarray:
+    """Xac suat lop 1 (ro ri) cho moi dong cua X"""
+    return np.asarray(model.predict_proba(X))[:, 1]
+
+
+def _concat(parts: List[Any]) -> Any:
+    # Giu DataFrame (CatBoost doi chieu ten cot) khi khong co scaler
+    if all(isinstance(p, pd.DataFrame) for p in parts):
+        return pd.concat(parts, ignore_index=True, copy=False)
+    return np.vstack([np.asarray(p) for p in parts])
+
+
+class InferenceBatcher:
+    """
+    Background micro-batcher cho predict_proba.
+
+    Args:
+        max_batch_size: So request toi da trong mot batch
+        max_batch_rows: So dong toi da trong mot batch (request lon hon van di mot minh)
+        max_wait_ms: Thoi gian toi da request dau tien cua batch cho request khac
+    """
+
+    def __init__(self, max_batch_size: int = 16, max_batch_rows: int = 200000, max_wait_ms: float = 5.0):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_rows = max(1, max_batch_rows)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._stats = {"requests": 0, "rows": 0, "batches": 0, "errors": 0, "max_batch_size": 0}
+        # Cua so gan day cho percentiles
+        self._batch_sizes: deque = deque(maxlen=1000)
+        self._queue_ms: deque = deque(maxlen=1000)
+        self._predict_ms: deque = deque(maxlen=1000)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the background batching thread"""
+        with self._cond:
+            if self.running:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="leak-inference-batcher", daemon=True)
+            self._thread.start()
+        logger.info(f"Inference batching started (max {self.max_batch_size} requests / {self.max_wait * 1000:.0f} ms)")
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the thread after serving everything still queued"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        logger.info(f"Inference batching stopped: {self.stats()}")
+
+    def submit(self, model: Any, X: Any) -> Future:
+        """Dua X vao hang doi; Future tra ve xac suat lop 1 (np.ndarray, len(X))"""
+        request = _Request(model, X)
+        with self._cond:
+            if not self.running or self._stopping:
+                request.future.set_result(positive_proba(model, X))
+                return request.future
+            self._pending.append(request)
+            self._cond.notify()
+        return request.future
+
+    def predict(self, model: Any, X: Any) -> np.ndarray:
+        """Nhu positive_proba(model, X) nhung di qua batcher neu dang chay (blocking)"""
+        if len(X) == 0 or not self.running:
+            return positive_proba(model, X)
+        return self.submit(model, X).result()
+
+    def _take_batch(self) -> List[_Request]:
+        """Doi request dau tien, roi gom them request cung model den khi du hoac het max_wait"""
+        with self._cond:
+            while not self._pending:
+                if self._stopping:
+                    return []
+                self._cond.wait()
+            first = self._pending[0]
+            deadline = first.enqueued + self.max_wait
+            while not self._stopping:
+                same_model = [r for r in self._pending if r.model is first.model]
+                rows = sum(r.rows for r in same_model)
+                remaining = deadline - time.perf_counter()
+                if len(same_model) >= self.max_batch_size or rows >= self.max_batch_rows or remaining <= 0:
+                    break
+                self._cond.wait(timeout=remaining)
+
+            batch, rows, keep = [], 0, deque()
+            while self._pending:
+                request = self._pending.popleft()
+                fits = len(batch) < self.max_batch_size and (not batch or rows + request.rows <= self.max_batch_rows)
+                if request.model is first.model and fits:
+                    batch.append(request)
+                    rows += request.rows
+                else:
+                    keep.append(request)
+            self._pending = keep
+            return batch
+
+    def _serve(self, batch: List[_Request]):
+        started = time.perf_counter()
+        try:
+            X = batch[0].X if len(batch) == 1 else _concat([r.X for r in batch])
+            proba = positive_proba(batch[0].model, X)
+        except Exception as e:
+            with self._cond:
+                self._stats["errors"] += len(batch)
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        offset = 0
+        for request in batch:
+            request.future.set_result(proba[offset:offset + request.rows])
+            offset += request.rows
+
+        with self._cond:
+            self._stats["requests"] += len(batch)
+            self._stats["rows"] += offset
+            self._stats["batches"] += 1
+            self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+            self._batch_sizes.append(len(batch))
+            self._predict_ms.append((finished - started) * 1000)
+            self._queue_ms.extend((started - r.enqueued) * 1000 for r in batch)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._serve(batch)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        def summary(values) -> Dict[str, float]:
+            if not values:
+                return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+            arr = np.fromiter(values, dtype=np.float64)
+            return {
+                "mean": round(float(arr.mean()), 3),
+                "p50": round(float(np.percentile(arr, 50)), 3),
+                "p95": round(float(np.percentile(arr, 95)), 3),
+                "max": round(float(arr.max()), 3),
+            }
+
+        with self._cond:
+            return {
+                **self._stats,
+                "running": self.running,
+                "pending": len(self._pending),
+                "batch_size": summary(self._batch_sizes),
+                "queue_ms": summary(self._queue_ms),
+                "predict_ms": summary(self._predict_ms),
+            }
+
+
+# Global batcher (chi start khi settings.leak_inference_batching bat)
+inference_batcher = InferenceBatcher(
+    max_batch_size=settings.leak_inference_max_batch_size,
+    max_batch_rows=settings.leak_inference_max_batch_rows,
+    max_wait_ms=settings.leak_inference_max_wait_ms
+)
+
+
+def start_inference_batching():
+    if settings.leak_inference_batching:
+        inference_batcher.start()
+
+
+def stop_inference_batching():
+    if settings.leak_inference_batching:
+        inference_batcher.stop()
@@ -0,0 +1,256 @@
+"""
+Xac nhan ung vien ro ri bang mo phong lai co muc tieu
+
+Model (hoac tu dien chu ky, services/leak_signatures.py) dua ra top-k node nghi ro ri; truoc khi
+cu doi di hien truong, mo phong lai ro ri tai tung ung vien trong khoang thoi gian bi danh dau
+va tim dien tich ro ri khop nhat voi ap luc quan sat:
+    - Quan sat: ap luc trung binh moi node trong cua so [window_start, window_end], head
+      reservoir trung binh cung cua so (mang mot nguon, demand co dinh: ap luc khong ro ri
+      tuyen tinh theo head nen trung binh cua so = trang thai tai head trung binh).
+    - Ro ri dien tich A o trang thai on dinh tuong duong demand them Q = Cd * A * sqrt(2 g p)
+      tai node -> tim theo Q: mot lan chay WNTR nhieu buoc (pattern demand, moi buoc mot Q)
+      danh gia ca luoi Q (~30 ms/buoc thay vi ~150 ms/lan mo phong rieng), A suy ra tu ap luc
+      mo phong tai node. Tim 1 chieu co bien: luoi ``grid_size`` diem tren [0, Q(max_area)],
+      thu hep quanh diem tot nhat ``rounds`` vong.
+    - Sai so: RMSE giua ap luc mo phong va quan sat tren cac sensor; xep hang ung vien theo
+      RMSE (kem RMSE khi khong ro ri de so sanh).
+Ung vien chay song song tren process pool "spawn" co gioi han so worker; moi worker parse
+mang mot lan (initializer) va dung lai cho moi request - pool giu giua cac request, tao lai
+khi file .inp thay doi.
+"""
+import multiprocessing
+import os
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from services.baseline_cache import SteadyStateSolver, inp_hash
+from services.leak_signatures import DEFAULT_DISCHARGE_COEFF
+from utils.logger import logger
+
+GRAVITY = 9.81  # m/s2
+LEAK_PATTERN = "LEAK_CONFIRMATION"
+
+
+class LeakFitSolver:
+    """Mang da parse (mot instance moi worker) de mo phong demand ro ri tai mot node"""
+
+    def __init__(self, inp_file: str):
+        self.solver = SteadyStateSolver(inp_file)
+        self.wn = self.solver.wn
+        self.reservoir = self.solver.reservoir
+        self.default_head = self.solver.default_head
+        self.sensors = [str(n) for n in self.wn.junction_name_list]
+        self._baselines: Dict[float, np.ndarray] = {}
+
+    def pressures(self, node: str, flows: Sequence[float], reservoir_head: float) -> np.ndarray:
+        """Ap luc [len(flows) x sensor] khi node co them demand ro ri flows[i] (m3/s)"""
+        import wntr
+
+        wn = self.wn
+        junction = wn.get_node(node)
+        options = wn.options.time
+        wn.add_pattern(LEAK_PATTERN, [float(q) for q in flows])
+        junction.demand_timeseries_list.append((1.0, wn.get_pattern(LEAK_PATTERN), LEAK_PATTERN))
+        wn.get_node(self.reservoir).base_head = float(reservoir_head)
+        options.duration = (len(flows) - 1) * 3600
+        options.hydraulic_timestep = options.report_timestep = options.pattern_timestep = 3600
+        try:
+            wn.reset_initial_values()
+            results = wntr.sim.WNTRSimulator(wn).run_sim()
+            return results.node['pressure'][self.sensors].to_numpy()
+        finally:
+            del junction.demand_timeseries_list[-1]
+            wn.remove_pattern(LEAK_PATTERN)
+            options.duration = 0
+            wn.get_node(self.reservoir).base_head = self.default_head
+
+    def baseline(self, reservoir_head: float) -> np.ndarray:
+        """Ap luc khong ro ri tai head reservoir (giu theo head trong worker)"""
+        key = round(float(reservoir_head), 6)
+        if key not in self._baselines:
+            self._baselines[key] = self.pressures(self.sensors[0], [0.0], key)[0]
+        return self._baselines[key]
+
+
+def fit_leak(solver: LeakFitSolver, node: str, observed: Mapping[str, float], reservoir_head: float,
+             max_area: float, discharge_coeff: float = DEFAULT_DISCHARGE_COEFF,
+             grid_size: int = 12, rounds: int = 3) -> Dict[str, Any]:
+    """
+    Dien tich ro ri tai node khop nhat voi ap luc quan sat (tim co bien tren luu luong ro ri)
+
+    Returns:
+        node_id, fitted_area_m2, leak_flow_m3s, rmse, no_leak_rmse, simulations, evaluations
+    """
+    started = time.perf_counter()
+    if node not in solver.sensors:
+        raise ValueError(f"Node {node} is not a junction")
+    columns = [i for i, s in enumerate(solver.sensors) if np.isfinite(observed.get(s, np.nan))]
+    if not columns:
+        raise ValueError("No observed pressure for network junctions")
+    target = np.array([observed[solver.sensors[i]] for i in columns])
+    node_col = solver.sensors.index(node)
+
+    def rmse(pressure: np.ndarray) -> np.ndarray:
+        return np.sqrt(((pressure[..., columns] - target) ** 2).mean(axis=-1))
+
+    baseline = solver.baseline(reservoir_head)
+    no_leak_rmse = float(rmse(baseline))
+    result = {
+        "node_id": node, "fitted_area_m2": 0.0, "leak_flow_m3s": 0.0, "rmse": no_leak_rmse,
+        "no_leak_rmse": no_leak_rmse, "simulations": 1, "evaluations": 1,
+    }
+    if baseline[node_col] <= 0:
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    # Q lon nhat: dien tich max_area voi ap luc khong ro ri (ap luc giam khi ro ri -> A(Q) <= max_area)
+    lo, hi = 0.0, discharge_coeff * max_area * np.sqrt(2 * GRAVITY * baseline[node_col])
+    for _ in range(max(1, rounds)):
+        flows = np.linspace(lo, hi, max(3, grid_size))
+        pressure = solver.pressures(node, flows, reservoir_head)
+        node_pressure = pressure[:, node_col]
+        areas = np.divide(flows, discharge_coeff * np.sqrt(2 * GRAVITY * np.maximum(node_pressure, 0)),
+                          out=np.full(len(flows), np.inf), where=node_pressure > 0)
+        areas[flows == 0] = 0.0
+        errors = np.where(areas <= max_area, rmse(pressure), np.inf)
+        best = int(np.argmin(errors))
+        result["simulations"] += 1
+        result["evaluations"] += len(flows)
+        if errors[best] < result["rmse"]:
+            result.update(fitted_area_m2=float(areas[best]), leak_flow_m3s=float(flows[best]),
+                          rmse=float(errors[best]))
+        step = flows[1] - flows[0]
+        lo, hi = max(lo, flows[best] - step), min(hi, flows[best] + step)
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+# Solver cua worker process hien tai (tao mot lan trong _init_worker) va hash .inp cua no
+_solver: Optional[LeakFitSolver] = None
+_solver_key: Optional[str] = None
+
+
+def _init_worker(inp_file: str):
+    global _solver, _solver_key
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        _solver = LeakFitSolver(inp_file)
+    _solver_key = inp_hash(inp_file)
+
+
+def _fit_task(node: str, observed: Dict[str, float], heads: Dict[str, float],
+              options: Dict[str, Any]) -> Dict[str, Any]:
+    head = heads.get(_solver.reservoir, np.nan)
+    head = float(head) if np.isfinite(head) else _solver.default_head
+    try:
+        result = fit_leak(_solver, node, observed, head, **options)
+    except Exception as e:
+        return {"node_id": node, "error": str(e)}
+    result["worker_pid"] = os.getpid()
+    return result
+
+
+class LeakConfirmer:
+    """
+    Fit dien tich ro ri cho cac ung vien song song, xep hang theo RMSE
+
+    Args:
+        inp_file: File .inp cua mang
+        workers: So process toi da (0 = so CPU; 1 = chay trong process hien tai)
+        max_area: Dien tich ro ri lon nhat khi fit (m2)
+        discharge_coeff: He so xa cua ro ri
+        grid_size, rounds: Luoi moi vong va so vong thu hep khoang tim
+    """
+
+    def __init__(self, inp_file: str, workers: int = 4, max_area: float = 0.005,
+                 discharge_coeff: float = DEFAULT_DISCHARGE_COEFF, grid_size: int = 12, rounds: int = 3):
+        if max_area <= 0:
+            raise ValueError("max_area must be positive")
+        self.inp_file = Path(inp_file)
+        self.workers = workers if workers and workers > 0 else (os.cpu_count() or 1)
+        self.options = {
+            "max_area": float(max_area),
+            "discharge_coeff": float(discharge_coeff),
+            "grid_size": int(grid_size),
+            "rounds": int(rounds),
+        }
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_key: Optional[str] = None
+        self._lock = threading.Lock()
+        self._inline_lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        """Pool worker (tao lazy, giu giua cac request; .inp doi -> tao pool moi)"""
+        key = inp_hash(str(self.inp_file))
+        with self._lock:
+            if self._pool is None or self._pool_key != key:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                context = multiprocessing.get_context("spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                 initializer=_init_worker, initargs=(str(self.inp_file),))
+                self._pool_key = key
+                logger.info(f"[OK] Leak confirmation pool: {self.workers} worker(s)")
+            return self._pool
+
+    def _run_inline(self, candidates: List[str], observed: Dict[str, float],
+                    heads: Dict[str, float]) -> List[Dict[str, Any]]:
+        key = inp_hash(str(self.inp_file))
+        with self._inline_lock:
+            if _solver_key != key:
+                _init_worker(str(self.inp_file))
+            return [_fit_task(node, observed, heads, self.options) for node in candidates]
+
+    def confirm(self, candidates: Sequence[str], observed: Mapping[str, float],
+                heads: Optional[Mapping[str, float]] = None) -> Dict[str, Any]:
+        """
+        Fit ro ri tai tung ung vien va xep hang theo RMSE
+
+        Args:
+            candidates: Node ung vien (thu tu tu model)
+            observed: node_id -> ap luc quan sat trung binh trong cua so (m)
+            heads: node_id -> head trung binh trong cua so; dung head cua reservoir
+                   (khong co -> head trong .inp)
+        """
+        started = time.perf_counter()
+        candidates = list(dict.fromkeys(str(c) for c in candidates))
+        observed = {str(k): float(v) for k, v in observed.items()}
+        heads = {str(k): float(v) for k, v in (heads or {}).items()}
+        workers = max(1, min(self.workers, len(candidates)))
+        if workers == 1 or self.workers == 1:
+            fits = self._run_inline(candidates, observed, heads)
+        else:
+            pool = self._executor()
+            futures = [pool.submit(_fit_task, node, observed, heads, self.options) for node in candidates]
+            fits = [f.result() for f in futures]
+
+        ranked = sorted((f for f in fits if "error" not in f), key=lambda f: f["rmse"])
+        for rank, fit in enumerate(ranked, 1):
+            fit["rank"] = rank
+            fit["improvement"] = (1 - fit["rmse"] / fit["no_leak_rmse"]) if fit["no_leak_rmse"] > 0 else 0.0
+        return {
+            "candidates": ranked,
+            "failed": [f for f in fits if "error" in f],
+            "workers": workers,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+                self._pool_key = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "pool_started": self._pool is not None,
+            **self.options,
+        }
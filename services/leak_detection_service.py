@@ -1,103 +1,208 @@
 """
 Service để phát hiện rò rỉ sử dụng model đã train
 """
-import pickle
-import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Callable, Dict, List, Any, Optional, Sequence, Set, Tuple, Union
 from datetime import datetime
 
 from utils.logger import logger
+from core.config import settings
+from services.baseline_cache import BaselineCache, BaselineNotWarmedError
+from services.feature_pipeline import (
+    FEATURE_VERSION, build_features, select_features, serving_features
+)
+from services.model_store import ModelBundle, ModelStore
+from services.oblivious_trees import ObliviousTreeModel
+from services.inference_batcher import inference_batcher, positive_proba
+from services.online_detector import OnlineLeakDetector
+from services.node_arrays import NodeArrays
+from services.leak_confirmation import LeakConfirmer
+from services.leak_ranking import LeakRanking, rank_leak_candidates
+from services.leak_signatures import LeakSignatureDictionary, SignaturesNotBuiltError
+from services.probability_cache import ProbabilityCache, ScoredRun
+from services.topology_store import DEFAULT_TOPOLOGY_FILE, TopologyFeatureStore
+
+# Xac suat toi thieu cua mot leak (duoi muc nay coi la false positive)
+MIN_LEAK_PROBABILITY = 0.05
+
+# Run cua detect_leaks_batch: NodeArrays hoac ham tra ve NodeArrays (goi khi khong co trong cache)
+RunSource = Union[NodeArrays, Callable[[], NodeArrays]]
+
+
+def _resolve_run(source: RunSource) -> Tuple[Optional[NodeArrays], Optional[str]]:
+    """NodeArrays cua mot run trong batch; loi / khong co du lieu -> (None, message)"""
+    try:
+        arrays = source() if callable(source) else source
+    except Exception as e:
+        logger.error(f"Error loading batch run: {str(e)}")
+        return None, str(e)
+    if arrays is None or len(arrays) == 0:
+        return None, "No data provided"
+    return arrays, None
+
+
+
+class RunNotFoundError(LookupError):
+    """Khong co simulation run voi run_id nay (route tra 404)"""
+
+
+def load_stored_run(run_id: int) -> NodeArrays:
+    """
+    NodeArrays cua simulation da luu (simulation_runs.results["nodes"])
+
+    Khong co run -> RunNotFoundError; run chua xong / du lieu hong -> ValueError
+    """
+    from core.database import db_manager
+    run = db_manager.get_simulation_run(run_id)
+    if run is None:
+        raise RunNotFoundError(f"Simulation run {run_id} not found")
+    if run["status"] != "completed" or not run["results"]:
+        raise ValueError(f"Simulation run {run_id} has no results (status: {run['status']})")
+    return NodeArrays.from_nodes_results(run["results"].get("nodes", {}))
+
 
 class LeakDetectionService:
     """Service để detect leak từ simulation results"""
     
-    def __init__(self):
-        self.model = None
-        self.scaler = None
-        self.feature_cols = None
-        self.threshold = 0.5  # Default threshold (will be overridden by metadata if available)
-        self.metadata = None
-        self.excluded_nodes = set()  # Nodes to exclude from leak detection (pumps, reservoirs, tanks)
-        self._load_model()
-        self._load_excluded_nodes()
-    
-    def _load_model(self):
-        """Load model, scaler và metadata"""
-        try:
-            model_dir = Path("models")
-            # Try local model first, fallback to server model
-            local_model_file = model_dir / "leak_detection_model_local.pkl"
-            server_model_file = model_dir / "leak_detection_model.pkl"
-            
-            if local_model_file.exists():
-                model_file = local_model_file
-                logger.info(f"[OK] Using LOCAL model: {model_file}")
-            elif server_model_file.exists():
-                model_file = server_model_file
-                logger.info(f"[OK] Using SERVER model: {model_file}")
-            else:
-                logger.warning(f"Model file not found: {model_file}")
-                return
-            
-            scaler_file = model_dir / "scaler.pkl"
-            metadata_file = model_dir / "model_metadata.json"
-            
-            # Load model
-            with open(model_file, 'rb') as f:
-                self.model = pickle.load(f)
-            logger.info("[OK] Model loaded successfully")
-            
-            # Load scaler (if exists)
-            if scaler_file.exists():
-                with open(scaler_file, 'rb') as f:
-                    self.scaler = pickle.load(f)
-                logger.info("[OK] Scaler loaded successfully")
-            else:
-                logger.warning("Scaler not found - using features without scaling")
-            
-            # Load metadata
-            if metadata_file.exists():
-                with open(metadata_file, 'r') as f:
-                    self.metadata = json.load(f)
-                
-                # Get feature columns
-                if 'feature_cols' in self.metadata:
-                    self.feature_cols = self.metadata['feature_cols']
-                
-                # Get optimal threshold if available
-                # Note: best_threshold (0.92) is too high for real-world use
-                # Using 0.1 (10%) for production - balanced between detection and false positives
-                # This threshold provides reasonable detection rate (~2-3%) with acceptable confidence
-                if 'best_threshold' in self.metadata:
-                    # Use balanced threshold for production
-                    # Original: self.threshold = self.metadata['best_threshold']  # 0.92 - too high
-                    # Previous: self.threshold = 0.05  # 5% - too low, many false positives
-                    self.threshold = 0.1  # 10% - balanced for production use
-                elif 'optimal_threshold' in self.metadata:
-                    self.threshold = self.metadata['optimal_threshold']
-                else:
-                    self.threshold = 0.1  # Default to 10% for production
-                
-                logger.info(f"[OK] Metadata loaded - Threshold: {self.threshold:.3f} (adjusted from {self.metadata.get('best_threshold', 'N/A')} for production balance)")
-            else:
-                logger.warning("Metadata file not found")
-                
-        except Exception as e:
-            logger.error(f"Error loading model: {str(e)}")
-            self.model = None
+    def __init__(self, model_dir: Path = Path("models"), runtime: str = "auto"):
+        # Model load lazy o lan dung dau tien va co the reload khi dang chay (services/model_store.py)
+        self.models = ModelStore(model_dir, runtime=runtime)
+        # Topology features bien dich mot lan, tu bien dich lai khi CSV / .inp thay doi
+        self.topology = TopologyFeatureStore(DEFAULT_TOPOLOGY_FILE, settings.epanet_input_file)
+        # Loi giai khong ro ri theo head reservoir cho residual features (chi dung khi model can)
+        self.baseline = BaselineCache(
+            settings.epanet_input_file, settings.leak_baseline_cache_dir, settings.leak_baseline_head_bin_m
+        )
+        # Chu ky ro ri chuan cua tung junction cho dinh vi vat ly: tao o warmup (services/warmup.py)
+        # hoac scripts/build_leak_signatures.py, khong bao gio tao trong request (xem localize_leak)
+        self.signatures = LeakSignatureDictionary(
+            settings.epanet_input_file, settings.leak_signature_cache_dir, settings.leak_signature_area_m2,
+            settings.leak_signature_reservoir_head_m, workers=settings.leak_signature_workers
+        )
+        # Mo phong lai ro ri tai ung vien de xac nhan (process pool tao lazy, xem confirm_leaks)
+        self.confirmer = LeakConfirmer(
+            settings.epanet_input_file, settings.leak_confirmation_workers, settings.leak_confirmation_max_area_m2,
+            grid_size=settings.leak_confirmation_grid_size, rounds=settings.leak_confirmation_rounds
+        )
+        # Nodes to exclude from leak detection (pumps, reservoirs, tanks); frozenset - chi doc khi detect
+        self.excluded_nodes = frozenset(self._load_excluded_nodes())
+        # Luong streaming (SCADA / simulation tung buoc): stream_id -> (OnlineLeakDetector, lan dung
+        # cuoi), thu tu LRU; toi da max_streams luong, luong khong cap nhat qua idle TTL bi xoa
+        self._streams: "OrderedDict[str, Tuple[OnlineLeakDetector, float]]" = OrderedDict()
+        self._streams_lock = threading.Lock()
+        self.max_streams = settings.leak_stream_max_streams
+        self.stream_idle_ttl = settings.leak_stream_idle_ttl_seconds
+        self.streams_evicted = 0
+        # Xac suat da cham diem theo run: doi threshold / top_k khong goi lai model
+        self.scored_runs = ProbabilityCache(settings.leak_probability_cache_runs)
+    
+    # Thuoc tinh cua bundle hien tai (giu tuong thich voi code cu)
+    @property
+    def model(self):
+        bundle = self.models.get()
+        return bundle.model if bundle else None
+    
+    @property
+    def scaler(self):
+        bundle = self.models.get()
+        return bundle.scaler if bundle else None
+    
+    @property
+    def metadata(self) -> Optional[Dict[str, Any]]:
+        bundle = self.models.get()
+        return bundle.metadata if bundle else None
+    
+    @property
+    def feature_cols(self) -> Optional[List[str]]:
+        bundle = self.models.get()
+        return bundle.feature_cols if bundle else None
+    
+    @property
+    def threshold(self) -> float:
+        bundle = self.models.get()
+        return bundle.threshold if bundle else 0.5
     
-    def _load_excluded_nodes(self):
-        """Load nodes to exclude from leak detection (reservoirs, tanks, pumps)"""
+    def reload_model(self) -> Dict[str, Any]:
+        """Load lai model tu dia va swap; request dang chay dung tiep model cu. Loi -> raise, giu model cu"""
+        bundle = self.models.reload()
+        logger.info(f"[OK] Model reloaded from {bundle.source}")
+        return bundle.info()
+    
+    async def watch_model_files(self, interval_seconds: float):
+        """Background task: tu reload khi file trong thu muc model thay doi"""
+        await self.models.watch(interval_seconds)
+    
+    def model_info(self) -> Dict[str, Any]:
+        """Trang thai model (khong kich hoat load)"""
+        bundle = self.models.peek()
+        return {
+            "loaded": bundle is not None,
+            "runtime": self.models.runtime,
+            "model": bundle.info() if bundle else None,
+            "last_error": self.models.last_error,
+        }
+    
+    def _evict_streams_locked(self, now: float):
+        """Xoa luong het han (idle TTL) roi luong it dung nhat khi vuot max_streams (giu _streams_lock)"""
+        if self.stream_idle_ttl > 0:
+            while self._streams:
+                stream_id, (_, last_used) = next(iter(self._streams.items()))
+                if now - last_used <= self.stream_idle_ttl:
+                    break
+                del self._streams[stream_id]
+                self.streams_evicted += 1
+        if self.max_streams > 0:
+            while len(self._streams) > self.max_streams:
+                self._streams.popitem(last=False)
+                self.streams_evicted += 1
+    
+    def online_detector(self, stream_id: str) -> OnlineLeakDetector:
+        """Detector streaming cua stream_id (tao moi neu chua co; danh dau vua dung)"""
+        now = time.monotonic()
+        with self._streams_lock:
+            entry = self._streams.get(stream_id)
+            detector = entry[0] if entry is not None else OnlineLeakDetector(self)
+            self._streams[stream_id] = (detector, now)
+            self._streams.move_to_end(stream_id)
+            self._evict_streams_locked(now)
+            return detector
+    
+    def get_stream(self, stream_id: str) -> Optional[OnlineLeakDetector]:
+        """Detector cua stream_id neu con (khong tinh la lan dung)"""
+        with self._streams_lock:
+            self._evict_streams_locked(time.monotonic())
+            entry = self._streams.get(stream_id)
+            return entry[0] if entry is not None else None
+    
+    def reset_stream(self, stream_id: str) -> bool:
+        """Xoa trang thai (ring buffer) cua stream_id"""
+        with self._streams_lock:
+            return self._streams.pop(stream_id, None) is not None
+    
+    def stream_stats(self) -> Dict[str, Any]:
+        with self._streams_lock:
+            self._evict_streams_locked(time.monotonic())
+            return {
+                "streams": len(self._streams),
+                "max_streams": self.max_streams,
+                "idle_ttl_seconds": self.stream_idle_ttl,
+                "evicted": self.streams_evicted,
+            }
+    
+    def _load_excluded_nodes(self) -> Set[str]:
+        """
+        Load nodes to exclude from leak detection (reservoirs, tanks, pumps) tu file .inp.
+        reservoir_nodes trong metadata thuoc ve tung model (ModelBundle.reservoir_nodes).
+        """
+        excluded_nodes = set()
         try:
-            # Load from metadata if available
-            if self.metadata and 'reservoir_nodes' in self.metadata:
-                excluded_from_metadata = set(str(n) for n in self.metadata['reservoir_nodes'])
-                self.excluded_nodes.update(excluded_from_metadata)
-                logger.info(f"[OK] Loaded {len(excluded_from_metadata)} excluded nodes from metadata")
-            
             # Parse EPANET input file to get reservoirs and tanks
             inp_file = Path("epanetVip1.inp")
             if not inp_file.exists():
@@ -115,7 +220,7 @@ class LeakDetectionService:
                     # Pattern: ID followed by Head value
                     reservoir_ids = re.findall(r'^(\w+)\s+', reservoir_section, re.MULTILINE)
                     for res_id in reservoir_ids:
-                        self.excluded_nodes.add(str(res_id).strip())
+                        excluded_nodes.add(str(res_id).strip())
                     logger.info(f"[OK] Found {len(reservoir_ids)} reservoirs: {reservoir_ids[:5]}...")
                 
                 # Find TANKS section
@@ -125,295 +230,135 @@ class LeakDetectionService:
                     # Pattern: ID followed by Elevation value
                     tank_ids = re.findall(r'^(\w+)\s+', tank_section, re.MULTILINE)
                     for tank_id in tank_ids:
-                        self.excluded_nodes.add(str(tank_id).strip())
+                        excluded_nodes.add(str(tank_id).strip())
                     logger.info(f"[OK] Found {len(tank_ids)} tanks: {tank_ids[:5]}...")
                 
-                logger.info(f"[OK] Total excluded nodes: {len(self.excluded_nodes)}")
+                logger.info(f"[OK] Total excluded nodes: {len(excluded_nodes)}")
             else:
                 logger.warning(f"EPANET input file not found: {inp_file}")
                 
         except Exception as e:
             logger.warning(f"Error loading excluded nodes: {e}")
+        return excluded_nodes
     
     def is_ready(self) -> bool:
-        """Check if service is ready to use"""
-        return self.model is not None
+        """Check if service is ready to use (load model neu chua load)"""
+        return self.models.get() is not None
+    
+    def is_loaded(self) -> bool:
+        """Model da nam trong bo nho chua (khong kich hoat load, dung cho health probe)"""
+        return self.models.peek() is not None
     
     def _load_topology_features(self):
-        """Load topology features from network_topology.csv if available"""
-        topology_file = Path("dataset/network_topology.csv")
-        neighbor_map = {}
-        topology_df = None
-        
-        if topology_file.exists():
-            try:
-                topology_df = pd.read_csv(topology_file)
-                logger.info(f"[OK] Topology loaded: {len(topology_df)} nodes")
-                
-                # Build neighbor map from topology
-                # Format 1: node_id, neighbors (comma-separated string)
-                if 'neighbors' in topology_df.columns and 'node_id' in topology_df.columns:
-                    for _, row in topology_df.iterrows():
-                        node_id = str(row['node_id'])
-                        neighbors_str = str(row['neighbors']) if pd.notna(row['neighbors']) else ''
-                        if neighbors_str and neighbors_str != 'nan':
-                            neighbors = [n.strip() for n in neighbors_str.split(',') if n.strip()]
-                            neighbor_map[node_id] = neighbors
-                            # Also add reverse connections
-                            for neighbor in neighbors:
-                                if neighbor not in neighbor_map:
-                                    neighbor_map[neighbor] = []
-                                if node_id not in neighbor_map[neighbor]:
-                                    neighbor_map[neighbor].append(node_id)
-                # Format 2: from_node, to_node (edge list)
-                elif 'from_node' in topology_df.columns and 'to_node' in topology_df.columns:
-                    for _, row in topology_df.iterrows():
-                        from_node = str(row['from_node'])
-                        to_node = str(row['to_node'])
-                        if from_node not in neighbor_map:
-                            neighbor_map[from_node] = []
-                        if to_node not in neighbor_map:
-                            neighbor_map[to_node] = []
-                        if to_node not in neighbor_map[from_node]:
-                            neighbor_map[from_node].append(to_node)
-                        if from_node not in neighbor_map[to_node]:
-                            neighbor_map[to_node].append(from_node)
-            except Exception as e:
-                logger.warning(f"Error loading topology: {e}")
-        else:
-            logger.warning(f"Topology file not found: {topology_file}")
-        
-        return neighbor_map, topology_df
+        """Topology features da bien dich (network_topology.csv + file .inp)"""
+        return self.topology.get()
     
-    def prepare_features(self, df: pd.DataFrame) -> pd.DataFrame:
+    def _load_baseline(self) -> BaselineCache:
+        """Baseline khong ro ri (services/baseline_cache.py)"""
+        return self.baseline
+    
+    def prepare_features(self, df: pd.DataFrame, feature_cols: Optional[Sequence[str]] = None) -> pd.DataFrame:
         """
         Prepare features từ simulation results
-        Áp dụng feature engineering giống như training
+        Áp dụng feature engineering giống như training (services/feature_pipeline.py)
+        
+        Args:
+            feature_cols: feature_cols của bundle sẽ chấm điểm (residual features chỉ tính khi
+                          bundle dùng); lấy từ chính bundle đó, không đọc lại ModelStore - model
+                          có thể reload giữa lúc tính feature và lúc predict
         """
         if df.empty:
             return df
         
         df_fe = df.copy()
+        return build_features(
+            df_fe, serving_features(feature_cols),
+            topology_loader=self._load_topology_features, baseline_loader=self._load_baseline
+        )
+    
+    def _scale_features(self, bundle: ModelBundle, X: np.ndarray) -> np.ndarray:
+        """Scale features (if scaler exists)"""
+        if bundle.scaler is not None:
+            try:
+                X = bundle.scaler.transform(X)
+            except Exception as e:
+                logger.warning(f"Scaling failed: {e}, using unscaled features")
+        return X
+    
+    def predict_proba(self, bundle: ModelBundle, X: np.ndarray) -> np.ndarray:
+        """Xac suat ro ri cho ma tran feature X (scale neu co scaler, predict qua batcher)"""
+        X = self._scale_features(bundle, X)
+        # Gom voi cac request dong thoi khac thanh mot lan predict_proba (neu batcher dang chay)
+        return inference_batcher.predict(bundle.model, X)
+    
+    def _collect_leaks(self, df_fe: pd.DataFrame, reservoir_nodes: set, threshold: float,
+                       top_k: Optional[int] = None, window: Optional[float] = None,
+                       min_probability: float = MIN_LEAK_PROBABILITY) -> Tuple[LeakRanking, int]:
+        """
+        Loc cac dong leak_probability >= threshold (bo node loai tru, node cap nuoc, xac suat/demand qua thap),
+        gop theo node - hoac node x cua so thoi gian (window, don vi cua timestamp) - giu xac suat
+        cao nhat (services/leak_ranking.py). Tra ve (ranking, so dong ro ri truoc khi gop)
+        """
+        node_ids = df_fe['node_id'].astype(str).to_numpy()
+        demand = df_fe['demand'].to_numpy()
+        probability = df_fe['leak_probability'].to_numpy()
         
-        # Group by scenario_id and node_id for rolling features
-        if 'scenario_id' not in df_fe.columns:
-            df_fe['scenario_id'] = 0  # Default scenario_id
-        
-        # Group by scenario_id and node_id
-        g = df_fe.groupby(['scenario_id', 'node_id'], sort=False)
-        
-        # Basic temporal features
-        if 'pressure_change' not in df_fe.columns:
-            df_fe['pressure_change'] = g['pressure'].transform(lambda x: x.diff().fillna(0))
-        
-        if 'head_change' not in df_fe.columns:
-            df_fe['head_change'] = g['head'].transform(lambda x: x.diff().fillna(0))
-        
-        # Moving averages
-        if 'pressure_ma3' not in df_fe.columns:
-            df_fe['pressure_ma3'] = g['pressure'].transform(lambda x: x.rolling(3, min_periods=1).mean())
-            df_fe['pressure_ma5'] = g['pressure'].transform(lambda x: x.rolling(5, min_periods=1).mean())
-            df_fe['head_ma3'] = g['head'].transform(lambda x: x.rolling(3, min_periods=1).mean())
-            df_fe['head_ma5'] = g['head'].transform(lambda x: x.rolling(5, min_periods=1).mean())
-        
-        # Network-level features
-        if 'network_pressure_mean' not in df_fe.columns:
-            df_fe['network_pressure_mean'] = df_fe.groupby(['scenario_id', 'timestamp'])['pressure'].transform('mean')
-            df_fe['network_pressure_std'] = df_fe.groupby(['scenario_id', 'timestamp'])['pressure'].transform('std').fillna(0)
-            df_fe['network_demand_mean'] = df_fe.groupby(['scenario_id', 'timestamp'])['demand'].transform('mean')
-        
-        # Deviation features
-        if 'pressure_deviation' not in df_fe.columns:
-            df_fe['pressure_deviation'] = df_fe['pressure'] - df_fe['network_pressure_mean']
-            df_fe['demand_deviation'] = df_fe.groupby(['scenario_id', 'node_id'])['demand'].transform(lambda x: x - x.mean())
-        
-        # Pressure/Head drops
-        if 'pressure_drop' not in df_fe.columns:
-            df_fe['pressure_drop'] = -df_fe['pressure_change'].clip(upper=0)
-            df_fe['head_drop'] = -df_fe['head_change'].clip(upper=0)
-        
-        # Additional statistical features (rolling window 5)
-        if 'pressure_std_5' not in df_fe.columns:
-            df_fe['pressure_std_5'] = g['pressure'].transform(lambda x: x.rolling(5, min_periods=1).std().fillna(0))
-            df_fe['head_std_5'] = g['head'].transform(lambda x: x.rolling(5, min_periods=1).std().fillna(0))
-            df_fe['demand_std_5'] = g['demand'].transform(lambda x: x.rolling(5, min_periods=1).std().fillna(0))
-        
-        if 'pressure_min_5' not in df_fe.columns:
-            df_fe['pressure_min_5'] = g['pressure'].transform(lambda x: x.rolling(5, min_periods=1).min())
-            df_fe['pressure_max_5'] = g['pressure'].transform(lambda x: x.rolling(5, min_periods=1).max())
-            df_fe['head_min_5'] = g['head'].transform(lambda x: x.rolling(5, min_periods=1).min())
-            df_fe['head_max_5'] = g['head'].transform(lambda x: x.rolling(5, min_periods=1).max())
-        
-        # Acceleration features (second derivative)
-        if 'pressure_acceleration' not in df_fe.columns:
-            df_fe['pressure_acceleration'] = g['pressure_change'].transform(lambda x: x.diff().fillna(0))
-            df_fe['head_acceleration'] = g['head_change'].transform(lambda x: x.diff().fillna(0))
-        
-        # Percentage change features
-        if 'pressure_change_pct' not in df_fe.columns:
-            df_fe['pressure_change_pct'] = (df_fe['pressure_change'] / (df_fe['pressure'].abs() + 1e-6))
-            df_fe['head_change_pct'] = (df_fe['head_change'] / (df_fe['head'].abs() + 1e-6))
-            df_fe['demand_change'] = g['demand'].transform(lambda x: x.diff().fillna(0))
-            df_fe['demand_change_pct'] = (df_fe['demand_change'] / (df_fe['demand'].abs() + 1e-6))
-        
-        # Ratio features
-        if 'pressure_demand_ratio' not in df_fe.columns:
-            df_fe['pressure_demand_ratio'] = df_fe['pressure'] / (df_fe['demand'].abs() + 1e-6)
-            df_fe['head_demand_ratio'] = df_fe['head'] / (df_fe['demand'].abs() + 1e-6)
-        
-        # 🚀 TOPOLOGY-BASED SPATIAL FEATURES (9 features)
-        # These are required by the new model (39 features total)
-        # ALWAYS create these features, even if they already exist (to ensure they're present)
-        topology_features = [
-            'neighbors_pressure_mean', 'neighbors_pressure_std', 'neighbors_head_mean',
-            'neighbors_demand_mean', 'pressure_gradient', 'head_gradient',
-            'node_degree', 'node_betweenness', 'node_elevation'
-        ]
-        
-        # Check if any topology feature is missing
-        missing_topology = [f for f in topology_features if f not in df_fe.columns]
-        
-        if missing_topology:
-            # Load topology if available
-            neighbor_map, topology_df = self._load_topology_features()
-            
-            # Initialize ALL topology features with defaults
-            if 'neighbors_pressure_mean' not in df_fe.columns:
-                df_fe['neighbors_pressure_mean'] = df_fe['pressure'].astype('float32')
-            if 'neighbors_pressure_std' not in df_fe.columns:
-                df_fe['neighbors_pressure_std'] = 0.0
-            if 'neighbors_head_mean' not in df_fe.columns:
-                df_fe['neighbors_head_mean'] = df_fe['head'].astype('float32')
-            if 'neighbors_demand_mean' not in df_fe.columns:
-                df_fe['neighbors_demand_mean'] = df_fe['demand'].astype('float32')
-            if 'pressure_gradient' not in df_fe.columns:
-                df_fe['pressure_gradient'] = 0.0
-            if 'head_gradient' not in df_fe.columns:
-                df_fe['head_gradient'] = 0.0
-            if 'node_degree' not in df_fe.columns:
-                df_fe['node_degree'] = 0
-            if 'node_betweenness' not in df_fe.columns:
-                df_fe['node_betweenness'] = 0.0
-            if 'node_elevation' not in df_fe.columns:
-                df_fe['node_elevation'] = 0.0
+        # Get detected leaks
+        mask = probability >= threshold
+        
+        # Filter out excluded nodes (reservoirs, tanks, pumps)
+        excluded_nodes = self.excluded_nodes | reservoir_nodes
+        if len(excluded_nodes) > 0:
+            keep = mask & ~pd.Index(node_ids).isin(excluded_nodes)
+            filtered_count = int(mask.sum() - keep.sum())
+            mask = keep
+            if filtered_count > 0:
+                logger.info(f"[OK] Filtered out {filtered_count} leaks from excluded nodes (reservoirs/tanks/pumps)")
+        
+        with np.errstate(invalid='ignore'):
+            # Filter out supply nodes (demand < 0) - these are pump stations or supply points
+            keep = mask & (demand >= 0)
+            filtered_supply = int(mask.sum() - keep.sum())
+            mask = keep
+            if filtered_supply > 0:
+                logger.info(f"[OK] Filtered out {filtered_supply} leaks from supply nodes (demand < 0)")
             
-            # Merge topology features if available
-            if topology_df is not None and 'node_id' in topology_df.columns:
-                # Calculate node_degree from neighbors count
-                if 'neighbors' in topology_df.columns:
-                    topology_df['node_degree'] = topology_df['neighbors'].apply(
-                        lambda x: len(str(x).split(',')) if pd.notna(x) and str(x) != 'nan' else 0
-                    ).astype('int32')
-                else:
-                    # If no neighbors column, calculate from neighbor_map
-                    if neighbor_map:
-                        degree_dict = {node_id: len(neighbors) for node_id, neighbors in neighbor_map.items()}
-                        topology_df['node_degree'] = topology_df['node_id'].astype(str).map(degree_dict).fillna(0).astype('int32')
-                    else:
-                        topology_df['node_degree'] = 0
-                
-                # Set default values for missing topology features
-                if 'node_betweenness' not in topology_df.columns:
-                    topology_df['node_betweenness'] = 0.0
-                if 'node_elevation' not in topology_df.columns:
-                    topology_df['node_elevation'] = 0.0
-                
-                # Merge topology features
-                merge_df = topology_df[['node_id', 'node_degree', 'node_betweenness', 'node_elevation']].copy()
-                merge_df['node_id'] = merge_df['node_id'].astype(str)
-                
-                # Merge with df_fe
-                df_fe['node_id_str'] = df_fe['node_id'].astype(str)
-                df_fe = df_fe.merge(merge_df, left_on='node_id_str', right_on='node_id', how='left', suffixes=('', '_topo'))
-                df_fe['node_degree'] = df_fe['node_degree'].fillna(0).astype('int32')
-                df_fe['node_betweenness'] = df_fe['node_betweenness'].fillna(0.0).astype('float32')
-                df_fe['node_elevation'] = df_fe['node_elevation'].fillna(0.0).astype('float32')
-                
-                # Clean up temporary column
-                if 'node_id_str' in df_fe.columns:
-                    df_fe = df_fe.drop(columns=['node_id_str'])
-                if 'node_id_topo' in df_fe.columns:
-                    df_fe = df_fe.drop(columns=['node_id_topo'])
+            # Filter out very low probability leaks (likely false positives)
+            # Minimum probability threshold: 5% for meaningful leaks
+            keep = mask & (probability >= min_probability)
+            filtered_low_prob = int(mask.sum() - keep.sum())
+            mask = keep
+            if filtered_low_prob > 0:
+                logger.info(f"[OK] Filtered out {filtered_low_prob} leaks with probability < {min_probability*100:.0f}% (likely false positives)")
             
-            # Compute neighbor features if neighbor_map is available
-            if neighbor_map:
-                # Group by timestamp for efficient processing
-                for timestamp in df_fe['timestamp'].unique():
-                    mask = df_fe['timestamp'] == timestamp
-                    timestamp_df = df_fe[mask].copy()
-                    
-                    # Build lookup for this timestamp
-                    node_lookup = {}
-                    for _, row in timestamp_df.iterrows():
-                        node_id = str(row['node_id'])
-                        node_lookup[node_id] = {
-                            'pressure': row['pressure'],
-                            'head': row['head'],
-                            'demand': row['demand']
-                        }
-                    
-                    # Compute neighbor features
-                    for idx in timestamp_df.index:
-                        row = timestamp_df.loc[idx]
-                        node_id = str(row['node_id'])
-                        neighbors = neighbor_map.get(node_id, [])
-                        
-                        if neighbors:
-                            neighbor_pressures = [node_lookup[n]['pressure'] for n in neighbors if n in node_lookup]
-                            neighbor_heads = [node_lookup[n]['head'] for n in neighbors if n in node_lookup]
-                            neighbor_demands = [node_lookup[n]['demand'] for n in neighbors if n in node_lookup]
-                            
-                            if neighbor_pressures:
-                                df_fe.at[idx, 'neighbors_pressure_mean'] = np.mean(neighbor_pressures)
-                                df_fe.at[idx, 'neighbors_pressure_std'] = np.std(neighbor_pressures) if len(neighbor_pressures) > 1 else 0.0
-                                df_fe.at[idx, 'pressure_gradient'] = row['pressure'] - np.mean(neighbor_pressures)
-                            else:
-                                df_fe.at[idx, 'neighbors_pressure_mean'] = row['pressure']
-                                df_fe.at[idx, 'neighbors_pressure_std'] = 0.0
-                                df_fe.at[idx, 'pressure_gradient'] = 0.0
-                            
-                            if neighbor_heads:
-                                df_fe.at[idx, 'neighbors_head_mean'] = np.mean(neighbor_heads)
-                                df_fe.at[idx, 'head_gradient'] = row['head'] - np.mean(neighbor_heads)
-                            else:
-                                df_fe.at[idx, 'neighbors_head_mean'] = row['head']
-                                df_fe.at[idx, 'head_gradient'] = 0.0
-                            
-                            if neighbor_demands:
-                                df_fe.at[idx, 'neighbors_demand_mean'] = np.mean(neighbor_demands)
-                            else:
-                                df_fe.at[idx, 'neighbors_demand_mean'] = row['demand']
-                        else:
-                            # No neighbors - use current values
-                            df_fe.at[idx, 'neighbors_pressure_mean'] = row['pressure']
-                            df_fe.at[idx, 'neighbors_pressure_std'] = 0.0
-                            df_fe.at[idx, 'neighbors_head_mean'] = row['head']
-                            df_fe.at[idx, 'neighbors_demand_mean'] = row['demand']
-                            df_fe.at[idx, 'pressure_gradient'] = 0.0
-                            df_fe.at[idx, 'head_gradient'] = 0.0
-        
-        # Final check: Ensure all 9 topology features exist
-        topology_features = [
-            'neighbors_pressure_mean', 'neighbors_pressure_std', 'neighbors_head_mean',
-            'neighbors_demand_mean', 'pressure_gradient', 'head_gradient',
-            'node_degree', 'node_betweenness', 'node_elevation'
-        ]
-        for feat in topology_features:
-            if feat not in df_fe.columns:
-                logger.warning(f"Topology feature {feat} missing, creating with default value")
-                if 'neighbors_pressure_mean' in feat or 'neighbors_head_mean' in feat or 'neighbors_demand_mean' in feat:
-                    df_fe[feat] = df_fe.get('pressure', 0) if 'pressure' in feat else (df_fe.get('head', 0) if 'head' in feat else df_fe.get('demand', 0))
-                elif 'degree' in feat:
-                    df_fe[feat] = 0
-                else:
-                    df_fe[feat] = 0.0
-        
-        return df_fe
+            # Additional filter: Remove nodes with very low demand (< 0.001 m³/s = 1 L/s)
+            # These are likely measurement noise or inactive nodes
+            keep = mask & (demand >= 0.001)
+            filtered_low_demand = int(mask.sum() - keep.sum())
+            mask = keep
+            if filtered_low_demand > 0:
+                logger.info(f"[OK] Filtered out {filtered_low_demand} leaks with demand < 0.001 m³/s (likely noise)")
+        
+        # Gop theo node: giu dong co xac suat cao nhat, sap xep theo xac suat giam dan
+        rows = np.flatnonzero(mask)
+        ranking = rank_leak_candidates(
+            node_ids[rows], df_fe['timestamp'].to_numpy()[rows], probability[rows],
+            {column: df_fe[column].to_numpy()[rows] for column in ('pressure', 'head', 'demand')},
+            top_k=top_k, window=window
+        )
+        
+        # Log duplicate removal
+        if len(rows) > len(ranking):
+            logger.info(f"[OK] Removed {len(rows) - len(ranking)} duplicate node entries (kept highest probability for each node)")
+        
+        return ranking, len(rows)
     
     def detect_leaks(
         self, 
         nodes_data: Dict[str, List[Dict[str, Any]]],
-        threshold: Optional[float] = None
+        threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+        window: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         Detect leaks từ simulation results
@@ -422,6 +367,8 @@ class LeakDetectionService:
             nodes_data: Dict với key là node_id, value là list of records
                        Mỗi record có: timestamp, pressure, head, demand
             threshold: Optional threshold override (default: use model threshold)
+            top_k: Chỉ trả về k node có xác suất cao nhất
+            window: Gộp theo node x cửa sổ thời gian (giây, vd 3600 = theo giờ)
         
         Returns:
             Dict với:
@@ -429,7 +376,36 @@ class LeakDetectionService:
             - leaks: List of detected leaks
             - summary: Summary statistics
         """
-        if not self.is_ready():
+        try:
+            arrays = NodeArrays.from_records(nodes_data)
+        except Exception as e:
+            logger.error(f"Error detecting leaks: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "leaks": [],
+                "summary": {}
+            }
+        return self.detect_leaks_from_arrays(arrays, threshold, top_k, window)
+    
+    def detect_leaks_from_arrays(
+        self,
+        arrays: NodeArrays,
+        threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+        window: Optional[float] = None,
+        run_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Detect leaks từ dữ liệu node dạng cột (services/node_arrays.py), vd NodeArrays.from_wntr
+        - không tạo record trung gian cho từng giá trị
+        
+        Xác suất được cache theo run_key (mặc định: hash nội dung arrays); cùng dữ liệu với
+        threshold / top_k khác không chạy lại feature engineering và model (xem query_run).
+        """
+        # Lay bundle mot lan: reload giua request khong lam doi model dang dung
+        bundle = self.models.get()
+        if bundle is None:
             return {
                 "success": False,
                 "error": "Model not loaded",
@@ -438,19 +414,7 @@ class LeakDetectionService:
             }
         
         try:
-            # Convert nodes_data to DataFrame
-            records = []
-            for node_id, node_records in nodes_data.items():
-                for record in node_records:
-                    records.append({
-                        'node_id': node_id,
-                        'timestamp': record.get('timestamp', 0),
-                        'pressure': record.get('pressure', 0),
-                        'head': record.get('head', 0),
-                        'demand': record.get('demand', 0)
-                    })
-            
-            if not records:
+            if len(arrays) == 0:
                 return {
                     "success": False,
                     "error": "No data provided",
@@ -458,264 +422,19 @@ class LeakDetectionService:
                     "summary": {}
                 }
             
-            df = pd.DataFrame(records)
-            
-            # Prepare features
-            df_fe = self.prepare_features(df)
-            
-            # Determine expected feature count from model
-            expected_feature_count = 30  # Default for local model
-            if hasattr(self.model, 'feature_names_') and self.model.feature_names_:
-                expected_feature_count = len(self.model.feature_names_)
-                logger.info(f"Model expects {expected_feature_count} features")
-            
-            # Base feature list (30 features) - for local model
-            base_feature_list = [
-                # Basic (3)
-                'pressure', 'head', 'demand',
-                # Moving averages (4)
-                'pressure_ma3', 'pressure_ma5', 'head_ma3', 'head_ma5',
-                # Temporal changes (4)
-                'pressure_change', 'head_change', 'pressure_drop', 'head_drop',
-                # Network-level spatial (5)
-                'network_pressure_mean', 'network_pressure_std', 'network_demand_mean',
-                'pressure_deviation', 'demand_deviation',
-                # Statistical rolling (7)
-                'pressure_std_5', 'head_std_5', 'demand_std_5',
-                'pressure_min_5', 'pressure_max_5', 'head_min_5', 'head_max_5',
-                # Acceleration (2)
-                'pressure_acceleration', 'head_acceleration',
-                # Percentage change (3)
-                'pressure_change_pct', 'head_change_pct', 'demand_change_pct',
-                # Ratio (2)
-                'pressure_demand_ratio', 'head_demand_ratio'
-            ]
-            
-            # Extended feature list (39 features) - for server model with topology features
-            extended_feature_list = base_feature_list + [
-                # Topology-based spatial (9) - Only for 39-feature model
-                'neighbors_pressure_mean', 'neighbors_pressure_std', 'neighbors_head_mean',
-                'neighbors_demand_mean', 'pressure_gradient', 'head_gradient',
-                'node_degree', 'node_betweenness', 'node_elevation'
-            ]
-            
-            # Select feature list based on model requirements
-            if expected_feature_count == 39:
-                full_feature_list = extended_feature_list
-                logger.info("Using 39-feature list (with topology features)")
+            run_key = run_key if run_key is not None else arrays.digest()
+            scored = self.scored_runs.get(run_key, bundle)
+            cached = scored is not None
+            if cached:
+                logger.info(f"[OK] Using cached probabilities for run {run_key} ({scored.total_records} records)")
             else:
-                full_feature_list = base_feature_list
-                logger.info(f"Using {len(base_feature_list)}-feature list (local model)")
-            
-            # Check which features are available
-            available_features = [f for f in full_feature_list if f in df_fe.columns]
-            missing_features = [f for f in full_feature_list if f not in df_fe.columns]
-            
-            # Log feature status
-            logger.info(f"Feature preparation: {len(available_features)}/{len(full_feature_list)} features available")
-            if missing_features:
-                logger.warning(f"Missing {len(missing_features)} features: {missing_features}")
-                # Try to add missing features with default values
-                for feat in missing_features:
-                    if 'neighbors_pressure_mean' in feat:
-                        df_fe[feat] = df_fe['pressure'].astype('float32') if 'pressure' in df_fe.columns else 0.0
-                    elif 'neighbors_head_mean' in feat:
-                        df_fe[feat] = df_fe['head'].astype('float32') if 'head' in df_fe.columns else 0.0
-                    elif 'neighbors_demand_mean' in feat:
-                        df_fe[feat] = df_fe['demand'].astype('float32') if 'demand' in df_fe.columns else 0.0
-                    elif feat in ['neighbors_pressure_std', 'pressure_gradient', 'head_gradient', 'node_betweenness', 'node_elevation']:
-                        df_fe[feat] = 0.0
-                    elif feat == 'node_degree':
-                        df_fe[feat] = 0
-                    else:
-                        logger.error(f"Cannot create default for missing feature: {feat}")
-                        # Set to 0 as last resort
-                        df_fe[feat] = 0.0
-                
-                # Re-check after adding defaults
-                available_features = [f for f in full_feature_list if f in df_fe.columns]
-                missing_features = [f for f in full_feature_list if f not in df_fe.columns]
-                logger.info(f"After adding defaults: {len(available_features)}/{len(full_feature_list)} features available")
-            
-            # Ensure we have exactly the number of features the model expects
-            if hasattr(self.model, 'feature_names_') and self.model.feature_names_:
-                expected_count = len(self.model.feature_names_)
-                
-                # Use metadata feature_cols if available and matches expected count
-                if self.feature_cols and len(self.feature_cols) == expected_count:
-                    logger.info(f"Using metadata feature_cols ({len(self.feature_cols)} features)")
-                    feature_list_to_use = [f for f in self.feature_cols if f in df_fe.columns]
-                    missing_from_metadata = [f for f in self.feature_cols if f not in df_fe.columns]
-                    
-                    if missing_from_metadata:
-                        logger.warning(f"Missing {len(missing_from_metadata)} features from metadata: {missing_from_metadata[:3]}...")
-                        # Create missing features with defaults
-                        for feat in missing_from_metadata:
-                            if feat not in df_fe.columns:
-                                df_fe[feat] = 0.0
-                        feature_list_to_use = self.feature_cols
-                    
-                    if len(feature_list_to_use) == expected_count:
-                        X = df_fe[feature_list_to_use].values
-                        logger.info(f"Using {len(feature_list_to_use)} features from metadata")
-                    else:
-                        # Fallback to full_feature_list
-                        if len(full_feature_list) == expected_count:
-                            logger.info(f"Falling back to full_feature_list ({len(full_feature_list)} features)")
-                            # Ensure all features exist
-                            for feat in full_feature_list:
-                                if feat not in df_fe.columns:
-                                    df_fe[feat] = 0.0
-                            X = df_fe[full_feature_list].values
-                        else:
-                            raise ValueError(f"Feature count mismatch: Expected {expected_count}, got {len(feature_list_to_use)}")
-                else:
-                    # Use full_feature_list (should match expected_count)
-                    if len(full_feature_list) != expected_count:
-                        logger.error(f"Feature list length ({len(full_feature_list)}) doesn't match model ({expected_count})")
-                        raise ValueError(f"Feature list mismatch: {len(full_feature_list)} != {expected_count}")
-                    
-                    # Ensure all features exist
-                    for feat in full_feature_list:
-                        if feat not in df_fe.columns:
-                            logger.warning(f"Creating missing feature: {feat}")
-                            df_fe[feat] = 0.0
-                    
-                    X = df_fe[full_feature_list].values
-                    logger.info(f"Using {len(full_feature_list)} features from full_feature_list")
-            else:
-                # Model doesn't have feature_names_, use metadata or full_feature_list
-                if self.feature_cols:
-                    X = df_fe[self.feature_cols].values
-                    logger.info(f"Using {len(self.feature_cols)} features from metadata (no model feature_names_)")
-                else:
-                    X = df_fe[full_feature_list].values
-                    logger.info(f"Using {len(full_feature_list)} features from full_feature_list (no model feature_names_)")
-            
-            # Scale features (if scaler exists)
-            if self.scaler is not None:
-                try:
-                    X_scaled = self.scaler.transform(X)
-                except Exception as e:
-                    logger.warning(f"Scaling failed: {e}, using unscaled features")
-                    X_scaled = X
-            else:
-                X_scaled = X
-            
-            # Predict
-            use_threshold = threshold if threshold is not None else self.threshold
-            proba = self.model.predict_proba(X_scaled)[:, 1]
-            
-            # Log probability statistics for debugging
-            logger.info(f"Probability stats - Min: {proba.min():.3f}, Max: {proba.max():.3f}, Mean: {proba.mean():.3f}, Threshold: {use_threshold:.3f}")
-            logger.info(f"Nodes with prob >= {use_threshold:.3f}: {(proba >= use_threshold).sum()} / {len(proba)}")
-            
-            # Log top probabilities for debugging
-            top_probs = np.sort(proba)[::-1][:10]  # Top 10
-            logger.info(f"Top 10 probabilities: {top_probs}")
-            
-            # Log feature statistics if probability is very low
-            if proba.max() < 0.2:
-                logger.warning(f"Very low probabilities detected (max: {proba.max():.3f}). Possible reasons:")
-                logger.warning("  1. Simulation data is normal (no leaks) - this is expected")
-                logger.warning("  2. Features may not match training data format")
-                logger.warning("  3. Model may need retraining with real-world data")
+                scored = self.score_arrays(bundle, arrays)
+                self.scored_runs.put(run_key, scored)
             
-            predictions = (proba >= use_threshold).astype(int)
-            
-            # Add predictions to dataframe
-            df_fe['leak_probability'] = proba
-            df_fe['predicted_leak'] = predictions
-            
-            # Get detected leaks
-            leaks_df = df_fe[df_fe['predicted_leak'] == 1].copy()
-            
-            # Filter out excluded nodes (reservoirs, tanks, pumps)
-            if len(self.excluded_nodes) > 0:
-                initial_count = len(leaks_df)
-                leaks_df = leaks_df[~leaks_df['node_id'].astype(str).isin(self.excluded_nodes)]
-                filtered_count = initial_count - len(leaks_df)
-                if filtered_count > 0:
-                    logger.info(f"[OK] Filtered out {filtered_count} leaks from excluded nodes (reservoirs/tanks/pumps)")
-            
-            # Filter out supply nodes (demand < 0) - these are pump stations or supply points
-            initial_count = len(leaks_df)
-            leaks_df = leaks_df[leaks_df['demand'] >= 0]
-            filtered_supply = initial_count - len(leaks_df)
-            if filtered_supply > 0:
-                logger.info(f"[OK] Filtered out {filtered_supply} leaks from supply nodes (demand < 0)")
-            
-            # Filter out very low probability leaks (likely false positives)
-            # Minimum probability threshold: 5% for meaningful leaks
-            min_probability_threshold = 0.05
-            initial_count = len(leaks_df)
-            leaks_df = leaks_df[leaks_df['leak_probability'] >= min_probability_threshold]
-            filtered_low_prob = initial_count - len(leaks_df)
-            if filtered_low_prob > 0:
-                logger.info(f"[OK] Filtered out {filtered_low_prob} leaks with probability < {min_probability_threshold*100:.0f}% (likely false positives)")
-            
-            # Additional filter: Remove nodes with very low demand (< 0.001 m³/s = 1 L/s)
-            # These are likely measurement noise or inactive nodes
-            initial_count = len(leaks_df)
-            leaks_df = leaks_df[leaks_df['demand'] >= 0.001]
-            filtered_low_demand = initial_count - len(leaks_df)
-            if filtered_low_demand > 0:
-                logger.info(f"[OK] Filtered out {filtered_low_demand} leaks with demand < 0.001 m³/s (likely noise)")
-            
-            # Format results
-            leaks = []
-            for _, row in leaks_df.iterrows():
-                # Calculate flow: positive for demand nodes (consumption)
-                # Flow = demand (already in m³/s, positive for consumption)
-                demand_m3s = float(row['demand'])
-                flow_lps = demand_m3s * 1000  # Convert to L/s, keep positive
-                
-                leaks.append({
-                    "node_id": str(row['node_id']),
-                    "timestamp": float(row['timestamp']),
-                    "probability": float(row['leak_probability']),
-                    "pressure": float(row['pressure']),
-                    "head": float(row['head']),
-                    "demand": demand_m3s,
-                    "flow": flow_lps  # Add flow field (positive for consumption)
-                })
-            
-            # Remove duplicate nodes: keep only the leak with highest probability for each node
-            # This prevents showing the same node multiple times at different timestamps
-            unique_leaks = {}
-            for leak in leaks:
-                node_id = leak['node_id']
-                if node_id not in unique_leaks or leak['probability'] > unique_leaks[node_id]['probability']:
-                    unique_leaks[node_id] = leak
-            
-            # Convert back to list and sort by probability (highest first)
-            leaks = list(unique_leaks.values())
-            leaks.sort(key=lambda x: x['probability'], reverse=True)
-            
-            # Log duplicate removal
-            if len(leaks_df) > len(leaks):
-                logger.info(f"[OK] Removed {len(leaks_df) - len(leaks)} duplicate node entries (kept highest probability for each node)")
-            
-            # Summary
-            # Calculate unique nodes count (for detection rate calculation)
-            unique_nodes_count = df_fe['node_id'].nunique() if 'node_id' in df_fe.columns else len(df_fe)
-            
-            summary = {
-                "total_records": len(df_fe),  # Total node-timestamp pairs
-                "total_unique_nodes": unique_nodes_count,  # Total unique nodes
-                "detected_leaks": len(leaks),  # Number of unique nodes with leaks
-                "detection_rate": len(leaks) / unique_nodes_count if unique_nodes_count > 0 else 0,  # Leaks / Unique nodes
-                "records_with_leaks": len(leaks_df),  # Total records (node-timestamp) with leaks (before deduplication)
-                "threshold_used": use_threshold,
-                "avg_probability": float(proba.mean()) if len(proba) > 0 else 0,
-                "max_probability": float(proba.max()) if len(proba) > 0 else 0
-            }
-            
-            return {
-                "success": True,
-                "leaks": leaks,
-                "summary": summary
-            }
+            result = self.query_run(scored, threshold, top_k, window)
+            result["run_key"] = run_key
+            result["cached"] = cached
+            return result
             
         except Exception as e:
             logger.error(f"Error detecting leaks: {str(e)}")
@@ -728,10 +447,262 @@ class LeakDetectionService:
                 "summary": {}
             }
     
+    def score_arrays(self, bundle: ModelBundle, arrays: NodeArrays) -> ScoredRun:
+        """Feature engineering + predict_proba cho mọi dòng (node x thời gian) của arrays"""
+        df = arrays.to_frame()
+        
+        # Prepare features
+        df_fe = self.prepare_features(df, bundle.feature_cols)
+        
+        # feature_cols da duoc doi chieu voi feature pipeline luc load model (load_bundle)
+        X = select_features(df_fe, bundle.feature_cols)
+        logger.info(f"Using {len(bundle.feature_cols)} features (feature pipeline v{FEATURE_VERSION})")
+        
+        proba = self.predict_proba(bundle, X)
+        
+        # Log probability statistics for debugging
+        logger.info(f"Probability stats - Min: {proba.min():.3f}, Max: {proba.max():.3f}, Mean: {proba.mean():.3f}")
+        
+        # Log top probabilities for debugging
+        top_probs = np.sort(proba)[::-1][:10]  # Top 10
+        logger.info(f"Top 10 probabilities: {top_probs}")
+        
+        # Log feature statistics if probability is very low
+        if proba.max() < 0.2:
+            logger.warning(f"Very low probabilities detected (max: {proba.max():.3f}). Possible reasons:")
+            logger.warning("  1. Simulation data is normal (no leaks) - this is expected")
+            logger.warning("  2. Features may not match training data format")
+            logger.warning("  3. Model may need retraining with real-world data")
+        
+        # Add predictions to dataframe
+        df_fe['leak_probability'] = proba
+        return ScoredRun(df_fe, bundle)
+    
+    def query_run(
+        self,
+        scored: ScoredRun,
+        threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+        window: Optional[float] = None,
+        min_probability: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Leaks + summary của một run đã chấm điểm - chỉ lọc và xếp hạng, không gọi model
+        
+        Args:
+            threshold: Optional threshold override (default: threshold của model đã chấm điểm)
+            min_probability: xác suất tối thiểu (default: MIN_LEAK_PROBABILITY)
+        """
+        bundle = scored.bundle
+        use_threshold = threshold if threshold is not None else bundle.threshold
+        use_min_probability = min_probability if min_probability is not None else MIN_LEAK_PROBABILITY
+        proba = scored.probability
+        logger.info(f"Nodes with prob >= {use_threshold:.3f}: {(proba >= use_threshold).sum()} / {len(proba)}")
+        
+        ranking, records_with_leaks = self._collect_leaks(
+            scored.frame, bundle.reservoir_nodes, use_threshold, top_k, window, use_min_probability
+        )
+        leaks = ranking.to_leaks()
+        
+        # Summary
+        # Calculate unique nodes count (for detection rate calculation)
+        unique_nodes_count = scored.unique_nodes
+        
+        summary = {
+            "total_records": scored.total_records,  # Total node-timestamp pairs
+            "total_unique_nodes": unique_nodes_count,  # Total unique nodes
+            "detected_leaks": ranking.n_nodes,  # Number of unique nodes with leaks
+            "detection_rate": ranking.n_nodes / unique_nodes_count if unique_nodes_count > 0 else 0,  # Leaks / Unique nodes
+            "records_with_leaks": records_with_leaks,  # Total records (node-timestamp) with leaks (before deduplication)
+            "threshold_used": use_threshold,
+            "avg_probability": float(proba.mean()) if len(proba) > 0 else 0,
+            "max_probability": float(proba.max()) if len(proba) > 0 else 0
+        }
+        if min_probability is not None:
+            summary["min_probability"] = use_min_probability
+        if top_k is not None:
+            summary["top_k"] = top_k
+        if window is not None:
+            summary["window_seconds"] = window
+            summary["leak_windows"] = ranking.n_groups  # node x window groups (before top_k)
+        
+        return {
+            "success": True,
+            "leaks": leaks,
+            "summary": summary
+        }
+    
+    def query_cached_run(
+        self,
+        run_key: str,
+        threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+        window: Optional[float] = None,
+        min_probability: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """query_run trên run trong cache; None nếu run không còn trong cache (hoặc model đã reload)"""
+        bundle = self.models.peek()
+        scored = self.scored_runs.get(run_key, bundle) if bundle is not None else None
+        if scored is None:
+            return None
+        result = self.query_run(scored, threshold, top_k, window, min_probability)
+        result["run_key"] = run_key
+        result["cached"] = True
+        return result
+    
+    def detect_leaks_batch(
+        self,
+        runs: Dict[str, RunSource],
+        threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+        window: Optional[float] = None,
+        max_rows: Optional[int] = None,
+        workers: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Detect leaks cho nhiều run một lần (vd báo cáo tuần từ các simulation đã lưu)
+        
+        Run chưa có trong cache xác suất được gom thành nhóm <= max_rows dòng: feature của
+        các run trong nhóm tính song song (mỗi run riêng - rolling features theo node không
+        lẫn giữa các run), nối thành một ma trận và predict một lần (model NumPy: chia cho các
+        thread). Kết quả xếp hạng riêng cho từng run (query_run).
+        
+        Args:
+            runs: run_key -> NodeArrays, hoặc hàm không tham số trả về NodeArrays (chỉ gọi khi
+                  run không có trong cache, vd đọc simulation từ database). Khóa cache xác suất:
+                  run_key cho hàm (run_id đã lưu), hash nội dung (NodeArrays.digest) cho NodeArrays
+                  - tên do client đặt không bao giờ dùng làm khóa cache
+            max_rows: số dòng tối đa mỗi lần predict (default: settings.leak_batch_max_rows)
+            workers: số thread (default: settings.leak_batch_workers, 0 = số CPU)
+        """
+        bundle = self.models.get()
+        if bundle is None:
+            return {"success": False, "error": "Model not loaded", "runs": {}, "summary": {}}
+        
+        started = time.perf_counter()
+        max_rows = max_rows or settings.leak_batch_max_rows
+        workers = workers or settings.leak_batch_workers or os.cpu_count() or 1
+        
+        # Run doc tu database: khoa = run_key (run_id, dung chung voi simulate-and-detect);
+        # du lieu gui kem: khoa = hash noi dung (cung ten khac du lieu khong lay nham cache)
+        cache_keys = {run_key: run_key if callable(source) else source.digest() for run_key, source in runs.items()}
+        scored: Dict[str, ScoredRun] = {}
+        errors: Dict[str, str] = {}
+        pending: List[str] = []
+        for run_key in runs:
+            cached = self.scored_runs.get(cache_keys[run_key], bundle)
+            if cached is not None:
+                scored[run_key] = cached
+            else:
+                pending.append(run_key)
+        cached_runs = len(scored)
+        
+        try:
+            scored_records = 0
+            model_passes = 0
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                loaded = []
+                for run_key, (arrays, error) in zip(pending, pool.map(lambda k: _resolve_run(runs[k]), pending)):
+                    if error is not None:
+                        errors[run_key] = error
+                    else:
+                        loaded.append((run_key, arrays))
+                
+                # Nhom run lien tiep toi da max_rows dong (run lon hon max_rows -> nhom rieng)
+                groups: List[List[Tuple[str, NodeArrays]]] = []
+                group_rows = 0
+                for item in loaded:
+                    if not groups or group_rows + len(item[1]) > max_rows:
+                        groups.append([])
+                        group_rows = 0
+                    groups[-1].append(item)
+                    group_rows += len(item[1])
+                
+                for group in groups:
+                    frames = list(pool.map(lambda item: self._features_or_error(item[1], bundle.feature_cols), group))
+                    ready = []
+                    for (run_key, _), (df_fe, error) in zip(group, frames):
+                        if error is not None:
+                            errors[run_key] = error
+                        else:
+                            ready.append((run_key, df_fe))
+                    if not ready:
+                        continue
+                    X = np.concatenate([select_features(df_fe, bundle.feature_cols) for _, df_fe in ready])
+                    proba = self._predict_rows(bundle, X, max_rows, pool, workers)
+                    offset = 0
+                    for run_key, df_fe in ready:
+                        df_fe['leak_probability'] = proba[offset:offset + len(df_fe)]
+                        offset += len(df_fe)
+                        scored[run_key] = ScoredRun(df_fe, bundle)
+                        self.scored_runs.put(cache_keys[run_key], scored[run_key])
+                    scored_records += len(X)
+                    model_passes += 1
+                    logger.info(f"[OK] Batch scored {len(ready)} runs ({len(X)} records) in one model pass")
+        except Exception as e:
+            logger.error(f"Error in batch leak detection: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return {"success": False, "error": str(e), "runs": {}, "summary": {}}
+        
+        results = {}
+        for run_key in runs:
+            if run_key in scored:
+                results[run_key] = self.query_run(scored[run_key], threshold, top_k, window)
+                results[run_key]["run_key"] = cache_keys[run_key]
+            else:
+                results[run_key] = {"success": False, "error": errors.get(run_key), "leaks": [], "summary": {}}
+        
+        elapsed = time.perf_counter() - started
+        total_records = sum(run.total_records for run in scored.values())
+        return {
+            "success": True,
+            "runs": results,
+            "summary": {
+                "runs": len(runs),
+                "failed_runs": len(errors),
+                "cached_runs": cached_runs,
+                "total_records": total_records,
+                "scored_records": scored_records,
+                "model_passes": model_passes,
+                "workers": workers,
+                "elapsed_ms": round(elapsed * 1000, 1),
+                "records_per_second": round(total_records / elapsed) if elapsed > 0 else None,
+            }
+        }
+    
+    def _features_or_error(self, arrays: NodeArrays,
+                           feature_cols: Sequence[str]) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+        """prepare_features cho một run trong batch; lỗi -> (None, message) thay vì hủy cả batch"""
+        try:
+            return self.prepare_features(arrays.to_frame(), feature_cols), None
+        except Exception as e:
+            logger.error(f"Error preparing features for batch run: {str(e)}")
+            return None, str(e)
+    
+    def _predict_rows(self, bundle: ModelBundle, X: np.ndarray, max_rows: int,
+                      pool: ThreadPoolExecutor, workers: int) -> np.ndarray:
+        """
+        predict_proba cho ma tran lon, toi da max_rows dong moi lan goi (khong qua batcher - da
+        la mot batch). CatBoost tu dung moi core trong mot lan goi; model NumPy (mot thread)
+        -> chia doan cho cac thread cua pool.
+        """
+        if len(X) == 0:
+            return np.zeros(0)
+        X = self._scale_features(bundle, X)
+        chunk = max_rows
+        if isinstance(bundle.model, ObliviousTreeModel):
+            chunk = min(max_rows, -(-len(X) // workers))
+        bounds = range(0, len(X), chunk)
+        parts = pool.map(lambda start: positive_proba(bundle.model, X[start:start + chunk]), bounds)
+        return np.concatenate(list(parts))
+    
     def detect_leaks_from_simulation_result(
         self, 
         simulation_result: Dict[str, Any],
-        threshold: Optional[float] = None
+        threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+        window: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         Detect leaks từ SimulationResult object
@@ -739,6 +710,7 @@ class LeakDetectionService:
         Args:
             simulation_result: SimulationResult dict từ EPANET service
             threshold: Optional threshold override
+            top_k, window: xem detect_leaks
         
         Returns:
             Dict với detected leaks
@@ -751,31 +723,9 @@ class LeakDetectionService:
             }
         
         try:
-            nodes_results = simulation_result.get('nodes_results', {})
-            
-            # Convert to format expected by detect_leaks
-            nodes_data = {}
-            for node_id, node_data in nodes_results.items():
-                if isinstance(node_data, list):
-                    nodes_data[node_id] = node_data
-                elif isinstance(node_data, dict):
-                    # Convert dict to list of records
-                    records = []
-                    timestamps = node_data.get('timestamps', [])
-                    pressures = node_data.get('pressures', [])
-                    heads = node_data.get('heads', [])
-                    demands = node_data.get('demands', [])
-                    
-                    for i in range(len(timestamps)):
-                        records.append({
-                            'timestamp': timestamps[i],
-                            'pressure': pressures[i] if i < len(pressures) else 0,
-                            'head': heads[i] if i < len(heads) else 0,
-                            'demand': demands[i] if i < len(demands) else 0
-                        })
-                    nodes_data[node_id] = records
-            
-            return self.detect_leaks(nodes_data, threshold)
+            # Dang list of records hoac dang cot {timestamps, pressures, ...} -> NodeArrays truc tiep
+            arrays = NodeArrays.from_nodes_results(simulation_result.get('nodes_results', {}))
+            return self.detect_leaks_from_arrays(arrays, threshold, top_k, window)
             
         except Exception as e:
             logger.error(f"Error detecting leaks from simulation result: {str(e)}")
@@ -785,6 +735,151 @@ class LeakDetectionService:
                 "leaks": []
             }
 
+    def node_residuals(self, arrays: NodeArrays) -> pd.Series:
+        """pressure_residual trung binh theo node của một run (so với baseline không rò rỉ)"""
+        df = arrays.to_frame()
+        residual = self.baseline.residuals(df)['pressure_residual']
+        return pd.Series(residual, index=df.index).groupby(df['node_id'].astype(str)).mean()
+    
+    def localize_leak(
+        self,
+        source: Union[NodeArrays, Dict[str, float]],
+        top_k: int = 10
+    ) -> Dict[str, Any]:
+        """
+        Định vị rò rỉ bằng từ điển chữ ký (vật lý, không cần model)
+        
+        Args:
+            source: NodeArrays của một run (residual tính từ baseline không rò rỉ)
+                    hoặc residual áp lực đã có theo node (node_id -> m)
+            top_k: Số junction ứng viên trả về
+        
+        Returns:
+            Dict với candidates (junction xếp hạng theo độ giống chữ ký rò rỉ)
+        
+        Raises:
+            SignaturesNotBuiltError: Từ điển chữ ký chưa được tạo (không mô phỏng trong request)
+            BaselineNotWarmedError: Baseline không rò rỉ chưa được giải trước (warmup)
+            ValueError: Residual không dùng được (ít hơn 2 junction, hằng số, dữ liệu run hỏng)
+        """
+        table = self.signatures.cached()
+        if table is None:
+            raise SignaturesNotBuiltError(
+                "Leak signatures not built yet - wait for warmup or run scripts/build_leak_signatures.py"
+            )
+        if isinstance(source, NodeArrays) and len(source) == 0:
+            raise ValueError("No data provided")
+        try:
+            start = time.perf_counter()
+            residuals = self.node_residuals(source) if isinstance(source, NodeArrays) else source
+            residual_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            result = self.signatures.localize(residuals, top_k, table)
+            return {
+                "success": True,
+                "candidates": result["candidates"],
+                "summary": {
+                    "sensors": result["sensors"],
+                    "junctions": len(table),
+                    "residual_ms": round(residual_ms, 2),
+                    "localization_ms": round((time.perf_counter() - start) * 1000, 3),
+                }
+            }
+        except (ValueError, BaselineNotWarmedError):
+            raise
+        except Exception as e:
+            logger.error(f"Error localizing leak: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "candidates": []
+            }
+
+    def confirm_leaks(
+        self,
+        arrays: NodeArrays,
+        candidates: Optional[List[str]] = None,
+        top_k: int = 10,
+        threshold: Optional[float] = None,
+        window_start: Optional[float] = None,
+        window_end: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Xác nhận ứng viên rò rỉ bằng mô phỏng lại: fit diện tích rò rỉ tại từng ứng viên
+        (song song, services/leak_confirmation.py) và xếp hạng theo sai số với áp lực quan sát
+        
+        Args:
+            arrays: NodeArrays của run (áp lực quan sát)
+            candidates: Node ứng viên; None -> top_k leaks do model phát hiện trên arrays
+            top_k: Số ứng viên lấy từ model
+            threshold: Optional threshold override khi lấy ứng viên từ model
+            window_start, window_end: Cửa sổ thời gian (giây); None -> khoảng model đánh dấu
+                                      (first_flagged..last_flagged của các ứng viên), hoặc cả run
+        
+        Returns:
+            Dict với candidates xếp hạng theo RMSE (fitted_area_m2, rmse, no_leak_rmse, improvement)
+        
+        Raises:
+            ValueError: Dữ liệu quan sát không dùng được (không có dữ liệu trong cửa sổ, cột thiếu)
+        """
+        try:
+            probabilities = {}
+            if candidates is None:
+                detection = self.detect_leaks_from_arrays(arrays, threshold, top_k)
+                if not detection.get("success"):
+                    return {"success": False, "error": detection.get("error"), "candidates": []}
+                leaks = detection["leaks"]
+                candidates = [leak["node_id"] for leak in leaks]
+                probabilities = {leak["node_id"]: leak["probability"] for leak in leaks}
+                if leaks and window_start is None:
+                    window_start = min(leak["first_flagged"] for leak in leaks)
+                if leaks and window_end is None:
+                    window_end = max(leak["last_flagged"] for leak in leaks)
+            if not candidates:
+                return {"success": True, "candidates": [], "failed": [], "window": None,
+                        "summary": {"candidates": 0, "message": "No leak candidates"}}
+            
+            df = arrays.to_frame()
+            timestamps = pd.to_numeric(df['timestamp'], errors='coerce').to_numpy(dtype=np.float64)
+            in_window = np.isfinite(timestamps)
+            if window_start is not None:
+                in_window &= timestamps >= window_start
+            if window_end is not None:
+                in_window &= timestamps <= window_end
+            if not in_window.any():
+                raise ValueError("No data in the flagged time window")
+            window = df[in_window]
+            means = window.groupby(window['node_id'].astype(str))[['pressure', 'head']].mean()
+            
+            result = self.confirmer.confirm(candidates, means['pressure'].to_dict(), means['head'].to_dict())
+            for fit in result["candidates"]:
+                if fit["node_id"] in probabilities:
+                    fit["probability"] = probabilities[fit["node_id"]]
+            return {
+                "success": True,
+                "candidates": result["candidates"],
+                "failed": result["failed"],
+                "window": {
+                    "start": float(timestamps[in_window].min()),
+                    "end": float(timestamps[in_window].max()),
+                    "steps": int(window['timestamp'].nunique()),
+                },
+                "summary": {
+                    "candidates": len(candidates),
+                    "workers": result["workers"],
+                    "elapsed_ms": result["elapsed_ms"],
+                }
+            }
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error confirming leaks: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "candidates": []
+            }
+
 # Global instance
-leak_detection_service = LeakDetectionService()
+leak_detection_service = LeakDetectionService(Path(settings.leak_model_dir), settings.leak_model_runtime)
 
@@ -0,0 +1,132 @@
+"""
+Gop va xep hang ung vien ro ri theo node bang phep reduce tren mang
+
+Truoc day _collect_leaks chuyen tung dong ro ri thanh dict (iterrows) roi vong lap Python
+giu dong co xac suat cao nhat cho moi node. rank_leak_candidates lam cung viec tren mang:
+    - nhom theo node (hoac node x cua so thoi gian), thu tu nhom = thu tu xuat hien dau tien;
+    - lexsort on dinh (nhom, -xac suat) -> dong dau moi nhom = dong co xac suat cao nhat
+      (bang nhau: dong xuat hien truoc, nhu vong lap cu);
+    - reduceat: xac suat trung binh, so buoc bi danh dau, thoi diem dau/cuoi;
+    - top_k: argpartition roi chi sap xep k nhom (giu thu tu bang nhau nhu sort on dinh).
+Khong co top_k / window -> cung danh sach (va thu tu) leaks nhu cach cu.
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class LeakRanking:
+    """
+    Ung vien ro ri da gop, sap xep theo xac suat giam dan.
+
+    columns: node_id, timestamp (thoi diem xac suat cao nhat), probability (max),
+    mean_probability, flagged_steps, first_flagged, last_flagged, pressure / head / demand
+    (tai dong xac suat cao nhat), window_start (chi khi gop theo cua so).
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], n_nodes: int, n_groups: int, window: Optional[float] = None):
+        self.columns = columns
+        self.n_nodes = n_nodes  # so node khac nhau co ro ri (truoc top_k)
+        self.n_groups = n_groups  # so nhom node (x cua so) truoc top_k
+        self.window = window
+
+    def __len__(self) -> int:
+        return len(self.columns['node_id'])
+
+    def to_leaks(self) -> List[Dict[str, Any]]:
+        """Danh sach leak cho API (cac truong cu + thong tin gop)"""
+        c = self.columns
+        leaks = []
+        for i in range(len(self)):
+            demand_m3s = float(c['demand'][i])
+            leak = {
+                "node_id": str(c['node_id'][i]),
+                "timestamp": float(c['timestamp'][i]),
+                "probability": float(c['probability'][i]),
+                "pressure": float(c['pressure'][i]),
+                "head": float(c['head'][i]),
+                "demand": demand_m3s,
+                "flow": demand_m3s * 1000,  # L/s, positive for consumption
+                "mean_probability": float(c['mean_probability'][i]),
+                "flagged_steps": int(c['flagged_steps'][i]),
+                "first_flagged": float(c['first_flagged'][i]),
+                "last_flagged": float(c['last_flagged'][i]),
+            }
+            if self.window is not None:
+                leak["window_start"] = float(c['window_start'][i])
+            leaks.append(leak)
+        return leaks
+
+
+def top_k_order(score: np.ndarray, k: Optional[int]) -> np.ndarray:
+    """
+    Chi so theo score giam dan (bang nhau: chi so nho truoc), chi lay k phan tu dau.
+    k < len: argpartition chon nguong roi chi sap xep cac phan tu >= nguong.
+    """
+    n = len(score)
+    if k is None or k >= n:
+        candidates = np.arange(n)
+    elif k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    else:
+        kth = np.partition(score, n - k)[n - k]
+        candidates = np.flatnonzero(score >= kth)
+    order = candidates[np.lexsort((candidates, -score[candidates]))]
+    return order[:k] if k is not None else order
+
+
+def rank_leak_candidates(
+    node_id: Any,
+    timestamp: Any,
+    probability: Any,
+    values: Dict[str, Any],
+    top_k: Optional[int] = None,
+    window: Optional[float] = None
+) -> LeakRanking:
+    """
+    Gop cac dong ro ri (da loc) theo node, hoac theo node x cua so thoi gian neu co window
+    (cung don vi voi timestamp, vd 3600 = theo gio; cua so bat dau tai boi so cua window).
+
+    Args:
+        node_id, timestamp, probability: mot phan tu cho moi dong ro ri
+        values: cot lay tai dong xac suat cao nhat cua moi nhom (pressure, head, demand)
+        top_k: chi giu k nhom xac suat cao nhat
+    """
+    node_id = np.asarray(node_id, dtype=object)
+    timestamp = np.asarray(timestamp, dtype=np.float64)
+    probability = np.asarray(probability, dtype=np.float64)
+
+    node_codes, node_uniques = pd.factorize(node_id)
+    if window is not None:
+        window_index = np.floor(timestamp / window)
+        groups, _ = pd.factorize(pd.MultiIndex.from_arrays([node_codes, window_index]))
+    else:
+        groups = node_codes
+    n_groups = int(groups.max()) + 1 if len(groups) else 0
+
+    # Dong dau moi nhom sau lexsort = xac suat cao nhat (lexsort on dinh -> dong xuat hien truoc)
+    order = np.lexsort((-probability, groups))
+    starts = np.flatnonzero(np.r_[True, groups[order][1:] != groups[order][:-1]]) if len(order) else order
+    best = order[starts]
+    counts = np.diff(np.r_[starts, len(order)])
+    sorted_ts = timestamp[order]
+
+    aggregated = {
+        'node_id': node_id[best],
+        'timestamp': timestamp[best],
+        'probability': probability[best],
+        'mean_probability': np.add.reduceat(probability[order], starts) / counts if n_groups else np.zeros(0),
+        'flagged_steps': counts,
+        'first_flagged': np.minimum.reduceat(sorted_ts, starts) if n_groups else np.zeros(0),
+        'last_flagged': np.maximum.reduceat(sorted_ts, starts) if n_groups else np.zeros(0),
+    }
+    for name, column in values.items():
+        aggregated[name] = np.asarray(column)[best]
+    if window is not None:
+        aggregated['window_start'] = np.floor(timestamp[best] / window) * window
+
+    # Thu tu nhom sau lexsort = ma nhom (thu tu xuat hien); xep theo xac suat, bang nhau giu ma nhom
+    ranked = top_k_order(aggregated['probability'], top_k)
+    return LeakRanking({name: column[ranked] for name, column in aggregated.items()},
+                       len(node_uniques), n_groups, window)
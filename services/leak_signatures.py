@@ -0,0 +1,338 @@
+"""
+Tu dien chu ky ro ri: dinh vi ro ri bang vat ly, song song voi ML model
+
+Voi moi junction ung vien, mo phong steady-state mot ro ri chuan (``Junction.add_leak`` nhu
+scripts/leak_simulation/simulation.py, dien tich ``area`` m2, head reservoir ``reservoir_head``,
+demand co dinh theo .inp) va ghi do thay doi ap luc tai moi node do (sensor = moi junction):
+    delta[j, s] = pressure_co_ro_ri_tai_j(s) - pressure_khong_ro_ri(s)
+Ma tran [junction x sensor] (float32) duoc chuan hoa tung dong (tru trung binh, chia norm) va
+luu <cache_dir>/<inp_hash>_<params>.npz; doi noi dung .inp hoac tham so -> tao lai.
+
+Dinh vi: residual ap luc quan sat (vd pressure_residual trung binh theo node, xem
+services/baseline_cache.py) chuan hoa cung cach -> similarity = mot phep nhan ma tran-vector
+(tuong quan Pearson voi tung chu ky), xep hang junction. ``leak_scale`` = he so binh phuong
+toi thieu cua chu ky tho (xap xi do lon ro ri so voi ro ri chuan).
+
+Tao tu dien can mot lan mo phong moi junction (~0.15 s/junction voi epanetVip1.inp): chia
+junction thanh cac doan, chay tren process pool "spawn" (moi worker doc mang mot lan).
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.baseline_cache import Fingerprint, SteadyStateSolver, inp_hash
+from utils.logger import logger
+
+# Discharge coefficient mac dinh cua WNTR / LeakScenario
+DEFAULT_DISCHARGE_COEFF = 0.75
+# So tap sensor con giu ma tran da chuan hoa (residual chi co mot phan node)
+MAX_SENSOR_SUBSETS = 8
+
+
+class SignaturesNotBuiltError(RuntimeError):
+    """Tu dien chu ky chua co: dang tao (warmup) hoac chua chay scripts/build_leak_signatures.py"""
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Tru trung binh va chia norm tung dong (dong hang so -> 0)"""
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float64))
+    centered = matrix - matrix.mean(axis=1, keepdims=True)
+    norm = np.linalg.norm(centered, axis=1, keepdims=True)
+    return np.divide(centered, norm, out=np.zeros_like(centered), where=norm > 1e-12)
+
+
+class LeakSignatureSolver:
+    """Mo phong steady-state ro ri chuan tai tung junction (mot instance moi worker process)"""
+
+    def __init__(self, inp_file: str, reservoir_head: float, area: float,
+                 discharge_coeff: float = DEFAULT_DISCHARGE_COEFF):
+        self.solver = SteadyStateSolver(inp_file)
+        self.wn = self.solver.wn
+        self.area = float(area)
+        self.discharge_coeff = float(discharge_coeff)
+        self.wn.get_node(self.solver.reservoir).base_head = float(reservoir_head)
+        self.sensors = [str(n) for n in self.wn.junction_name_list]
+        self.baseline = self._pressures()
+
+    def _pressures(self) -> np.ndarray:
+        import wntr
+
+        # Control bat ro ri (start_time=0) chi chay khi thoi gian mo phong cua wn ve 0
+        self.wn.reset_initial_values()
+        results = wntr.sim.WNTRSimulator(self.wn).run_sim()
+        return results.node['pressure'][self.sensors].to_numpy()[0]
+
+    def __call__(self, junctions: Sequence[str]) -> np.ndarray:
+        """delta [len(junctions) x sensor]: ap luc co ro ri tai junction - ap luc khong ro ri"""
+        import wntr.network.elements
+
+        delta = np.empty((len(junctions), len(self.sensors)))
+        for i, name in enumerate(junctions):
+            junction = self.wn.get_node(name)
+            if not isinstance(junction, wntr.network.elements.Junction):
+                raise ValueError(f"Node {name} is not a junction")
+            junction.add_leak(self.wn, area=self.area, discharge_coeff=self.discharge_coeff, start_time=0)
+            try:
+                delta[i] = self._pressures() - self.baseline
+            finally:
+                junction.remove_leak(self.wn)
+        return delta
+
+
+# Solver cua worker process hien tai (tao mot lan trong _init_worker)
+_solver: Optional[LeakSignatureSolver] = None
+
+
+def _init_worker(inp_file: str, reservoir_head: float, area: float, discharge_coeff: float):
+    global _solver
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        _solver = LeakSignatureSolver(inp_file, reservoir_head, area, discharge_coeff)
+
+
+def _signature_task(junctions: List[str]) -> np.ndarray:
+    return _solver(junctions)
+
+
+class SignatureTable:
+    """Chu ky ro ri cua mot file .inp + bo tham so (khong doi sau khi tao)"""
+
+    def __init__(self, key: str, params: Dict[str, Any], junctions: Sequence[str], sensors: Sequence[str],
+                 delta: np.ndarray, normalized: Optional[np.ndarray] = None):
+        self.key = key
+        self.params = params
+        self.junctions = [str(j) for j in junctions]
+        self.sensors = [str(s) for s in sensors]
+        self.sensor_index = pd.Index(self.sensors)
+        self.delta = np.asarray(delta, dtype=np.float32)
+        self.normalized = (np.asarray(normalized, dtype=np.float32) if normalized is not None
+                           else normalize_rows(self.delta).astype(np.float32))
+        self._subsets: Dict[Tuple[int, ...], np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.junctions)
+
+    def normalized_for(self, columns: np.ndarray) -> np.ndarray:
+        """Ma tran chuan hoa tren tap sensor con (giu toi da MAX_SENSOR_SUBSETS tap gan nhat)"""
+        if len(columns) == len(self.sensors) and np.array_equal(columns, np.arange(len(self.sensors))):
+            return self.normalized
+        key = tuple(columns.tolist())
+        with self._lock:
+            matrix = self._subsets.get(key)
+            if matrix is None:
+                if len(self._subsets) >= MAX_SENSOR_SUBSETS:
+                    self._subsets.pop(next(iter(self._subsets)))
+                matrix = self._subsets[key] = normalize_rows(self.delta[:, columns]).astype(np.float32)
+            return matrix
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".{os.getpid()}.tmp.npz")
+        np.savez(tmp, key=self.key, params=json.dumps(self.params, sort_keys=True),
+                 junctions=np.asarray(self.junctions), sensors=np.asarray(self.sensors),
+                 delta=self.delta, normalized=self.normalized)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "SignatureTable":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(str(data['key']), json.loads(str(data['params'])), data['junctions'].tolist(),
+                       data['sensors'].tolist(), data['delta'], data['normalized'])
+
+
+class LeakSignatureDictionary:
+    """
+    Tu dien chu ky ro ri theo (hash .inp, tham so); table() tao neu chua co (warmup, script),
+    cached() chi doc (request path)
+
+    Args:
+        inp_file: File .inp cua mang (hash noi dung la khoa)
+        cache_dir: Thu muc luu tu dien (None -> chi giu trong bo nho)
+        area: Dien tich ro ri chuan (m2)
+        reservoir_head: Head reservoir khi mo phong (m)
+        discharge_coeff: He so xa cua ro ri chuan
+        junctions: Junction ung vien (None -> moi junction)
+        workers: So process khi tao tu dien (0 = so CPU, 1 = chay trong process hien tai)
+    """
+
+    def __init__(self, inp_file: str, cache_dir: Optional[str] = None, area: float = 0.0005,
+                 reservoir_head: float = 30.0, discharge_coeff: float = DEFAULT_DISCHARGE_COEFF,
+                 junctions: Optional[Sequence[str]] = None, workers: int = 0):
+        if area <= 0:
+            raise ValueError("area must be positive")
+        self.inp_file = Path(inp_file)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.params = {
+            "area": float(area),
+            "reservoir_head": float(reservoir_head),
+            "discharge_coeff": float(discharge_coeff),
+            "junctions": [str(j) for j in junctions] if junctions is not None else None,
+        }
+        self.workers = workers if workers and workers > 0 else (os.cpu_count() or 1)
+        self.builds = 0  # so lan tao tu dien bang mo phong (khong tinh doc tu file)
+        self.last_build_s: Optional[float] = None
+        self._fingerprint: Optional[Fingerprint] = None
+        self._table: Optional[SignatureTable] = None
+        self._lock = threading.Lock()
+
+    def _key(self, inp_key: str) -> str:
+        digest = hashlib.blake2b(json.dumps(self.params, sort_keys=True).encode(), digest_size=6).hexdigest()
+        return f"{inp_key}_{digest}"
+
+    def _path(self, key: str) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / f"{key}.npz"
+
+    def _stat(self) -> Fingerprint:
+        stat = self.inp_file.stat()
+        return (str(self.inp_file), stat.st_mtime_ns, stat.st_size)
+
+    def table(self) -> SignatureTable:
+        """Tu dien cua file .inp hien tai (doc file cache neu co, khong thi mo phong)"""
+        fingerprint = self._stat()
+        table = self._table
+        if table is not None and self._fingerprint == fingerprint:
+            return table
+        with self._lock:
+            if self._table is None or self._fingerprint != fingerprint:
+                key = self._key(inp_hash(str(self.inp_file)))
+                if self._table is None or self._table.key != key:
+                    table = self._load(key)
+                    if table is None:
+                        table = self._build(key)
+                        path = self._path(key)
+                        if path is not None:
+                            table.save(path)
+                    self._table = table
+                self._fingerprint = fingerprint
+            return self._table
+
+    def cached(self) -> Optional[SignatureTable]:
+        """
+        Tu dien neu da co (trong bo nho hoac file cache), khong bao gio mo phong
+
+        Dung tren request path: chua co tu dien / dang tao o thread khac -> None ngay
+        (khong cho lock trong luc table() mo phong).
+        """
+        fingerprint = self._stat()
+        table = self._table
+        if table is not None and self._fingerprint == fingerprint:
+            return table
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            key = self._key(inp_hash(str(self.inp_file)))
+            if self._table is None or self._table.key != key:
+                table = self._load(key)
+                if table is None:
+                    return None
+                self._table = table
+            self._fingerprint = fingerprint
+            return self._table
+        finally:
+            self._lock.release()
+
+    def _load(self, key: str) -> Optional[SignatureTable]:
+        path = self._path(key)
+        if path is not None and path.exists():
+            try:
+                table = SignatureTable.load(path)
+                if table.key == key:
+                    logger.info(f"[OK] Leak signatures loaded: {len(table)} junctions from {path}")
+                    return table
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable leak signature cache {path}: {e}")
+        return None
+
+    def _build(self, key: str) -> SignatureTable:
+        """Mo phong ro ri chuan tai moi junction ung vien, chia doan tren process pool"""
+        started = time.perf_counter()
+        args = (str(self.inp_file), self.params["reservoir_head"], self.params["area"],
+                self.params["discharge_coeff"])
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            solver = LeakSignatureSolver(*args)
+        junctions = self.params["junctions"] or list(solver.sensors)
+        workers = max(1, min(self.workers, len(junctions)))
+        if workers == 1:
+            delta = solver(junctions)
+        else:
+            # Vai doan moi worker de can tai khi junction hoi tu cham nhanh khac nhau
+            chunks = [list(c) for c in np.array_split(np.asarray(junctions, dtype=object), workers * 4) if len(c)]
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                     initargs=args) as pool:
+                delta = np.vstack(list(pool.map(_signature_task, chunks)))
+        self.builds += 1
+        self.last_build_s = time.perf_counter() - started
+        logger.info(f"[OK] Leak signatures: {len(junctions)} junctions x {len(solver.sensors)} sensors "
+                    f"in {self.last_build_s:.1f} s on {workers} worker(s)")
+        return SignatureTable(key, self.params, junctions, solver.sensors, delta)
+
+    def localize(self, residuals: Mapping[str, float], top_k: int = 10,
+                 table: Optional[SignatureTable] = None) -> Dict[str, Any]:
+        """
+        Xep hang junction theo do giong giua residual quan sat va chu ky ro ri
+
+        Args:
+            residuals: node_id -> residual ap luc (m, am = ap luc thap hon binh thuong);
+                       node khong phai sensor / NaN bi bo qua
+            top_k: So junction tra ve
+            table: Tu dien da co (vd tu cached()); None -> table() (mo phong neu chua co)
+
+        Returns:
+            {"candidates": [{rank, node_id, similarity, leak_scale, estimated_area_m2}], "sensors": so sensor dung}
+        """
+        table = table if table is not None else self.table()
+        observed = pd.Series(residuals, dtype=np.float64)
+        columns = table.sensor_index.get_indexer(observed.index.astype(str))
+        values = observed.to_numpy()
+        keep = (columns >= 0) & np.isfinite(values)
+        columns, values = columns[keep], values[keep]
+        order = np.argsort(columns)
+        columns, values = columns[order], values[order]
+        if len(columns) < 2:
+            raise ValueError("Need residuals for at least 2 network junctions")
+        vector = normalize_rows(values)[0]
+        if not vector.any():
+            raise ValueError("Residuals are constant - nothing to localize")
+
+        similarity = table.normalized_for(columns) @ vector.astype(np.float32)
+        k = min(int(top_k), len(table))
+        top = np.argpartition(-similarity, k - 1)[:k]
+        top = top[np.argsort(-similarity[top], kind='stable')]
+        raw = table.delta[top][:, columns].astype(np.float64)
+        energy = (raw * raw).sum(axis=1)
+        scale = np.divide(raw @ values, energy, out=np.zeros(len(top)), where=energy > 0)
+        candidates = [{
+            "rank": rank + 1,
+            "node_id": table.junctions[i],
+            "similarity": float(similarity[i]),
+            "leak_scale": float(s),
+            "estimated_area_m2": float(max(s, 0.0) * self.params["area"]),
+        } for rank, (i, s) in enumerate(zip(top, scale))]
+        return {"candidates": candidates, "sensors": int(len(columns))}
+
+    def stats(self) -> Dict[str, Any]:
+        table = self._table
+        return {
+            "key": table.key if table is not None else None,
+            "junctions": len(table) if table is not None else 0,
+            "sensors": len(table.sensors) if table is not None else 0,
+            "area_m2": self.params["area"],
+            "reservoir_head_m": self.params["reservoir_head"],
+            "builds": self.builds,
+            "last_build_s": round(self.last_build_s, 3) if self.last_build_s is not None else None,
+        }
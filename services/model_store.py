@@ -0,0 +1,283 @@
+"""
+Model bundle cho LeakDetectionService: load lazy, hot reload, swap nguyen tu
+
+    - ModelBundle: model + scaler + metadata + feature_cols + threshold cua MOT lan load,
+      khong doi sau khi tao. Request lay bundle mot lan roi dung den het -> reload giua
+      chung khong lam request dang chay doi model.
+    - ModelStore: giu bundle hien tai; load lan dau khi duoc dung (khong phai luc import
+      module), reload() load bundle moi roi gan lai mot tham chieu (nguyen tu). Load loi
+      -> giu bundle cu. watch() theo doi mtime/size cac file model de tu reload.
+
+Model file: uu tien dinh dang native cua CatBoost (.cbm, CatBoostClassifier.load_model - doc
+thang cau truc model, khong dung lai object graph nhu pickle) khi catboost co cai dat va
+file .cbm khong cu hon file .pkl cung ten; khong thi unpickle .pkl nhu truoc.
+Runtime "numpy" (hoac "auto" khi khong cai catboost): load .npz do scripts/export_model_numpy.py
+xuat ra - ensemble oblivious tree dang mang, predict bang NumPy (services/oblivious_trees.py).
+"""
+import asyncio
+import importlib.util
+import json
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.logger import logger
+from services.feature_pipeline import (
+    BASE_FEATURES, FEATURE_SCHEMA, FEATURE_VERSION, FeatureSchemaError, check_feature_metadata
+)
+from services.oblivious_trees import ObliviousTreeModel
+
+# catboost chi import khi load .cbm/.pkl: worker chay runtime numpy khong nap thu vien CatBoost
+CATBOOST_INSTALLED = importlib.util.find_spec("catboost") is not None
+
+# Thu tu uu tien: model local truoc model server (giong truoc day)
+MODEL_STEMS = ("leak_detection_model_local", "leak_detection_model")
+SCALER_FILE = "scaler.pkl"
+METADATA_FILE = "model_metadata.json"
+MODEL_RUNTIMES = ("auto", "catboost", "numpy")
+
+MODEL_FORMATS = {".cbm": "catboost-native", ".npz": "numpy-oblivious-trees", ".pkl": "pickle"}
+
+Fingerprint = Tuple[Tuple[str, int, int], ...]
+
+
+def model_fingerprint(model_dir: Path) -> Fingerprint:
+    """(ten, mtime_ns, size) cua cac file model/scaler/metadata dang co"""
+    names = [f"{stem}{ext}" for stem in MODEL_STEMS for ext in (".cbm", ".pkl", ".npz")] + [SCALER_FILE, METADATA_FILE]
+    entries = []
+    for name in names:
+        try:
+            stat = (Path(model_dir) / name).stat()
+        except OSError:
+            continue
+        entries.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
+
+
+def find_model_file(model_dir: Path, runtime: str = "auto") -> Optional[Path]:
+    """
+    File model se duoc load:
+        - runtime numpy (hoac auto khi khong cai catboost): .npz neu co va khong cu hon .cbm/.pkl
+          (khong cai catboost -> van dung .npz cu, kem canh bao);
+        - con lai: .cbm (neu doc duoc va khong cu hon .pkl) hoac .pkl.
+    """
+    if runtime not in MODEL_RUNTIMES:
+        raise ValueError(f"Unknown model runtime '{runtime}' (expected one of {', '.join(MODEL_RUNTIMES)})")
+    use_numpy = runtime == "numpy" or (runtime == "auto" and not CATBOOST_INSTALLED)
+    for stem in MODEL_STEMS:
+        native = Path(model_dir) / f"{stem}.cbm"
+        pickled = Path(model_dir) / f"{stem}.pkl"
+        arrays = Path(model_dir) / f"{stem}.npz"
+        if use_numpy and arrays.exists():
+            newer = [p for p in (native, pickled)
+                     if p.exists() and p.stat().st_mtime_ns > arrays.stat().st_mtime_ns]
+            if not newer:
+                return arrays
+            if not CATBOOST_INSTALLED:
+                logger.warning(f"{arrays} is older than {newer[0]} - re-run scripts/export_model_numpy.py")
+                return arrays
+            logger.warning(f"{arrays} is older than {newer[0]} - loading the CatBoost model")
+        elif use_numpy and runtime == "numpy":
+            logger.warning(f"{arrays} not found - falling back to the CatBoost model")
+        if native.exists() and CATBOOST_INSTALLED:
+            if not pickled.exists() or native.stat().st_mtime_ns >= pickled.stat().st_mtime_ns:
+                return native
+            logger.warning(f"{native} is older than {pickled} - loading the pickle")
+        elif native.exists():
+            logger.warning(f"{native} found but catboost is not installed - falling back to pickle")
+        if pickled.exists():
+            return pickled
+    return None
+
+
+def load_model_file(path: Path) -> Any:
+    if path.suffix == ".npz":
+        return ObliviousTreeModel.load(path)
+    if path.suffix == ".cbm":
+        from catboost import CatBoostClassifier
+        model = CatBoostClassifier()
+        model.load_model(str(path), format="cbm")
+        return model
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def resolve_feature_cols(model: Any, feature_cols: Optional[List[str]]) -> List[str]:
+    """
+    Feature list cho model: feature_cols trong metadata, hoac (metadata khong co) suy ra
+    tu so feature cua model - 30 (local model) / 39 (co topology features).
+    """
+    expected = len(model.feature_names_) if getattr(model, 'feature_names_', None) else None
+    if feature_cols:
+        if expected is not None and len(feature_cols) != expected:
+            raise FeatureSchemaError(
+                f"Metadata lists {len(feature_cols)} features but the model expects {expected}"
+            )
+        return list(feature_cols)
+    if expected is None or expected == len(BASE_FEATURES):
+        return list(BASE_FEATURES)
+    if expected == len(FEATURE_SCHEMA):
+        return list(FEATURE_SCHEMA)
+    raise FeatureSchemaError(f"Model expects {expected} features - no matching feature list in pipeline v{FEATURE_VERSION}")
+
+
+def production_threshold(metadata: Optional[Dict[str, Any]]) -> float:
+    """Threshold dung khi detect (metadata co the khong co)"""
+    if not metadata:
+        return 0.5  # Default threshold (no metadata)
+    # Note: best_threshold (0.92) is too high for real-world use
+    # Using 0.1 (10%) for production - balanced between detection and false positives
+    # This threshold provides reasonable detection rate (~2-3%) with acceptable confidence
+    if 'best_threshold' in metadata:
+        # Use balanced threshold for production
+        # Original: threshold = metadata['best_threshold']  # 0.92 - too high
+        # Previous: threshold = 0.05  # 5% - too low, many false positives
+        return 0.1  # 10% - balanced for production use
+    elif 'optimal_threshold' in metadata:
+        return metadata['optimal_threshold']
+    return 0.1  # Default to 10% for production
+
+
+class ModelBundle:
+    """Mot lan load model (khong doi sau khi tao)"""
+
+    def __init__(self, model: Any, scaler: Any, metadata: Optional[Dict[str, Any]], feature_cols: List[str],
+                 threshold: float, source: Path, fingerprint: Fingerprint):
+        self.model = model
+        self.scaler = scaler
+        self.metadata = metadata
+        self.feature_cols = feature_cols
+        self.threshold = threshold
+        self.source = source
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+
+    @property
+    def reservoir_nodes(self) -> set:
+        if self.metadata and 'reservoir_nodes' in self.metadata:
+            return set(str(n) for n in self.metadata['reservoir_nodes'])
+        return set()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "source": str(self.source),
+            "format": MODEL_FORMATS.get(self.source.suffix, "pickle"),
+            "loaded_at": self.loaded_at,
+            "feature_version": (self.metadata or {}).get('feature_version'),
+            "n_features": len(self.feature_cols),
+            "threshold": self.threshold,
+        }
+
+
+def load_bundle(model_dir: Path, runtime: str = "auto") -> ModelBundle:
+    """Load model, scaler va metadata tu model_dir; loi -> exception (khong tra ve bundle do dang)"""
+    model_dir = Path(model_dir)
+    fingerprint = model_fingerprint(model_dir)
+    model_file = find_model_file(model_dir, runtime)
+    if model_file is None:
+        raise FileNotFoundError(f"No model file in {model_dir}/ (expected {', '.join(MODEL_STEMS)} .cbm/.pkl/.npz)")
+
+    started = time.perf_counter()
+    model = load_model_file(model_file)
+    logger.info(f"[OK] Model loaded from {model_file} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    scaler = None
+    scaler_file = model_dir / SCALER_FILE
+    if scaler_file.exists():
+        with open(scaler_file, 'rb') as f:
+            scaler = pickle.load(f)
+        logger.info("[OK] Scaler loaded successfully")
+    else:
+        logger.warning("Scaler not found - using features without scaling")
+
+    metadata = None
+    feature_cols = None
+    metadata_file = model_dir / METADATA_FILE
+    if metadata_file.exists():
+        with open(metadata_file, 'r') as f:
+            metadata = json.load(f)
+        # Fail fast neu model duoc train voi feature pipeline khac
+        if 'feature_cols' in metadata:
+            feature_cols = check_feature_metadata(metadata)
+    else:
+        logger.warning("Metadata file not found")
+
+    threshold = production_threshold(metadata)
+    if metadata is not None:
+        logger.info(f"[OK] Metadata loaded - Threshold: {threshold:.3f} (adjusted from {metadata.get('best_threshold', 'N/A')} for production balance)")
+
+    return ModelBundle(model, scaler, metadata, resolve_feature_cols(model, feature_cols),
+                       threshold, model_file, fingerprint)
+
+
+class ModelStore:
+    """Bundle hien tai + load lazy / reload / watch"""
+
+    def __init__(self, model_dir: Path = Path("models"), loader: Optional[Callable[[Path], ModelBundle]] = None,
+                 runtime: str = "auto"):
+        self.model_dir = Path(model_dir)
+        self.runtime = runtime
+        self._loader = loader or (lambda path: load_bundle(path, runtime))
+        self._bundle: Optional[ModelBundle] = None
+        self._lock = threading.Lock()
+        self._attempted = False
+        self._seen_fingerprint: Optional[Fingerprint] = None
+        self.last_error: Optional[str] = None
+
+    def get(self) -> Optional[ModelBundle]:
+        """Bundle hien tai (load lan dau neu chua load); None neu khong load duoc"""
+        bundle = self._bundle
+        if bundle is None and not self._attempted:
+            with self._lock:
+                if not self._attempted:
+                    try:
+                        self._load_locked()
+                    except Exception as e:
+                        logger.error(f"Error loading model: {str(e)}")
+        return self._bundle
+
+    def peek(self) -> Optional[ModelBundle]:
+        """Bundle hien tai, khong kich hoat load"""
+        return self._bundle
+
+    def reload(self) -> ModelBundle:
+        """Load bundle moi va swap; loi -> giu bundle cu va raise"""
+        with self._lock:
+            return self._load_locked()
+
+    def reload_if_changed(self) -> bool:
+        """Reload khi file model/scaler/metadata thay doi tu lan load truoc (dung cho watcher)"""
+        if not self._attempted:
+            return False  # chua dung lan nao -> de load lazy
+        if model_fingerprint(self.model_dir) == self._seen_fingerprint:
+            return False
+        try:
+            self.reload()
+            return True
+        except Exception as e:
+            logger.error(f"Model reload failed, keeping previous model: {str(e)}")
+            return False
+
+    def _load_locked(self) -> ModelBundle:
+        self._attempted = True
+        self._seen_fingerprint = model_fingerprint(self.model_dir)
+        try:
+            bundle = self._loader(self.model_dir)
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        self._bundle = bundle  # swap: request dang chay van giu bundle cu
+        self.last_error = None
+        return bundle
+
+    async def watch(self, interval_seconds: float):
+        """Vong lap theo doi file model (chay nhu background task trong lifespan)"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                if await asyncio.to_thread(self.reload_if_changed):
+                    logger.info(f"[OK] Model hot-reloaded from {self._bundle.source}")
+            except Exception as e:
+                logger.error(f"Model watcher error: {e}")
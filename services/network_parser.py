@@ -3,13 +3,14 @@ Network Parser Service - Parse EPANET input file để lấy topology
 """
 import os
 import re
-from typing import List, Dict, Any, Tuple
-from dataclasses import dataclass
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, replace
 import logging
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(frozen=True)
 class NetworkNode:
     """Network node với tọa độ thật"""
     id: str
@@ -20,7 +21,7 @@ class NetworkNode:
     base_demand: float = 0.0  # Base demand từ [DEMANDS] section - dùng để so sánh
     node_type: str = "junction"  # junction, reservoir, tank
 
-@dataclass
+@dataclass(frozen=True)
 class NetworkPipe:
     """Network pipe với thông tin kết nối"""
     id: str
@@ -31,56 +32,84 @@ class NetworkPipe:
     roughness: float = 140.0
     status: str = "OPEN"
 
+@dataclass(frozen=True)
+class NetworkTopology:
+    """Kết quả parse file EPANET - không đổi sau khi tạo, dùng chung giữa các request"""
+    nodes: Tuple[NetworkNode, ...]
+    pipes: Tuple[NetworkPipe, ...]
+
 class NetworkParser:
-    """Parser cho EPANET input file"""
+    """Parser cho EPANET input file (an toàn khi gọi đồng thời từ nhiều thread)"""
     
     def __init__(self, inp_file_path: str = "epanetVip1.inp"):
         self.inp_file_path = inp_file_path
-        self.nodes: List[NetworkNode] = []
-        self.pipes: List[NetworkPipe] = []
-        self.parsed = False  # Thêm cờ để kiểm tra đã parse chưa
+        # Snapshot đã parse: gán một lần (dưới lock), không sửa sau đó
+        self._topology: Optional[NetworkTopology] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def parsed(self) -> bool:
+        """Đã parse chưa"""
+        return self._topology is not None
+    
+    @property
+    def nodes(self) -> Tuple[NetworkNode, ...]:
+        topology = self._topology
+        return topology.nodes if topology is not None else ()
+    
+    @property
+    def pipes(self) -> Tuple[NetworkPipe, ...]:
+        topology = self._topology
+        return topology.pipes if topology is not None else ()
+    
+    def topology(self) -> NetworkTopology:
+        """Topology đã parse; lần đầu parse file (một thread parse, các thread khác chờ kết quả)"""
+        topology = self._topology
+        if topology is not None:
+            return topology
+        with self._lock:
+            if self._topology is None:
+                self._topology = self._parse()
+            return self._topology
+    
+    def _parse(self) -> NetworkTopology:
+        """Parse file vào các list cục bộ rồi đóng băng thành NetworkTopology"""
+        logger.info(f"Parsing EPANET file: {self.inp_file_path}")
+        if not os.path.exists(self.inp_file_path):
+            raise FileNotFoundError(f"File {self.inp_file_path} không tồn tại")
+        
+        with open(self.inp_file_path, 'r', encoding='utf-8') as file:
+            content = file.read()
+        
+        # Parse coordinates
+        nodes = self._parse_coordinates(content)
+        
+        # Parse pipes
+        pipes = self._parse_pipes(content)
+        
+        # Parse junctions để lấy elevation và demand
+        nodes = self._parse_junctions(content, nodes)
+        
+        # Parse demands section để lấy base_demand (demand dùng để so sánh)
+        nodes = self._parse_demands(content, nodes)
+        
+        logger.info(f"Finished parsing. Found {len(nodes)} nodes and {len(pipes)} pipes.")
+        return NetworkTopology(tuple(nodes), tuple(pipes))
         
     def parse_file(self) -> Dict[str, Any]:
-        """Parse toàn bộ file EPANET"""
+        """Parse toàn bộ file EPANET (lần sau trả về topology đã parse)"""
         if self.parsed:
             logger.info("Returning cached network topology.")
-            return {
-                "success": True,
-                "nodes": [self._node_to_dict(node) for node in self.nodes],
-                "pipes": [self._pipe_to_dict(pipe) for pipe in self.pipes],
-                "total_nodes": len(self.nodes),
-                "total_pipes": len(self.pipes)
-            }
-        
-        logger.info(f"Parsing EPANET file: {self.inp_file_path}")
         try:
-            if not os.path.exists(self.inp_file_path):
-                raise FileNotFoundError(f"File {self.inp_file_path} không tồn tại")
-            
-            with open(self.inp_file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-            
-            # Parse coordinates
-            self._parse_coordinates(content)
-            
-            # Parse pipes
-            self._parse_pipes(content)
-            
-            # Parse junctions để lấy elevation và demand
-            self._parse_junctions(content)
-            
-            # Parse demands section để lấy base_demand (demand dùng để so sánh)
-            self._parse_demands(content)
-            
-            self.parsed = True
-            logger.info(f"Finished parsing. Found {len(self.nodes)} nodes and {len(self.pipes)} pipes.")
+            topology = self.topology()
             
+            # Dict mới cho mỗi lần gọi: caller sửa kết quả không ảnh hưởng snapshot
             return {
                 "success": True,
-                "nodes": [self._node_to_dict(node) for node in self.nodes],
-                "pipes": [self._pipe_to_dict(pipe) for pipe in self.pipes],
-                "total_nodes": len(self.nodes),
-                "total_pipes": len(self.pipes)
+                "nodes": [self._node_to_dict(node) for node in topology.nodes],
+                "pipes": [self._pipe_to_dict(pipe) for pipe in topology.pipes],
+                "total_nodes": len(topology.nodes),
+                "total_pipes": len(topology.pipes)
             }
             
         except Exception as e:
@@ -92,14 +121,15 @@ class NetworkParser:
                 "pipes": []
             }
     
-    def _parse_coordinates(self, content: str):
+    def _parse_coordinates(self, content: str) -> List[NetworkNode]:
         """Parse phần [COORDINATES]"""
+        nodes: List[NetworkNode] = []
         try:
             # Tìm phần [COORDINATES]
             coords_match = re.search(r'\[COORDINATES\](.*?)(?=\[|\Z)', content, re.DOTALL)
             if not coords_match:
                 logger.warning("Không tìm thấy phần [COORDINATES]")
-                return
+                return nodes
             
             coords_section = coords_match.group(1)
             lines = coords_section.strip().split('\n')
@@ -127,7 +157,7 @@ class NetworkParser:
                             x_coord=x_coord,
                             y_coord=y_coord
                         )
-                        self.nodes.append(node)
+                        nodes.append(node)
                         
                     except (ValueError, IndexError) as e:
                         logger.warning(f"Không thể parse line: {line} - {e}")
@@ -135,15 +165,17 @@ class NetworkParser:
                         
         except Exception as e:
             logger.error(f"Error parsing coordinates: {str(e)}")
+        return nodes
     
-    def _parse_pipes(self, content: str):
+    def _parse_pipes(self, content: str) -> List[NetworkPipe]:
         """Parse phần [PIPES]"""
+        pipes: List[NetworkPipe] = []
         try:
             # Tìm phần [PIPES]
             pipes_match = re.search(r'\[PIPES\](.*?)(?=\[|\Z)', content, re.DOTALL)
             if not pipes_match:
                 logger.warning("Không tìm thấy phần [PIPES]")
-                return
+                return pipes
             
             pipes_section = pipes_match.group(1)
             lines = pipes_section.strip().split('\n')
@@ -180,7 +212,7 @@ class NetworkParser:
                             roughness=roughness,
                             status=status
                         )
-                        self.pipes.append(pipe)
+                        pipes.append(pipe)
                         
                     except (ValueError, IndexError) as e:
                         logger.warning(f"Không thể parse pipe line: {line} - {e}")
@@ -188,15 +220,16 @@ class NetworkParser:
                         
         except Exception as e:
             logger.error(f"Error parsing pipes: {str(e)}")
+        return pipes
     
-    def _parse_junctions(self, content: str):
+    def _parse_junctions(self, content: str, nodes: List[NetworkNode]) -> List[NetworkNode]:
         """Parse phần [JUNCTIONS] để lấy elevation và demand"""
         try:
             # Tìm phần [JUNCTIONS]
             junctions_match = re.search(r'\[JUNCTIONS\](.*?)(?=\[|\Z)', content, re.DOTALL)
             if not junctions_match:
                 logger.warning("Không tìm thấy phần [JUNCTIONS]")
-                return
+                return nodes
             
             junctions_section = junctions_match.group(1)
             lines = junctions_section.strip().split('\n')
@@ -231,24 +264,26 @@ class NetworkParser:
                         logger.warning(f"Không thể parse junction line: {line} - {e}")
                         continue
             
-            # Cập nhật nodes với junction data
-            for node in self.nodes:
-                if node.id in junction_data:
-                    node.elevation = junction_data[node.id]['elevation']
-                    node.demand = junction_data[node.id]['demand']
-                    node.node_type = "junction"
+            # Cập nhật nodes với junction data (node mới, NetworkNode không sửa được)
+            nodes = [
+                replace(node, elevation=junction_data[node.id]['elevation'],
+                        demand=junction_data[node.id]['demand'], node_type="junction")
+                if node.id in junction_data else node
+                for node in nodes
+            ]
                         
         except Exception as e:
             logger.error(f"Error parsing junctions: {str(e)}")
+        return nodes
     
-    def _parse_demands(self, content: str):
+    def _parse_demands(self, content: str, nodes: List[NetworkNode]) -> List[NetworkNode]:
         """Parse phần [DEMANDS] để lấy base_demand (demand dùng để so sánh)"""
         try:
             # Tìm phần [DEMANDS]
             demands_match = re.search(r'\[DEMANDS\](.*?)(?=\[|\Z)', content, re.DOTALL)
             if not demands_match:
                 logger.warning("Không tìm thấy phần [DEMANDS]")
-                return
+                return nodes
             
             demands_section = demands_match.group(1)
             lines = demands_section.strip().split('\n')
@@ -285,16 +320,17 @@ class NetworkParser:
                         continue
             
             # Cập nhật nodes với base_demand
-            updated_count = 0
-            for node in self.nodes:
-                if node.id in demand_data:
-                    node.base_demand = demand_data[node.id]
-                    updated_count += 1
+            updated_count = sum(1 for node in nodes if node.id in demand_data)
+            nodes = [
+                replace(node, base_demand=demand_data[node.id]) if node.id in demand_data else node
+                for node in nodes
+            ]
             
             logger.info(f"Updated {updated_count} nodes with base_demand from [DEMANDS] section")
                         
         except Exception as e:
             logger.error(f"Error parsing demands: {str(e)}")
+        return nodes
     
     def _node_to_dict(self, node: NetworkNode) -> Dict[str, Any]:
         """Convert NetworkNode to dict"""
@@ -331,10 +367,11 @@ class NetworkParser:
         """
         if not self.parsed:
             self.parse_file()
+        nodes, pipes = self.nodes, self.pipes
 
         # Convert nodes to Cytoscape format
         cytoscape_nodes = []
-        for node in self.nodes:
+        for node in nodes:
             cytoscape_nodes.append({
                 "data": {
                     "id": node.id,
@@ -349,7 +386,7 @@ class NetworkParser:
 
         # Convert pipes to Cytoscape format (edges)
         cytoscape_edges = []
-        for pipe in self.pipes:
+        for pipe in pipes:
             cytoscape_edges.append({
                 "data": {
                     "id": pipe.id,
@@ -0,0 +1,134 @@
+"""
+Ket qua node dang cot cho leak detection
+
+detect_leaks nhan du lieu {node_id: [record, ...]}: truoc day moi record duoc chep
+thanh mot dict moi, gom thanh list of dicts roi moi thanh DataFrame - moi gia tri di
+qua vai doi tuong Python trung gian. NodeArrays giu du lieu dang cot (long format,
+node-major: moi node lien tiep theo thoi gian - cung thu tu dong nhu truoc):
+    - from_wntr: lay thang mang [time x node] cua ket qua WNTR (khong qua record nao);
+    - from_nodes_results / from_records: mot lan duyet moi cot cho du lieu JSON;
+    - to_frame: DataFrame cho feature pipeline tu cac cot do;
+    - digest: hash noi dung (khoa cache xac suat, services/probability_cache.py).
+"""
+import hashlib
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+_DEFAULTS = {'timestamp': 0, 'pressure': 0, 'head': 0, 'demand': 0}
+
+
+def _fit(values: Sequence[Any], n: int) -> List[Any]:
+    """values[i] neu i < len(values), nguoc lai 0 (i < n)"""
+    values = list(values[:n])
+    if len(values) < n:
+        values.extend([0] * (n - len(values)))
+    return values
+
+
+class NodeArrays:
+    """
+    Du lieu node theo thoi gian dang cot: node_id, timestamp, pressure, head, demand
+    (moi cot la list hoac np.ndarray cung do dai).
+    """
+
+    COLUMNS = ('node_id', 'timestamp', 'pressure', 'head', 'demand')
+
+    def __init__(self, node_id, timestamp, pressure, head, demand):
+        self.columns = {
+            'node_id': node_id,
+            'timestamp': timestamp,
+            'pressure': pressure,
+            'head': head,
+            'demand': demand,
+        }
+        lengths = {len(values) for values in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"NodeArrays columns have different lengths: {sorted(lengths)}")
+
+    def __len__(self) -> int:
+        return len(self.columns['node_id'])
+
+    def digest(self) -> str:
+        """Hash noi dung cac cot (cung du lieu -> cung gia tri, khong phu thuoc list hay ndarray)"""
+        h = hashlib.blake2b(digest_size=16)
+        for name in self.COLUMNS:
+            values = np.asarray(self.columns[name])
+            if values.dtype == object or values.dtype.kind in 'US':
+                h.update("\x1f".join(map(str, values.tolist())).encode('utf-8'))
+            else:
+                h.update(values.astype(np.float64).tobytes())
+            h.update(b"\x1e")
+        return h.hexdigest()
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame cho build_features (kieu du lieu suy ra nhu pd.DataFrame(records) truoc day)"""
+        return pd.DataFrame(self.columns)
+
+    @classmethod
+    def from_matrix(cls, node_ids: Sequence[str], timestamps: Sequence[Any],
+                    pressure: np.ndarray, head: np.ndarray, demand: np.ndarray) -> "NodeArrays":
+        """Tu mang [time x node] (vd DataFrame ket qua WNTR): mot lan chuyen vi moi cot"""
+        n_nodes, n_times = len(node_ids), len(timestamps)
+        return cls(
+            np.repeat(np.asarray(node_ids, dtype=object), n_times),
+            np.tile(np.asarray(timestamps), n_nodes),
+            np.asarray(pressure).T.ravel(),
+            np.asarray(head).T.ravel(),
+            np.asarray(demand).T.ravel(),
+        )
+
+    @classmethod
+    def from_wntr(cls, results) -> "NodeArrays":
+        """
+        Tu ket qua WNTR (results.node['pressure'|'head'|'demand']), cung don vi voi
+        EPANETService._extract_wntr_results: demand m3/s -> LPS; timestamp = giay mo phong.
+        """
+        pressure = results.node['pressure']
+        node_ids = [str(n) for n in pressure.columns]
+        head = results.node['head'].reindex(columns=pressure.columns)
+        demand = results.node['demand'].reindex(columns=pressure.columns).to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            demand_lps = np.where(demand != 0, demand * 1000, 0.0)
+        return cls.from_matrix(
+            node_ids, pressure.index.to_numpy(),
+            pressure.to_numpy(dtype=np.float64), head.to_numpy(dtype=np.float64), demand_lps
+        )
+
+    @classmethod
+    def from_records(cls, nodes_data: Dict[str, List[Dict[str, Any]]]) -> "NodeArrays":
+        """Tu {node_id: [{timestamp, pressure, head, demand}, ...]} (gia tri thieu -> 0)"""
+        columns = {name: [] for name in cls.COLUMNS}
+        for node_id, records in nodes_data.items():
+            columns['node_id'].extend([node_id] * len(records))
+            for name, default in _DEFAULTS.items():
+                columns[name].extend([record.get(name, default) for record in records])
+        return cls(**columns)
+
+    @classmethod
+    def from_nodes_results(cls, nodes_results: Dict[str, Any]) -> "NodeArrays":
+        """
+        Tu SimulationResult.nodes_results: moi node la list of records hoac dang cot
+        {timestamps, pressures, heads, demands} (so dong = len(timestamps)).
+        Sai cau truc (khong phai dict theo node, record khong phai dict) -> ValueError.
+        """
+        if not isinstance(nodes_results, dict):
+            raise ValueError("nodes_results must be an object keyed by node_id")
+        columns = {name: [] for name in cls.COLUMNS}
+        for node_id, node_data in nodes_results.items():
+            if isinstance(node_data, list):
+                if not all(isinstance(record, dict) for record in node_data):
+                    raise ValueError(f"Node {node_id}: records must be objects")
+                columns['node_id'].extend([node_id] * len(node_data))
+                for name, default in _DEFAULTS.items():
+                    columns[name].extend([record.get(name, default) for record in node_data])
+            elif isinstance(node_data, dict):
+                timestamps = list(node_data.get('timestamps', []))
+                n = len(timestamps)
+                columns['node_id'].extend([node_id] * n)
+                columns['timestamp'].extend(timestamps)
+                columns['pressure'].extend(_fit(node_data.get('pressures', []), n))
+                columns['head'].extend(_fit(node_data.get('heads', []), n))
+                columns['demand'].extend(_fit(node_data.get('demands', []), n))
+        return cls(**columns)
@@ -0,0 +1,193 @@
+"""
+Inference thuan NumPy cho model CatBoost (oblivious trees)
+
+Container serving chi can predict nhung truoc day phai cai CatBoost va unpickle ca
+model. Model CatBoost la ensemble oblivious tree: moi tree co depth split (feature,
+border) dung chung cho ca tang, leaf = bit mask cua cac so sanh x[feature] > border.
+ObliviousTreeModel giu ensemble duoi dang mang:
+    split_features [tree x depth], borders [tree x depth] (float32 nhu CatBoost),
+    leaf_values [tree x 2^depth], scale / bias
+va tinh predict_proba bang vai phep gather/so sanh vector hoa - khong can catboost.
+
+Export: tu model CatBoost (save_model format="json") hoac file JSON do -> .npz
+(scripts/export_model_numpy.py). ModelStore load .npz khi catboost khong co san
+(hoac settings.leak_model_runtime = "numpy").
+
+Chi ho tro binary classification (Logloss) voi float features - dung nhu model hien tai.
+"""
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+NPZ_FORMAT_VERSION = 1
+
+# Chia theo dong de mang trung gian [tree x rows] khong qua lon (1000 tree -> ~4 MB/chunk)
+_ROW_CHUNK = 1024
+
+
+class ObliviousTreeModel:
+    """
+    Ensemble oblivious tree dang mang NumPy, cung interface predict_proba voi CatBoostClassifier.
+
+    Args:
+        split_features: [n_trees x depth] chi so cot cua X cho moi split
+        borders: [n_trees x depth] nguong (x > border -> bit 1); split dem them co border = +inf
+        leaf_values: [n_trees x 2^depth]
+        scale, bias: raw = scale * sum(leaf) + bias, proba = sigmoid(raw)
+        nan_as_true: [n_features] NaN tinh la lon hon moi border (nan_value_treatment AsTrue)
+        feature_names: Ten feature theo thu tu cot (feature_names_ cua CatBoost)
+    """
+
+    def __init__(self, split_features: np.ndarray, borders: np.ndarray, leaf_values: np.ndarray,
+                 scale: float = 1.0, bias: float = 0.0, nan_as_true: Optional[np.ndarray] = None,
+                 feature_names: Optional[List[str]] = None):
+        self.split_features = np.ascontiguousarray(split_features, dtype=np.int32)
+        self.borders = np.ascontiguousarray(borders, dtype=np.float32)
+        self.leaf_values = np.ascontiguousarray(leaf_values, dtype=np.float64)
+        self.scale = float(scale)
+        self.bias = float(bias)
+        self.n_features = int(self.split_features.max()) + 1 if self.split_features.size else 0
+        if feature_names is not None:
+            self.n_features = max(self.n_features, len(feature_names))
+        self.nan_as_true = (np.zeros(self.n_features, dtype=bool) if nan_as_true is None
+                            else np.asarray(nan_as_true, dtype=bool))
+        self.feature_names_ = list(feature_names) if feature_names is not None else None
+        self.classes_ = np.array([0, 1])
+
+        depth = self.split_features.shape[1] if self.split_features.ndim == 2 else 0
+        if self.leaf_values.shape != (len(self.split_features), 1 << depth):
+            raise ValueError(f"leaf_values shape {self.leaf_values.shape} does not match "
+                             f"{len(self.split_features)} trees of depth {depth}")
+        # Vi tri dau mang leaf cua moi tree trong leaf_values.ravel()
+        self._index_dtype = np.int32 if self.leaf_values.size < 2 ** 31 else np.int64
+        self._leaf_offset = (np.arange(len(self.split_features), dtype=self._index_dtype) << depth)[:, None]
+
+    @property
+    def tree_count_(self) -> int:
+        return len(self.split_features)
+
+    @property
+    def depth(self) -> int:
+        return self.split_features.shape[1]
+
+    def _prepare(self, X: Any) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] < self.n_features:
+            raise ValueError(f"Expected a 2D matrix with {self.n_features} features, got shape {X.shape}")
+        if self.nan_as_true.any():
+            X = X.copy()
+            cols = np.flatnonzero(self.nan_as_true)
+            block = X[:, cols]
+            block[np.isnan(block)] = np.inf
+            X[:, cols] = block
+        # NaN con lai: so sanh > border luon False (nan_value_treatment Min/AsFalse)
+        return X
+
+    def predict_raw(self, X: Any) -> np.ndarray:
+        """Tong leaf values (scale/bias da ap dung) cho moi dong"""
+        # Layout [feature x rows] / [tree x rows]: moi tang la mot gather theo dong lien tuc
+        XT = np.ascontiguousarray(self._prepare(X).T)
+        raw = np.empty(XT.shape[1], dtype=np.float64)
+        flat_values = self.leaf_values.ravel()
+        for start in range(0, XT.shape[1], _ROW_CHUNK):
+            chunk = XT[:, start:start + _ROW_CHUNK]
+            # Leaf index: bit d = so sanh cua tang d (cung thu tu split nhu CatBoost)
+            leaves = np.zeros((self.tree_count_, chunk.shape[1]), dtype=self._index_dtype)
+            for d in range(self.depth):
+                leaves |= (chunk[self.split_features[:, d]] > self.borders[:, d, None]).astype(self._index_dtype) << d
+            leaves += self._leaf_offset
+            raw[start:start + chunk.shape[1]] = np.take(flat_values, leaves).sum(axis=0)
+        return self.scale * raw + self.bias
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        raw = self.predict_raw(X)
+        p = 1.0 / (1.0 + np.exp(-raw))
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X: Any) -> np.ndarray:
+        return (self.predict_raw(X) > 0).astype(np.int64)
+
+    # ---- Export / load ----
+
+    @classmethod
+    def from_catboost_json(cls, model_json: Dict[str, Any], feature_names: Optional[List[str]] = None) -> "ObliviousTreeModel":
+        """Tu model CatBoost dang JSON (CatBoostClassifier.save_model(..., format="json"))"""
+        float_features = model_json.get('features_info', {}).get('float_features', [])
+        if model_json.get('features_info', {}).get('categorical_features'):
+            raise ValueError("Categorical features are not supported by the NumPy evaluator")
+        # float_feature_index -> cot cua X
+        column_of = {f['feature_index']: f.get('flat_feature_index', f['feature_index']) for f in float_features}
+        n_features = max(column_of.values()) + 1 if column_of else 0
+        nan_as_true = np.zeros(n_features, dtype=bool)
+        for f in float_features:
+            if f.get('nan_value_treatment') == 'AsTrue':
+                nan_as_true[column_of[f['feature_index']]] = True
+
+        trees = model_json.get('oblivious_trees')
+        if trees is None:
+            raise ValueError("Model JSON has no oblivious_trees (non-symmetric trees are not supported)")
+        depth = max((len(t['splits']) for t in trees), default=0)
+        split_features = np.zeros((len(trees), depth), dtype=np.int32)
+        borders = np.full((len(trees), depth), np.inf, dtype=np.float32)
+        leaf_values = np.zeros((len(trees), 1 << depth), dtype=np.float64)
+        for i, tree in enumerate(trees):
+            splits = tree['splits']
+            for j, split in enumerate(splits):
+                if split.get('split_type', 'FloatFeature') != 'FloatFeature':
+                    raise ValueError(f"Unsupported split type: {split.get('split_type')}")
+                split_features[i, j] = column_of.get(split['float_feature_index'], split['float_feature_index'])
+                borders[i, j] = split['border']
+            values = np.asarray(tree['leaf_values'], dtype=np.float64)
+            if len(values) != 1 << len(splits):
+                raise ValueError("Only single-dimension (binary) leaf values are supported")
+            # Split dem (border = +inf) luon bit 0 -> chi dung nua dau cua mang leaf
+            leaf_values[i, :len(values)] = values
+
+        scale, bias = model_json.get('scale_and_bias', [1.0, [0.0]])
+        bias = bias[0] if isinstance(bias, (list, tuple)) else bias
+        if feature_names is None:
+            names = [f.get('feature_id') for f in float_features]
+            feature_names = names if names and all(names) else None
+        return cls(split_features, borders, leaf_values, scale, bias, nan_as_true, feature_names)
+
+    @classmethod
+    def from_catboost(cls, model: Any) -> "ObliviousTreeModel":
+        """Tu CatBoostClassifier da train (can catboost)"""
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            model.save_model(path, format="json")
+            with open(path, 'r') as f:
+                model_json = json.load(f)
+        finally:
+            os.remove(path)
+        names = list(model.feature_names_) if getattr(model, 'feature_names_', None) else None
+        return cls.from_catboost_json(model_json, names)
+
+    def save(self, path: Union[str, Path]):
+        """Luu .npz (khong pickle object)"""
+        np.savez(
+            path,
+            format_version=np.array(NPZ_FORMAT_VERSION),
+            split_features=self.split_features,
+            borders=self.borders,
+            leaf_values=self.leaf_values,
+            scale_and_bias=np.array([self.scale, self.bias]),
+            nan_as_true=self.nan_as_true,
+            feature_names=np.array(self.feature_names_ or [], dtype=str),
+        )
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "ObliviousTreeModel":
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data['format_version'])
+            if version != NPZ_FORMAT_VERSION:
+                raise ValueError(f"Unsupported NumPy model format v{version} (expected v{NPZ_FORMAT_VERSION})")
+            names = [str(n) for n in data['feature_names']] or None
+            scale, bias = data['scale_and_bias']
+            return cls(data['split_features'], data['borders'], data['leaf_values'],
+                       scale, bias, data['nan_as_true'], names)
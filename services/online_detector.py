@@ -0,0 +1,241 @@
+"""
+Online (streaming) leak scoring voi ring buffer cho moi node
+
+detect_leaks dung lai DataFrame tu toan bo lich su va tinh lai moi rolling/network
+feature moi lan goi. OnlineLeakDetector giu trang thai cua mot luong du lieu (SCADA
+hoac simulation chay tung buoc):
+    - ring buffer [ROLLING_WINDOW x node] cho pressure/head/demand (cac cua so rolling
+      cua feature pipeline dai toi da ROLLING_WINDOW buoc);
+    - change truoc do (acceleration) va tong/so mau demand (demand_deviation);
+moi buoc thoi gian moi chi tinh feature cho cac dong cua buoc do: O(so node x
+ROLLING_WINDOW), khong phu thuoc do dai lich su.
+
+Feature cua buoc t bang feature ma build_features tinh cho dong t khi chay tren lich
+su den t (khong dung du lieu tuong lai):
+    - rolling / diff / acceleration: lay tu ring buffer;
+    - demand_deviation: demand - trung binh demand cua node tu dau luong den t (ban batch
+      dung trung binh ca chuoi -> chi trung o buoc cuoi cua chuoi);
+    - network / ratio / topology features: build_features tren frame cua buoc t.
+Sai khac voi batch chi o muc lam tron (vd tong tuan tu thay vi Kahan/pairwise).
+"""
+import threading
+import time
+import warnings
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from services.feature_engine import _prep_rolling
+from services.feature_pipeline import TopologyLoader, build_features, select_features, serving_features
+from services.topology_store import TopologyFeatures, as_topology_features
+
+# Cua so rolling dai nhat trong feature pipeline (ma5, *_std_5, *_min_5, *_max_5)
+ROLLING_WINDOW = 5
+
+_SIGNALS = ('pressure', 'head', 'demand')
+
+
+class OnlineLeakDetector:
+    """
+    Trang thai streaming cua mot luong du lieu.
+
+    Args:
+        service: LeakDetectionService (model, loc ket qua, topology)
+        topology_loader: Ham tra ve TopologyFeatures (mac dinh service._load_topology_features -
+            goi moi buoc, store tu bien dich lai khi file doi) hoac (neighbor_map, topology_df)
+            (goi va bien dich mot lan roi dung lai cho moi buoc)
+    """
+
+    def __init__(self, service, topology_loader: Optional[TopologyLoader] = None):
+        self.service = service
+        self._topology_loader = topology_loader or service._load_topology_features
+        self._topology = None
+        self._lock = threading.Lock()
+
+        self.node_ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._buffers = {signal: np.full((ROLLING_WINDOW, 0), np.nan) for signal in _SIGNALS}
+        self._count = np.zeros(0, dtype=np.int64)
+        self._last_change = {signal: np.zeros(0) for signal in ('pressure', 'head')}
+        self._demand_sum = np.zeros(0)
+        self._demand_n = np.zeros(0, dtype=np.int64)
+        self.steps = 0
+        self.last_timestamp: Optional[Any] = None
+
+    def _topology_features(self) -> TopologyFeatures:
+        if self._topology is not None:
+            return self._topology
+        topology = self._topology_loader()
+        if isinstance(topology, TopologyFeatures):
+            return topology
+        self._topology = as_topology_features(topology)
+        return self._topology
+
+    def _node_codes(self, node_ids: Sequence[str]) -> np.ndarray:
+        """Ma cua cac node (them node moi vao trang thai neu chua co)"""
+        new = [n for n in dict.fromkeys(node_ids) if n not in self._index]
+        if new:
+            for node_id in new:
+                self._index[node_id] = len(self.node_ids)
+                self.node_ids.append(node_id)
+            k = len(new)
+            for signal in _SIGNALS:
+                self._buffers[signal] = np.hstack([self._buffers[signal], np.full((ROLLING_WINDOW, k), np.nan)])
+            self._count = np.concatenate([self._count, np.zeros(k, dtype=np.int64)])
+            for signal in self._last_change:
+                self._last_change[signal] = np.concatenate([self._last_change[signal], np.zeros(k)])
+            self._demand_sum = np.concatenate([self._demand_sum, np.zeros(k)])
+            self._demand_n = np.concatenate([self._demand_n, np.zeros(k, dtype=np.int64)])
+        return np.fromiter((self._index[n] for n in node_ids), dtype=np.int64, count=len(node_ids))
+
+    def _window(self, signal: str, codes: np.ndarray, count: np.ndarray, length: int) -> np.ndarray:
+        """[length x node]: gia tri moi nhat truoc, NaN khi node chua du buoc"""
+        lags = np.arange(length)[:, None]
+        slots = (count[None, :] - 1 - lags) % ROLLING_WINDOW
+        values = self._buffers[signal][slots, codes[None, :]]
+        values[lags >= count[None, :]] = np.nan
+        return _prep_rolling(values)
+
+    def _rolling_features(self, codes: np.ndarray, current: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Ghi buoc moi vao ring buffer va tinh cac feature phu thuoc lich su"""
+        count = self._count[codes]
+        slot = count % ROLLING_WINDOW
+        previous = {}
+        for signal in _SIGNALS:
+            prev = self._buffers[signal][(count - 1) % ROLLING_WINDOW, codes]
+            previous[signal] = np.where(count > 0, prev, np.nan)
+            self._buffers[signal][slot, codes] = current[signal]
+        count = count + 1
+        self._count[codes] = count
+
+        features = {}
+        with np.errstate(invalid='ignore'):
+            for signal in _SIGNALS:
+                change = current[signal] - previous[signal]
+                change[np.isnan(change)] = 0
+                features[f'{signal}_change'] = change
+            for signal in ('pressure', 'head'):
+                change = features[f'{signal}_change']
+                acceleration = np.where(count > 1, change - self._last_change[signal][codes], 0.0)
+                acceleration[np.isnan(acceleration)] = 0
+                features[f'{signal}_acceleration'] = acceleration
+                self._last_change[signal][codes] = change
+
+        # Node chua du mau: nan* canh bao 'All-NaN slice' / 'Degrees of freedom' -> bo qua
+        with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            for signal in _SIGNALS:
+                window = self._window(signal, codes, count, ROLLING_WINDOW)
+                low, high = np.nanmin(window, axis=0), np.nanmax(window, axis=0)
+                if signal != 'demand':
+                    for length in (3, ROLLING_WINDOW):
+                        part = window[:length]
+                        mean = np.nanmean(part, axis=0)
+                        # Cua so toan gia tri bang nhau -> chinh gia tri do (nhu roll_mean)
+                        part_low, part_high = np.nanmin(part, axis=0), np.nanmax(part, axis=0)
+                        features[f'{signal}_ma{length}'] = np.where(part_low == part_high, part_high, mean)
+                    features[f'{signal}_min_5'] = low
+                    features[f'{signal}_max_5'] = high
+                std = np.nanstd(window, axis=0, ddof=1)
+                # Cua so toan gia tri bang nhau -> 0 (nhu roll_var); < 2 mau -> fillna(0)
+                std[low == high] = 0.0
+                std[np.isnan(std)] = 0.0
+                features[f'{signal}_std_5'] = std
+
+            # demand_deviation: trung binh demand tu dau luong (expanding)
+            demand = current['demand']
+            seen = ~np.isnan(demand)
+            self._demand_sum[codes[seen]] += demand[seen]
+            self._demand_n[codes[seen]] += 1
+            n = self._demand_n[codes]
+            features['demand_deviation'] = demand - np.where(n > 0, self._demand_sum[codes] / n, np.nan)
+        return features
+
+    def update(self, timestamp: Any, node_ids: Sequence[str], pressure, head, demand,
+               feature_cols: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        Them mot buoc thoi gian va tra ve feature cua buoc do (mot dong moi node).
+
+        Args:
+            timestamp: Thoi diem cua buoc (giong cot timestamp cua detect_leaks)
+            node_ids: Node co du lieu o buoc nay (moi node toi da mot lan)
+            pressure, head, demand: Mang cung do dai node_ids
+            feature_cols: feature_cols cua bundle se cham diem (None -> FEATURE_SCHEMA, khong residual)
+        """
+        node_ids = [str(n) for n in node_ids]
+        if len(set(node_ids)) != len(node_ids):
+            raise ValueError("Each node may appear only once per timestep")
+        current = {
+            'pressure': np.asarray(pressure, dtype=np.float64),
+            'head': np.asarray(head, dtype=np.float64),
+            'demand': np.asarray(demand, dtype=np.float64),
+        }
+        if any(len(values) != len(node_ids) for values in current.values()):
+            raise ValueError("pressure/head/demand must have one value per node")
+
+        codes = self._node_codes(node_ids)
+        step = pd.DataFrame({
+            'node_id': node_ids, 'timestamp': timestamp, **current, 'scenario_id': 0,
+            **self._rolling_features(codes, current)
+        })
+        self.steps += 1
+        self.last_timestamp = timestamp
+
+        topology = self._topology_features()
+        return build_features(step, serving_features(feature_cols), topology_loader=lambda: topology,
+                              baseline_loader=self.service._load_baseline)
+
+    def score(self, timestamp: Any, nodes: Dict[str, Dict[str, float]], threshold: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Them mot buoc (nodes: node_id -> {pressure, head, demand}) va phat hien ro ri chi cho buoc do.
+
+        Ket qua cung dang voi detect_leaks (leaks loc bang cung quy tac).
+        """
+        bundle = self.service.models.get()
+        if bundle is None:
+            return {"success": False, "error": "Model not loaded", "leaks": [], "summary": {}}
+
+        started = time.perf_counter()
+        node_ids = list(nodes.keys())
+        with self._lock:
+            df_step = self.update(
+                timestamp, node_ids,
+                [nodes[n].get('pressure', 0) for n in node_ids],
+                [nodes[n].get('head', 0) for n in node_ids],
+                [nodes[n].get('demand', 0) for n in node_ids],
+                bundle.feature_cols,
+            )
+        if df_step.empty:
+            return {"success": False, "error": "No data provided", "leaks": [], "summary": {}}
+
+        X = select_features(df_step, bundle.feature_cols)
+        proba = self.service.predict_proba(bundle, X)
+        use_threshold = threshold if threshold is not None else bundle.threshold
+        df_step['leak_probability'] = proba
+        ranking, records_with_leaks = self.service._collect_leaks(df_step, bundle.reservoir_nodes, use_threshold)
+        leaks = ranking.to_leaks()
+
+        return {
+            "success": True,
+            "timestamp": timestamp,
+            "leaks": leaks,
+            "summary": {
+                "step": self.steps,
+                "nodes": len(df_step),
+                "detected_leaks": len(leaks),
+                "records_with_leaks": records_with_leaks,
+                "threshold_used": use_threshold,
+                "max_probability": float(proba.max()),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+        }
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "nodes": len(self.node_ids),
+            "steps": self.steps,
+            "last_timestamp": self.last_timestamp,
+            "window": ROLLING_WINDOW,
+        }
+
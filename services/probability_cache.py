@@ -0,0 +1,94 @@
+"""
+Cache ma tran xac suat da cham diem theo run cho leak detection
+
+Nguoi van hanh chinh threshold lien tuc tren UI: truoc day moi lan doi threshold la mot
+request /detect moi - feature engineering va predict_proba chay lai tren cung du lieu.
+Xac suat khong phu thuoc threshold, nen ScoredRun giu ket qua cham diem [node x thoi gian]
+(node_id, timestamp, pressure, head, demand, leak_probability) cua mot run; cac truy van
+threshold / min_probability / top_k / window chi loc va xep hang tren cac cot nay
+(services/leak_ranking.py), khong goi model.
+
+ProbabilityCache: LRU theo khoa run - run_id cua mo phong (simulate-and-detect) hoac
+hash noi dung du lieu dau vao (NodeArrays.digest) - toi da ``max_runs`` run. Run cham diem
+bang model khac (reload) khong duoc dung lai.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+SCORED_COLUMNS = ('node_id', 'timestamp', 'pressure', 'head', 'demand', 'leak_probability')
+
+
+class ScoredRun:
+    """Ket qua cham diem cua mot run (khong doi sau khi tao - nhieu truy van doc dong thoi)"""
+
+    def __init__(self, frame: pd.DataFrame, bundle: Any):
+        self.frame = frame[list(SCORED_COLUMNS)]
+        self.bundle = bundle
+        self.total_records = len(frame)
+        self.unique_nodes = int(frame['node_id'].nunique())
+        self.created = time.time()
+
+    @property
+    def probability(self):
+        return self.frame['leak_probability'].to_numpy()
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.frame.memory_usage(index=False, deep=False).sum())
+
+
+class ProbabilityCache:
+    """LRU run key -> ScoredRun (thread-safe)"""
+
+    def __init__(self, max_runs: int = 16):
+        self.max_runs = max_runs
+        self._runs: "OrderedDict[str, ScoredRun]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._runs)
+
+    def get(self, key: str, bundle: Any = None) -> Optional[ScoredRun]:
+        """ScoredRun cua key (danh dau vua dung); bundle khac model da cham diem -> None"""
+        with self._lock:
+            run = self._runs.get(key)
+            if run is not None and (bundle is None or run.bundle is bundle):
+                self._runs.move_to_end(key)
+                self.hits += 1
+                return run
+            self.misses += 1
+            return None
+
+    def put(self, key: str, run: ScoredRun):
+        if self.max_runs <= 0:
+            return
+        with self._lock:
+            self._runs[key] = run
+            self._runs.move_to_end(key)
+            while len(self._runs) > self.max_runs:
+                self._runs.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._runs.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            runs: List[Dict[str, Any]] = [{
+                "run_key": key,
+                "records": run.total_records,
+                "nodes": run.unique_nodes,
+                "bytes": run.nbytes,
+            } for key, run in reversed(self._runs.items())]
+            return {
+                "max_runs": self.max_runs,
+                "hits": self.hits,
+                "misses": self.misses,
+                "runs": runs,
+            }
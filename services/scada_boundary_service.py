@@ -3,6 +3,7 @@ Service để apply SCADA data làm boundary conditions cho WNTR simulation
 """
 import json
 from pathlib import Path
+from types import MappingProxyType
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 import wntr
@@ -10,6 +11,13 @@ import pandas as pd
 import numpy as np
 
 from utils.logger import logger
+from services.time_alignment import (
+    INTERPOLATION_MODES,
+    TimeSeriesAligner,
+    epoch_us_to_datetime,
+    nearest_grid_index,
+    simulation_epochs_us,
+)
 
 
 class SCADABoundaryService:
@@ -19,7 +27,11 @@ class SCADABoundaryService:
     
     def __init__(self):
         """Initialize SCADA boundary service"""
-        self.mapping_config = self._load_mapping_config()
+        # Chi doc sau khi load: dung chung giua cac request dong thoi, khong cho sua tai cho
+        self.mapping_config = MappingProxyType({
+            station_code: MappingProxyType(mapping)
+            for station_code, mapping in self._load_mapping_config().items()
+        })
         logger.info(f"Loaded SCADA boundary mapping for {len(self.mapping_config)} stations")
     
     def _load_mapping_config(self) -> Dict[str, Dict[str, Any]]:
@@ -39,6 +51,10 @@ class SCADABoundaryService:
             for station_code, station_info in scada_stations.items():
                 epanet_mapping = station_info.get('epanet_mapping', {})
                 if epanet_mapping:
+                    interpolation = epanet_mapping.get('interpolation', 'nearest')
+                    if interpolation not in INTERPOLATION_MODES:
+                        logger.warning(f"Unknown interpolation '{interpolation}' for station {station_code} - using 'nearest'")
+                        interpolation = 'nearest'
                     mapping[station_code] = {
                         'epanet_node': epanet_mapping.get('epanet_node'),
                         'node_type': epanet_mapping.get('node_type', 'unknown'),
@@ -46,6 +62,8 @@ class SCADABoundaryService:
                         'apply_flow': epanet_mapping.get('apply_flow', False),
                         'pressure_type': epanet_mapping.get('pressure_type', 'absolute'),  # Fix: Load pressure_type
                         'elevation': epanet_mapping.get('elevation', 0.0),  # Fix: Load elevation
+                        'interpolation': interpolation,  # nearest | linear | step
+                        'max_gap_hours': epanet_mapping.get('max_gap_hours', 24),
                         'description': epanet_mapping.get('description', '')
                     }
                     logger.info(f"Mapped SCADA station {station_code} -> EPANET {epanet_mapping.get('node_type')} {epanet_mapping.get('epanet_node')}")
@@ -181,34 +199,15 @@ class SCADABoundaryService:
                 logger.info(f"Reservoir {epanet_node}: apply_pressure_as_head is False - skipping")
                 return False
             
-            # Build time-series từ SCADA data
-            # Tạo time index cho simulation
-            time_steps = []
-            head_values = []
+            # Build time-series từ SCADA data: epoch đã sort + binary search
+            # (thay cho vòng quét O(steps x records))
+            interpolation = mapping.get('interpolation', 'nearest')
+            max_gap_hours = mapping.get('max_gap_hours', 24)
+            aligner, n_unparsed = TimeSeriesAligner.from_records(boundary_records, 'pressure')
+            if n_unparsed:
+                logger.warning(f"Skipped {n_unparsed} SCADA record(s) with unparseable timestamps for {epanet_node}")
             
-            # Parse timestamps từ SCADA records
-            scada_times = []
-            scada_pressures = []
-            
-            for record in boundary_records:
-                timestamp_str = record.get('timestamp')
-                pressure = record.get('pressure')
-                
-                if timestamp_str and pressure is not None:
-                    try:
-                        # Parse timestamp (format: "2025-01-15 10:00" hoặc ISO format)
-                        if 'T' in timestamp_str:
-                            dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                        else:
-                            dt = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M")
-                        
-                        scada_times.append(dt)
-                        scada_pressures.append(float(pressure))
-                    except Exception as e:
-                        logger.warning(f"Error parsing timestamp {timestamp_str}: {e}")
-                        continue
-            
-            if not scada_times:
+            if len(aligner) == 0:
                 logger.warning(f"No valid SCADA data with timestamps for reservoir {epanet_node}")
                 # Fallback: dùng giá trị đầu tiên với proper conversion
                 if boundary_records:
@@ -237,76 +236,45 @@ class SCADABoundaryService:
             # Tạo time-series cho simulation
             # Fix: Sync simulation time với SCADA data time
             if simulation_start_time is None:
-                # Nếu không có simulation_start_time, dùng timestamp từ SCADA data đầu tiên
-                if scada_times:
-                    simulation_start = scada_times[0].replace(minute=0, second=0, microsecond=0)
-                else:
-                    # Fallback: dùng thời gian hiện tại
-                    simulation_start = datetime.now().replace(minute=0, second=0, microsecond=0)
+                # Nếu không có simulation_start_time, dùng timestamp SCADA sớm nhất
+                simulation_start = epoch_us_to_datetime(aligner.epochs_us[0]).replace(minute=0, second=0, microsecond=0)
             else:
                 simulation_start = simulation_start_time.replace(minute=0, second=0, microsecond=0)
             
-            simulation_times = []
-            simulation_heads = []
+            # Time steps cho simulation (mỗi hydraulic_timestep)
+            sim_epochs = simulation_epochs_us(
+                simulation_start, simulation_duration_hours, hydraulic_timestep_hours
+            )
+            pressures, valid, gaps = aligner.align(
+                sim_epochs, mode=interpolation, max_gap_seconds=max_gap_hours * 3600
+            )
             
-            # Tạo time steps cho simulation (mỗi hydraulic_timestep)
-            for hour in range(0, simulation_duration_hours + 1, hydraulic_timestep_hours):
-                sim_time = simulation_start + timedelta(hours=hour)
-                simulation_times.append(hour * 3600)  # Convert to seconds
-                
-                # Tìm SCADA data gần nhất với thời gian này
-                closest_pressure = None
-                min_time_diff = float('inf')
-                
-                for scada_time, scada_pressure in zip(scada_times, scada_pressures):
-                    time_diff = abs((scada_time - sim_time).total_seconds())
-                    if time_diff < min_time_diff:
-                        min_time_diff = time_diff
-                        closest_pressure = scada_pressure
-                
-                if closest_pressure is not None:
-                    # Fix: Validate pressure value và time difference
-                    pressure_value = float(closest_pressure)
-                    
-                    # Validate time difference (max 24 hours)
-                    max_time_diff_hours = 24
-                    if min_time_diff > max_time_diff_hours * 3600:
-                        logger.warning(f"SCADA data too old for {epanet_node} at {sim_time} (diff: {min_time_diff/3600:.1f}h) - using current head")
-                        current_head = node.base_head if hasattr(node, 'base_head') else 0.0
-                        simulation_heads.append(current_head)
-                    # Validate pressure value range
-                    elif pressure_value < 0:
-                        logger.warning(f"Invalid pressure value {pressure_value}m for {epanet_node} at {sim_time} - using current head")
-                        current_head = node.base_head if hasattr(node, 'base_head') else 0.0
-                        simulation_heads.append(current_head)
-                    elif pressure_value > 1000:  # Reasonable max head (1000m)
-                        logger.warning(f"Suspiciously high pressure value {pressure_value}m for {epanet_node} at {sim_time} - using current head")
-                        current_head = node.base_head if hasattr(node, 'base_head') else 0.0
-                        simulation_heads.append(current_head)
-                    else:
-                        # Fix: Apply pressure as head với proper conversion
-                        # Load pressure_type và elevation từ mapping (đã load từ config)
-                        pressure_type = mapping.get('pressure_type', 'absolute')  # Default: absolute
-                        if pressure_type == 'gauge':
-                            # Gauge pressure: Head = Elevation + Pressure
-                            # Elevation là giá trị CỐ ĐỊNH từ file .inp (base_head ban đầu)
-                            # SCADA P1 là giá trị ĐỘNG (thay đổi theo thời gian)
-                            elevation = initial_base_head  # Lấy từ file .inp (cố định)
-                            head_value = elevation + pressure_value  # Head = Elevation (cố định) + Pressure (động)
-                            logger.info(f"[SCADA] Gauge pressure conversion for {epanet_node}:")
-                            logger.info(f"  Elevation (from .inp): {elevation:.2f}m (CỐ ĐỊNH)")
-                            logger.info(f"  SCADA P1 (gauge): {pressure_value:.2f}m (ĐỘNG)")
-                            logger.info(f"  Absolute Head: {head_value:.2f}m = {elevation:.2f}m + {pressure_value:.2f}m")
-                        else:
-                            # Absolute head: dùng trực tiếp (SCADA pressure đã là absolute head)
-                            head_value = pressure_value
-                            logger.info(f"[SCADA] Using absolute head {head_value:.2f}m directly from SCADA pressure for {epanet_node}")
-                        
-                        simulation_heads.append(head_value)
-                else:
-                    # Nếu không có data, dùng giá trị hiện tại
-                    current_head = node.base_head if hasattr(node, 'base_head') else 0.0
-                    simulation_heads.append(current_head)
+            # Validate: quá max_gap hoặc ngoài khoảng hợp lý (0 - 1000m) -> giữ head hiện tại
+            in_range = valid & (pressures >= 0) & (pressures <= 1000)
+            current_head = node.base_head if hasattr(node, 'base_head') else 0.0
+            
+            # Fix: Apply pressure as head với proper conversion
+            pressure_type = mapping.get('pressure_type', 'absolute')  # Default: absolute
+            if pressure_type == 'gauge':
+                # Gauge pressure: Head = Elevation (CỐ ĐỊNH, base_head từ file .inp) + Pressure (ĐỘNG)
+                scada_heads = initial_base_head + pressures
+            else:
+                # Absolute head: dùng trực tiếp (SCADA pressure đã là absolute head)
+                scada_heads = pressures
+            simulation_heads = np.where(in_range, scada_heads, current_head).tolist()
+            
+            n_too_old = int((~valid).sum())
+            n_out_of_range = int((valid & ~in_range).sum())
+            logger.info(
+                f"[SCADA] Aligned {len(aligner)} SCADA samples to {len(simulation_heads)} steps "
+                f"(mode={interpolation}, max_gap={max_gap_hours}h, pressure_type={pressure_type}, "
+                f"elevation={initial_base_head:.2f}m, "
+                f"max gap used={(gaps[valid].max() / 3600 if valid.any() else float('nan')):.2f}h)"
+            )
+            if n_too_old:
+                logger.warning(f"SCADA data too far (> {max_gap_hours}h) for {epanet_node} at {n_too_old} step(s) - using current head")
+            if n_out_of_range:
+                logger.warning(f"Invalid pressure value (< 0 or > 1000m) for {epanet_node} at {n_out_of_range} step(s) - using current head")
             
             # Fix: Apply time-series head sử dụng WNTR Pattern
             if len(simulation_heads) > 1:
@@ -347,14 +315,12 @@ class SCADABoundaryService:
                     if abs(pattern_timestep_hours - hydraulic_timestep_hours) > 0.01:
                         # Resample: tạo multipliers cho mỗi pattern timestep
                         num_pattern_steps = int(simulation_duration_hours / pattern_timestep_hours) + 1
-                        resampled_multipliers = []
-                        for i in range(num_pattern_steps):
-                            pattern_time_hours = i * pattern_timestep_hours
-                            # Tìm multiplier gần nhất
-                            closest_idx = min(range(len(simulation_heads)), 
-                                             key=lambda j: abs(j * hydraulic_timestep_hours - pattern_time_hours))
-                            resampled_multipliers.append(multipliers[closest_idx])
-                        multipliers = resampled_multipliers
+                        pattern_times_hours = np.arange(num_pattern_steps) * pattern_timestep_hours
+                        # Tìm multiplier gần nhất (binary search trên lưới hydraulic timestep)
+                        closest_idx = nearest_grid_index(
+                            hydraulic_timestep_hours, len(simulation_heads), pattern_times_hours
+                        )
+                        multipliers = [multipliers[j] for j in closest_idx]
                     
                     # Add pattern vào WNTR
                     wn.add_pattern(pattern_name, multipliers)
@@ -0,0 +1,128 @@
+"""
+Kho du lieu SCADA cuc bo (khong goi API that)
+
+Doc cac file da ghi bang ``scripts/scada_replay_server.py record``: moi tram la file
+``<stationCode>.json`` (response nguyen ban cua API ``{"code": 200, "data": [...]}`` hoac chi
+mang ``data``), hoac thu muc ``<stationCode>/`` chua nhieu file nhu vay (vd moi thang mot file
+khi ghi nhieu thang). Khac RecordedStationSource cua replay server (lap lai ban ghi theo chu
+ky), kho nay tra dung du lieu trong khoang thoi gian duoc hoi - dung cho backtest lich su.
+
+LocalSCADAStore.get_station_data_by_hour co cung ket qua voi SCADAService.get_station_data_by_hour,
+nen SCADAService(store=...) dung nguyen parse_scada_data / convert_to_epanet_format.
+"""
+import bisect
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.logger import logger
+
+TIME_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M")
+
+
+def parse_time(value: Any) -> datetime:
+    """Parse thoi gian theo cac format API SCADA dung (fromDate/toDate/transferTime)"""
+    if isinstance(value, datetime):
+        return value
+    value = str(value).strip()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return datetime.fromisoformat(value)
+
+
+class LocalSCADAStore:
+    """Du lieu SCADA da ghi, truy van theo tram va khoang thoi gian"""
+
+    def __init__(self, store_dir: str):
+        self.store_dir = Path(store_dir)
+        if not self.store_dir.is_dir():
+            raise FileNotFoundError(f"Khong tim thay thu muc du lieu SCADA: {store_dir}")
+        # station_code -> (thoi gian da sort, items cung thu tu); nap lan dau khi can
+        self._series: Dict[str, Tuple[List[datetime], List[Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def stations(self) -> List[str]:
+        codes = {p.stem for p in self.store_dir.glob("*.json")}
+        codes.update(p.name for p in self.store_dir.iterdir() if p.is_dir())
+        return sorted(codes)
+
+    def _files(self, station_code: str) -> List[Path]:
+        files = []
+        single = self.store_dir / f"{station_code}.json"
+        if single.is_file():
+            files.append(single)
+        folder = self.store_dir / station_code
+        if folder.is_dir():
+            files.extend(sorted(folder.glob("*.json")))
+        return files
+
+    def _load(self, station_code: str) -> Tuple[List[datetime], List[Dict[str, Any]]]:
+        with self._lock:
+            series = self._series.get(station_code)
+            if series is not None:
+                return series
+
+            rows = []
+            skipped = 0
+            for path in self._files(station_code):
+                with open(path, "r", encoding="utf-8") as f:
+                    payload = json.load(f)
+                items = payload.get("data", []) if isinstance(payload, dict) else payload
+                for item in items or []:
+                    try:
+                        rows.append((parse_time(item["transferTime"]), item))
+                    except (KeyError, TypeError, ValueError):
+                        skipped += 1
+            if skipped:
+                logger.warning(f"Skipped {skipped} stored SCADA item(s) without valid transferTime for {station_code}")
+            rows.sort(key=lambda row: row[0])
+            series = ([ts for ts, _ in rows], [item for _, item in rows])
+            self._series[station_code] = series
+            return series
+
+    def date_range(self, station_codes: Optional[List[str]] = None) -> Optional[Tuple[datetime, datetime]]:
+        """Thoi gian som nhat / muon nhat co du lieu (None neu kho trong)"""
+        bounds = []
+        for code in station_codes or self.stations:
+            times, _ = self._load(code)
+            if times:
+                bounds.append((times[0], times[-1]))
+        if not bounds:
+            return None
+        return min(b[0] for b in bounds), max(b[1] for b in bounds)
+
+    def get_items(self, station_code: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Cac item co transferTime trong [start, end], theo thu tu thoi gian"""
+        times, items = self._load(station_code)
+        lo = bisect.bisect_left(times, start)
+        hi = bisect.bisect_right(times, end)
+        return items[lo:hi]
+
+    def get_station_data_by_hour(self, station_code: str, from_date: str, to_date: str) -> Dict[str, Any]:
+        """Cung format voi SCADAService.get_station_data_by_hour (data = response API)"""
+        try:
+            start, end = parse_time(from_date), parse_time(to_date)
+        except ValueError as e:
+            return {"success": False, "error": "Exception", "message": str(e)}
+
+        if not self._files(station_code):
+            return {
+                "success": False,
+                "error": "Not found",
+                "message": f"Khong co du lieu da ghi cho tram {station_code}"
+            }
+
+        items = self.get_items(station_code, start, end)
+        return {
+            "success": True,
+            "data": {"code": 200, "message": "success", "data": items},
+            "station_code": station_code,
+            "from_date": from_date,
+            "to_date": to_date
+        }
@@ -0,0 +1,254 @@
+"""
+Time alignment engine - can chinh chuoi SCADA theo moc thoi gian simulation
+
+Thay cho viec quet toan bo records cho moi buoc simulation (O(steps x records)),
+thoi gian SCADA duoc chuyen thanh mang epoch da sap xep va tim bang binary search
+(np.searchsorted), nen cua so SCADA nhieu tuan, do phan giai phut van la
+O((steps + records) log records).
+
+Cac mode:
+    - nearest: mau gan nhat (hoa -> mau som hon, trung moc -> mau dau tien trong input)
+    - linear:  noi suy tuyen tinh giua 2 mau bao quanh
+    - step:    giu gia tri mau gan nhat truoc do (zero-order hold)
+
+Max-gap policy: moc simulation chi hop le khi du lieu du gan (xem ``TimeSeriesAligner.align``).
+Moc khong hop le duoc danh dau trong ``valid`` de caller tu quyet dinh fallback.
+"""
+from datetime import datetime
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+INTERPOLATION_MODES = ("nearest", "linear", "step")
+
+# Format timestamp SCADA thuong gap - fast path khi parse vectorized
+SCADA_TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+_US_PER_SECOND = 1_000_000
+
+
+def _naive(dt: datetime) -> datetime:
+    """Bo tzinfo de so sanh duoc voi moc simulation (naive, gio dia phuong)"""
+    return dt.replace(tzinfo=None) if dt.tzinfo is not None else dt
+
+
+def parse_timestamp(value) -> datetime:
+    """Parse mot timestamp SCADA ("2025-01-15 10:00" hoac ISO format)"""
+    if isinstance(value, datetime):
+        return _naive(value)
+    value = str(value)
+    if 'T' in value:
+        return _naive(datetime.fromisoformat(value.replace('Z', '+00:00')))
+    return datetime.strptime(value, SCADA_TIME_FORMAT)
+
+
+def to_epoch_us(timestamps: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Chuyen list timestamp (str/datetime) thanh mang epoch microseconds (int64).
+
+    Returns:
+        (epochs, ok): ``ok[i]`` = False neu timestamp thu i khong parse duoc
+        (epochs[i] khi do khong co nghia).
+    """
+    n = len(timestamps)
+    epochs = np.zeros(n, dtype=np.int64)
+    ok = np.zeros(n, dtype=bool)
+    if n == 0:
+        return epochs, ok
+
+    # Fast path: format chuan, parse vectorized
+    series = pd.Series(list(timestamps), dtype=object)
+    is_str = series.map(lambda v: isinstance(v, str)).to_numpy()
+    if is_str.any():
+        parsed = pd.to_datetime(series[is_str], format=SCADA_TIME_FORMAT, errors="coerce")
+        hit = parsed.notna().to_numpy()
+        idx = np.flatnonzero(is_str)[hit]
+        epochs[idx] = parsed[hit].to_numpy(dtype="datetime64[us]").astype(np.int64)
+        ok[idx] = True
+
+    # Slow path: ISO/datetime/format khac
+    for i in np.flatnonzero(~ok):
+        value = timestamps[i]
+        if value is None or value == "":
+            continue
+        try:
+            dt = parse_timestamp(value)
+        except (TypeError, ValueError):
+            continue
+        epochs[i] = np.datetime64(dt, "us").astype(np.int64)
+        ok[i] = True
+
+    return epochs, ok
+
+
+def datetime_to_epoch_us(dt: datetime) -> int:
+    """Epoch microseconds cua mot datetime (naive)"""
+    return int(np.datetime64(_naive(dt), "us").astype(np.int64))
+
+
+def epoch_us_to_datetime(epoch_us: int) -> datetime:
+    """Nguoc lai cua ``datetime_to_epoch_us``"""
+    return pd.Timestamp(int(epoch_us), unit="us").to_pydatetime()
+
+
+class TimeSeriesAligner:
+    """
+    Chuoi (time, value) da sap xep, dung de can chinh theo nhieu moc thoi gian cung luc.
+
+    Args:
+        epochs_us: Thoi gian mau (epoch microseconds), khong can sap xep truoc
+        values: Gia tri mau; mau NaN bi bo qua
+    """
+
+    def __init__(self, epochs_us: Iterable[int], values: Iterable[float]):
+        epochs_us = np.asarray(epochs_us, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if epochs_us.shape != values.shape:
+            raise ValueError("epochs_us va values phai cung kich thuoc")
+
+        keep = ~np.isnan(values)
+        epochs_us = epochs_us[keep]
+        values = values[keep]
+
+        # Stable sort: cac mau trung moc giu thu tu input
+        order = np.argsort(epochs_us, kind="stable")
+        self.epochs_us = epochs_us[order]
+        self.values = values[order]
+
+    def __len__(self) -> int:
+        return len(self.epochs_us)
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Sequence[dict],
+        value_key: str,
+        time_key: str = "timestamp"
+    ) -> Tuple["TimeSeriesAligner", int]:
+        """
+        Tao aligner tu list records SCADA (vd: output cua SCADAService.convert_to_epanet_format).
+
+        Returns:
+            (aligner, n_invalid): n_invalid = so record co value nhung timestamp khong parse duoc
+        """
+        times = []
+        values = []
+        for record in records:
+            value = record.get(value_key)
+            timestamp = record.get(time_key)
+            if timestamp and value is not None:
+                try:
+                    values.append(float(value))
+                except (TypeError, ValueError):
+                    continue
+                times.append(timestamp)
+
+        epochs, ok = to_epoch_us(times)
+        values = np.asarray(values, dtype=np.float64)
+        return cls(epochs[ok], values[ok]), int((~ok).sum())
+
+    def _first_of_ties(self, idx: np.ndarray) -> np.ndarray:
+        """Voi cac mau trung moc, tra ve chi so mau dau tien (theo thu tu input)"""
+        return np.searchsorted(self.epochs_us, self.epochs_us[idx], side="left")
+
+    def align(
+        self,
+        target_epochs_us: Iterable[int],
+        mode: str = "nearest",
+        max_gap_seconds: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Can chinh gia tri theo cac moc thoi gian target.
+
+        Max-gap policy (max_gap_seconds=None -> khong gioi han):
+            - nearest: hop le neu |t - mau gan nhat| <= max_gap
+            - step:    hop le neu co mau truoc do va t - mau truoc <= max_gap
+            - linear:  noi suy khi t nam giua 2 mau cach nhau <= max_gap;
+                       ngoai khoang du lieu hoac khoang trong qua lon -> nhu nearest
+
+        Returns:
+            (values, valid, gap_seconds): values[i] = NaN khi khong hop le,
+            gap_seconds[i] = khoang cach toi mau duoc dung (inf neu khong co mau)
+        """
+        if mode not in INTERPOLATION_MODES:
+            raise ValueError(f"Unknown interpolation mode '{mode}' - expected one of {INTERPOLATION_MODES}")
+
+        targets = np.asarray(target_epochs_us, dtype=np.int64)
+        n = len(targets)
+        out = np.full(n, np.nan)
+        gap = np.full(n, np.inf)
+        if n == 0 or len(self) == 0:
+            return out, np.zeros(n, dtype=bool), gap
+
+        times = self.epochs_us
+        last = len(times) - 1
+        limit_us = np.inf if max_gap_seconds is None else max_gap_seconds * _US_PER_SECOND
+
+        # pos: mau dau tien >= t ; pos - 1: mau cuoi cung < t
+        pos = np.searchsorted(times, targets, side="left")
+        right = np.minimum(pos, last)
+        left = self._first_of_ties(np.maximum(pos - 1, 0))
+        has_left = pos > 0
+        has_right = pos <= last
+
+        d_left = np.where(has_left, targets - times[left], np.iinfo(np.int64).max)
+        d_right = np.where(has_right, times[right] - targets, np.iinfo(np.int64).max)
+
+        if mode == "step":
+            # Mau cuoi cung <= t (ca mau trung moc t)
+            exact = has_right & (d_right == 0)
+            idx = np.where(exact, right, left)
+            dist = np.where(exact, 0, d_left)
+            valid = (exact | has_left) & (dist <= limit_us)
+            out[valid] = self.values[idx[valid]]
+            gap[valid] = dist[valid] / _US_PER_SECOND
+            return out, valid, gap
+
+        # Nearest: hoa -> mau som hon (giong vong quet cu voi records sap xep)
+        use_left = d_left <= d_right
+        idx = np.where(use_left, left, right)
+        dist = np.minimum(d_left, d_right)
+        valid = dist <= limit_us
+        out[valid] = self.values[idx[valid]]
+        gap[valid] = dist[valid] / _US_PER_SECOND
+
+        if mode == "linear":
+            span = d_left.astype(np.float64) + d_right.astype(np.float64)
+            inner = has_left & has_right & (d_right > 0) & (span <= limit_us)
+            if inner.any():
+                w = d_left[inner] / span[inner]
+                v0 = self.values[left[inner]]
+                v1 = self.values[right[inner]]
+                out[inner] = v0 + (v1 - v0) * w
+                gap[inner] = np.minimum(d_left[inner], d_right[inner]) / _US_PER_SECOND
+                valid = valid | inner
+
+        return out, valid, gap
+
+
+def nearest_grid_index(grid_step: float, grid_size: int, targets: Iterable[float]) -> np.ndarray:
+    """
+    Chi so diem luoi deu (0, step, 2*step, ...) gan nhat voi moi target (hoa -> chi so nho hon).
+
+    Tuong duong ``min(range(grid_size), key=lambda j: abs(j * grid_step - t))`` nhung vectorized.
+    """
+    targets = np.asarray(targets, dtype=np.float64)
+    if grid_size <= 0:
+        raise ValueError("grid_size phai > 0")
+    if grid_step <= 0:
+        return np.zeros(len(targets), dtype=np.int64)
+
+    grid = np.arange(grid_size, dtype=np.float64) * grid_step
+    pos = np.searchsorted(grid, targets, side="left")
+    right = np.minimum(pos, grid_size - 1)
+    left = np.maximum(pos - 1, 0)
+    d_left = np.abs(grid[left] - targets)
+    d_right = np.abs(grid[right] - targets)
+    return np.where(d_left <= d_right, left, right).astype(np.int64)
+
+
+def simulation_epochs_us(start: datetime, duration_hours: int, timestep_hours: int) -> np.ndarray:
+    """Moc thoi gian simulation (epoch us): start, start + timestep, ..., start + duration"""
+    hours = np.arange(0, duration_hours + 1, timestep_hours, dtype=np.int64)
+    return datetime_to_epoch_us(start) + hours * 3600 * _US_PER_SECOND
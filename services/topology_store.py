@@ -0,0 +1,239 @@
+"""
+Topology features tinh san theo node cho feature pipeline
+
+Truoc day moi request: load_topology doc lai network_topology.csv (iterrows de dung
+neighbor_map), _add_topology_features tinh lai node_degree (apply) roi merge theo node_id
+dang chuoi. TopologyFeatures bien dich mot lan:
+    - index: thu tu node cua mang (file .inp), node chi co trong CSV noi vao cuoi;
+    - STATIC_FEATURES -> mang NumPy [node] (node_degree int32, node_betweenness /
+      node_elevation float32) theo thu tu index;
+    - neighbor_map cho neighbor features (services/neighbor_features.py).
+Moi request: ma node (get_indexer tren cac node_id khac nhau) roi gather mot lan.
+TopologyFeatureStore giu ban bien dich, bien dich lai khi CSV hoac .inp thay doi (mtime/size).
+
+Gia tri lay tu cot CSV cua scripts/extract_network_topology.py (degree,
+betweenness_centrality, elevation - nhu dataset training) hoac node_degree /
+node_betweenness / node_elevation; CSV khong co cot -> tu .inp (degree = so node ke
+khac nhau, elevation cua junction/tank), khong co nua -> 0.
+"""
+import threading
+import warnings
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import logger
+
+DEFAULT_TOPOLOGY_FILE = "dataset/network_topology.csv"
+
+# feature -> (cot CSV theo thu tu uu tien, dtype); _neighbor_count = so phan tu cua chuoi
+# neighbors (cach tinh node_degree truoc day)
+STATIC_FEATURES: Dict[str, Tuple[Tuple[str, ...], type]] = {
+    'node_degree': (('node_degree', 'degree', '_neighbor_count'), np.int32),
+    'node_betweenness': (('node_betweenness', 'betweenness_centrality'), np.float32),
+    'node_elevation': (('node_elevation', 'elevation'), np.float32),
+}
+
+Fingerprint = Tuple[Tuple[str, int, int], ...]
+
+
+def load_topology(topology_file: str = DEFAULT_TOPOLOGY_FILE) -> Tuple[Dict[str, List[str]], Optional[pd.DataFrame]]:
+    """Load topology (neighbor_map, topology_df) tu network_topology.csv neu co"""
+    topology_file = Path(topology_file)
+    neighbor_map = {}
+    topology_df = None
+
+    if topology_file.exists():
+        try:
+            topology_df = pd.read_csv(topology_file)
+            logger.info(f"[OK] Topology loaded: {len(topology_df)} nodes")
+
+            # Build neighbor map from topology
+            # Format 1: node_id, neighbors (comma-separated string)
+            if 'neighbors' in topology_df.columns and 'node_id' in topology_df.columns:
+                for _, row in topology_df.iterrows():
+                    node_id = str(row['node_id'])
+                    neighbors_str = str(row['neighbors']) if pd.notna(row['neighbors']) else ''
+                    if neighbors_str and neighbors_str != 'nan':
+                        neighbors = [n.strip() for n in neighbors_str.split(',') if n.strip()]
+                        neighbor_map[node_id] = neighbors
+                        # Also add reverse connections
+                        for neighbor in neighbors:
+                            if neighbor not in neighbor_map:
+                                neighbor_map[neighbor] = []
+                            if node_id not in neighbor_map[neighbor]:
+                                neighbor_map[neighbor].append(node_id)
+            # Format 2: from_node, to_node (edge list)
+            elif 'from_node' in topology_df.columns and 'to_node' in topology_df.columns:
+                for _, row in topology_df.iterrows():
+                    from_node = str(row['from_node'])
+                    to_node = str(row['to_node'])
+                    if from_node not in neighbor_map:
+                        neighbor_map[from_node] = []
+                    if to_node not in neighbor_map:
+                        neighbor_map[to_node] = []
+                    if to_node not in neighbor_map[from_node]:
+                        neighbor_map[from_node].append(to_node)
+                    if from_node not in neighbor_map[to_node]:
+                        neighbor_map[to_node].append(from_node)
+        except Exception as e:
+            logger.warning(f"Error loading topology: {e}")
+    else:
+        logger.warning(f"Topology file not found: {topology_file}")
+
+    return neighbor_map, topology_df
+
+
+def load_inp_nodes(inp_file: str) -> Optional[pd.DataFrame]:
+    """Node cua file .inp theo thu tu mang: node_id, degree (so node ke khac nhau), elevation"""
+    if not Path(inp_file).exists():
+        return None
+    try:
+        # Import khi can: worker khong dung .inp khong phai nap wntr
+        import wntr
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            wn = wntr.network.WaterNetworkModel(str(inp_file))
+    except ImportError:
+        return None
+    except Exception as e:
+        logger.warning(f"Error reading network nodes from {inp_file}: {e}")
+        return None
+    adjacent = {name: set() for name in wn.node_name_list}
+    for _, link in wn.links():
+        if link.start_node_name != link.end_node_name:
+            adjacent[link.start_node_name].add(link.end_node_name)
+            adjacent[link.end_node_name].add(link.start_node_name)
+    return pd.DataFrame({
+        'node_id': [str(name) for name in wn.node_name_list],
+        'degree': [len(adjacent[name]) for name in wn.node_name_list],
+        'elevation': [getattr(wn.get_node(name), 'elevation', 0.0) for name in wn.node_name_list],
+    })
+
+
+def _first_column(df: Optional[pd.DataFrame], columns: Tuple[str, ...]) -> Optional[str]:
+    if df is None:
+        return None
+    return next((c for c in columns if c in df.columns), None)
+
+
+class TopologyFeatures:
+    """
+    Topology da bien dich (khong doi sau khi tao).
+
+    Args:
+        index: node_id (chuoi) -> vi tri trong cac mang
+        attributes: STATIC_FEATURES -> mang [node]
+        neighbor_map: node_id -> danh sach node ke
+    """
+
+    def __init__(self, index: pd.Index, attributes: Dict[str, np.ndarray], neighbor_map: Dict[str, List[str]],
+                 fingerprint: Fingerprint = ()):
+        self.index = index
+        self.attributes = attributes
+        self.neighbor_map = neighbor_map
+        self.fingerprint = fingerprint
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.index)
+
+    @classmethod
+    def from_frames(cls, neighbor_map: Dict[str, List[str]], topology_df: Optional[pd.DataFrame],
+                    inp_nodes: Optional[pd.DataFrame] = None, fingerprint: Fingerprint = ()) -> "TopologyFeatures":
+        """Bien dich tu (neighbor_map, topology_df) cua load_topology va node cua .inp (neu co)"""
+        if topology_df is not None and 'node_id' not in topology_df.columns:
+            topology_df = None
+        if topology_df is not None and 'neighbors' in topology_df.columns:
+            topology_df = topology_df.assign(_neighbor_count=topology_df['neighbors'].apply(
+                lambda x: len(str(x).split(',')) if pd.notna(x) and str(x) != 'nan' else 0
+            ))
+        order = list(inp_nodes['node_id']) if inp_nodes is not None else []
+        csv_ids = topology_df['node_id'].astype(str).to_numpy() if topology_df is not None else np.array([], dtype=object)
+        known = set(order)
+        order.extend(n for n in pd.unique(csv_ids) if n not in known)
+        index = pd.Index(order, dtype=object)
+
+        attributes = {}
+        for name, (columns, dtype) in STATIC_FEATURES.items():
+            values = np.zeros(len(index), dtype=dtype)
+            source, ids = topology_df, csv_ids
+            column = _first_column(topology_df, columns)
+            if column is None:
+                # CSV khong co cot nay -> gia tri tu .inp
+                source = inp_nodes
+                ids = inp_nodes['node_id'].to_numpy() if inp_nodes is not None else None
+                column = _first_column(inp_nodes, columns)
+            if column is not None:
+                positions = index.get_indexer(ids)
+                # Node trung lap trong CSV: dong dau tien (ghi nguoc de dong dau ghi sau cung)
+                values[positions[::-1]] = source[column].fillna(0).to_numpy()[::-1].astype(dtype)
+            attributes[name] = values
+        return cls(index, attributes, neighbor_map, fingerprint)
+
+    def gather(self, node_keys: pd.Series) -> Dict[str, np.ndarray]:
+        """STATIC_FEATURES cho moi dong (node_keys: node_id dang chuoi); node la -> 0"""
+        codes, uniques = pd.factorize(node_keys)
+        positions = self.index.get_indexer(uniques)[codes]
+        found = (codes >= 0) & (positions >= 0)
+        out = {}
+        for name, values in self.attributes.items():
+            column = np.zeros(len(codes), dtype=values.dtype)
+            column[found] = values[positions[found]]
+            out[name] = column
+        return out
+
+
+EMPTY_TOPOLOGY = TopologyFeatures(pd.Index([], dtype=object), {}, {})
+
+
+def as_topology_features(topology) -> TopologyFeatures:
+    """TopologyFeatures tu gia tri cua topology_loader (TopologyFeatures, (neighbor_map, topology_df) hoac None)"""
+    if topology is None:
+        return EMPTY_TOPOLOGY
+    if isinstance(topology, TopologyFeatures):
+        return topology
+    neighbor_map, topology_df = topology
+    return TopologyFeatures.from_frames(neighbor_map, topology_df)
+
+
+def _fingerprint(paths: Tuple[Path, ...]) -> Fingerprint:
+    entries = []
+    for path in paths:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
+
+
+class TopologyFeatureStore:
+    """TopologyFeatures hien tai; bien dich lan dau khi dung va lai khi CSV / .inp thay doi"""
+
+    def __init__(self, topology_file: str = DEFAULT_TOPOLOGY_FILE, inp_file: Optional[str] = None):
+        self.topology_file = Path(topology_file)
+        self.inp_file = Path(inp_file) if inp_file else None
+        self._paths = (self.topology_file,) + ((self.inp_file,) if self.inp_file else ())
+        self._current: Optional[TopologyFeatures] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> TopologyFeatures:
+        fingerprint = _fingerprint(self._paths)
+        current = self._current
+        if current is not None and current.fingerprint == fingerprint:
+            return current
+        with self._lock:
+            if self._current is None or self._current.fingerprint != fingerprint:
+                self._current = self._compile(fingerprint)
+            return self._current
+
+    def _compile(self, fingerprint: Fingerprint) -> TopologyFeatures:
+        neighbor_map, topology_df = load_topology(str(self.topology_file))
+        inp_nodes = load_inp_nodes(str(self.inp_file)) if self.inp_file else None
+        topology = TopologyFeatures.from_frames(neighbor_map, topology_df, inp_nodes, fingerprint)
+        logger.info(f"[OK] Topology features compiled: {topology.n_nodes} nodes, "
+                    f"{len(topology.neighbor_map)} with neighbors")
+        return topology
@@ -0,0 +1,138 @@
+"""
+Khoi dong nong (warmup) cac artifact dung chung truoc khi nhan request
+
+Moi buoc nap mot artifact ma request dau tien se can (mang da parse, topology features, model,
+bang baseline, tu dien chu ky ro ri); cac store deu cache theo fingerprint nen goi lai chi ton
+mot lan stat file.
+- uvicorn thuong: lifespan chay warm_up tren thread nen, GET /ready tra 503 cho den khi xong.
+- Prefork (core/prefork.py): master goi warm_up truoc khi fork -> worker nhan trang thai
+  da san sang va dung chung artifact voi master theo copy-on-write.
+Loi o mot buoc khong chan cac buoc khac: ghi vao errors. Process chi ready khi moi buoc bat buoc
+(REQUIRED_STEPS - vd model: thieu thi moi endpoint detect tra 503) thanh cong; loi o buoc tuy
+chon (vd tu dien chu ky) van ready, /ready liet ke buoc loi.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from utils.logger import logger
+
+
+def _network_template():
+    from services.epanet_service import epanet_service
+    epanet_service.template.payload()
+
+
+def _network_topology():
+    from services.network_parser import network_parser
+    network_parser.topology()
+
+
+def _topology_features():
+    from services.leak_detection_service import leak_detection_service
+    leak_detection_service.topology.get()
+
+
+def _leak_model():
+    from services.leak_detection_service import leak_detection_service
+    if leak_detection_service.models.get() is None:
+        raise RuntimeError(leak_detection_service.models.last_error or "No model loaded")
+
+
+def _leak_baseline():
+    # Giai truoc khoang head cau hinh: residuals() tren request path khong mo phong
+    from core.config import settings
+    from services.leak_detection_service import leak_detection_service
+    leak_detection_service.baseline.warm(settings.leak_baseline_head_min_m, settings.leak_baseline_head_max_m)
+
+
+def _leak_signatures():
+    # Tao tu dien chu ky (mo phong moi junction, process pool) neu chua co file cache
+    from services.leak_detection_service import leak_detection_service
+    leak_detection_service.signatures.table()
+
+
+WARMUP_STEPS: Dict[str, Callable[[], None]] = {
+    "network_template": _network_template,
+    "network_topology": _network_topology,
+    "topology_features": _topology_features,
+    "leak_model": _leak_model,
+    "leak_baseline": _leak_baseline,
+    "leak_signatures": _leak_signatures,
+}
+# leak_detection_api.py chay khong can WNTR: chi nap topology features va model
+LEAK_API_STEPS = ("topology_features", "leak_model")
+# Buoc loi -> process khong ready (neu buoc do duoc chay)
+REQUIRED_STEPS = frozenset(LEAK_API_STEPS)
+
+
+class WarmupState:
+    """Trang thai warmup cua process (ke thua qua fork: worker prefork bat dau voi trang thai cua master)"""
+
+    def __init__(self):
+        self.ready = False  # warmup xong va moi buoc bat buoc thanh cong
+        self.finished = False
+        self.running = False
+        self.pid: Optional[int] = None  # process da chay warmup
+        self.steps: Dict[str, float] = {}  # buoc -> thoi gian (ms)
+        self.errors: Dict[str, str] = {}
+        self.elapsed_ms: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def failed_steps(self) -> List[str]:
+        """Buoc bat buoc bi loi (ly do process khong ready)"""
+        return [name for name in self.errors if name in REQUIRED_STEPS]
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.ready:
+            status = "ready"
+        else:
+            status = "failed" if self.finished else "warming_up"
+        return {
+            "status": status,
+            "ready": self.ready,
+            "running": self.running,
+            "pid": os.getpid(),
+            "preforked": self.finished and self.pid != os.getpid(),
+            "elapsed_ms": self.elapsed_ms,
+            "steps": dict(self.steps),
+            "errors": dict(self.errors),
+            "failed_steps": self.failed_steps,
+        }
+
+
+warmup_state = WarmupState()
+
+
+def warm_up(steps: Sequence[str] = tuple(WARMUP_STEPS), state: WarmupState = warmup_state) -> WarmupState:
+    """Chay cac buoc warmup mot lan (goi lai khi da chay xong -> tra ve ngay)"""
+    unknown = [name for name in steps if name not in WARMUP_STEPS]
+    if unknown:
+        raise ValueError(f"Unknown warmup step(s): {', '.join(unknown)}")
+    with state._lock:
+        if state.finished:
+            return state
+        state.running = True
+        started = time.perf_counter()
+        try:
+            for name in steps:
+                step_started = time.perf_counter()
+                try:
+                    WARMUP_STEPS[name]()
+                except Exception as e:
+                    state.errors[name] = str(e)
+                    logger.warning(f"Warmup step {name} failed: {e}")
+                state.steps[name] = round((time.perf_counter() - step_started) * 1000, 1)
+        finally:
+            state.running = False
+        state.elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        state.pid = os.getpid()
+        state.finished = True
+        state.ready = not state.failed_steps
+        if state.ready:
+            logger.info(f"[OK] Warmup finished in {state.elapsed_ms:.0f} ms: {state.steps}")
+        else:
+            logger.error(f"Warmup failed - required step(s) {state.failed_steps} errored, /ready stays 503")
+        return state
@@ -0,0 +1,257 @@
+"""
+Test script de verify backtest lich su (services/backtest.py, services/scada_store.py):
+kho SCADA cuc bo khong goi API, pipeline SCADA -> mo phong -> detect theo ngay tren process pool,
+Parquet tung ngay, resume tu checkpoint
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import json
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from services.backtest import BacktestPipeline, BacktestRunner
+from services.scada_store import LocalSCADAStore
+
+STATION = "13085"
+FIRST_DAY = date(2025, 7, 1)
+
+
+class PressureModel:
+    """Xac suat tu pressure (cot dau) - xac dinh, khong can file model"""
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=float)
+        p = 1.0 / (1.0 + np.exp(-(X[:, 0] - 25.0) / 4.0))
+        return np.column_stack([1 - p, p])
+
+
+def _items(start: datetime, hours: int, base: float = 20.0):
+    return [{
+        "stationCode": STATION,
+        "transferTime": (start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M:%S"),
+        "parameterCode": "P1",
+        "parameterName": "Ap luc vao",
+        "value": base + (h % 24) / 4,
+        "unitCode": "m",
+    } for h in range(hours)]
+
+
+def _write_recordings(store_dir: Path):
+    """3 ngay du lieu: ngay dau trong <station>.json, hai ngay sau trong thu muc <station>/"""
+    start = datetime.combine(FIRST_DAY, datetime.min.time())
+    with open(store_dir / f"{STATION}.json", "w", encoding="utf-8") as f:
+        json.dump({"code": 200, "message": "success", "data": _items(start, 24)}, f)
+    (store_dir / STATION).mkdir()
+    for i in (1, 2):
+        # Chi mang data (khong boc response), ap luc khac nhau moi ngay
+        with open(store_dir / STATION / f"day{i}.json", "w", encoding="utf-8") as f:
+            json.dump(_items(start + timedelta(days=i), 24, base=20.0 + 4 * i), f)
+
+
+def fake_pipeline(store_dir: str) -> BacktestPipeline:
+    """Pipeline that (SCADAService + EPANETService) voi model gia, database rieng trong thu muc test"""
+    import services.epanet_service as epanet_module
+    from core.database import DatabaseManager
+    from services.feature_pipeline import BASE_FEATURES
+    from services.leak_detection_service import LeakDetectionService
+    from services.model_store import ModelBundle, ModelStore
+    from services.scada_service import SCADAService
+
+    epanet_module.db_manager = DatabaseManager(str(Path(store_dir).parent / "backtest.db"))
+    detector = LeakDetectionService()
+    detector._load_topology_features = lambda: ({}, None)
+    detector.models = ModelStore(loader=lambda path: ModelBundle(
+        PressureModel(), None, None, list(BASE_FEATURES), 0.5, Path("fake.pkl"), ()
+    ))
+    return BacktestPipeline(SCADAService(store=LocalSCADAStore(store_dir)), epanet_module.epanet_service, detector)
+
+
+def _same_detections(left: pd.DataFrame, right: pd.DataFrame) -> bool:
+    """Cung xep hang moi ngay (run_id khac nhau giua cac lan chay; xac suat co the lech vai ulp
+    giua cac process do thu tu cong trong feature)"""
+    columns = ["day", "rank", "node_id", "flagged_steps", "detected_at"]
+    left = left.sort_values(["day", "rank"]).reset_index(drop=True)
+    right = right.sort_values(["day", "rank"]).reset_index(drop=True)
+    return (len(left) == len(right) and left[columns].equals(right[columns])
+            and np.allclose(left["probability"], right["probability"], rtol=0, atol=1e-12))
+
+
+def test_local_store():
+    """Test 1: loc theo khoang thoi gian, gop nhieu file, SCADAService(store) khong goi HTTP"""
+    print("\n" + "="*60)
+    print("TEST 1: Local SCADA Store")
+    print("="*60)
+
+    import requests
+    from services.scada_service import SCADAService
+
+    original_post = requests.post
+
+    def no_http(*args, **kwargs):
+        raise AssertionError("SCADA API must not be called")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            store_dir = Path(tmp)
+            _write_recordings(store_dir)
+            store = LocalSCADAStore(str(store_dir))
+            if store.stations != [STATION]:
+                print(f"[ERROR] Unexpected stations: {store.stations}")
+                return False
+            first, last = store.date_range()
+            if first != datetime(2025, 7, 1) or last != datetime(2025, 7, 3, 23):
+                print(f"[ERROR] Wrong date range: {first} - {last}")
+                return False
+
+            result = store.get_station_data_by_hour(STATION, "2025-07-02 00:00", "2025-07-03 00:00")
+            items = result["data"]["data"]
+            times = [item["transferTime"] for item in items]
+            if not result["success"] or len(items) != 25 or times != sorted(times):
+                print(f"[ERROR] Expected 25 sorted items for the day, got {len(items)}")
+                return False
+            if times[0] != "2025-07-02T00:00:00" or times[-1] != "2025-07-03T00:00:00":
+                print(f"[ERROR] Wrong bounds: {times[0]} - {times[-1]}")
+                return False
+            if store.get_station_data_by_hour("99999", "2025-07-02 00:00", "2025-07-03 00:00")["success"]:
+                print("[ERROR] Unknown station should fail like the API")
+                return False
+
+            requests.post = no_http
+            service = SCADAService(store=store)
+            boundary = service.get_boundary_data([STATION], "2025-07-02 00:00", "2025-07-03 00:00")
+            records = boundary["boundary_conditions"].get(STATION, [])
+            if not boundary["success"] or len(records) != 25 or records[0]["pressure"] != 24.0:
+                print(f"[ERROR] Unexpected boundary data: {boundary['summary']}")
+                return False
+            empty = service.get_boundary_data([STATION], "2025-08-01 00:00", "2025-08-02 00:00")
+            if empty["success"]:
+                print("[ERROR] Day without stored data should give no boundary conditions")
+                return False
+            print(f"[OK] {len(records)} boundary records for one day from 2 files, no HTTP call")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            requests.post = original_post
+
+
+def test_parallel_backtest_and_resume():
+    """Test 2: 4 ngay (1 ngay khong co du lieu) tren 2 process, giong chay tuan tu, resume"""
+    print("\n" + "="*60)
+    print("TEST 2: Parallel Backtest And Resume")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            store_dir = Path(tmp) / "recordings"
+            store_dir.mkdir()
+            _write_recordings(store_dir)
+            last_day = FIRST_DAY + timedelta(days=3)
+            out_dir = Path(tmp) / "backtest"
+
+            def runner(workers, out=out_dir, **kwargs):
+                return BacktestRunner(str(store_dir), str(out), FIRST_DAY, last_day, threshold=0.6,
+                                      workers=workers, pipeline_factory=fake_pipeline, **kwargs)
+
+            summary = runner(2).run()
+            if (summary["processed_days"] != 4 or summary["completed"] != 3 or summary["no_data"] != 1
+                    or summary["workers"] != 2):
+                print(f"[ERROR] Unexpected summary: {summary}")
+                return False
+            timings = pd.read_parquet(summary["timings_path"])
+            detections = pd.read_parquet(summary["detections_path"])
+            if sorted(timings["day"]) != [(FIRST_DAY + timedelta(days=i)).isoformat() for i in range(4)]:
+                print(f"[ERROR] Wrong days in timings: {list(timings['day'])}")
+                return False
+            completed = timings[timings["status"] == "completed"]
+            if (completed[["scada_ms", "simulation_ms", "detection_ms", "total_ms"]] <= 0).any().any():
+                print("[ERROR] Missing stage timings")
+                return False
+            if len(set(timings["worker_pid"])) < 2 and (os.cpu_count() or 1) > 1:
+                print("[WARN] All days ran in one worker process")
+
+            # Cung ket qua voi chay tuan tu trong process hien tai
+            serial = runner(1, out=Path(tmp) / "serial").run()
+            serial_detections = pd.read_parquet(serial["detections_path"])
+            if len(detections) == 0 or not _same_detections(detections, serial_detections):
+                print("[ERROR] Parallel detections differ from serial run")
+                return False
+
+            # Resume: khong con ngay nao can chay; xoa checkpoint mot ngay -> chi chay ngay do
+            again = runner(2).run()
+            if again["processed_days"] != 0 or again["skipped_days"] != 4:
+                print(f"[ERROR] Resume should skip finished days: {again}")
+                return False
+            os.remove(out_dir / "days" / "2025-07-02.timing.parquet")
+            resumed = runner(2).run()
+            if resumed["processed_days"] != 1 or resumed["completed"] != 1:
+                print(f"[ERROR] Only the missing day should run: {resumed}")
+                return False
+            if not _same_detections(pd.read_parquet(resumed["detections_path"]), detections):
+                print("[ERROR] Detections changed after resume")
+                return False
+
+            try:
+                runner(2, top_k=5).run()
+                print("[ERROR] Different options on the same output should be rejected")
+                return False
+            except ValueError:
+                pass
+            per_day = completed["total_ms"].mean() / 1000
+            print(f"[OK] {summary['completed']} days on {summary['workers']} processes ({summary['elapsed_s']:.1f} s, "
+                  f"{per_day:.2f} s/day), {len(detections)} detections = serial run, resume re-ran 1 day "
+                  f"({os.cpu_count()} CPU)")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("BACKTEST - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['local_store'] = test_local_store()
+    results['parallel_backtest_and_resume'] = test_parallel_backtest_and_resume()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
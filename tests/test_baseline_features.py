@@ -0,0 +1,326 @@
+"""
+Test script de verify baseline khong ro ri va residual features (services/baseline_cache.py):
+residual ~ 0 khi khong ro ri, am nhat tai node ro ri, cache theo hash .inp + bin head,
+model khong dung residual thi khong mo phong baseline
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import shutil
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from services.baseline_cache import BaselineCache, BaselineNotWarmedError
+from services.feature_pipeline import (
+    BASE_FEATURES, BASELINE_FEATURES, FeatureSchemaError, build_features, check_feature_metadata, feature_metadata
+)
+from services.leak_detection_service import LeakDetectionService
+from services.model_store import ModelBundle, ModelStore
+from services.node_arrays import NodeArrays
+
+INP_FILE = str(project_root / "epanetVip1.inp")
+RESERVOIR = "TXU2"
+
+
+def _simulate(inp_file, heads, leak_node=None, leak_area=0.002):
+    """Mo phong 1 buoc/gio, head TXU2 theo ``heads`` (nhu SCADA boundary), co the them ro ri"""
+    import wntr
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        wn = wntr.network.WaterNetworkModel(inp_file)
+    for pattern_id in list(wn.pattern_name_list):
+        pattern = wn.get_pattern(pattern_id)
+        pattern.multipliers = [1.0] * len(pattern.multipliers)
+    wn.options.time.duration = (len(heads) - 1) * 3600
+    wn.options.time.hydraulic_timestep = 3600
+    wn.options.time.report_timestep = 3600
+    wn.options.time.pattern_timestep = 3600
+    reservoir = wn.get_node(RESERVOIR)
+    reservoir.base_head = heads[0]
+    wn.add_pattern("HEAD", [h / heads[0] for h in heads])
+    reservoir.head_pattern_name = "HEAD"
+    if leak_node is not None:
+        wn.get_node(leak_node).add_leak(wn, area=leak_area, start_time=0, end_time=wn.options.time.duration)
+    results = wntr.sim.WNTRSimulator(wn).run_sim()
+    return NodeArrays.from_wntr(results).to_frame()
+
+
+def _residual_frame(df, cache):
+    cache.warm_frame(df)
+    return build_features(df, list(BASELINE_FEATURES), baseline_loader=lambda: cache)
+
+
+def test_residuals_against_simulation():
+    """Test 1: khong ro ri -> residual ~ 0 moi head; ro ri -> node ro ri co residual am nhat"""
+    print("\n" + "="*60)
+    print("TEST 1: Residuals vs Simulated Network")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            cache = BaselineCache(INP_FILE, tmp, bin_width=0.5)
+            heads = [30.0, 31.3, 32.8, 30.7, 29.6, 33.1]
+            normal = _residual_frame(_simulate(INP_FILE, heads), cache)
+            junctions = normal['node_id'] != RESERVOIR
+            worst = normal.loc[junctions, 'pressure_residual'].abs().max()
+            if worst > 1e-3 or normal['head_residual'].abs().max() > 1e-3:
+                print(f"[ERROR] No-leak residuals should be ~0, max |pressure residual| = {worst}")
+                return False
+            solves = cache.solves
+            if solves != len({int(np.floor(h / 0.5)) for h in heads} | {int(np.floor(h / 0.5)) + 1 for h in heads}):
+                print(f"[ERROR] Unexpected number of baseline solves: {solves}")
+                return False
+
+            leak_node = normal.loc[junctions, 'node_id'].iloc[40]
+            leak = _residual_frame(_simulate(INP_FILE, heads, leak_node=leak_node), cache)
+            if cache.solves != solves:
+                print("[ERROR] Same head bins should not be simulated again")
+                return False
+            per_node = leak[leak['node_id'] != RESERVOIR].groupby('node_id')['pressure_residual'].mean()
+            if per_node.idxmin() != leak_node or per_node.min() >= -0.1:
+                print(f"[ERROR] Most negative residual at {per_node.idxmin()} ({per_node.min():.3f}), leak at {leak_node}")
+                return False
+
+            # Khoi dong lai: bang baseline doc tu file, khong mo phong lai
+            reopened = BaselineCache(INP_FILE, tmp, bin_width=0.5)
+            again = _residual_frame(_simulate(INP_FILE, heads), reopened)
+            if reopened.solves != 0 or not np.allclose(again['pressure_residual'], normal['pressure_residual']):
+                print(f"[ERROR] Reopened cache should reuse stored bins ({reopened.solves} solves)")
+                return False
+            print(f"[OK] No-leak |residual| <= {worst:.1e} m over {len(heads)} heads ({solves} bins), "
+                  f"leak at {leak_node}: most negative residual ({per_node.min():.2f} m)")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+def test_inp_change_and_pipeline():
+    """Test 2: doi .inp -> baseline moi; residual phai duoc yeu cau ro; model cu khong tinh baseline"""
+    print("\n" + "="*60)
+    print("TEST 2: INP Invalidation And Feature Pipeline")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            inp_copy = Path(tmp) / "network.inp"
+            shutil.copy(INP_FILE, inp_copy)
+            cache = BaselineCache(str(inp_copy), str(Path(tmp) / "cache"), bin_width=0.5)
+            df = _simulate(str(inp_copy), [30.0, 31.0])
+            _residual_frame(df.copy(), cache)
+            first_key, first_solves = cache.table().key, cache.solves
+
+            with open(inp_copy, "a", encoding="utf-8") as f:
+                f.write("\n; edited\n")
+            _residual_frame(df.copy(), cache)
+            if cache.table().key == first_key or cache.solves != 2 * first_solves:
+                print("[ERROR] Changed .inp should invalidate the baseline")
+                return False
+            if len(list((Path(tmp) / "cache").glob("*.npz"))) != 2:
+                print("[ERROR] Each .inp hash should have its own baseline file")
+                return False
+
+            try:
+                build_features(df.copy(), list(BASELINE_FEATURES))
+                print("[ERROR] Residual features without a baseline should fail")
+                return False
+            except FeatureSchemaError:
+                pass
+            feature_cols = list(BASE_FEATURES) + list(BASELINE_FEATURES)
+            if check_feature_metadata(feature_metadata(feature_cols)) != feature_cols:
+                print("[ERROR] Metadata with residual features should be accepted")
+                return False
+
+            class ResidualModel:
+                """Xac suat tang khi pressure_residual (cot ke cuoi) am"""
+
+                def predict_proba(self, X):
+                    X = np.asarray(X, dtype=float)
+                    p = 1.0 / (1.0 + np.exp(X[:, -2] * 0.5))
+                    return np.column_stack([1 - p, p])
+
+            def service_for(model, cols):
+                service = LeakDetectionService()
+                service._load_topology_features = lambda: ({}, None)
+                service.baseline = BaselineCache(INP_FILE, None, bin_width=0.5)
+                service.baseline.warm(29.0, 33.0)
+                service.models = ModelStore(loader=lambda path: ModelBundle(
+                    model, None, None, list(cols), 0.5, Path("fake.pkl"), ()
+                ))
+                return service
+
+            heads = [30.0, 31.0, 32.0]
+            # Node co demand (detect bo qua node demand < 0.001)
+            candidates = df[(df['node_id'] != RESERVOIR) & (df['demand'] >= 0.01)]['node_id'].unique()
+            leak_node = candidates[len(candidates) // 2]
+            frame = _simulate(INP_FILE, heads, leak_node=leak_node)
+            arrays = NodeArrays(frame['node_id'].tolist(), frame['timestamp'].tolist(), frame['pressure'].tolist(),
+                                frame['head'].tolist(), frame['demand'].tolist())
+
+            residual_service = service_for(ResidualModel(), feature_cols)
+            result = residual_service.detect_leaks_from_arrays(arrays, top_k=1)
+            if not result["success"] or result["leaks"][0]["node_id"] != leak_node:
+                print(f"[ERROR] Residual model should rank the leak node first: {result.get('error') or result['leaks']}")
+                return False
+
+            class ConstantModel:
+                def predict_proba(self, X):
+                    return np.column_stack([np.full(len(X), 0.4), np.full(len(X), 0.6)])
+
+            plain = service_for(ConstantModel(), BASE_FEATURES)
+            extrapolated = plain.baseline.extrapolated
+            if not plain.detect_leaks_from_arrays(arrays)["success"] or plain.baseline.extrapolated != extrapolated:
+                print("[ERROR] Model without residual features should not compute residuals")
+                return False
+
+            # Hot reload (sang model khong residual) sau khi request da lay bundle: feature theo
+            # bundle dang cham diem, khong doc lai ModelStore
+            bundle = residual_service.models.get()
+            residual_service.models = plain.models
+            scored = residual_service.score_arrays(bundle, arrays)
+            df_fe, error = residual_service._features_or_error(arrays, bundle.feature_cols)
+            if error is not None or not all(f in df_fe.columns for f in BASELINE_FEATURES) \
+                    or scored.bundle is not bundle:
+                print(f"[ERROR] Features should follow the scoring bundle across a reload: {error}")
+                return False
+            print(f"[OK] .inp edit -> new baseline ({first_solves} bins re-solved), residual model ranks "
+                  f"{leak_node} first, 30-feature model skips the baseline, features follow the scoring bundle")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+def test_request_path_never_solves():
+    """Test 3: residuals() khong mo phong - chua warm -> loi ro rang; ngoai khoang -> ngoai suy"""
+    print("\n" + "="*60)
+    print("TEST 3: Request Path Never Solves")
+    print("="*60)
+
+    try:
+        cache = BaselineCache(INP_FILE, None, bin_width=0.5)
+        df = _simulate(INP_FILE, [30.0, 31.2, 33.4, 28.6])
+        try:
+            cache.residuals(df)
+            print("[ERROR] Residuals without warmed bins should fail")
+            return False
+        except BaselineNotWarmedError:
+            pass
+        if cache.solves != 0:
+            print("[ERROR] residuals() should never simulate")
+            return False
+
+        cache.warm(30.0, 31.0)
+        solves = cache.solves
+        residuals = cache.residuals(df)
+        junctions = (df['node_id'] != RESERVOIR).to_numpy()
+        worst = np.abs(residuals['pressure_residual'][junctions]).max()
+        if cache.solves != solves or cache.extrapolated == 0:
+            print(f"[ERROR] Heads outside the warmed range should be extrapolated, not solved ({cache.stats()})")
+            return False
+        if worst > 1e-3:
+            print(f"[ERROR] Extrapolated no-leak residual too large: {worst}")
+            return False
+        print(f"[OK] cold cache -> BaselineNotWarmedError; heads 28.6-33.4 m from bins 30-31.5 m: "
+              f"{cache.extrapolated} rows extrapolated, |residual| <= {worst:.1e} m, no extra solve")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_residual_cost():
+    """Test 4: residual cho 7 ngay x 96 buoc (cache am) vs mo phong baseline moi request"""
+    print("\n" + "="*60)
+    print("TEST 4: Residual Feature Cost")
+    print("="*60)
+
+    try:
+        cache = BaselineCache(INP_FILE, None, bin_width=0.25)
+        cache.warm(25.0, 40.0)
+        table = cache.table()
+        n_steps = 7 * 96
+        rng = np.random.default_rng(0)
+        reservoir_heads = rng.uniform(26.0, 39.0, n_steps)
+        node_ids = np.array(table.node_ids)
+        df = {
+            'node_id': np.tile(node_ids, n_steps),
+            'timestamp': np.repeat(np.arange(n_steps) * 900.0, len(node_ids)),
+            'pressure': rng.uniform(10, 40, n_steps * len(node_ids)),
+            'head': rng.uniform(20, 60, n_steps * len(node_ids)),
+        }
+        df = pd.DataFrame(df)
+        df.loc[df['node_id'] == RESERVOIR, 'head'] = reservoir_heads
+
+        solves = cache.solves
+        t0 = time.perf_counter()
+        residuals = cache.residuals(df)
+        residual_ms = (time.perf_counter() - t0) * 1000
+        if cache.solves != solves or not np.isfinite(residuals['pressure_residual']).all():
+            print("[ERROR] Warm cache should not simulate")
+            return False
+
+        t0 = time.perf_counter()
+        cache._get_solver()([31.0])
+        solve_ms = (time.perf_counter() - t0) * 1000
+        print(f"[OK] {len(df)} rows: residual features {residual_ms:.0f} ms from {len(table)} cached bins; "
+              f"one baseline simulation {solve_ms:.0f} ms (x {n_steps} steps if solved per request)")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("BASELINE RESIDUAL FEATURES - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['residuals_against_simulation'] = test_residuals_against_simulation()
+    results['inp_change_and_pipeline'] = test_inp_change_and_pipeline()
+    results['request_path_never_solves'] = test_request_path_never_solves()
+    results['residual_cost'] = test_residual_cost()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""
+Test script de verify batch detection nhieu run (LeakDetectionService.detect_leaks_batch):
+cung ket qua voi detect tung run, chia nhom theo max_rows, doc simulation da luu, endpoint
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from services.feature_pipeline import BASE_FEATURES
+from services.leak_detection_service import LeakDetectionService
+from services.model_store import ModelBundle, ModelStore
+from services.node_arrays import NodeArrays
+from services.oblivious_trees import ObliviousTreeModel
+from services.probability_cache import ProbabilityCache
+
+
+class CountingModel:
+    """Xac suat tu pressure (cot dau); dem so lan predict_proba va so dong"""
+
+    def __init__(self):
+        self.calls = 0
+        self.rows = []
+
+    def predict_proba(self, X):
+        self.calls += 1
+        self.rows.append(len(X))
+        X = np.asarray(X, dtype=float)
+        p = 1.0 / (1.0 + np.exp(-(X[:, 0] - 25.0) / 4.0))
+        return np.column_stack([1 - p, p])
+
+
+def _service(model, cache_runs=64):
+    service = LeakDetectionService()
+    service._load_topology_features = lambda: ({}, None)
+    service.models = ModelStore(loader=lambda path: ModelBundle(
+        model, None, None, list(BASE_FEATURES), 0.5, Path("fake.pkl"), ()
+    ))
+    service.scored_runs = ProbabilityCache(cache_runs)
+    return service
+
+
+def _nodes_results(n_nodes, n_steps, seed):
+    """nodes_results dang list of records nhu EPANETService._extract_wntr_results"""
+    rng = np.random.default_rng(seed)
+    return {
+        f"N{i}": [{"timestamp": t * 3600, "pressure": float(rng.uniform(5, 45)),
+                   "head": float(rng.uniform(20, 60)), "demand": float(rng.uniform(0, 0.02))}
+                  for t in range(n_steps)]
+        for i in range(n_nodes)
+    }
+
+
+def _runs(sizes, seed=0):
+    return {f"day-{i}": NodeArrays.from_nodes_results(_nodes_results(n, 24, seed + i))
+            for i, n in enumerate(sizes)}
+
+
+def test_matches_per_run_detection():
+    """Test 1: ket qua tung run = detect rieng; nhom theo max_rows; model NumPy chia thread"""
+    print("\n" + "="*60)
+    print("TEST 1: Batch vs Per-Run Detection")
+    print("="*60)
+
+    try:
+        runs = _runs([30, 45, 20, 60, 35])
+        reference = _service(CountingModel(), cache_runs=0)
+        expected = {key: reference.detect_leaks_from_arrays(arrays, threshold=0.6, top_k=10)
+                    for key, arrays in runs.items()}
+
+        model = CountingModel()
+        service = _service(model)
+        # 2000 dong / lan predict: run 60 node x 24 = 1440 dong nam rieng mot nhom
+        result = service.detect_leaks_batch(runs, threshold=0.6, top_k=10, max_rows=2000, workers=3)
+        if not result["success"]:
+            print(f"[ERROR] {result['error']}")
+            return False
+        for key in runs:
+            got = result["runs"][key]
+            if got["leaks"] != expected[key]["leaks"] or got["summary"] != expected[key]["summary"]:
+                print(f"[ERROR] Run {key} differs from per-run detection")
+                return False
+        if model.calls != result["summary"]["model_passes"] or max(model.rows) > 2000 or model.calls >= len(runs):
+            print(f"[ERROR] Unexpected model passes: {model.rows}")
+            return False
+
+        # Lan hai: moi run da co trong cache -> khong goi model
+        again = service.detect_leaks_batch(runs, threshold=0.8)
+        if again["summary"]["cached_runs"] != len(runs) or model.calls != result["summary"]["model_passes"]:
+            print("[ERROR] Second batch should use cached probabilities")
+            return False
+
+        # Model NumPy (mot thread): ma tran chia doan cho cac thread, ket qua khong doi
+        rng = np.random.default_rng(1)
+        n = len(BASE_FEATURES)
+        trees = ObliviousTreeModel(rng.integers(0, n, (60, 6)), rng.normal(size=(60, 6)),
+                                   rng.normal(size=(60, 64)), 1.0, 0.0, feature_names=list(BASE_FEATURES))
+        single = _service(trees).detect_leaks_batch(runs, workers=1)
+        threaded = _service(trees).detect_leaks_batch(runs, workers=4)
+        if any(single["runs"][k]["leaks"] != threaded["runs"][k]["leaks"] for k in runs):
+            print("[ERROR] Threaded NumPy prediction differs")
+            return False
+        print(f"[OK] {len(runs)} runs identical to per-run detection, {model.calls} model passes "
+              f"({model.rows} rows), cached on second batch")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_stored_runs_and_endpoint():
+    """Test 2: run_ids tu database (run_id duoc cap nhat khi xong), run loi khong huy ca batch"""
+    print("\n" + "="*60)
+    print("TEST 2: Stored Runs And /detect-batch")
+    print("="*60)
+
+    import core.database as database
+    import api.routes.leak_detection as routes
+    from core.database import DatabaseManager
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    original_db = database.db_manager
+    original_service = routes.leak_detection_service
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(os.path.join(tmp, "test.db"))
+        try:
+            # Nhu EPANETService.run_simulation: tao run "running" roi cap nhat chinh run do
+            run_ids = []
+            for seed in range(3):
+                run_id = manager.save_simulation_run("running", {"duration": 24})
+                manager.update_simulation_run(run_id, "completed", results={"nodes": _nodes_results(25, 24, seed)})
+                run_ids.append(run_id)
+            failed = manager.save_simulation_run("running", {"duration": 24})
+            manager.update_simulation_run(failed, "failed", error_message="boom")
+            stored = manager.get_simulation_run(run_ids[0])
+            if stored["status"] != "completed" or stored["input_data"] != {"duration": 24} or not stored["results"]:
+                print(f"[ERROR] Run not updated in place: {stored['status']}")
+                return False
+            if [r["id"] for r in manager.list_simulation_runs("completed")] != run_ids:
+                print("[ERROR] list_simulation_runs should return the completed runs")
+                return False
+
+            database.db_manager = manager
+            service = _service(CountingModel())
+            routes.leak_detection_service = service
+            app = FastAPI()
+            app.include_router(routes.router, prefix="/leak-detection")
+            client = TestClient(app)
+            simulation_result = {"nodes_results": _nodes_results(20, 24, 9)}
+            response = client.post("/leak-detection/detect-batch", json={
+                "run_ids": run_ids + [failed, 999],
+                "simulation_results": {"uploaded": simulation_result},
+                "top_k": 5,
+            })
+            if response.status_code != 200:
+                print(f"[ERROR] HTTP {response.status_code}: {response.text[:200]}")
+                return False
+            data = response.json()["data"]
+            ok = [k for k, r in data["runs"].items() if r["success"]]
+            if sorted(ok) != sorted([str(r) for r in run_ids] + ["uploaded"]) or data["summary"]["failed_runs"] != 2:
+                print(f"[ERROR] Unexpected run results: {ok}, {data['summary']}")
+                return False
+            if "failed" not in data["runs"][str(failed)]["error"] or "not found" not in data["runs"]["999"]["error"]:
+                print("[ERROR] Failed runs should report their error")
+                return False
+
+            expected = _service(CountingModel(), cache_runs=0).detect_leaks_from_simulation_result(
+                simulation_result, top_k=5)
+            if data["runs"]["uploaded"]["leaks"] != expected["leaks"]:
+                print("[ERROR] Uploaded run differs from /detect-from-simulation")
+                return False
+            if data["runs"]["uploaded"]["run_key"] != expected["run_key"]:
+                print("[ERROR] Uploaded run should be cached under its content hash")
+                return False
+
+            # Ten do client dat khong phai khoa cache: cung ten / ten trung run_id, du lieu khac
+            other = {"nodes_results": _nodes_results(20, 24, 10)}
+            again = client.post("/leak-detection/detect-batch", json={
+                "simulation_results": {"uploaded": other, str(run_ids[0]): other}, "top_k": 5,
+            }).json()["data"]
+            expected_other = _service(CountingModel(), cache_runs=0).detect_leaks_from_simulation_result(
+                other, top_k=5)
+            if again["summary"]["cached_runs"] != 0 or any(
+                    again["runs"][k]["leaks"] != expected_other["leaks"] for k in ("uploaded", str(run_ids[0]))):
+                print(f"[ERROR] Same name with different data reused a cached run: {again['summary']}")
+                return False
+            if client.get(f"/leak-detection/runs/{run_ids[0]}/leaks?top_k=5").json()["data"]["leaks"] != \
+                    data["runs"][str(run_ids[0])]["leaks"]:
+                print("[ERROR] Inline run named like a stored run_id overwrote its cache entry")
+                return False
+            # Stored run dung chung cache (run_key = run_id) voi /runs/{run_key}/leaks
+            if client.get(f"/leak-detection/runs/{run_ids[0]}/leaks").status_code != 200:
+                print("[ERROR] Stored run should be re-queryable by run_id")
+                return False
+            if client.post("/leak-detection/detect-batch", json={}).status_code != 400:
+                print("[ERROR] Empty batch should return 400")
+                return False
+            print(f"[OK] {len(ok)} runs scored, 2 failed runs reported, run_id rows updated in place")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            database.db_manager = original_db
+            routes.leak_detection_service = original_service
+            manager.close()
+
+
+def test_batch_throughput():
+    """Test 3: 7 run (mot tuan) - goi detect tung run vs batch, theo so worker"""
+    print("\n" + "="*60)
+    print("TEST 3: Batch Throughput")
+    print("="*60)
+
+    try:
+        runs = _runs([150] * 7, seed=20)
+        records = sum(len(a) for a in runs.values())
+
+        per_run = _service(CountingModel(), cache_runs=0)
+        t0 = time.perf_counter()
+        for arrays in runs.values():
+            per_run.detect_leaks_from_arrays(arrays)
+        per_run_ms = (time.perf_counter() - t0) * 1000
+
+        timings = []
+        cpus = os.cpu_count() or 1
+        for workers in sorted({1, min(4, cpus), cpus}):
+            result = _service(CountingModel()).detect_leaks_batch(runs, workers=workers)
+            if not result["success"] or result["summary"]["model_passes"] != 1:
+                print(f"[ERROR] Batch failed: {result.get('error') or result['summary']}")
+                return False
+            timings.append(f"{workers} worker(s) {result['summary']['elapsed_ms']:.0f} ms")
+        print(f"[OK] {len(runs)} runs / {records} records: one call per run {per_run_ms:.0f} ms, "
+              f"batch {', '.join(timings)} ({cpus} CPU)")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("BATCH DETECTION - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['matches_per_run_detection'] = test_matches_per_run_detection()
+    results['stored_runs_and_endpoint'] = test_stored_runs_and_endpoint()
+    results['batch_throughput'] = test_batch_throughput()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Test script de verify cac singleton dung chung an toan khi goi dong thoi tu thread pool
+(endpoint blocking chay qua run_in_threadpool): nhieu thread goi cung luc cho ket qua giong het
+khi goi tuan tu - parse topology, mo phong voi SCADA boundary khac nhau, detect leak
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from services.network_parser import NetworkParser
+from services.node_arrays import NodeArrays
+
+THREADS = 8
+INP_FILE = str(project_root / "epanetVip1.inp")
+
+
+class PressureModel:
+    """Xac suat tu pressure (cot dau) - xac dinh, khong can file model"""
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=float)
+        p = 1.0 / (1.0 + np.exp(-(X[:, 0] - 25.0) / 4.0))
+        return np.column_stack([1 - p, p])
+
+
+def _run_concurrently(fn, args):
+    """Goi fn(arg) cho moi arg tren THREADS thread cung luc, giu thu tu ket qua"""
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return list(pool.map(fn, args))
+
+
+def test_network_parser():
+    """Test 1: parser chua parse, THREADS thread goi cung luc -> parse mot lan, khong node trung"""
+    print("\n" + "="*60)
+    print("TEST 1: Concurrent Network Parsing")
+    print("="*60)
+
+    try:
+        expected = NetworkParser(INP_FILE).parse_file()
+        parser = NetworkParser(INP_FILE)
+        results = _run_concurrently(lambda _: parser.parse_file(), range(THREADS * 4))
+        graphs = _run_concurrently(lambda _: parser.get_graph_structure(), range(THREADS))
+
+        if not expected["success"] or any(r != expected for r in results):
+            print("[ERROR] Concurrent parse_file results differ from a single parse")
+            return False
+        ids = [n.id for n in parser.nodes]
+        if len(ids) != len(set(ids)) or len(parser.pipes) != expected["total_pipes"]:
+            print(f"[ERROR] Duplicated topology: {len(ids)} nodes, {len(set(ids))} unique")
+            return False
+        if any(g != graphs[0] for g in graphs) or graphs[0]["total_nodes"] != expected["total_nodes"]:
+            print("[ERROR] Concurrent graph structures differ")
+            return False
+
+        # Ket qua tra ve la ban sao: caller sua khong anh huong request khac
+        results[0]["nodes"][0]["elevation"] = -999.0
+        if parser.parse_file()["nodes"][0]["elevation"] == -999.0:
+            print("[ERROR] parse_file should return fresh dicts")
+            return False
+        print(f"[OK] {THREADS * 4} concurrent parse_file calls on {THREADS} threads: "
+              f"{expected['total_nodes']} nodes, {expected['total_pipes']} pipes, identical results")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_simulation():
+    """Test 2: mo phong dong thoi voi head SCADA khac nhau = mo phong tuan tu tung input"""
+    print("\n" + "="*60)
+    print("TEST 2: Concurrent Simulations")
+    print("="*60)
+
+    import services.epanet_service as epanet_module
+    from core.database import DatabaseManager
+    from models.schemas import SimulationInput
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            epanet_module.db_manager = DatabaseManager(os.path.join(tmp, "concurrency.db"))
+            service = epanet_module.epanet_service
+            simulation_input = SimulationInput(duration=3, hydraulic_timestep=1, report_timestep=1)
+
+            def simulate(base_head):
+                boundary = {"13085": [{"timestamp": f"2025-01-15 0{h}:00", "pressure": base_head + h}
+                                      for h in range(4)]}
+                result = service.run_simulation(simulation_input, scada_boundary_data=boundary)
+                if result.status != "completed":
+                    raise RuntimeError(result.error_message)
+                return {node: [r["pressure"] for r in records] for node, records in result.nodes_results.items()}
+
+            heads = [18.0 + i for i in range(THREADS)]
+            expected = [simulate(h) for h in heads]
+            parses = service.template.parses
+            concurrent = _run_concurrently(simulate, heads)
+
+            # WNTR khong lap lai tung bit giua cac lan chay (ke ca tuan tu) -> so sanh toi 1e-9 m
+            if any(c.keys() != e.keys() or not all(np.allclose(c[n], e[n], rtol=0, atol=1e-9) for n in e)
+                   for c, e in zip(concurrent, expected)):
+                print("[ERROR] Concurrent simulations differ from serial runs")
+                return False
+            if np.allclose(expected[0]["2"], expected[1]["2"]):
+                print("[ERROR] Different boundary heads should give different pressures")
+                return False
+            if service.template.parses != parses:
+                print("[ERROR] Network template should be parsed once and reused")
+                return False
+            print(f"[OK] {THREADS} concurrent simulations (reservoir head {heads[0]:.0f}-{heads[-1]:.0f} m) "
+                  f"match serial runs; network parsed {service.template.parses} time(s)")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+def test_leak_detection():
+    """Test 3: detect leak dong thoi tren du lieu khac nhau = detect tuan tu"""
+    print("\n" + "="*60)
+    print("TEST 3: Concurrent Leak Detection")
+    print("="*60)
+
+    from services.feature_pipeline import BASE_FEATURES
+    from services.leak_detection_service import LeakDetectionService
+    from services.model_store import ModelBundle, ModelStore
+
+    try:
+        service = LeakDetectionService()
+        service._load_topology_features = lambda: ({}, None)
+        service.models = ModelStore(loader=lambda path: ModelBundle(
+            PressureModel(), None, None, list(BASE_FEATURES), 0.5, Path("fake.pkl"), ()
+        ))
+
+        rng = np.random.default_rng(7)
+        nodes = [str(n) for n in range(1, 61)] + ["TXU2"]
+        timestamps = [3600.0 * h for h in range(24)]
+        datasets = []
+        for _ in range(THREADS):
+            node_ids = [n for n in nodes for _ in timestamps]
+            pressure = rng.uniform(10.0, 40.0, len(node_ids))
+            datasets.append(NodeArrays(node_ids, timestamps * len(nodes), pressure.tolist(),
+                                       (pressure + 1.5).tolist(), [0.01] * len(node_ids)))
+
+        def detect(arrays):
+            result = service.detect_leaks_from_arrays(arrays, threshold=0.97)
+            if not result["success"]:
+                raise RuntimeError(result.get("error"))
+            return result["leaks"]
+
+        expected = [detect(a) for a in datasets]
+        service.scored_runs.clear()  # tinh lai xac suat, khong lay tu cache
+        concurrent = _run_concurrently(detect, datasets)
+
+        if concurrent != expected:
+            print("[ERROR] Concurrent detections differ from serial runs")
+            return False
+        if any("TXU2" in [leak["node_id"] for leak in leaks] for leaks in concurrent):
+            print("[ERROR] Reservoir should stay excluded")
+            return False
+        print(f"[OK] {THREADS} concurrent detections identical to serial runs "
+              f"({sum(len(leaks) for leaks in expected)} leak nodes, reservoir excluded)")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("CONCURRENCY - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['network_parser'] = test_network_parser()
+    results['simulation'] = test_simulation()
+    results['leak_detection'] = test_leak_detection()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,473 @@
+"""
+Test script de verify DatabaseManager (connection per-thread, WAL, transaction)
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from core.database import DatabaseManager
+from core.async_database import AsyncDatabaseManager
+from core.ingestion import WriteBehindQueue, IngestionBacklogFull
+
+
+def test_connection_pragmas_and_reuse():
+    """Test 1: WAL + connection duoc tai su dung trong cung thread"""
+    print("\n" + "="*60)
+    print("TEST 1: Connection Pragmas & Reuse")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(os.path.join(tmp, "test.db"))
+        try:
+            with manager.connection() as conn:
+                journal = conn.execute("PRAGMA journal_mode").fetchone()[0]
+                synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+            with manager.connection() as conn2:
+                same = conn is conn2
+
+            if journal.lower() != "wal":
+                print(f"[ERROR] journal_mode = {journal}")
+                return False
+            if synchronous != 1:  # NORMAL
+                print(f"[ERROR] synchronous = {synchronous}")
+                return False
+            if not same:
+                print("[ERROR] Connection not reused within the same thread")
+                return False
+
+            other = []
+            t = threading.Thread(target=lambda: other.append(manager._get_connection()))
+            t.start()
+            t.join()
+            if other[0] is conn:
+                print("[ERROR] Connection shared across threads")
+                return False
+
+            print(f"[OK] journal_mode={journal}, synchronous=NORMAL, per-thread reuse")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            manager.close()
+
+
+def test_concurrent_writes():
+    """Test 2: Ghi dong thoi tu nhieu thread khong mat du lieu"""
+    print("\n" + "="*60)
+    print("TEST 2: Concurrent Writes")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(os.path.join(tmp, "test.db"))
+        try:
+            errors = []
+
+            def writer(k):
+                try:
+                    for i in range(100):
+                        manager.save_real_time_data(f"N{k}", pressure=float(i))
+                        if i % 10 == 0:
+                            manager.get_latest_real_time_data(f"N{k}")
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=writer, args=(k,)) for k in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            with manager.connection() as conn:
+                count = conn.execute("SELECT COUNT(*) FROM real_time_data").fetchone()[0]
+
+            if errors:
+                print(f"[ERROR] {len(errors)} writer error(s): {errors[0]}")
+                return False
+            if count != 800:
+                print(f"[ERROR] Expected 800 rows, got {count}")
+                return False
+
+            run_id = manager.save_simulation_run("completed", results={"ok": True})
+            print(f"[OK] 8 threads x 100 rows = {count} rows, run_id={run_id}")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            manager.close()
+
+
+def test_rollback_and_close():
+    """Test 3: Loi trong transaction -> rollback; close() dong het connection"""
+    print("\n" + "="*60)
+    print("TEST 3: Rollback & Close")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(os.path.join(tmp, "test.db"))
+        try:
+            try:
+                with manager.connection() as conn:
+                    conn.execute("INSERT INTO real_time_data (node_id, pressure) VALUES ('N1', 1.0)")
+                    raise RuntimeError("boom")
+            except RuntimeError:
+                pass
+
+            if manager.get_latest_real_time_data("N1"):
+                print("[ERROR] Row from failed transaction was committed")
+                return False
+
+            conn = manager._get_connection()
+            manager.close()
+            try:
+                conn.execute("SELECT 1")
+                print("[ERROR] Connection still open after close()")
+                return False
+            except sqlite3.ProgrammingError:
+                pass
+
+            # Van dung duoc sau close (mo lai lazily)
+            manager.save_real_time_data("N2", pressure=2.0)
+            if len(manager.get_latest_real_time_data("N2")) != 1:
+                print("[ERROR] Manager unusable after close()")
+                return False
+
+            print("[OK] Rollback on error, close() releases connections, lazy reopen")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            manager.close()
+
+
+def test_batch_insert():
+    """Test 4: save_real_time_data_batch - mot transaction, all-or-nothing"""
+    print("\n" + "="*60)
+    print("TEST 4: Batch Insert")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(os.path.join(tmp, "test.db"))
+        try:
+            rows = [(f"N{i % 10}", 20.0 + i, None, None, None) for i in range(1000)]
+            rows.append(("N99", None, 5.0, None, "2025-10-22 10:00:00"))
+            saved = manager.save_real_time_data_batch(rows)
+
+            with manager.connection() as conn:
+                count = conn.execute("SELECT COUNT(*) FROM real_time_data").fetchone()[0]
+                stamped = conn.execute("SELECT timestamp FROM real_time_data WHERE node_id = 'N99'").fetchone()[0]
+                defaulted = conn.execute("SELECT COUNT(*) FROM real_time_data WHERE timestamp IS NULL").fetchone()[0]
+
+            if saved != 1001 or count != 1001 or defaulted:
+                print(f"[ERROR] saved={saved}, count={count}, null timestamps={defaulted}")
+                return False
+            if stamped != "2025-10-22 10:00:00":
+                print(f"[ERROR] Explicit timestamp not stored: {stamped}")
+                return False
+
+            # node_id NULL -> ca batch rollback
+            try:
+                manager.save_real_time_data_batch([("N1", 1.0, None, None, None), (None, 2.0, None, None, None)])
+                print("[ERROR] Expected IntegrityError")
+                return False
+            except sqlite3.IntegrityError:
+                pass
+            with manager.connection() as conn:
+                count_after = conn.execute("SELECT COUNT(*) FROM real_time_data").fetchone()[0]
+            if count_after != 1001:
+                print(f"[ERROR] Partial batch committed: {count_after}")
+                return False
+
+            print(f"[OK] {saved} rows in one transaction, failed batch rolled back")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            manager.close()
+
+
+def test_write_behind_queue():
+    """Test 5: Write-behind flush theo size/time, stop() drain queue, backlog limit"""
+    print("\n" + "="*60)
+    print("TEST 5: Write-behind Queue")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(os.path.join(tmp, "test.db"))
+        queue = WriteBehindQueue(manager, flush_rows=100, flush_interval_ms=50, max_pending_rows=5000)
+        try:
+            queue.start()
+            for k in range(20):
+                queue.enqueue([(f"N{k}", float(i), None, None, None) for i in range(50)])
+
+            # Flush theo thoi gian (50 ms) cho phan du
+            deadline = time.time() + 5
+            while queue.stats()["written"] < 1000 and time.time() < deadline:
+                time.sleep(0.02)
+            stats = queue.stats()
+            if stats["written"] != 1000 or stats["pending"] != 0:
+                print(f"[ERROR] Unexpected stats after flush: {stats}")
+                return False
+
+            with manager.connection() as conn:
+                null_ts = conn.execute("SELECT COUNT(*) FROM real_time_data WHERE timestamp IS NULL").fetchone()[0]
+            if null_ts:
+                print("[ERROR] Rows written without enqueue timestamp")
+                return False
+
+            # stop() drain nhung gi con trong queue
+            queue.enqueue([("N_last", 1.0, None, None, None)] * 30)
+            queue.stop()
+            with manager.connection() as conn:
+                last = conn.execute("SELECT COUNT(*) FROM real_time_data WHERE node_id = 'N_last'").fetchone()[0]
+            if last != 30:
+                print(f"[ERROR] stop() did not drain queue: {last}")
+                return False
+
+            # Backlog day -> tu choi thay vi tang bo nho
+            small = WriteBehindQueue(manager, flush_rows=10, max_pending_rows=20)
+            small.enqueue([("N1", 1.0, None, None, None)] * 20)
+            try:
+                small.enqueue([("N1", 1.0, None, None, None)])
+                print("[ERROR] Expected IngestionBacklogFull")
+                return False
+            except IngestionBacklogFull:
+                pass
+
+            print(f"[OK] Write-behind stats: {queue.stats()}")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            queue.stop()
+            manager.close()
+
+
+def test_indexes_rollups_and_retention():
+    """Test 6: Index duoc dung, rollup khop voi raw, retention + history auto"""
+    print("\n" + "="*60)
+    print("TEST 6: Indexes, Rollups & Retention")
+    print("="*60)
+
+    from datetime import datetime, timedelta, timezone
+    from core.config import settings
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(os.path.join(tmp, "test.db"))
+        try:
+            with manager.connection() as conn:
+                plan = conn.execute(
+                    "EXPLAIN QUERY PLAN SELECT * FROM real_time_data WHERE node_id = ? ORDER BY timestamp DESC LIMIT 1",
+                    ("N1",)
+                ).fetchall()
+            if not any("idx_real_time_data_node_ts" in str(row) for row in plan):
+                print(f"[ERROR] Latest-per-node query does not use index: {plan}")
+                return False
+
+            # Nhieu batch nho -> rollup cap nhat incremental qua nhieu lan
+            now = datetime.now(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+            old = now - timedelta(days=settings.realtime_raw_retention_days + 5)
+            for day in (old, now - timedelta(hours=3)):
+                for chunk in range(5):
+                    manager.save_real_time_data_batch([
+                        ("N1", 10.0 + i + chunk, (i % 3) or None, None,
+                         (day + timedelta(minutes=7 * i)).strftime("%Y-%m-%d %H:%M:%S"))
+                        for i in range(20)
+                    ])
+
+            with manager.connection() as conn:
+                expected = conn.execute('''
+                    SELECT strftime('%Y-%m-%d %H:00:00', timestamp) AS b, MIN(pressure), MAX(pressure),
+                           SUM(pressure), COUNT(pressure), COUNT(flow)
+                    FROM real_time_data WHERE node_id = 'N1' GROUP BY b ORDER BY b
+                ''').fetchall()
+                rollup = conn.execute('''
+                    SELECT bucket, pressure_min, pressure_max, pressure_sum, pressure_count, flow_count
+                    FROM real_time_rollup_hourly WHERE node_id = 'N1' ORDER BY bucket
+                ''').fetchall()
+            if expected != rollup:
+                print(f"[ERROR] Rollup mismatch:\n  raw:    {expected[:2]}\n  rollup: {rollup[:2]}")
+                return False
+
+            deleted = manager.prune_real_time_data(chunk_size=7)
+            if deleted["raw"] != 100:
+                print(f"[ERROR] Expected 100 raw rows pruned, got {deleted}")
+                return False
+
+            # Lich su: ngan -> raw ; qua retention -> hourly (van con du lieu cu) ; dai -> daily
+            short = manager.get_real_time_history("N1", start=now - timedelta(hours=6))
+            past = manager.get_real_time_history("N1", start=old - timedelta(hours=1), end=old + timedelta(hours=3))
+            long_range = manager.get_real_time_history("N1", start=now - timedelta(days=120), limit=1000)
+            if short["resolution"] != "raw" or len(short["data"]) != 100:
+                print(f"[ERROR] Short range: {short['resolution']}, {len(short['data'])} rows")
+                return False
+            if past["resolution"] != "hourly" or sum(r["pressure_count"] for r in past["data"]) != 100:
+                print(f"[ERROR] Past range after pruning: {past['resolution']}, {past['data'][:1]}")
+                return False
+            if long_range["resolution"] != "daily":
+                print(f"[ERROR] Long range resolution: {long_range['resolution']}")
+                return False
+
+            # Moc co timezone (vd ?start=...Z hoac +07:00) -> quy ve UTC, khong TypeError khi so voi now
+            ict = timezone(timedelta(hours=7))
+            aware = manager.get_real_time_history("N1", start=(now - timedelta(hours=6)).replace(tzinfo=timezone.utc))
+            aware_ict = manager.get_real_time_history(
+                "N1", start=(now - timedelta(hours=6)).replace(tzinfo=timezone.utc).astimezone(ict),
+                end=now.replace(tzinfo=timezone.utc).astimezone(ict)
+            )
+            if aware != short or aware_ict["resolution"] != "raw" or len(aware_ict["data"]) != 100:
+                print(f"[ERROR] Timezone-aware range: {aware['resolution']}, {len(aware_ict['data'])} rows")
+                return False
+
+            print(f"[OK] Index used, {len(rollup)} hourly buckets match raw, pruned {deleted}")
+            print(f"[OK] History resolutions: short=raw, past=hourly, 120 days=daily; tz-aware bounds as UTC")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            manager.close()
+
+
+def test_async_manager_does_not_block_loop():
+    """Test 7: AsyncDatabaseManager chay SQLite ngoai event loop, ket qua giong ban sync"""
+    print("\n" + "="*60)
+    print("TEST 7: Async Database Manager")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(os.path.join(tmp, "test.db"))
+        async_manager = AsyncDatabaseManager(manager, max_workers=2)
+
+        async def scenario():
+            loop_thread = threading.get_ident()
+            # Ghi dong thoi tu nhieu coroutine
+            counts = await asyncio.gather(*[
+                async_manager.save_real_time_data_batch(
+                    ((f"N{k}", float(i), None, None, None) for k in range(10))
+                )
+                for i in range(20)
+            ])
+            await async_manager.save_real_time_data("N0", pressure=99.0)
+            run_id = await async_manager.save_simulation_run("completed", {"duration": 24})
+            latest = await async_manager.get_latest_real_time_data("N0")
+            history = await async_manager.get_real_time_history("N1", resolution="raw", limit=1000)
+            worker_thread = await async_manager.run(threading.get_ident)
+
+            # Loop van phuc vu coroutine khac trong khi mot thao tac DB bi chan (vd: cho write lock)
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            task = asyncio.create_task(ticker())
+            await async_manager.run(time.sleep, 0.3)
+            task.cancel()
+            return loop_thread, worker_thread, counts, run_id, latest, history, ticks
+
+        try:
+            loop_thread, worker_thread, counts, run_id, latest, history, ticks = asyncio.run(scenario())
+
+            if worker_thread == loop_thread:
+                print("[ERROR] Database call ran on the event loop thread")
+                return False
+            if sum(counts) != 200 or run_id != 1:
+                print(f"[ERROR] Unexpected write results: {sum(counts)} rows, run_id={run_id}")
+                return False
+            if latest != manager.get_latest_real_time_data("N0") or latest[0]["pressure"] != 99.0:
+                print(f"[ERROR] Async read differs from sync read: {latest}")
+                return False
+            if len(history["data"]) != 20:
+                print(f"[ERROR] Expected 20 history rows for N1, got {len(history['data'])}")
+                return False
+            if ticks < 10:
+                print(f"[ERROR] Event loop blocked: only {ticks} ticks during a 300 ms database call")
+                return False
+
+            # close() dung pool + dong connection, manager van dung lai duoc
+            asyncio.run(async_manager.close())
+            again = asyncio.run(async_manager.get_latest_real_time_data("N0"))
+            asyncio.run(async_manager.close())
+            if again != latest:
+                print("[ERROR] Manager not reusable after close()")
+                return False
+
+            print(f"[OK] 201 rows + run {run_id} written via worker thread, loop ticked {ticks}x during 300 ms call")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            manager.close()
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("DATABASE MANAGER - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['pragmas_and_reuse'] = test_connection_pragmas_and_reuse()
+    results['concurrent_writes'] = test_concurrent_writes()
+    results['rollback_and_close'] = test_rollback_and_close()
+    results['batch_insert'] = test_batch_insert()
+    results['write_behind_queue'] = test_write_behind_queue()
+    results['indexes_rollups_retention'] = test_indexes_rollups_and_retention()
+    results['async_manager'] = test_async_manager_does_not_block_loop()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
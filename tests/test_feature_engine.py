@@ -0,0 +1,208 @@
+"""
+Test script de verify dense rolling feature engine (services/feature_engine.py)
+trung tung bit voi groupby(...).transform(lambda x: x.rolling(...)) cu
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.feature_engine import RollingFeatureEngine
+from services.leak_detection_service import LeakDetectionService
+
+
+def _legacy_features(df, col):
+    """Cac lambda cu (copy tu prepare_features / train_leak_model.py)"""
+    g = df.groupby(['scenario_id', 'node_id'], sort=False)
+    return {
+        'diff': g[col].transform(lambda x: x.diff().fillna(0)),
+        'ma3': g[col].transform(lambda x: x.rolling(3, min_periods=1).mean()),
+        'ma5': g[col].transform(lambda x: x.rolling(5, min_periods=1).mean()),
+        'std5': g[col].transform(lambda x: x.rolling(5, min_periods=1).std().fillna(0)),
+        'min5': g[col].transform(lambda x: x.rolling(5, min_periods=1).min()),
+        'max5': g[col].transform(lambda x: x.rolling(5, min_periods=1).max()),
+        'deviation': df.groupby(['scenario_id', 'node_id'])[col].transform(lambda x: x - x.mean()),
+    }
+
+
+def _engine_features(engine, col):
+    return {
+        'diff': engine.diff(col),
+        'ma3': engine.mean(col, 3),
+        'ma5': engine.mean(col, 5),
+        'std5': engine.std(col, 5),
+        'min5': engine.min(col, 5),
+        'max5': engine.max(col, 5),
+        'deviation': engine.deviation(col),
+    }
+
+
+def _make_case(seed, n_scenarios=3, n_nodes=20, n_times=30, ragged=False, float32=False):
+    rng = np.random.default_rng(seed)
+    records = []
+    for s in range(n_scenarios):
+        for t in range(n_times):
+            for n in range(n_nodes):
+                if ragged and rng.random() < 0.15:
+                    continue  # node thieu tai timestamp nay -> nhom co do dai khac nhau
+                r = rng.random()
+                if r > 0.3:
+                    pressure = rng.normal(20, 5)
+                elif r > 0.15:
+                    pressure = 5.0  # chuoi gia tri lap lai
+                elif r > 0.08:
+                    pressure = np.nan
+                elif r > 0.05:
+                    pressure = np.inf
+                elif r > 0.03:
+                    pressure = -0.0
+                else:
+                    pressure = -3.0
+                demand = rng.choice([0.0, rng.random() * 1e-3, 1e8 * rng.random()])
+                records.append((s, f"J{n}", t * 3600, pressure, demand))
+    df = pd.DataFrame(records, columns=['scenario_id', 'node_id', 'timestamp', 'pressure', 'demand'])
+    df = df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+    if float32:
+        df['pressure'] = df['pressure'].astype('float32')
+    return df
+
+
+def _identical(a, b) -> bool:
+    a, b = np.asarray(a), np.asarray(b)
+    if a.dtype != b.dtype:
+        return False
+    same = (a == b) | (np.isnan(a) & np.isnan(b))
+    # Phan biet ca 0.0 / -0.0
+    return bool(same.all() and (np.signbit(a) == np.signbit(b)).all())
+
+
+def test_matches_pandas_transform():
+    """Test 1: moi kernel trung tung bit (ca dtype) voi transform lambda cu"""
+    print("\n" + "="*60)
+    print("TEST 1: Engine vs groupby.transform(lambda)")
+    print("="*60)
+
+    try:
+        cases = [
+            dict(seed=1),
+            dict(seed=2, ragged=True),
+            dict(seed=3, float32=True),
+            dict(seed=4, n_times=3),
+            dict(seed=5, n_nodes=5, n_times=200),
+        ]
+        for case in cases:
+            df = _make_case(**case)
+            engine = RollingFeatureEngine(df)
+            for col in ('pressure', 'demand'):
+                legacy = _legacy_features(df, col)
+                fast = _engine_features(engine, col)
+                for name, expected in legacy.items():
+                    if not _identical(expected.to_numpy(), fast[name]):
+                        print(f"[ERROR] {case}: {col} {name} differs (dtype {expected.dtype} vs {fast[name].dtype})")
+                        return False
+            print(f"[OK] {case}: {len(df)} rows, {engine.n_groups} groups, {len(engine.blocks)} block(s) identical")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_prepare_features_columns():
+    """Test 2: cot rolling cua prepare_features khong doi, nhanh hon transform lambda"""
+    print("\n" + "="*60)
+    print("TEST 2: prepare_features (10 scenarios x 195 nodes x 25 steps)")
+    print("="*60)
+
+    try:
+        n_scenarios, n_nodes, n_times = 10, 195, 25
+        rng = np.random.default_rng(7)
+        n = n_scenarios * n_nodes * n_times
+        df = pd.DataFrame({
+            'scenario_id': np.repeat(np.arange(n_scenarios), n_nodes * n_times),
+            'timestamp': np.tile(np.repeat(np.arange(n_times) * 3600, n_nodes), n_scenarios),
+            'node_id': np.tile([str(i) for i in range(n_nodes)], n_scenarios * n_times),
+            'pressure': rng.normal(30, 3, n),
+            'head': rng.normal(60, 3, n),
+            'demand': rng.uniform(0, 2, n),
+        })
+
+        service = LeakDetectionService()
+        service._load_topology_features = lambda: ({}, None)
+
+        t0 = time.perf_counter()
+        features = service.prepare_features(df)
+        fast_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        g = df.groupby(['scenario_id', 'node_id'], sort=False)
+        expected = {
+            'pressure_change': g['pressure'].transform(lambda x: x.diff().fillna(0)),
+            'pressure_ma3': g['pressure'].transform(lambda x: x.rolling(3, min_periods=1).mean()),
+            'head_ma5': g['head'].transform(lambda x: x.rolling(5, min_periods=1).mean()),
+            'demand_std_5': g['demand'].transform(lambda x: x.rolling(5, min_periods=1).std().fillna(0)),
+            'pressure_min_5': g['pressure'].transform(lambda x: x.rolling(5, min_periods=1).min()),
+            'head_max_5': g['head'].transform(lambda x: x.rolling(5, min_periods=1).max()),
+            'demand_deviation': df.groupby(['scenario_id', 'node_id'])['demand'].transform(lambda x: x - x.mean()),
+        }
+        legacy_time = time.perf_counter() - t0
+        g_change = features.groupby(['scenario_id', 'node_id'], sort=False)['pressure_change']
+        expected['pressure_acceleration'] = g_change.transform(lambda x: x.diff().fillna(0))
+
+        for name, values in expected.items():
+            if not _identical(values.to_numpy(), features[name].to_numpy()):
+                print(f"[ERROR] {name} differs from transform lambda")
+                return False
+
+        print(f"[OK] {len(df)} rows: 7 legacy rolling columns {legacy_time:.2f}s (lambda); "
+              f"whole prepare_features {fast_time:.2f}s")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("ROLLING FEATURE ENGINE - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['matches_pandas_transform'] = test_matches_pandas_transform()
+    results['prepare_features_columns'] = test_prepare_features_columns()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+Test script de verify feature pipeline dung chung (services/feature_pipeline.py)
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import numpy as np
+import pandas as pd
+
+from services.feature_pipeline import (
+    BASE_FEATURES,
+    FEATURE_SCHEMA,
+    FEATURE_VERSION,
+    FeatureSchemaError,
+    build_features,
+    check_feature_metadata,
+    feature_metadata,
+    select_features,
+)
+from services.leak_detection_service import LeakDetectionService
+from services.model_store import resolve_feature_cols
+
+
+def _make_frame(n_scenarios=2, n_nodes=12, n_times=10, seed=0):
+    rng = np.random.default_rng(seed)
+    n = n_scenarios * n_nodes * n_times
+    return pd.DataFrame({
+        'scenario_id': np.repeat(np.arange(n_scenarios), n_nodes * n_times),
+        'timestamp': np.tile(np.repeat(np.arange(n_times) * 3600, n_nodes), n_scenarios),
+        'node_id': np.tile([str(i) for i in range(n_nodes)], n_scenarios * n_times),
+        'pressure': rng.normal(30, 3, n),
+        'head': rng.normal(60, 3, n),
+        'demand': rng.uniform(0, 2, n),
+    })
+
+
+def test_one_definition_everywhere():
+    """Test 1: service va scripts (subset feature) cho cung gia tri; chi tinh cot can thiet"""
+    print("\n" + "="*60)
+    print("TEST 1: Shared Definitions")
+    print("="*60)
+
+    try:
+        df = _make_frame()
+        service = LeakDetectionService()
+        service._load_topology_features = lambda: ({}, None)
+        served = service.prepare_features(df)
+
+        missing = [f for f in FEATURE_SCHEMA if f not in served.columns]
+        if missing:
+            print(f"[ERROR] prepare_features is missing {missing}")
+            return False
+
+        # Danh sach feature cua train_leak_model.py
+        train_cols = ['pressure', 'head', 'demand', 'pressure_ma3', 'pressure_ma5', 'head_ma3', 'head_ma5',
+                      'pressure_change', 'head_change', 'pressure_drop', 'head_drop',
+                      'network_pressure_mean', 'network_pressure_std', 'network_demand_mean',
+                      'pressure_deviation', 'demand_deviation']
+        trained = build_features(df.copy(), train_cols)
+        # Chi them phu thuoc cua cot duoc yeu cau (pressure_drop / head_drop can *_max_5)
+        extra = set(trained.columns) - set(df.columns) - set(train_cols) - {'pressure_max_5', 'head_max_5'}
+        if extra:
+            print(f"[ERROR] Subset build computed unrequested columns: {sorted(extra)}")
+            return False
+        if not np.array_equal(select_features(trained, train_cols), select_features(served, train_cols)):
+            print("[ERROR] Training and serving features differ")
+            return False
+
+        # demand_deviation nhom theo scenario x node (khong phai chi node)
+        by_node = df.groupby('node_id')['demand'].transform(lambda x: x - x.mean())
+        if np.allclose(served['demand_deviation'], by_node):
+            print("[ERROR] demand_deviation is grouped by node only")
+            return False
+
+        # pressure_drop / head_drop = max cua so 5 - gia tri (nhu train_leak_model.py da train model)
+        groups = df.groupby(['scenario_id', 'node_id'])
+        for signal in ('pressure', 'head'):
+            rolling_max = groups[signal].transform(lambda x: x.rolling(5, min_periods=1).max())
+            if not np.allclose(served[f'{signal}_drop'], rolling_max - df[signal]):
+                print(f"[ERROR] {signal}_drop should be rolling max5 - {signal}")
+                return False
+
+        print(f"[OK] {len(FEATURE_SCHEMA)} schema features served; training subset of {len(train_cols)} identical")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_version_checks_fail_fast():
+    """Test 2: metadata khac version / feature la / thieu cot -> FeatureSchemaError"""
+    print("\n" + "="*60)
+    print("TEST 2: Version & Schema Checks")
+    print("="*60)
+
+    def rejects(func, *args):
+        try:
+            func(*args)
+        except FeatureSchemaError as e:
+            print(f"[OK] Rejected: {e}")
+            return True
+        print(f"[ERROR] {func.__name__}{args!r} was accepted")
+        return False
+
+    try:
+        metadata = feature_metadata(BASE_FEATURES)
+        if metadata['feature_version'] != FEATURE_VERSION or check_feature_metadata(metadata) != list(BASE_FEATURES):
+            print(f"[ERROR] Round trip failed: {metadata}")
+            return False
+        # Metadata cu (chua co feature_version) = v1
+        legacy = {'feature_cols': list(BASE_FEATURES)}
+        if check_feature_metadata(legacy) != list(BASE_FEATURES):
+            print("[ERROR] Legacy metadata rejected")
+            return False
+
+        ok = all([
+            rejects(check_feature_metadata, {'feature_version': FEATURE_VERSION + 1, 'feature_cols': ['pressure']}),
+            rejects(check_feature_metadata, {'feature_version': FEATURE_VERSION, 'feature_cols': ['pressure', 'hour_sin']}),
+            rejects(check_feature_metadata, {'feature_version': FEATURE_VERSION}),
+            rejects(build_features, _make_frame(), ['node_id_int']),
+            rejects(select_features, _make_frame(), ['pressure', 'pressure_ma3']),
+        ])
+        if not ok:
+            return False
+
+        # Service: metadata khong khop so feature cua model -> khong ready (khong dien 0)
+        class FakeModel:
+            feature_names_ = list(FEATURE_SCHEMA)
+
+        if not rejects(resolve_feature_cols, FakeModel(), list(BASE_FEATURES)):
+            return False
+        if resolve_feature_cols(FakeModel(), None) != list(FEATURE_SCHEMA):
+            print("[ERROR] 39-feature model should resolve to FEATURE_SCHEMA")
+            return False
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("FEATURE PIPELINE - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['one_definition_everywhere'] = test_one_definition_everywhere()
+    results['version_checks_fail_fast'] = test_version_checks_fail_fast()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
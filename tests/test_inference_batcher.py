@@ -0,0 +1,243 @@
+"""
+Test script de verify micro-batching predict_proba (services/inference_batcher.py)
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from services.feature_pipeline import BASE_FEATURES
+from services.inference_batcher import InferenceBatcher, positive_proba
+from services.leak_detection_service import LeakDetectionService
+from services.model_store import ModelBundle, ModelStore
+
+
+class RowModel:
+    """Model gia: xac suat phu thuoc tung dong, dem so lan goi predict_proba"""
+
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.calls = 0
+        self.batch_rows = []
+        self._lock = threading.Lock()
+
+    def predict_proba(self, X):
+        with self._lock:
+            self.calls += 1
+            self.batch_rows.append(len(X))
+        values = np.asarray(X, dtype=np.float64)
+        p = 1.0 / (1.0 + np.exp(-self.scale * np.tanh(values.mean(axis=1))))
+        return np.column_stack([1 - p, p])
+
+
+class FailingModel:
+    def predict_proba(self, X):
+        raise RuntimeError("boom")
+
+
+def _matrices(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.normal(size=(int(rng.integers(1, 300)), 8)) for _ in range(n)]
+
+
+def _run_concurrently(batcher, model, matrices):
+    barrier = threading.Barrier(len(matrices))
+
+    def call(X):
+        barrier.wait()
+        return batcher.predict(model, X)
+
+    with ThreadPoolExecutor(max_workers=len(matrices)) as pool:
+        return list(pool.map(call, matrices))
+
+
+def test_batches_concurrent_requests():
+    """Test 1: request dong thoi -> it lan predict_proba hon, ket qua dung cho tung caller"""
+    print("\n" + "="*60)
+    print("TEST 1: Concurrent Requests Are Batched")
+    print("="*60)
+
+    batcher = InferenceBatcher(max_batch_size=16, max_wait_ms=50)
+    batcher.start()
+    try:
+        model = RowModel()
+        matrices = _matrices(24)
+        results = _run_concurrently(batcher, model, matrices)
+        reference = RowModel()
+        for X, proba in zip(matrices, results):
+            if not np.array_equal(proba, positive_proba(reference, X)):
+                print("[ERROR] Scattered probabilities differ from a direct call")
+                return False
+        stats = batcher.stats()
+        if model.calls >= len(matrices) or stats["requests"] != len(matrices) or stats["max_batch_size"] > 16:
+            print(f"[ERROR] Expected batching: {model.calls} calls, stats {stats}")
+            return False
+        print(f"[OK] {len(matrices)} requests -> {model.calls} predict_proba calls, rows per call {model.batch_rows}")
+        print(f"[OK] Stats: batch_size {stats['batch_size']}, queue_ms {stats['queue_ms']}")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        batcher.stop()
+
+
+def test_models_and_errors_are_isolated():
+    """Test 2: khong gom request cua model khac; loi chi tra ve cho batch bi loi"""
+    print("\n" + "="*60)
+    print("TEST 2: Per-Model Batches And Errors")
+    print("="*60)
+
+    batcher = InferenceBatcher(max_batch_size=8, max_wait_ms=30)
+    batcher.start()
+    try:
+        old, new, bad = RowModel(1.0), RowModel(3.0), FailingModel()
+        models = [old, new, bad] * 4
+        matrices = _matrices(len(models), seed=1)
+        barrier = threading.Barrier(len(models))
+
+        def call(args):
+            model, X = args
+            barrier.wait()
+            try:
+                return batcher.predict(model, X)
+            except RuntimeError as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=len(models)) as pool:
+            results = list(pool.map(call, zip(models, matrices)))
+
+        for model, X, result in zip(models, matrices, results):
+            if model is bad:
+                if not isinstance(result, RuntimeError):
+                    print("[ERROR] Failing model did not raise")
+                    return False
+            elif not np.array_equal(result, positive_proba(RowModel(model.scale), X)):
+                print("[ERROR] Result computed with the wrong model")
+                return False
+
+        # DataFrame (khong co scaler) giu nguyen DataFrame khi noi
+        frames = [pd.DataFrame(X, columns=[f"f{i}" for i in range(8)]) for X in _matrices(4, seed=2)]
+        results = _run_concurrently(batcher, old, frames)
+        if not all(np.array_equal(r, positive_proba(RowModel(1.0), f)) for r, f in zip(results, frames)):
+            print("[ERROR] DataFrame inputs scattered incorrectly")
+            return False
+        print(f"[OK] Models kept apart, errors isolated; stats {batcher.stats()['errors']} errored requests")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        batcher.stop()
+
+
+def test_detect_leaks_unchanged():
+    """Test 3: detect_leaks qua batcher cho ket qua giong goi truc tiep"""
+    print("\n" + "="*60)
+    print("TEST 3: detect_leaks With And Without Batching")
+    print("="*60)
+
+    import services.leak_detection_service as service_module
+
+    try:
+        model = RowModel(40.0)
+        service = LeakDetectionService()
+        service._load_topology_features = lambda: ({}, None)
+        service.models = ModelStore(loader=lambda path: ModelBundle(
+            model, None, None, list(BASE_FEATURES), 0.5, Path("fake.pkl"), ()
+        ))
+
+        rng = np.random.default_rng(3)
+        requests = []
+        for r in range(6):
+            requests.append({
+                f"N{n}": [
+                    {"timestamp": t * 3600, "pressure": float(rng.uniform(5, 40)),
+                     "head": float(rng.uniform(20, 60)), "demand": float(rng.uniform(0, 2))}
+                    for t in range(24)
+                ]
+                for n in range(30 + r)
+            })
+
+        direct = [service.detect_leaks(nodes_data) for nodes_data in requests]
+        # Xac suat cua cac lan goi truc tiep dang nam trong cache: bo di de cham diem lai qua batcher
+        service.scored_runs.clear()
+
+        batcher = InferenceBatcher(max_batch_size=8, max_wait_ms=50)
+        original = service_module.inference_batcher
+        service_module.inference_batcher = batcher
+        batcher.start()
+        try:
+            calls_before = model.calls
+            barrier = threading.Barrier(len(requests))
+
+            def call(nodes_data):
+                barrier.wait()
+                return service.detect_leaks(nodes_data)
+
+            with ThreadPoolExecutor(max_workers=len(requests)) as pool:
+                batched = list(pool.map(call, requests))
+        finally:
+            batcher.stop()
+            service_module.inference_batcher = original
+
+        if batched != direct or not all(r["success"] for r in batched):
+            print("[ERROR] Batched detect_leaks results differ")
+            return False
+        print(f"[OK] {len(requests)} detect_leaks calls identical, "
+              f"{model.calls - calls_before} predict_proba calls when batched")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("INFERENCE BATCHER - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['batches_concurrent_requests'] = test_batches_concurrent_requests()
+    results['models_and_errors_are_isolated'] = test_models_and_errors_are_isolated()
+    results['detect_leaks_unchanged'] = test_detect_leaks_unchanged()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
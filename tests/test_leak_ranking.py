@@ -0,0 +1,248 @@
+"""
+Test script de verify gop / xep hang ung vien ro ri (services/leak_ranking.py): cung ket qua
+voi vong lap iterrows + dict cu, top_k = tien to cua xep hang day du, gop theo cua so thoi gian
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.leak_detection_service import LeakDetectionService
+from services.leak_ranking import rank_leak_candidates, top_k_order
+
+
+def _legacy_collect(df_fe, excluded_nodes):
+    """_collect_leaks truoc day (loc tren DataFrame, iterrows, dict giu xac suat cao nhat)"""
+    leaks_df = df_fe[df_fe['predicted_leak'] == 1].copy()
+    leaks_df = leaks_df[~leaks_df['node_id'].astype(str).isin(excluded_nodes)]
+    leaks_df = leaks_df[leaks_df['demand'] >= 0]
+    leaks_df = leaks_df[leaks_df['leak_probability'] >= 0.05]
+    leaks_df = leaks_df[leaks_df['demand'] >= 0.001]
+    leaks = []
+    for _, row in leaks_df.iterrows():
+        demand_m3s = float(row['demand'])
+        leaks.append({
+            "node_id": str(row['node_id']),
+            "timestamp": float(row['timestamp']),
+            "probability": float(row['leak_probability']),
+            "pressure": float(row['pressure']),
+            "head": float(row['head']),
+            "demand": demand_m3s,
+            "flow": demand_m3s * 1000
+        })
+    unique_leaks = {}
+    for leak in leaks:
+        node_id = leak['node_id']
+        if node_id not in unique_leaks or leak['probability'] > unique_leaks[node_id]['probability']:
+            unique_leaks[node_id] = leak
+    leaks = list(unique_leaks.values())
+    leaks.sort(key=lambda x: x['probability'], reverse=True)
+    return leaks, len(leaks_df)
+
+
+def _scored_frame(n_nodes, n_steps, step_seconds=900, seed=0, rounded=False):
+    """Du lieu da predict: node x buoc thoi gian, xac suat lam tron (-> nhieu gia tri bang nhau)"""
+    rng = np.random.default_rng(seed)
+    n = n_nodes * n_steps
+    probability = rng.beta(0.5, 2.0, n)
+    if rounded:
+        probability = probability.round(2)
+    demand = rng.uniform(-0.002, 0.02, n)
+    demand[rng.random(n) < 0.01] = np.nan
+    return pd.DataFrame({
+        'node_id': np.tile([f"J{i}" for i in range(n_nodes)], n_steps),
+        'timestamp': np.repeat(np.arange(n_steps) * step_seconds, n_nodes).astype(float),
+        'pressure': rng.uniform(10, 40, n),
+        'head': rng.uniform(20, 60, n),
+        'demand': demand,
+        'leak_probability': probability,
+        'predicted_leak': (probability >= 0.2).astype(int),
+    })
+
+
+def _service():
+    service = LeakDetectionService.__new__(LeakDetectionService)
+    service.excluded_nodes = {"J3", "J7"}
+    return service
+
+
+def test_matches_legacy():
+    """Test 1: cung danh sach leaks (thu tu, gia tri, xac suat bang nhau) va so dong ro ri"""
+    print("\n" + "="*60)
+    print("TEST 1: Vectorized Ranking vs Legacy Loop")
+    print("="*60)
+
+    try:
+        service = _service()
+        for seed in range(3):
+            df_fe = _scored_frame(60, 40, seed=seed, rounded=True)
+            expected, expected_rows = _legacy_collect(df_fe, service.excluded_nodes | {"J11"})
+            ranking, rows = service._collect_leaks(df_fe, {"J11"}, 0.2)
+            leaks = ranking.to_leaks()
+            legacy_keys = list(expected[0].keys())
+            if rows != expected_rows or [{k: l[k] for k in legacy_keys} for l in leaks] != expected:
+                print(f"[ERROR] Seed {seed}: leaks differ from legacy loop")
+                return False
+            if ranking.n_nodes != len(expected):
+                print(f"[ERROR] n_nodes {ranking.n_nodes} != {len(expected)}")
+                return False
+
+        # Aggregates theo node
+        leak = leaks[0]
+        node_rows = df_fe[(df_fe['node_id'].astype(str) == leak['node_id']) & (df_fe['predicted_leak'] == 1)
+                          & (df_fe['demand'] >= 0.001)]
+        if (leak['flagged_steps'] != len(node_rows)
+                or not np.isclose(leak['mean_probability'], node_rows['leak_probability'].mean())
+                or leak['first_flagged'] != node_rows['timestamp'].min()
+                or leak['last_flagged'] != node_rows['timestamp'].max()):
+            print(f"[ERROR] Wrong aggregates for node {leak['node_id']}: {leak}")
+            return False
+
+        empty, rows = service._collect_leaks(df_fe, set(), 1.01)
+        if len(empty) != 0 or rows != 0 or empty.to_leaks() != []:
+            print("[ERROR] No flagged rows should give an empty ranking")
+            return False
+        print(f"[OK] Identical to legacy loop ({len(leaks)} nodes from {expected_rows} flagged rows in last case)")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_top_k_and_windows():
+    """Test 2: top_k = k phan tu dau cua xep hang day du; gop theo gio"""
+    print("\n" + "="*60)
+    print("TEST 2: Top-K And Windowed Aggregation")
+    print("="*60)
+
+    try:
+        rng = np.random.default_rng(4)
+        score = rng.integers(0, 20, 500).astype(float)
+        full = top_k_order(score, None)
+        for k in (0, 1, 7, 25, 499, 500, 800):
+            if not np.array_equal(top_k_order(score, k), full[:k]):
+                print(f"[ERROR] top_k_order({k}) is not a prefix of the full order")
+                return False
+
+        df_fe = _scored_frame(30, 96, step_seconds=900, seed=5, rounded=True)
+        flagged = df_fe[(df_fe['predicted_leak'] == 1) & (df_fe['demand'] >= 0.001)]
+        args = (flagged['node_id'].astype(str), flagged['timestamp'], flagged['leak_probability'],
+                {c: flagged[c] for c in ('pressure', 'head', 'demand')})
+        full_leaks = rank_leak_candidates(*args).to_leaks()
+        top = rank_leak_candidates(*args, top_k=5)
+        if top.to_leaks() != full_leaks[:5] or top.n_nodes != len(full_leaks):
+            print("[ERROR] top_k should keep the first k leaks of the full ranking")
+            return False
+
+        hourly = rank_leak_candidates(*args, window=3600)
+        grouped = flagged.assign(hour=flagged['timestamp'] // 3600 * 3600, node=flagged['node_id'].astype(str))
+        expected = grouped.groupby(['node', 'hour']).agg(
+            probability=('leak_probability', 'max'), steps=('leak_probability', 'size'),
+            mean=('leak_probability', 'mean'), first=('timestamp', 'min'), last=('timestamp', 'max'))
+        result = pd.DataFrame(hourly.to_leaks()).set_index(['node_id', 'window_start'])
+        result = result.loc[expected.index]
+        if (len(hourly) != len(expected) or hourly.n_groups != len(expected)
+                or not np.allclose(result['probability'], expected['probability'])
+                or not np.array_equal(result['flagged_steps'], expected['steps'])
+                or not np.allclose(result['mean_probability'], expected['mean'])
+                or not np.array_equal(result['first_flagged'], expected['first'])
+                or not np.array_equal(result['last_flagged'], expected['last'])):
+            print("[ERROR] Hourly aggregates differ from pandas groupby")
+            return False
+        if not np.all(np.diff(hourly.columns['probability']) <= 0):
+            print("[ERROR] Windows should be sorted by probability")
+            return False
+        print(f"[OK] top_k prefix of full ranking; {len(hourly)} node-hour windows match groupby")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_multi_day_timing():
+    """Test 3: 500 node x 7 ngay x 96 buoc/ngay - vong lap cu vs reduce tren mang"""
+    print("\n" + "="*60)
+    print("TEST 3: Multi-Day Ranking Time")
+    print("="*60)
+
+    try:
+        service = _service()
+        df_fe = _scored_frame(500, 7 * 96, seed=6)
+
+        t0 = time.perf_counter()
+        expected, _ = _legacy_collect(df_fe, service.excluded_nodes)
+        legacy_ms = (time.perf_counter() - t0) * 1000
+
+        times = []
+        for _ in range(3):
+            t0 = time.perf_counter()
+            ranking, rows = service._collect_leaks(df_fe, set(), 0.2)
+            times.append(time.perf_counter() - t0)
+        vectorized_ms = float(np.median(times)) * 1000
+
+        t0 = time.perf_counter()
+        top = service._collect_leaks(df_fe, set(), 0.2, top_k=20, window=3600)[0]
+        windowed_ms = (time.perf_counter() - t0) * 1000
+
+        if [l['node_id'] for l in ranking.to_leaks()] != [l['node_id'] for l in expected]:
+            print("[ERROR] Ranking differs from legacy loop")
+            return False
+        if len(top) != 20:
+            print(f"[ERROR] Expected 20 windows, got {len(top)}")
+            return False
+        print(f"[OK] {len(df_fe)} rows ({rows} flagged): legacy {legacy_ms:.0f} ms, "
+              f"vectorized {vectorized_ms:.1f} ms, hourly top-20 {windowed_ms:.1f} ms")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("LEAK RANKING - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['matches_legacy'] = test_matches_legacy()
+    results['top_k_and_windows'] = test_top_k_and_windows()
+    results['multi_day_timing'] = test_multi_day_timing()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Test script de verify tu dien chu ky ro ri (services/leak_signatures.py): tao song song =
+tao tuan tu, luu / doc lai theo hash .inp, dinh vi ro ri mo phong bang similarity search
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from services.baseline_cache import BaselineCache
+from services.leak_detection_service import LeakDetectionService
+from services.leak_signatures import LeakSignatureDictionary, SignaturesNotBuiltError
+from services.node_arrays import NodeArrays
+from tests.test_baseline_features import INP_FILE, _simulate
+
+# Junction ung vien cua test (mot phan mang de tao tu dien nhanh)
+JUNCTIONS = ['575', '18', '1437', '269', '938', '80', '7', '180', '548', '481', '968', '1071',
+             '10', '612', '134', '171', '174', '146', '277', '285', '26', '885', '6', '429']
+
+
+def test_parallel_build_and_cache():
+    """Test 1: process pool = tuan tu, file cache dung lai, doi .inp -> tao lai"""
+    print("\n" + "="*60)
+    print("TEST 1: Parallel Build And Cache")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            inp_copy = Path(tmp) / "network.inp"
+            shutil.copy(INP_FILE, inp_copy)
+            cache_dir = str(Path(tmp) / "signatures")
+            junctions = JUNCTIONS[:8]
+
+            parallel = LeakSignatureDictionary(str(inp_copy), cache_dir, junctions=junctions, workers=2)
+            if parallel.cached() is not None or parallel.builds != 0:
+                print("[ERROR] cached() should not build a missing dictionary")
+                return False
+            started = time.perf_counter()
+            table = parallel.table()
+            parallel_s = time.perf_counter() - started
+            serial = LeakSignatureDictionary(str(inp_copy), None, junctions=junctions, workers=1).table()
+            if table.junctions != junctions or table.delta.shape != (8, len(table.sensors)):
+                print(f"[ERROR] Unexpected table shape {table.delta.shape}")
+                return False
+            if not np.allclose(table.delta, serial.delta, atol=1e-6):
+                print("[ERROR] Parallel signatures differ from serial build")
+                return False
+            own = [table.delta[i, table.sensors.index(j)] for i, j in enumerate(junctions)]
+            if not all(d < 0 and d == table.delta[i].min() for i, d in enumerate(own)):
+                print("[ERROR] Largest pressure drop should be at the leaking junction")
+                return False
+            if not np.allclose(np.linalg.norm(table.normalized, axis=1), 1.0, atol=1e-5):
+                print("[ERROR] Signatures should be unit-normalized")
+                return False
+
+            reopened = LeakSignatureDictionary(str(inp_copy), cache_dir, junctions=junctions, workers=2)
+            cached = reopened.cached()
+            if cached is None or cached.key != table.key or reopened.table() is not cached or reopened.builds != 0:
+                print("[ERROR] Stored dictionary should be reused")
+                return False
+
+            with open(inp_copy, "a", encoding="utf-8") as f:
+                f.write("\n; edited\n")
+            if reopened.table().key == table.key or reopened.builds != 1:
+                print("[ERROR] Changed .inp should rebuild the dictionary")
+                return False
+            if len(list(Path(cache_dir).glob("*.npz"))) != 2:
+                print("[ERROR] Each .inp hash should have its own dictionary file")
+                return False
+            if reopened.cached() is None:
+                print("[ERROR] Rebuilt dictionary should be served by cached()")
+                return False
+            print(f"[OK] {len(junctions)} signatures on 2 processes ({parallel_s:.1f} s) = serial build, "
+                  f"cached() never builds, reused from cache, rebuilt after .inp edit")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+def test_localization():
+    """Test 2: ro ri khac dien tich / head chuan -> junction ro ri dung dau, ca voi mot phan sensor"""
+    print("\n" + "="*60)
+    print("TEST 2: Localization")
+    print("="*60)
+
+    try:
+        service = LeakDetectionService()
+        service.baseline = BaselineCache(INP_FILE, None, bin_width=0.5)
+        service.baseline.warm(27.0, 32.0)
+        service.signatures = LeakSignatureDictionary(INP_FILE, None, junctions=JUNCTIONS, workers=1)
+        try:
+            service.localize_leak({'269': -1.0, '548': -0.5})
+            print("[ERROR] Localization should not build the dictionary inside the request")
+            return False
+        except SignaturesNotBuiltError:
+            pass
+        if service.signatures.builds != 0:
+            print("[ERROR] Localization should not build the dictionary inside the request")
+            return False
+
+        # /localize tra 503 cho den khi warmup (hoac script) tao xong tu dien
+        from fastapi.testclient import TestClient
+        from api.routes import leak_detection as routes
+        from main import app
+        client = TestClient(app)
+        url = "/api/v1/leak-detection/localize"
+        original = routes.leak_detection_service.signatures
+        routes.leak_detection_service.signatures = service.signatures
+        try:
+            response = client.post(url, json={"residuals": {'269': -1.0, '548': -0.5}})
+            if response.status_code != 503:
+                print(f"[ERROR] /localize before signatures are built: {response.status_code} {response.text}")
+                return False
+
+            table = service.signatures.table()
+            # Input sai -> 400, run_id khong ton tai -> 404
+            statuses = {
+                "single residual": client.post(url, json={"residuals": {'269': -1.0}}).status_code,
+                "constant residuals": client.post(url, json={"residuals": {'269': -1.0, '548': -1.0}}).status_code,
+                "malformed simulation_result": client.post(
+                    url, json={"simulation_result": {"nodes_results": [1, 2]}}).status_code,
+                "missing run_id": client.post(url, json={"run_id": 987654321}).status_code,
+            }
+        finally:
+            routes.leak_detection_service.signatures = original
+            for db in project_root.glob("epanet_data.db*"):
+                db.unlink()
+        if statuses != {"single residual": 400, "constant residuals": 400, "malformed simulation_result": 400,
+                        "missing run_id": 404}:
+            print(f"[ERROR] Unexpected /localize error codes: {statuses}")
+            return False
+
+        sensors = table.sensors[::4]
+
+        timings = []
+        for leak_node in ('269', '548', '134'):
+            frame = _simulate(INP_FILE, [28.0, 29.0], leak_node=leak_node, leak_area=0.001)
+            arrays = NodeArrays(frame['node_id'].tolist(), frame['timestamp'].tolist(), frame['pressure'].tolist(),
+                                frame['head'].tolist(), frame['demand'].tolist())
+            result = service.localize_leak(arrays, top_k=5)
+            if not result["success"] or result["candidates"][0]["node_id"] != leak_node:
+                print(f"[ERROR] Leak at {leak_node} ranked {result.get('error') or result['candidates']}")
+                return False
+            best = result["candidates"][0]
+            if best["similarity"] < 0.95 or best["estimated_area_m2"] <= 0:
+                print(f"[ERROR] Weak match for {leak_node}: {best}")
+                return False
+            timings.append(result["summary"]["localization_ms"])
+
+            residuals = service.node_residuals(arrays)
+            partial = service.localize_leak(residuals[residuals.index.isin(sensors)].to_dict(), top_k=3)
+            if not partial["success"] or leak_node not in [c["node_id"] for c in partial["candidates"]]:
+                print(f"[ERROR] Leak at {leak_node} not in top 3 with {len(sensors)} sensors")
+                return False
+
+        try:
+            service.localize_leak({'269': -1.0})
+            print("[ERROR] A single residual should not be localized")
+            return False
+        except ValueError:
+            pass
+        print(f"[OK] 503 before the dictionary exists, 400 bad input, 404 unknown run; 3 leaks (2x standard area, other head) ranked first among {len(table)} junctions, "
+              f"top 3 with {len(sensors)} sensors; localization {max(timings):.2f} ms")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("LEAK SIGNATURE DICTIONARY - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['parallel_build_and_cache'] = test_parallel_build_and_cache()
+    results['localization'] = test_localization()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""
+Test script de verify model store (services/model_store.py): load lazy, reload
+nguyen tu, giu model cu khi reload loi, watcher theo fingerprint file
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+from services.feature_pipeline import BASE_FEATURES, feature_metadata
+from services.model_store import ModelStore, load_bundle
+
+
+class ConstantModel:
+    """Model gia: xac suat ro ri co dinh (catboost khong can cho test)"""
+
+    def __init__(self, p):
+        self.p = p
+
+    def predict_proba(self, X):
+        n = len(X)
+        return np.column_stack([np.full(n, 1 - self.p), np.full(n, self.p)])
+
+
+def _write_model(model_dir: Path, p: float, mtime_ns: int):
+    model_file = model_dir / "leak_detection_model.pkl"
+    with open(model_file, 'wb') as f:
+        pickle.dump(ConstantModel(p), f)
+    # mtime co dinh: khong phu thuoc do phan giai dong ho cua filesystem
+    os.utime(model_file, ns=(mtime_ns, mtime_ns))
+
+
+def _make_model_dir() -> Path:
+    model_dir = Path(tempfile.mkdtemp(prefix="model_store_"))
+    with open(model_dir / "model_metadata.json", 'w') as f:
+        json.dump({**feature_metadata(BASE_FEATURES), 'best_threshold': 0.9}, f)
+    _write_model(model_dir, 0.2, 1_000_000_000)
+    return model_dir
+
+
+def test_lazy_load():
+    """Test 1: khong load gi luc tao store; lan get() dau tien load bundle"""
+    print("\n" + "="*60)
+    print("TEST 1: Lazy Load")
+    print("="*60)
+
+    model_dir = _make_model_dir()
+    try:
+        calls = []
+
+        def loader(path):
+            calls.append(path)
+            return load_bundle(path)
+
+        store = ModelStore(model_dir, loader=loader)
+        if calls or store.peek() is not None:
+            print("[ERROR] Model loaded at construction")
+            return False
+        bundle = store.get()
+        if bundle is None or len(calls) != 1 or store.get() is not bundle or len(calls) != 1:
+            print(f"[ERROR] Expected exactly one load, got {len(calls)}")
+            return False
+        if bundle.feature_cols != list(BASE_FEATURES) or bundle.threshold != 0.1:
+            print(f"[ERROR] Unexpected bundle: {bundle.info()}")
+            return False
+
+        # Thu muc khong co model: get() tra ve None, ghi lai loi, khong thu lai moi request
+        empty = ModelStore(Path(tempfile.mkdtemp(prefix="model_store_empty_")), loader=loader)
+        if empty.get() is not None or not empty.last_error or len(calls) != 2 or empty.get() is not None or len(calls) != 2:
+            print("[ERROR] Missing model should be reported once")
+            return False
+        shutil.rmtree(empty.model_dir, ignore_errors=True)
+        print(f"[OK] Loaded on first use: {bundle.info()}")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(model_dir, ignore_errors=True)
+
+
+def test_reload_swaps_atomically():
+    """Test 2: reload thay bundle moi; caller dang giu bundle cu van dung model cu"""
+    print("\n" + "="*60)
+    print("TEST 2: Atomic Reload")
+    print("="*60)
+
+    model_dir = _make_model_dir()
+    try:
+        store = ModelStore(model_dir)
+        in_flight = store.get()
+        _write_model(model_dir, 0.7, 2_000_000_000)
+        fresh = store.reload()
+
+        X = np.zeros((3, len(BASE_FEATURES)))
+        old_p = in_flight.model.predict_proba(X)[0, 1]
+        new_p = store.get().model.predict_proba(X)[0, 1]
+        if fresh is in_flight or store.get() is not fresh or old_p != 0.2 or new_p != 0.7:
+            print(f"[ERROR] Swap failed: in-flight p={old_p}, current p={new_p}")
+            return False
+        print("[OK] In-flight request keeps p=0.2, new requests see p=0.7")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(model_dir, ignore_errors=True)
+
+
+def test_failed_reload_keeps_model():
+    """Test 3: file model hong -> reload raise, bundle cu van duoc dung"""
+    print("\n" + "="*60)
+    print("TEST 3: Failed Reload Keeps Previous Model")
+    print("="*60)
+
+    model_dir = _make_model_dir()
+    try:
+        store = ModelStore(model_dir)
+        before = store.get()
+        (model_dir / "leak_detection_model.pkl").write_bytes(b"not a pickle")
+        try:
+            store.reload()
+            print("[ERROR] Reload of a corrupt file should raise")
+            return False
+        except Exception as e:
+            print(f"[OK] Reload failed as expected: {type(e).__name__}")
+        if store.get() is not before or not store.last_error:
+            print("[ERROR] Previous model was not kept")
+            return False
+        print("[OK] Previous model still served, last_error recorded")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(model_dir, ignore_errors=True)
+
+
+def test_reload_if_changed():
+    """Test 4: watcher chi reload khi file model/metadata thay doi"""
+    print("\n" + "="*60)
+    print("TEST 4: Reload If Changed")
+    print("="*60)
+
+    model_dir = _make_model_dir()
+    try:
+        store = ModelStore(model_dir)
+        if store.reload_if_changed():
+            print("[ERROR] Watcher must not load before first use")
+            return False
+        first = store.get()
+        if store.reload_if_changed() or store.get() is not first:
+            print("[ERROR] Reloaded without changes")
+            return False
+        _write_model(model_dir, 0.5, 3_000_000_000)
+        if not store.reload_if_changed() or store.get() is first:
+            print("[ERROR] Change not picked up")
+            return False
+        if store.reload_if_changed():
+            print("[ERROR] Reloaded twice for one change")
+            return False
+        print("[OK] Reloaded exactly once after the model file changed")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(model_dir, ignore_errors=True)
+
+
+def test_cold_store_off_event_loop():
+    """Test 5: route async khong load model tren event loop; health probe khong kich hoat load"""
+    print("\n" + "="*60)
+    print("TEST 5: Cold Store Off Event Loop")
+    print("="*60)
+
+    import asyncio
+    import time
+
+    import api.routes.leak_detection as routes
+    from services.leak_detection_service import LeakDetectionService
+    from services.model_store import ModelBundle
+
+    def slow_loader(path):
+        time.sleep(0.5)
+        return ModelBundle(ConstantModel(0.2), None, None, list(BASE_FEATURES), 0.5, Path("fake.pkl"), ())
+
+    async def ticker(done, ticks):
+        while not done.is_set():
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.02)
+
+    async def run(service):
+        done, ticks = asyncio.Event(), []
+        tick_task = asyncio.create_task(ticker(done, ticks))
+        await asyncio.sleep(0)
+        status = await routes.get_leak_detection_status()
+        done.set()
+        await tick_task
+        return status, ticks
+
+    original_service = routes.leak_detection_service
+    try:
+        service = LeakDetectionService()
+        service._load_topology_features = lambda: ({}, None)
+        service.models = ModelStore(loader=slow_loader)
+        if service.is_loaded() or service.models.peek() is not None:
+            print("[ERROR] is_loaded() must not trigger a model load")
+            return False
+        routes.leak_detection_service = service
+        status, ticks = asyncio.run(run(service))
+        if not status["ready"] or not service.is_loaded():
+            print(f"[ERROR] /status should load the model on first use: {status['ready']}")
+            return False
+        # Load 0.5s tren event loop -> ticker dung; tren threadpool -> ~25 tick
+        if len(ticks) < 10:
+            print(f"[ERROR] Event loop blocked during model load: {len(ticks)} ticks")
+            return False
+        print(f"[OK] Event loop kept running during a 0.5s cold load ({len(ticks)} ticks)")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        routes.leak_detection_service = original_service
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("MODEL STORE - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['lazy_load'] = test_lazy_load()
+    results['reload_swaps_atomically'] = test_reload_swaps_atomically()
+    results['failed_reload_keeps_model'] = test_failed_reload_keeps_model()
+    results['reload_if_changed'] = test_reload_if_changed()
+    results['cold_store_off_event_loop'] = test_cold_store_off_event_loop()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
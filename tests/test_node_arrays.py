@@ -0,0 +1,224 @@
+"""
+Test script de verify duong dan dang cot tu ket qua mo phong den feature pipeline
+(services/node_arrays.py): cung DataFrame / cung ket qua detect nhu cach chuyen doi cu
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import numpy as np
+import pandas as pd
+
+from services.feature_pipeline import BASE_FEATURES
+from services.leak_detection_service import LeakDetectionService
+from services.model_store import ModelBundle, ModelStore
+from services.node_arrays import NodeArrays
+
+
+class DropModel:
+    """Model gia: xac suat tang theo pressure_drop"""
+
+    def predict_proba(self, X):
+        p = 1.0 - np.exp(-np.asarray(X)[:, BASE_FEATURES.index('pressure_drop')])
+        return np.column_stack([1 - p, p])
+
+
+def _legacy_frame(nodes_results):
+    """Chuyen doi cu: nodes_results -> nodes_data (records) -> list of dicts -> DataFrame"""
+    nodes_data = {}
+    for node_id, node_data in nodes_results.items():
+        if isinstance(node_data, list):
+            nodes_data[node_id] = node_data
+        elif isinstance(node_data, dict):
+            records = []
+            timestamps = node_data.get('timestamps', [])
+            pressures = node_data.get('pressures', [])
+            heads = node_data.get('heads', [])
+            demands = node_data.get('demands', [])
+            for i in range(len(timestamps)):
+                records.append({
+                    'timestamp': timestamps[i],
+                    'pressure': pressures[i] if i < len(pressures) else 0,
+                    'head': heads[i] if i < len(heads) else 0,
+                    'demand': demands[i] if i < len(demands) else 0
+                })
+            nodes_data[node_id] = records
+    records = []
+    for node_id, node_records in nodes_data.items():
+        for record in node_records:
+            records.append({
+                'node_id': node_id,
+                'timestamp': record.get('timestamp', 0),
+                'pressure': record.get('pressure', 0),
+                'head': record.get('head', 0),
+                'demand': record.get('demand', 0)
+            })
+    return pd.DataFrame(records)
+
+
+def _nodes_results(seed=0, n_nodes=25, n_times=12):
+    rng = np.random.default_rng(seed)
+    nodes_results = {}
+    for i in range(n_nodes):
+        node_id = f"N{i}"
+        pressure = rng.uniform(10, 40, n_times)
+        if i == 3:
+            pressure[6:] -= 8  # ap luc giam -> ro ri
+        demand = rng.choice([0.0, 0.5, 2.0], n_times)
+        if i % 3 == 0:
+            # Dang cot; mot so node thieu gia tri cuoi
+            nodes_results[node_id] = {
+                'timestamps': [t * 3600 for t in range(n_times)],
+                'pressures': pressure.tolist()[: n_times - (i % 2)],
+                'heads': (pressure + 20).tolist(),
+                'demands': demand.tolist(),
+            }
+        else:
+            # Records nhu EPANETService._extract_wntr_results (khong co timestamp)
+            nodes_results[node_id] = [
+                {'node_id': node_id, 'pressure': float(p), 'head': float(p) + 20, 'demand': float(d), 'flow': float(d)}
+                for p, d in zip(pressure, demand)
+            ]
+    return nodes_results
+
+
+def test_same_frame_as_legacy():
+    """Test 1: NodeArrays.to_frame() = DataFrame cua cach chuyen doi cu (gia tri va dtype)"""
+    print("\n" + "="*60)
+    print("TEST 1: NodeArrays vs Legacy Conversion")
+    print("="*60)
+
+    try:
+        nodes_results = _nodes_results()
+        pd.testing.assert_frame_equal(NodeArrays.from_nodes_results(nodes_results).to_frame(), _legacy_frame(nodes_results))
+
+        records_only = {k: v for k, v in nodes_results.items() if isinstance(v, list)}
+        pd.testing.assert_frame_equal(NodeArrays.from_records(records_only).to_frame(), _legacy_frame(records_only))
+
+        # Ma tran [time x node] -> long format node-major
+        arrays = NodeArrays.from_matrix(['A', 'B'], [0, 3600, 7200], np.arange(6.0).reshape(3, 2),
+                                        np.zeros((3, 2)), np.ones((3, 2)))
+        frame = arrays.to_frame()
+        if list(frame['node_id']) != ['A'] * 3 + ['B'] * 3 or list(frame['pressure']) != [0, 2, 4, 1, 3, 5]:
+            print(f"[ERROR] Wrong matrix layout:\n{frame}")
+            return False
+        print(f"[OK] {len(frame)}-row matrix and {len(_legacy_frame(nodes_results))}-row nodes_results frames identical")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_same_detection_result():
+    """Test 2: detect_leaks_from_simulation_result cho ket qua nhu truoc"""
+    print("\n" + "="*60)
+    print("TEST 2: Detection Result Unchanged")
+    print("="*60)
+
+    try:
+        service = LeakDetectionService()
+        service._load_topology_features = lambda: ({}, None)
+        service.models = ModelStore(loader=lambda path: ModelBundle(
+            DropModel(), None, None, list(BASE_FEATURES), 0.5, Path("fake.pkl"), ()
+        ))
+        nodes_results = _nodes_results(seed=1)
+        result = service.detect_leaks_from_simulation_result({'nodes_results': nodes_results})
+
+        # Tham chieu: DataFrame cu di qua cung pipeline
+        service.scored_runs.clear()
+        reference = service.detect_leaks_from_arrays(NodeArrays(*[
+            _legacy_frame(nodes_results)[c].tolist() for c in NodeArrays.COLUMNS
+        ]))
+        if not result["success"] or result != reference or not result["leaks"]:
+            print(f"[ERROR] Results differ or empty: {result.get('summary')} vs {reference.get('summary')}")
+            return False
+        print(f"[OK] {len(result['leaks'])} leaks, summary identical")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_from_wntr_matches_extracted_records():
+    """Test 3: NodeArrays.from_wntr = gia tri cua _extract_wntr_results (cung don vi)"""
+    print("\n" + "="*60)
+    print("TEST 3: WNTR Arrays vs Extracted Records")
+    print("="*60)
+
+    try:
+        import wntr
+    except ImportError:
+        print("[WARN] wntr not installed - skipped")
+        return True
+
+    try:
+        from core.config import settings
+        from services.epanet_service import EPANETService
+
+        wn = wntr.network.WaterNetworkModel(settings.epanet_input_file)
+        wn.options.time.duration = 3 * 3600
+        wn.options.time.hydraulic_timestep = 3600
+        wn.options.time.report_timestep = 3600
+        results = wntr.sim.WNTRSimulator(wn).run_sim()
+
+        arrays = NodeArrays.from_wntr(results).to_frame()
+        nodes = EPANETService()._extract_wntr_results(results, wn)["nodes"]
+        legacy = _legacy_frame(nodes)
+        for column in ('node_id', 'pressure', 'head', 'demand'):
+            if not np.array_equal(arrays[column].to_numpy(), legacy[column].to_numpy()):
+                print(f"[ERROR] Column {column} differs")
+                return False
+        if list(arrays['timestamp'].unique()) != list(results.node['pressure'].index):
+            print("[ERROR] Timestamps should be the simulation times")
+            return False
+        print(f"[OK] {len(nodes)} nodes x {len(results.node['pressure'].index)} steps identical")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("NODE ARRAYS - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['same_frame_as_legacy'] = test_same_frame_as_legacy()
+    results['same_detection_result'] = test_same_detection_result()
+    results['from_wntr_matches_extracted_records'] = test_from_wntr_matches_extracted_records()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Test script de verify inference NumPy cho model CatBoost (services/oblivious_trees.py):
+cung xac suat voi cach CatBoost ap dung model JSON / predict_proba, load qua ModelStore
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from services.feature_pipeline import BASE_FEATURES
+from services.model_store import CATBOOST_INSTALLED, ModelStore, find_model_file
+from services.oblivious_trees import ObliviousTreeModel
+
+
+def _catboost_json(n_features=8, n_trees=40, seed=0):
+    """Model dang JSON cua CatBoost: depth khac nhau, feature AsTrue, border dang float64"""
+    rng = np.random.default_rng(seed)
+    float_features = [{
+        'feature_index': i, 'flat_feature_index': i, 'feature_id': f"f{i}",
+        'has_nans': True, 'nan_value_treatment': 'AsTrue' if i == 2 else 'AsFalse',
+    } for i in range(n_features)]
+    trees = []
+    for _ in range(n_trees):
+        depth = int(rng.integers(1, 7))
+        trees.append({
+            'leaf_values': rng.normal(scale=0.3, size=1 << depth).tolist(),
+            'splits': [{'float_feature_index': int(rng.integers(n_features)), 'border': float(rng.normal()) + 1e-9,
+                        'split_type': 'FloatFeature'} for _ in range(depth)],
+        })
+    return {'features_info': {'float_features': float_features}, 'oblivious_trees': trees,
+            'scale_and_bias': [0.8, [-0.4]]}
+
+
+def _apply_json(model_json, x):
+    """Ap dung model JSON tung dong nhu vi du json model applier cua CatBoost"""
+    nan_true = {f['feature_index'] for f in model_json['features_info']['float_features']
+                if f['nan_value_treatment'] == 'AsTrue'}
+    total = 0.0
+    for tree in model_json['oblivious_trees']:
+        index = 0
+        for depth, split in enumerate(tree['splits']):
+            value = np.float32(x[split['float_feature_index']])
+            if math.isnan(value):
+                bit = split['float_feature_index'] in nan_true
+            else:
+                bit = value > np.float32(split['border'])
+            if bit:
+                index |= 1 << depth
+        total += tree['leaf_values'][index]
+    scale, bias = model_json['scale_and_bias']
+    return 1.0 / (1.0 + math.exp(-(scale * total + bias[0])))
+
+
+def test_matches_json_applier():
+    """Test 1: predict_proba = ap dung model JSON tung dong (ke ca NaN va gia tri sat border)"""
+    print("\n" + "="*60)
+    print("TEST 1: Vectorized Evaluator vs JSON Applier")
+    print("="*60)
+
+    try:
+        model_json = _catboost_json()
+        model = ObliviousTreeModel.from_catboost_json(model_json)
+        rng = np.random.default_rng(1)
+        X = rng.normal(size=(3000, 8))
+        X[rng.random(X.shape) < 0.05] = np.nan
+        # Gia tri nam giua border float64 va float32(border)
+        X[:40, 0] = [s['border'] for t in model_json['oblivious_trees'][:40] for s in t['splits'][:1]]
+
+        proba = model.predict_proba(X)
+        expected = np.array([_apply_json(model_json, x) for x in X])
+        diff = np.abs(proba[:, 1] - expected).max()
+        if diff > 1e-12 or not np.allclose(proba.sum(axis=1), 1.0):
+            print(f"[ERROR] Max abs diff {diff:.2e}")
+            return False
+        if model.feature_names_ != [f"f{i}" for i in range(8)] or model.tree_count_ != 40:
+            print(f"[ERROR] Wrong metadata: {model.feature_names_}, {model.tree_count_} trees")
+            return False
+        print(f"[OK] {len(X)} rows, {model.tree_count_} trees (depth <= {model.depth}): max abs diff {diff:.2e}")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_npz_through_model_store():
+    """Test 2: .npz luu/load khong doi ket qua; ModelStore runtime numpy load .npz"""
+    print("\n" + "="*60)
+    print("TEST 2: NPZ Round Trip And ModelStore")
+    print("="*60)
+
+    try:
+        rng = np.random.default_rng(2)
+        n = len(BASE_FEATURES)
+        model = ObliviousTreeModel(rng.integers(0, n, (50, 6)), rng.normal(size=(50, 6)),
+                                   rng.normal(size=(50, 64)), 1.0, -1.0, feature_names=list(BASE_FEATURES))
+        X = rng.normal(size=(500, n))
+        with tempfile.TemporaryDirectory() as model_dir:
+            path = Path(model_dir) / "leak_detection_model.npz"
+            model.save(path)
+            if not np.array_equal(ObliviousTreeModel.load(path).predict_proba(X), model.predict_proba(X)):
+                print("[ERROR] Predictions changed after save/load")
+                return False
+
+            # .pkl moi hon .npz: runtime numpy van dung .npz khi khong co catboost
+            pickled = Path(model_dir) / "leak_detection_model.pkl"
+            pickled.write_bytes(b"stale")
+            os.utime(pickled, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+            expected = pickled if CATBOOST_INSTALLED else path
+            if find_model_file(Path(model_dir), "numpy") != expected:
+                print(f"[ERROR] Expected {expected.name}")
+                return False
+            pickled.unlink()
+
+            store = ModelStore(Path(model_dir), runtime="numpy")
+            bundle = store.get()
+            if bundle is None or bundle.info()["format"] != "numpy-oblivious-trees":
+                print(f"[ERROR] Bundle not loaded from npz: {store.last_error}")
+                return False
+            if bundle.feature_cols != list(BASE_FEATURES):
+                print("[ERROR] Feature columns should come from the exported names")
+                return False
+            if not np.array_equal(bundle.model.predict_proba(X), model.predict_proba(X)):
+                print("[ERROR] ModelStore model differs")
+                return False
+        print(f"[OK] {path.name} round trip identical, loaded by ModelStore (runtime numpy)")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_matches_catboost():
+    """Test 3: export tu CatBoostClassifier that - predict_proba trong sai so dau phay dong"""
+    print("\n" + "="*60)
+    print("TEST 3: NumPy Export vs CatBoost predict_proba")
+    print("="*60)
+
+    if not CATBOOST_INSTALLED:
+        print("[WARN] catboost not installed - skipped")
+        return True
+
+    try:
+        from catboost import CatBoostClassifier
+        rng = np.random.default_rng(3)
+        X = rng.normal(size=(2000, 10))
+        y = (X[:, 0] + X[:, 3] * X[:, 5] + rng.normal(scale=0.5, size=2000) > 0.5).astype(int)
+        X[rng.random(X.shape) < 0.02] = np.nan
+        reference = CatBoostClassifier(iterations=200, depth=6, verbose=False, random_seed=0, allow_writing_files=False)
+        reference.fit(X, y)
+
+        model = ObliviousTreeModel.from_catboost(reference)
+        X_test = rng.normal(size=(5000, 10))
+        X_test[rng.random(X_test.shape) < 0.02] = np.nan
+        diff = np.abs(reference.predict_proba(X_test) - model.predict_proba(X_test)).max()
+        if diff > 1e-9:
+            print(f"[ERROR] Max abs diff {diff:.2e}")
+            return False
+        print(f"[OK] {model.tree_count_} trees: max abs diff {diff:.2e}")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("OBLIVIOUS TREES - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['matches_json_applier'] = test_matches_json_applier()
+    results['npz_through_model_store'] = test_npz_through_model_store()
+    results['matches_catboost'] = test_matches_catboost()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
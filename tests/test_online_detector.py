@@ -0,0 +1,247 @@
+"""
+Test script de verify online leak scoring (services/online_detector.py): feature cua
+moi buoc bang build_features tren lich su den buoc do, chi phi khong tang theo lich su
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.feature_pipeline import BASE_FEATURES, FEATURE_SCHEMA, build_features
+from services.leak_detection_service import LeakDetectionService
+from services.model_store import ModelBundle, ModelStore
+from services.online_detector import OnlineLeakDetector
+
+
+class PressureDropModel:
+    """Model gia: xac suat ro ri tang khi ap luc giam (cot pressure_drop)"""
+
+    def __init__(self, feature_cols):
+        self.column = list(feature_cols).index('pressure_drop')
+
+    def predict_proba(self, X):
+        p = 1.0 - np.exp(-np.asarray(X)[:, self.column])
+        return np.column_stack([1 - p, p])
+
+
+def _make_history(n_nodes=30, n_times=14, seed=0):
+    rng = np.random.default_rng(seed)
+    nodes = [f"J{i}" for i in range(n_nodes)]
+    neighbor_map = {n: [nodes[(i + 1) % n_nodes], nodes[(i + 7) % n_nodes]] for i, n in enumerate(nodes)}
+    topology_df = pd.DataFrame({
+        'node_id': nodes,
+        'neighbors': [",".join(neighbor_map[n]) for n in nodes],
+        'node_betweenness': rng.uniform(0, 1, n_nodes),
+        'node_elevation': rng.uniform(0, 30, n_nodes),
+    })
+    steps = []
+    for t in range(n_times):
+        present = [n for n in nodes if rng.random() > 0.1]  # node thieu o mot so buoc
+        pressure = rng.uniform(10, 40, len(present))
+        pressure[rng.random(len(present)) < 0.05] = np.nan
+        if t % 4 == 0:
+            pressure[:5] = 25.0  # cua so gia tri bang nhau
+        steps.append(pd.DataFrame({
+            'node_id': present,
+            'timestamp': t * 3600,
+            'pressure': pressure,
+            'head': rng.uniform(20, 60, len(present)),
+            'demand': rng.choice([0.0, 0.002, 0.01], len(present)),
+        }))
+    return steps, (neighbor_map, topology_df)
+
+
+def test_matches_batch_features():
+    """Test 1: feature streaming = build_features tren lich su den buoc hien tai"""
+    print("\n" + "="*60)
+    print("TEST 1: Streaming vs Batch Features")
+    print("="*60)
+
+    try:
+        steps, topology = _make_history()
+        detector = OnlineLeakDetector(LeakDetectionService(), topology_loader=lambda: topology)
+        worst = 0.0
+        for t, step in enumerate(steps):
+            online = detector.update(step['timestamp'].iloc[0], step['node_id'], step['pressure'], step['head'], step['demand'])
+            history = pd.concat(steps[:t + 1], ignore_index=True)
+            batch = build_features(history, topology_loader=lambda: topology)
+            batch = batch[batch['timestamp'] == t * 3600].set_index('node_id').loc[online['node_id']]
+            for feat in FEATURE_SCHEMA:
+                a = online[feat].to_numpy(dtype=np.float64)
+                b = batch[feat].to_numpy(dtype=np.float64)
+                if not np.allclose(a, b, rtol=1e-9, atol=1e-9, equal_nan=True):
+                    print(f"[ERROR] Step {t}: {feat} differs (max diff {np.nanmax(np.abs(a - b))})")
+                    return False
+                both = ~np.isnan(a) & ~np.isnan(b)
+                if both.any():
+                    worst = max(worst, float(np.abs(a[both] - b[both]).max()))
+        print(f"[OK] {len(steps)} steps x {len(FEATURE_SCHEMA)} features match batch (max abs diff {worst:.2e})")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_cost_independent_of_history():
+    """Test 2: thoi gian moi buoc khong tang theo do dai lich su"""
+    print("\n" + "="*60)
+    print("TEST 2: Update Cost vs History Length")
+    print("="*60)
+
+    try:
+        rng = np.random.default_rng(1)
+        nodes = [f"J{i}" for i in range(200)]
+        detector = OnlineLeakDetector(LeakDetectionService(), topology_loader=lambda: ({}, None))
+
+        def timed(n_steps, start):
+            times = []
+            for t in range(start, start + n_steps):
+                t0 = time.perf_counter()
+                detector.update(t, nodes, rng.uniform(10, 40, 200), rng.uniform(20, 60, 200), rng.uniform(0, 1, 200))
+                times.append(time.perf_counter() - t0)
+            return float(np.median(times[-20:]))
+
+        early = timed(25, 0)
+        timed(500, 25)
+        late = timed(25, 525)
+        print(f"[OK] Median update: {early * 1000:.2f} ms after 25 steps, {late * 1000:.2f} ms after 550 steps")
+        if late > 3 * early:
+            print("[ERROR] Update cost grows with history")
+            return False
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_score_and_streams():
+    """Test 3: score() chi tra ve ro ri cua buoc hien tai; stream registry"""
+    print("\n" + "="*60)
+    print("TEST 3: Scoring And Stream Registry")
+    print("="*60)
+
+    try:
+        service = LeakDetectionService()
+        service._load_topology_features = lambda: ({}, None)
+        model = PressureDropModel(BASE_FEATURES)
+        service.models = ModelStore(loader=lambda path: ModelBundle(
+            model, None, None, list(BASE_FEATURES), 0.5, Path("fake.pkl"), ()
+        ))
+
+        detector = service.online_detector("zone-1")
+        if service.online_detector("zone-1") is not detector:
+            print("[ERROR] Stream should be reused")
+            return False
+        nodes = {f"J{i}": {"pressure": 30.0, "head": 50.0, "demand": 0.01} for i in range(20)}
+        first = detector.score(0, nodes)
+        nodes["J3"] = {"pressure": 20.0, "head": 40.0, "demand": 0.01}  # ap luc giam 10 m
+        second = detector.score(3600, nodes)
+
+        if not first["success"] or first["leaks"]:
+            print(f"[ERROR] Unexpected first step: {first}")
+            return False
+        if [leak["node_id"] for leak in second["leaks"]] != ["J3"] or second["leaks"][0]["timestamp"] != 3600.0:
+            print(f"[ERROR] Expected one leak at J3: {second['leaks']}")
+            return False
+        if detector.info()["steps"] != 2 or not service.reset_stream("zone-1") or service.get_stream("zone-1") is not None:
+            print("[ERROR] Stream registry failed")
+            return False
+        print(f"[OK] Leak at J3 detected on step 2 in {second['summary']['elapsed_ms']} ms; stream reset")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_stream_eviction():
+    """Test 4: vuot max_streams -> xoa luong it dung nhat; luong qua idle TTL bi xoa"""
+    print("\n" + "="*60)
+    print("TEST 4: Stream Eviction")
+    print("="*60)
+
+    try:
+        service = LeakDetectionService()
+        service.max_streams = 3
+        service.stream_idle_ttl = 0
+
+        first = service.online_detector("s0")
+        for i in range(1, 3):
+            service.online_detector(f"s{i}")
+        service.online_detector("s0")  # s0 vua dung -> s1 la luong cu nhat
+        service.online_detector("s3")
+        if service.get_stream("s1") is not None or service.online_detector("s0") is not first:
+            print("[ERROR] Least recently used stream s1 should be evicted, s0 kept")
+            return False
+        # Nhieu stream_id khac nhau khong lam registry lon mai
+        for i in range(100):
+            service.online_detector(f"flood-{i}")
+        stats = service.stream_stats()
+        if stats["streams"] != 3 or stats["evicted"] != 101:
+            print(f"[ERROR] Registry should stay at max_streams: {stats}")
+            return False
+
+        service.stream_idle_ttl = 0.05
+        service.online_detector("fresh")
+        time.sleep(0.1)
+        kept = service.online_detector("active")
+        if service.get_stream("fresh") is not None or service.get_stream("active") is not kept:
+            print("[ERROR] Idle stream should expire after the TTL")
+            return False
+        print(f"[OK] LRU eviction at {service.max_streams} streams, idle TTL expiry; {service.stream_stats()}")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("ONLINE DETECTOR - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['matches_batch_features'] = test_matches_batch_features()
+    results['cost_independent_of_history'] = test_cost_independent_of_history()
+    results['score_and_streams'] = test_score_and_streams()
+    results['stream_eviction'] = test_stream_eviction()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+Test script de verify payload codec cho simulation_runs (core/payload_codec.py)
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import json
+import math
+import os
+import random
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+from core.database import DatabaseManager
+from core.payload_codec import (
+    FORMAT_VERSION,
+    HEADER,
+    MAGIC,
+    PayloadCodecError,
+    decode_payload,
+    encode_payload,
+)
+from models.schemas import SimulationInput
+
+
+def _json_round_trip(payload):
+    """Gia tri ma reader cu nhan duoc: json.loads(json.dumps(...))"""
+    return json.loads(encode_payload(payload, fmt="json"))
+
+
+def _sample_results(n_nodes=20, n_steps=25):
+    rng = random.Random(1)
+    return {
+        "nodes": {
+            str(n): [{"node_id": str(n), "pressure": rng.uniform(10, 40), "head": rng.uniform(20, 60),
+                      "demand": 0.0, "flow": -rng.random()} for _ in range(n_steps)]
+            for n in range(n_nodes)
+        },
+        "pipes": {
+            f"P{p}": [{"timestamp": t * 3600, "flow": np.float64(rng.uniform(-5, 5))} for t in range(n_steps)]
+            for p in range(n_nodes)
+        },
+        "pumps": {}
+    }
+
+
+def test_round_trip_matches_json():
+    """Test 1: decode(encode(x)) == json.loads(json.dumps(x)) cho nhieu dang payload"""
+    print("\n" + "="*60)
+    print("TEST 1: Round Trip vs JSON")
+    print("="*60)
+
+    try:
+        payloads = {
+            "results": _sample_results(),
+            "input": SimulationInput(duration=48).dict(),
+            "mixed_lists": {
+                "same_keys": [{"a": 1, "b": "x"}, {"a": 2, "b": None}],
+                "different_keys": [{"a": 1}, {"b": 2}],
+                "nested": [{"id": 1, "v": [1.5, 2.5], "m": {"k": True}}, {"id": 2, "v": [], "m": {}}],
+                "floats_and_ints": [{"x": 1.0}, {"x": 2}],
+                "empty_dicts": [{}, {}],
+                "tuple": (1, 2.5, "s"),
+                "datetime": datetime(2025, 10, 22, 8, 30),
+                "int_keys": {1: "a", 2.5: "b", True: "c", None: "d"},
+                "negative_zero": [{"v": -0.0}, {"v": 1e-300}],
+            },
+            # Dict trung key danh dau columnar -> phai duoc escape
+            "marker_clash": {"__columnar__": [["a"], 1], "__data__": [[1]]},
+            "top_level_list": [{"t": i, "p": i / 3} for i in range(10)],
+        }
+
+        for name, payload in payloads.items():
+            expected = _json_round_trip(payload)
+            for compression in ("zlib", "none"):
+                encoded = encode_payload(payload, fmt="binary", compression=compression)
+                if not encoded.startswith(MAGIC):
+                    print(f"[ERROR] {name}: missing header")
+                    return False
+                got = decode_payload(encoded)
+                if got != expected:
+                    print(f"[ERROR] {name} ({compression}): decoded payload differs from JSON round trip")
+                    return False
+
+        # NaN/inf giu nguyen (json cu cung ghi NaN/Infinity)
+        special = decode_payload(encode_payload([{"p": float("nan")}, {"p": float("inf")}], fmt="binary"))
+        if not (math.isnan(special[0]["p"]) and math.isinf(special[1]["p"])):
+            print(f"[ERROR] NaN/inf not preserved: {special}")
+            return False
+
+        print(f"[OK] {len(payloads)} payload shapes decode identical to json.loads(json.dumps(...))")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_legacy_rows_and_versioning():
+    """Test 2: reader doc duoc ca row JSON cu lan row binary moi; version la bi tu choi"""
+    print("\n" + "="*60)
+    print("TEST 2: Legacy Rows & Version Header")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(os.path.join(tmp, "test.db"))
+        try:
+            results = _sample_results()
+            input_data = SimulationInput(duration=24).dict()
+
+            with manager.connection() as conn:
+                legacy_id = conn.execute(
+                    "INSERT INTO simulation_runs (status, input_data, results) VALUES (?, ?, ?)",
+                    ("completed", json.dumps(input_data, default=str), json.dumps(results))
+                ).lastrowid
+            new_id = manager.save_simulation_run("completed", input_data, results)
+
+            legacy = manager.get_simulation_run(legacy_id)
+            new = manager.get_simulation_run(new_id)
+            if legacy["results"] != new["results"] or legacy["results"] != _json_round_trip(results):
+                print("[ERROR] Legacy and binary rows decode differently")
+                return False
+            if new["input_data"] != _json_round_trip(input_data):
+                print(f"[ERROR] input_data mismatch: {new['input_data']}")
+                return False
+            if manager.get_simulation_run(9999) is not None:
+                print("[ERROR] Missing run should return None")
+                return False
+
+            with manager.connection() as conn:
+                raw_type = conn.execute("SELECT typeof(results) FROM simulation_runs WHERE id = ?", (new_id,)).fetchone()[0]
+            if raw_type != "blob":
+                print(f"[ERROR] New rows should be stored as blob, got {raw_type}")
+                return False
+
+            encoded = encode_payload(results, fmt="binary")
+            future = HEADER.pack(MAGIC, FORMAT_VERSION + 1, 1, 1) + encoded[HEADER.size:]
+            try:
+                decode_payload(future)
+                print("[ERROR] Newer format version was accepted")
+                return False
+            except PayloadCodecError:
+                pass
+
+            print(f"[OK] Legacy JSON row {legacy_id} and binary row {new_id} decode to the same results")
+            print(f"[OK] Binary size {len(encoded)} bytes vs JSON {len(json.dumps(results))} bytes")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            manager.close()
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("PAYLOAD CODEC - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['round_trip_vs_json'] = test_round_trip_matches_json()
+    results['legacy_rows_and_versioning'] = test_legacy_rows_and_versioning()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Test script de verify warmup + readiness (services/warmup.py) va che do prefork (core/prefork.py):
+/ready 503 truoc warmup, 200 sau warmup; worker fork tu master da warm, dung lai gon khi SIGTERM
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import os
+import signal
+import socket
+import subprocess
+import time
+
+import requests
+
+from services.warmup import WarmupState, warm_up
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_readiness():
+    """Test 1: warm_up chay mot lan, loi mot buoc khong chan; /ready 503 -> 200"""
+    print("\n" + "="*60)
+    print("TEST 1: Warmup And Readiness")
+    print("="*60)
+
+    try:
+        from fastapi.testclient import TestClient
+        import main
+        from services import warmup
+
+        state = WarmupState()
+        warm_up(("network_template", "network_topology", "topology_features"), state)
+        if not state.ready or state.errors or list(state.steps) != ["network_template", "network_topology",
+                                                                     "topology_features"]:
+            print(f"[ERROR] Unexpected warmup state: {state.to_dict()}")
+            return False
+        elapsed = state.elapsed_ms
+        if warm_up(("network_template",), state).elapsed_ms != elapsed:
+            print("[ERROR] Warmup should run once per process")
+            return False
+        try:
+            warm_up(("no_such_step",), WarmupState())
+            print("[ERROR] Unknown step should be rejected")
+            return False
+        except ValueError:
+            pass
+
+        failing = WarmupState()
+        warmup.WARMUP_STEPS["broken"] = lambda: 1 / 0
+        try:
+            warm_up(("broken", "network_topology"), failing)
+        finally:
+            del warmup.WARMUP_STEPS["broken"]
+        if not failing.ready or list(failing.errors) != ["broken"] or "network_topology" not in failing.steps:
+            print(f"[ERROR] A failed step should be recorded without blocking the others: {failing.to_dict()}")
+            return False
+
+        # Buoc bat buoc (model) loi -> khong ready, /ready 503 liet ke buoc loi
+        no_model = WarmupState()
+        original_step = warmup.WARMUP_STEPS["leak_model"]
+        warmup.WARMUP_STEPS["leak_model"] = lambda: 1 / 0
+        try:
+            warm_up(("network_template", "leak_model"), no_model)
+        finally:
+            warmup.WARMUP_STEPS["leak_model"] = original_step
+        if no_model.ready or no_model.to_dict()["status"] != "failed" or no_model.failed_steps != ["leak_model"]:
+            print(f"[ERROR] A failed required step should keep the process unready: {no_model.to_dict()}")
+            return False
+
+        # /ready doc warmup_state cua process
+        original = warmup.warmup_state.__dict__.copy()
+        try:
+            warmup.warmup_state.ready = False
+            client = TestClient(main.app)
+            cold = client.get("/ready")
+            warmup.warmup_state.__dict__.update(no_model.__dict__)
+            failed = client.get("/ready")
+            warmup.warmup_state.__dict__.update(state.__dict__)
+            warm = client.get("/ready")
+        finally:
+            warmup.warmup_state.__dict__.update(original)
+        if cold.status_code != 503 or cold.json()["status"] != "warming_up":
+            print(f"[ERROR] /ready before warmup: {cold.status_code} {cold.json()}")
+            return False
+        if failed.status_code != 503 or failed.json()["failed_steps"] != ["leak_model"]:
+            print(f"[ERROR] /ready with a failed model step: {failed.status_code} {failed.json()}")
+            return False
+        if warm.status_code != 200 or warm.json()["preforked"] or "network_template" not in warm.json()["steps"]:
+            print(f"[ERROR] /ready after warmup: {warm.status_code} {warm.json()}")
+            return False
+        print(f"[OK] warmup {elapsed:.0f} ms ({state.steps}), runs once, optional failure recorded, "
+              f"required failure -> 503; /ready 503 -> 200")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        for db in project_root.glob("epanet_data.db*"):
+            db.unlink()
+
+
+def test_prefork_server():
+    """Test 2: master warm roi fork 2 worker; /ready xanh ngay (preforked), SIGTERM dung ca cay process"""
+    print("\n" + "="*60)
+    print("TEST 2: Prefork Server")
+    print("="*60)
+
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(project_root / "scripts" / "serve_prefork.py"), "--host", "127.0.0.1", "--port",
+         str(port), "--workers", "2", "--log-level", "warning",
+         "--warmup", "network_template,network_topology,topology_features"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    try:
+        body = None
+        while time.perf_counter() - started < 120 and process.poll() is None:
+            try:
+                response = requests.get(f"http://127.0.0.1:{port}/ready", timeout=2)
+                if response.status_code == 200:
+                    body = response.json()
+                    break
+                print(f"[ERROR] Prefork worker answered {response.status_code} - should be warm on accept")
+                return False
+            except requests.RequestException:
+                time.sleep(0.1)
+        elapsed = time.perf_counter() - started
+        if body is None:
+            print(f"[ERROR] Prefork server not ready (exit code {process.poll()})")
+            return False
+        if not body["preforked"] or body["pid"] == process.pid or body["errors"]:
+            print(f"[ERROR] Worker should inherit the master warmup: {body}")
+            return False
+        # Master da dong connection SQLite mo luc import core.database truoc khi fork
+        master_files = [os.readlink(f"/proc/{process.pid}/fd/{fd}") for fd in os.listdir(f"/proc/{process.pid}/fd")]
+        if any("epanet_data.db" in path for path in master_files):
+            print(f"[ERROR] Prefork master still holds the database open: {master_files}")
+            return False
+        topology = requests.get(f"http://127.0.0.1:{port}/api/v1/network/topology/summary", timeout=10).json()
+        if topology["summary"]["total_nodes"] != 194:
+            print(f"[ERROR] Unexpected topology from worker: {topology}")
+            return False
+
+        os.kill(process.pid, signal.SIGTERM)
+        code = process.wait(timeout=30)
+        if code != 0:
+            print(f"[ERROR] Master exit code {code} after SIGTERM")
+            return False
+        print(f"[OK] ready {elapsed:.1f} s after launch, worker {body['pid']} preforked from {process.pid}; "
+              f"clean SIGTERM shutdown")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+        for db in project_root.glob("epanet_data.db*"):
+            db.unlink()
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("WARMUP / PREFORK - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['readiness'] = test_readiness()
+    results['prefork_server'] = test_prefork_server()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Test script de verify cache xac suat theo run (services/probability_cache.py): doi threshold /
+top_k khong goi lai model, ket qua = cham diem lai tu dau, LRU va reload model, endpoint /runs
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.feature_pipeline import BASE_FEATURES
+from services.leak_detection_service import LeakDetectionService
+from services.model_store import ModelBundle, ModelStore
+from services.node_arrays import NodeArrays
+from services.probability_cache import ProbabilityCache, ScoredRun
+
+
+class CountingModel:
+    """Xac suat tu pressure (cot dau); dem so lan predict_proba"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict_proba(self, X):
+        self.calls += 1
+        X = np.asarray(X, dtype=float)
+        p = 1.0 / (1.0 + np.exp(-(X[:, 0] - 25.0) / 4.0))
+        return np.column_stack([1 - p, p])
+
+
+def _service(model, cache_runs=16):
+    service = LeakDetectionService()
+    service._load_topology_features = lambda: ({}, None)
+    service.models = ModelStore(loader=lambda path: ModelBundle(
+        model, None, None, list(BASE_FEATURES), 0.5, Path("fake.pkl"), ()
+    ))
+    service.scored_runs = ProbabilityCache(cache_runs)
+    return service
+
+
+def _arrays(n_nodes=40, n_steps=48, seed=0):
+    rng = np.random.default_rng(seed)
+    n = n_nodes * n_steps
+    return NodeArrays(
+        np.repeat([f"N{i}" for i in range(n_nodes)], n_steps).tolist(),
+        np.tile(np.arange(n_steps) * 1800, n_nodes).tolist(),
+        rng.uniform(5, 45, n).tolist(),
+        rng.uniform(20, 60, n).tolist(),
+        rng.uniform(0, 0.02, n).tolist(),
+    )
+
+
+def test_lru_and_model_reload():
+    """Test 1: LRU giu run vua dung, bo run cu nhat; run cua model khac khong duoc dung"""
+    print("\n" + "="*60)
+    print("TEST 1: LRU Eviction And Model Identity")
+    print("="*60)
+
+    try:
+        frame = pd.DataFrame({'node_id': ['A', 'B'], 'timestamp': [0, 0], 'pressure': [1.0, 2.0],
+                              'head': [1.0, 2.0], 'demand': [0.1, 0.2], 'leak_probability': [0.3, 0.9]})
+        bundle, other = object(), object()
+        cache = ProbabilityCache(max_runs=2)
+        cache.put("a", ScoredRun(frame, bundle))
+        cache.put("b", ScoredRun(frame, bundle))
+        cache.get("a", bundle)
+        cache.put("c", ScoredRun(frame, bundle))
+        if cache.get("b", bundle) is not None or cache.get("a", bundle) is None or len(cache) != 2:
+            print("[ERROR] Least recently used run should be evicted")
+            return False
+        if cache.get("a", other) is not None:
+            print("[ERROR] Run scored by another model should not be reused")
+            return False
+        if [r["run_key"] for r in cache.stats()["runs"]] != ["a", "c"]:
+            print(f"[ERROR] Wrong LRU order: {cache.stats()['runs']}")
+            return False
+
+        disabled = ProbabilityCache(max_runs=0)
+        disabled.put("a", ScoredRun(frame, bundle))
+        if len(disabled) != 0:
+            print("[ERROR] max_runs=0 should disable the cache")
+            return False
+        print("[OK] LRU eviction, model identity check, max_runs=0 disables cache")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_requery_matches_fresh_detection():
+    """Test 2: /detect lap lai va /runs/{key}/leaks = cham diem lai, model chi goi mot lan"""
+    print("\n" + "="*60)
+    print("TEST 2: Cached Re-Query vs Fresh Detection")
+    print("="*60)
+
+    try:
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        import api.routes.leak_detection as routes
+
+        model = CountingModel()
+        service = _service(model)
+        fresh = _service(CountingModel(), cache_runs=0)
+        arrays = _arrays()
+
+        first = service.detect_leaks_from_arrays(arrays)
+        run_key = first["run_key"]
+        if first["cached"] or model.calls != 1:
+            print("[ERROR] First detection should score the run")
+            return False
+
+        for threshold, top_k in ((0.5, None), (0.8, None), (0.3, 5), (0.95, 3)):
+            cached = service.detect_leaks_from_arrays(_arrays(), threshold=threshold, top_k=top_k)
+            expected = fresh.detect_leaks_from_arrays(arrays, threshold=threshold, top_k=top_k)
+            if not cached["cached"] or cached["leaks"] != expected["leaks"] or cached["summary"] != expected["summary"]:
+                print(f"[ERROR] threshold={threshold}, top_k={top_k}: cached result differs")
+                return False
+        if model.calls != 1:
+            print(f"[ERROR] Model called {model.calls} times")
+            return False
+
+        app = FastAPI()
+        app.include_router(routes.router, prefix="/leak-detection")
+        original = routes.leak_detection_service
+        routes.leak_detection_service = service
+        try:
+            client = TestClient(app)
+            response = client.get(f"/leak-detection/runs/{run_key}/leaks",
+                                  params={"threshold": 0.7, "min_probability": 0.75, "top_k": 4})
+            expected = fresh.query_run(service.scored_runs.get(run_key), 0.7, 4, None, 0.75)
+            data = response.json()["data"]
+            if response.status_code != 200 or data["leaks"] != expected["leaks"] or len(data["leaks"]) != 4:
+                print(f"[ERROR] Endpoint returned {response.status_code}: {response.text[:200]}")
+                return False
+            if min(l["probability"] for l in data["leaks"]) < 0.75 or data["summary"]["min_probability"] != 0.75:
+                print("[ERROR] min_probability not applied")
+                return False
+            if client.get("/leak-detection/runs/unknown/leaks").status_code != 404:
+                print("[ERROR] Unknown run should return 404")
+                return False
+
+            # Reload model: run cu khong con dung duoc
+            service.models.reload()
+            if client.get(f"/leak-detection/runs/{run_key}/leaks").status_code != 404:
+                print("[ERROR] Run scored by the previous model should not be served")
+                return False
+        finally:
+            routes.leak_detection_service = original
+        if model.calls != 1:
+            print(f"[ERROR] Model called {model.calls} times")
+            return False
+        print("[OK] 4 threshold/top_k re-queries + endpoint identical to fresh detection, 1 model call")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_requery_time():
+    """Test 3: thoi gian doi threshold - detect lai tu dau vs truy van cache"""
+    print("\n" + "="*60)
+    print("TEST 3: Threshold Change Latency")
+    print("="*60)
+
+    try:
+        service = _service(CountingModel())
+        fresh = _service(CountingModel(), cache_runs=0)
+        arrays = _arrays(n_nodes=300, n_steps=96, seed=1)
+        run_key = service.detect_leaks_from_arrays(arrays)["run_key"]
+
+        timings = {}
+        for name, fn in (("full", lambda t: fresh.detect_leaks_from_arrays(arrays, threshold=t)),
+                         ("cached", lambda t: service.query_cached_run(run_key, threshold=t))):
+            times = []
+            for threshold in (0.4, 0.5, 0.6):
+                t0 = time.perf_counter()
+                result = fn(threshold)
+                times.append(time.perf_counter() - t0)
+                if not result["success"]:
+                    print(f"[ERROR] {name} query failed: {result.get('error')}")
+                    return False
+            timings[name] = float(np.median(times)) * 1000
+        print(f"[OK] {len(arrays)} records: full detection {timings['full']:.0f} ms, "
+              f"cached re-query {timings['cached']:.1f} ms")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("PROBABILITY CACHE - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['lru_and_model_reload'] = test_lru_and_model_reload()
+    results['requery_matches_fresh_detection'] = test_requery_matches_fresh_detection()
+    results['requery_time'] = test_requery_time()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
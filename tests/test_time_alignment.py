@@ -0,0 +1,223 @@
+"""
+Test script de verify time alignment engine (SCADA -> moc thoi gian simulation)
+"""
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from services.time_alignment import (
+    TimeSeriesAligner,
+    datetime_to_epoch_us,
+    nearest_grid_index,
+    simulation_epochs_us,
+)
+
+
+def _legacy_nearest(scada_times, scada_values, sim_time, max_gap_hours=24):
+    """Vong quet O(records) cu trong SCADABoundaryService._apply_reservoir_boundary"""
+    closest = None
+    min_diff = float('inf')
+    for t, v in zip(scada_times, scada_values):
+        diff = abs((t - sim_time).total_seconds())
+        if diff < min_diff:
+            min_diff = diff
+            closest = v
+    if closest is None or min_diff > max_gap_hours * 3600:
+        return None
+    return closest
+
+
+def test_nearest_matches_legacy_scan():
+    """Test 1: nearest mode trung ket qua voi vong quet cu (ca truong hop hoa)"""
+    print("\n" + "="*60)
+    print("TEST 1: Nearest Mode vs Legacy Scan")
+    print("="*60)
+
+    try:
+        rng = random.Random(0)
+        start = datetime(2025, 10, 22, 0, 0)
+        # Mau cach nhau 30/60/90 phut -> nhieu truong hop hoa tai moc gio, co mau trung moc
+        scada_times = []
+        t = start - timedelta(hours=3)
+        for _ in range(200):
+            t += timedelta(minutes=rng.choice([0, 30, 60, 90]))
+            scada_times.append(t)
+        # Khoang trong lon de kiem tra max_gap
+        scada_times += [t + timedelta(hours=40), t + timedelta(hours=41)]
+        values = [round(rng.uniform(15, 25), 2) for _ in scada_times]
+
+        sim_times = [start + timedelta(hours=h) for h in range(0, 24 * 7)]
+        aligner = TimeSeriesAligner([datetime_to_epoch_us(x) for x in scada_times], values)
+        out, valid, _ = aligner.align([datetime_to_epoch_us(x) for x in sim_times], mode="nearest",
+                                      max_gap_seconds=24 * 3600)
+
+        mismatches = 0
+        for i, sim_time in enumerate(sim_times):
+            expected = _legacy_nearest(scada_times, values, sim_time)
+            got = out[i] if valid[i] else None
+            if expected != got:
+                mismatches += 1
+                if mismatches <= 3:
+                    print(f"[ERROR] {sim_time}: expected {expected}, got {got}")
+
+        if mismatches:
+            print(f"[ERROR] {mismatches} mismatch(es)")
+            return False
+        print(f"[OK] {len(sim_times)} steps match legacy scan ({int((~valid).sum())} beyond max gap)")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_linear_and_step_modes():
+    """Test 2: linear/step + max-gap policy"""
+    print("\n" + "="*60)
+    print("TEST 2: Linear & Step Modes")
+    print("="*60)
+
+    try:
+        h = 3600 * 1_000_000
+        # Mau tai 0h, 2h, 10h (khoang trong 8h)
+        aligner = TimeSeriesAligner([0, 2 * h, 10 * h], [10.0, 20.0, 30.0])
+        targets = [-h, 0, h, 2 * h, 3 * h, 6 * h, 11 * h, 20 * h]
+
+        linear, lvalid, _ = aligner.align(targets, mode="linear", max_gap_seconds=3 * 3600)
+        # -1h: ngoai khoang -> nearest (1h) ; 1h: noi suy ; 3h, 6h: khoang 8h > 3h -> nearest trong 3h
+        expected_linear = [10.0, 10.0, 15.0, 20.0, 20.0, np.nan, 30.0, np.nan]
+        if not np.allclose(linear, expected_linear, equal_nan=True):
+            print(f"[ERROR] linear: expected {expected_linear}, got {linear.tolist()}")
+            return False
+
+        step, svalid, _ = aligner.align(targets, mode="step", max_gap_seconds=3 * 3600)
+        expected_step = [np.nan, 10.0, 10.0, 20.0, 20.0, np.nan, 30.0, np.nan]
+        if not np.allclose(step, expected_step, equal_nan=True):
+            print(f"[ERROR] step: expected {expected_step}, got {step.tolist()}")
+            return False
+
+        unlimited, uvalid, _ = aligner.align(targets, mode="linear")
+        if not uvalid.all() or unlimited[5] != 25.0:
+            print(f"[ERROR] linear without max gap: {unlimited.tolist()}")
+            return False
+
+        print(f"[OK] linear: {linear.tolist()}")
+        print(f"[OK] step:   {step.tolist()}")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_grid_resampling_matches_min_scan():
+    """Test 3: nearest_grid_index == min(range(...), key=...) cu"""
+    print("\n" + "="*60)
+    print("TEST 3: Pattern Resampling")
+    print("="*60)
+
+    try:
+        for hyd, pat, duration in [(1, 0.25, 24), (1, 0.5, 48), (2, 1, 24), (1, 3, 72)]:
+            n_heads = len(range(0, duration + 1, hyd))
+            n_steps = int(duration / pat) + 1
+            targets = [i * pat for i in range(n_steps)]
+            expected = [min(range(n_heads), key=lambda j: abs(j * hyd - t)) for t in targets]
+            got = nearest_grid_index(hyd, n_heads, targets).tolist()
+            if got != expected:
+                print(f"[ERROR] hyd={hyd} pattern={pat}: {got[:8]} != {expected[:8]}")
+                return False
+        print("[OK] Resampled indices match legacy min() scan")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_multi_week_minute_window():
+    """Test 4: 4 tuan du lieu phut (~40k mau) can chinh nhanh"""
+    print("\n" + "="*60)
+    print("TEST 4: Multi-week Minute-resolution Window")
+    print("="*60)
+
+    try:
+        start = datetime(2025, 10, 1)
+        n = 4 * 7 * 24 * 60
+        records = [
+            {"timestamp": (start + timedelta(minutes=m)).strftime("%Y-%m-%d %H:%M"), "pressure": 20.0 + (m % 60) / 100}
+            for m in range(n)
+        ]
+
+        t0 = time.perf_counter()
+        aligner, n_bad = TimeSeriesAligner.from_records(records, "pressure")
+        targets = simulation_epochs_us(start, 4 * 7 * 24 - 1, 1)
+        out, valid, _ = aligner.align(targets, mode="linear", max_gap_seconds=3600)
+        elapsed = time.perf_counter() - t0
+
+        if n_bad or len(aligner) != n or not valid.all():
+            print(f"[ERROR] Unexpected alignment: n_bad={n_bad}, samples={len(aligner)}, valid={valid.sum()}")
+            return False
+        if not np.allclose(out, 20.0):
+            print(f"[ERROR] Expected 20.0 at every hour, got {out[:5]}")
+            return False
+        if elapsed > 5.0:
+            print(f"[ERROR] Alignment too slow: {elapsed:.2f}s")
+            return False
+
+        print(f"[OK] {n} samples -> {len(targets)} steps in {elapsed * 1000:.0f} ms")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("TIME ALIGNMENT ENGINE - TEST SUITE")
+    print("="*60)
+
+    results = {}
+    results['nearest_vs_legacy'] = test_nearest_matches_legacy_scan()
+    results['linear_and_step'] = test_linear_and_step_modes()
+    results['grid_resampling'] = test_grid_resampling_matches_min_scan()
+    results['multi_week_window'] = test_multi_week_minute_window()
+
+    # Summary
+    print("\n" + "="*60)
+    print("TEST SUMMARY")
+    print("="*60)
+
+    total = len(results)
+    passed = sum(1 for v in results.values() if v)
+
+    for test_name, result in results.items():
+        status = "[OK] PASS" if result else "[ERROR] FAIL"
+        print(f"{status} - {test_name}")
+
+    print(f"\nTotal: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("\n[SUCCESS] ALL TESTS PASSED")
+        return 0
+    else:
+        print(f"\n[WARN] {total - passed} test(s) failed - Please review")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())